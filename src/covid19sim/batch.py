@@ -0,0 +1,144 @@
+"""
+Runs many simulations (e.g. the seeds of a calibration sweep) in long-lived processes, without paying for the
+imports and the loading of the configuration of one `python run.py` invocation per simulation.
+
+A job is a `(seed, overrides)` pair: it runs the simulation of `python run.py seed=<seed> <key>=<value> ...` for the
+`key: value` items of `overrides`, where a key may also select a configuration group (e.g. `intervention: heuristicv1`).
+The state kept at the module level by simulations is reset between jobs (see `reset_simulation_state`), so that each
+job runs the same simulation as its own `python run.py` would.
+
+    from covid19sim.batch import run_jobs
+
+    jobs = [(seed, {"n_people": 500, "simulation_days": 30}) for seed in range(1000)]
+    results = run_jobs(jobs, collect=get_calibration_metrics, n_workers=32)
+"""
+import concurrent.futures
+import copy
+import functools
+import gc
+import multiprocessing
+import typing
+from pathlib import Path
+
+import yaml
+from omegaconf import OmegaConf
+
+from covid19sim.inference.heavy_jobs import DummyMemManager
+from covid19sim.run import run_simulation
+from covid19sim.utils.utils import parse_configuration
+
+HYDRA_SIM_PATH = Path(__file__).resolve().parent / "configs" / "simulation"
+
+JobType = typing.Tuple[int, typing.Optional[typing.Dict[str, typing.Any]]]
+
+
+@functools.lru_cache(maxsize=None)
+def _load_default_conf(groups: typing.Tuple[typing.Tuple[str, str], ...]) -> typing.Dict:
+    """
+    Loads the (unparsed) configuration of `run.py`, merging the files of its defaults in order as hydra does.
+
+    Args:
+        groups: (group, name) of the configuration groups to select instead of their defaults. Groups without a default
+            (e.g. `run_type`) are merged last.
+
+    Returns:
+        The configuration, shared by all calls with the same `groups`: it must be copied before being modified.
+    """
+    with (HYDRA_SIM_PATH / "config.yaml").open("r") as f:
+        defaults = yaml.safe_load(f)["defaults"]
+    selected = dict(groups)
+    paths = []
+    for default in defaults:
+        if isinstance(default, str):
+            paths.append(HYDRA_SIM_PATH / f"{default}.yaml")
+        else:
+            group, name = next(iter(default.items()))
+            paths.append(HYDRA_SIM_PATH / group / f"{selected.pop(group, name)}.yaml")
+    paths += [HYDRA_SIM_PATH / group / f"{name}.yaml" for group, name in selected.items()]
+    for path in paths:
+        assert path.exists(), f"unknown configuration file: {path}"
+    conf = OmegaConf.merge(*[OmegaConf.load(str(path)) for path in paths])
+    return OmegaConf.to_container(conf, resolve=True)
+
+
+def load_conf(overrides: typing.Optional[typing.Dict[str, typing.Any]] = None) -> typing.Dict:
+    """
+    Loads the configuration `python run.py <key>=<value> ...` runs with, for the items of `overrides`.
+
+    Args:
+        overrides: values of the keys of the configuration, or names of the files of configuration groups.
+
+    Returns:
+        The parsed configuration (see `covid19sim.utils.utils.parse_configuration`).
+    """
+    overrides = dict(overrides or {})
+    groups = tuple(sorted((key, overrides.pop(key)) for key in list(overrides) if (HYDRA_SIM_PATH / key).is_dir()))
+    conf = copy.deepcopy(_load_default_conf(groups))
+    unknown_keys = set(overrides) - set(conf)
+    assert not unknown_keys, f"unknown configuration keys: {sorted(unknown_keys)}"
+    conf.update(copy.deepcopy(overrides))
+    return parse_configuration(conf)
+
+
+def reset_simulation_state():
+    """Resets the state kept at the module level by the simulations run so far in this process."""
+    DummyMemManager.reset()
+    # cities are graphs of cyclic references: they are freed right away rather than at the next collections
+    gc.collect()
+
+
+def run_job(
+    seed: int,
+    overrides: typing.Optional[typing.Dict[str, typing.Any]] = None,
+    collect: typing.Optional[typing.Callable] = None,
+) -> typing.Any:
+    """
+    Runs the simulation of a job in this process, writing its outputs as `python run.py` does.
+
+    Args:
+        seed: seed of the simulation.
+        overrides: values of the configuration of the simulation (see `load_conf`).
+        collect: called with the city of the simulation once it is done, to return its results.
+
+    Returns:
+        What `collect` returned, or None if it is None.
+    """
+    reset_simulation_state()
+    conf = load_conf({**(overrides or {}), "seed": seed})
+    city = None
+    try:
+        city = run_simulation(conf)
+        return collect(city) if collect is not None else None
+    finally:
+        del city
+        reset_simulation_state()
+
+
+def run_jobs(
+    jobs: typing.Iterable[JobType],
+    collect: typing.Optional[typing.Callable] = None,
+    n_workers: typing.Optional[int] = None,
+) -> typing.List[typing.Any]:
+    """
+    Runs the simulations of `jobs`, one after the other in each process.
+
+    Args:
+        jobs: (seed, overrides) of the simulations (see `run_job`).
+        collect: called with the city of each simulation once it is done, to return its results (e.g. metrics of its
+            tracker). With `n_workers`, it must be picklable (e.g. a function of a module), as must its results.
+        n_workers: number of worker processes, forked once and running jobs until there are none left. None to run
+            the jobs in this process.
+
+    Returns:
+        What `collect` returned for each job, in order (None if `collect` is None).
+    """
+    jobs = [(seed, overrides) for seed, overrides in jobs]
+    if n_workers is None:
+        return [run_job(seed, overrides, collect) for seed, overrides in jobs]
+
+    # the workers inherit the imported modules and the default configuration
+    _load_default_conf(())
+    context = multiprocessing.get_context("fork")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as executor:
+        futures = [executor.submit(run_job, seed, overrides, collect) for seed, overrides in jobs]
+        return [future.result() for future in futures]
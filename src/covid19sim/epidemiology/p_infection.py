@@ -1,6 +1,4 @@
-import datetime
 import numpy as np
-from covid19sim.utils.constants import SECONDS_PER_DAY
 
 def get_human_human_p_transmission(infector, infectors_infectiousness, infectee, social_contact_factor, contagion_knob, self, h):
     """
@@ -71,7 +69,6 @@ def infectiousness_delta(human, t_near):
     if not human.is_infectious:
         return 0
 
-    start_p = human.get_infectiousness_for_day(human.env.timestamp, human.is_infectious)
-    end_p = human.get_infectiousness_for_day(human.env.timestamp + datetime.timedelta(seconds=t_near), human.is_infectious)
-    area = (t_near / SECONDS_PER_DAY) * (start_p + end_p) / 2
+    # trapezoid of the viral load curve over [now, now + t_near], scaled to infectiousness
+    area = human.viral_load_area(human.env.now, t_near) * human.viral_load_to_infectiousness_multiplier
     return area
@@ -3,6 +3,7 @@ import numpy as np
 from scipy.stats import gamma, truncnorm
 from covid19sim.epidemiology.symptoms import _get_covid_progression, \
     MODERATE, SEVERE, EXTREMELY_SEVERE
+from covid19sim.native._native import BaseHuman, viral_load_for_days
 from covid19sim.utils.constants import SECONDS_PER_DAY
 
 def _sample_viral_load_gamma(rng, shape_mean=4.5, shape_std=.15, scale_mean=1., scale_std=.15):
@@ -279,9 +280,23 @@ def compute_covid_properties(human):
         human.city.tracker.track_covid_properties(human)
 
 
+def _to_posix_timestamp(human, timestamp):
+    """
+    Converts `timestamp` to the POSIX timestamps used by `BaseHuman`, following the same conversion as
+    `BaseHuman.infection_timestamp`.
+    """
+    if isinstance(timestamp, (int, float)):
+        return timestamp
+    return human.env.ts_initial + (timestamp - human.env.initial_timestamp).total_seconds()
+
+
 def viral_load_for_day(human, timestamp):
     """ Calculates the elapsed time since infection, returning this person's current viral load"""
 
+    if isinstance(human, BaseHuman):
+        return human.viral_load_for_day(_to_posix_timestamp(human, timestamp))
+
+    # snapshots of humans (e.g. `DummyHuman`) evaluate the curve in python
     if not human.has_covid:
         return 0.
 
@@ -318,3 +333,22 @@ def viral_load_for_day(human, timestamp):
     assert 0 <= cur_viral_load <= 1, f"effective viral load out of bounds. viral load:{cur_viral_load} plateau_end:{days_since_plateau_end}"
 
     return cur_viral_load
+
+
+def viral_loads_for_day(humans, timestamps):
+    """
+    Batched version of `viral_load_for_day` evaluated natively for all `humans` in one call.
+
+    Args:
+        humans (list): `covid19sim.human.Human` objects
+        timestamps (float or datetime.datetime or list): one timestamp for all humans, or one per human
+
+    Returns:
+        (np.ndarray): viral load of each human at its timestamp
+    """
+    humans = list(humans)
+    if isinstance(timestamps, (list, tuple, np.ndarray)):
+        timestamps = [_to_posix_timestamp(human, t) for human, t in zip(humans, timestamps)]
+    elif humans:
+        timestamps = _to_posix_timestamp(humans[0], timestamps)
+    return np.array(viral_load_for_days(humans, timestamps), dtype=np.float64)
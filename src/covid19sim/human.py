@@ -17,7 +17,6 @@ from covid19sim.locations.city import PersonalMailboxType
 from covid19sim.locations.hospital import Hospital, ICU
 from collections import deque
 
-from covid19sim.utils.utils import calculate_average_infectiousness
 from covid19sim.epidemiology.human_properties import may_develop_severe_illness, _get_inflammatory_disease_level,\
     _get_preexisting_conditions, _get_random_sex, get_carefulness, get_age_bin
 from covid19sim.epidemiology.viral_load import compute_covid_properties, viral_load_for_day
@@ -27,6 +26,7 @@ from covid19sim.epidemiology.p_infection import get_human_human_p_transmission,
 from covid19sim.inference.message_utils import ContactBook, exchange_encounter_messages, RealUserIDType
 from covid19sim.utils.visits import Visits
 from covid19sim.native._native import BaseHuman
+from covid19sim.utils.population import PopulationColumn, PopulationMirror
 from covid19sim.interventions.intervened_behavior import IntervenedBehavior
 
 from covid19sim.utils.constants import SECONDS_PER_MINUTE, SECONDS_PER_HOUR, SECONDS_PER_DAY
@@ -54,9 +54,28 @@ class Human(BaseHuman):
         conf (dict): yaml configuration of the experiment
     """
 
+    # attributes stored in the city's `PopulationTable` (see `covid19sim.utils.population`)
+    ts_death = PopulationMirror()
+    ts_covid19_infection = PopulationMirror()
+    ts_covid19_immunity = PopulationMirror()
+    infectiousness_onset_days = PopulationMirror()
+    infection_timestamp = PopulationMirror()
+    recovered_timestamp = PopulationMirror()
+    is_immune = PopulationMirror()
+    has_app = PopulationColumn("has_app", bool)
+    carefulness = PopulationColumn("carefulness", float)
+    normalized_susceptibility = PopulationColumn("normalized_susceptibility", float)
+    _rec_level = PopulationColumn("rec_level", int)
+
     def __init__(self, env, city, name, age, rng, conf):
         super().__init__(env)
 
+        # Population table of the city, if it keeps one. It needs to be set before any of the attributes above.
+        self._population = getattr(city, "population", None)
+        if self._population is not None:
+            self._population_idx = self._population.register(self)
+            self._population.sync_covid_state(self)
+
         # Utility References
         self.conf = conf  # Simulation-level Configurations
         self.env = env  # Simpy Environment (primarily used for timing / syncronization)
@@ -122,7 +141,7 @@ class Human(BaseHuman):
 
         ### Covid-19 ###
         # Covid-19 properties
-        self.viral_load_plateau_height, self.viral_load_plateau_start, self.viral_load_plateau_end, self.viral_load_peak_start, self.viral_load_peak_height = None, None, None, None, None  # Determines aspects of the piece-wise linear viral load curve for this human
+        # the piece-wise linear viral load curve (viral_load_peak_*, viral_load_plateau_*, *_slope) is stored in `BaseHuman` and set by `compute_covid_properties`
         self.incubation_days = 0  # number of days the virus takes to incubate before the person becomes infectious
         self.recovery_days = None  # number of recovery days post viral load plateau
         self.infectiousness_onset_days = 0  # number of days after exposure that this person becomes infectious
@@ -189,7 +208,7 @@ class Human(BaseHuman):
         self.heuristic_reasons = set() # Defined here so that we remember it's an attribute of human (gets re-initialized daily)
 
         ### Risk prediction ###
-        self.contact_book = ContactBook(tracing_n_days_history=self.conf.get("TRACING_N_DAYS_HISTORY"))  # Used for tracking high-risk contacts (for app-based contact tracing methods)
+        self.contact_book = ContactBook(tracing_n_days_history=self.conf.get("TRACING_N_DAYS_HISTORY"), owner_uid=self.name)  # Used for tracking high-risk contacts (for app-based contact tracing methods)
         self.infectiousness_history_map = dict()  # Stores the (predicted) 14-day history of Covid-19 infectiousness (based on viral load and symptoms)
         self.risk_history_map = dict()  # 14-day risk history (estimated infectiousness) updated inside the human's (current) timeslot
         self.prev_risk_history_map = dict()  # used to check how the risk changed since the last timeslot
@@ -211,6 +230,9 @@ class Human(BaseHuman):
         self.location_leaving_time = self.env.ts_initial + SECONDS_PER_HOUR
         self.location_start_time = self.env.ts_initial
 
+        if self._population is not None:
+            self._population.set_static_attributes(self)
+
     def assign_household(self, location):
         if location is not None:
             self.household = location
@@ -1048,7 +1070,12 @@ class Human(BaseHuman):
             # sample interactions with other humans at this location
             # unknown are the ones that self is not aware of e.g. person sitting next to self in a cafe
             # sleep is an inactive stage so we sample only unknown interactions
-            known_interactions, unknown_interactions = location.sample_interactions(self, unknown_only = type_of_activity == "sleep")
+            unknown_only = type_of_activity == "sleep"
+            if self.conf.get("BATCH_INTERACTION_SAMPLING", False):
+                # interactions of everyone leaving this location right now are sampled together
+                known_interactions, unknown_interactions = yield location.request_interactions(self, unknown_only=unknown_only)
+            else:
+                known_interactions, unknown_interactions = location.sample_interactions(self, unknown_only=unknown_only)
             self.interact_with(known_interactions, type="known")
             self.interact_with(unknown_interactions, type="unknown")
 
@@ -1189,21 +1216,6 @@ class Human(BaseHuman):
         assert len(result) == expected_history_len
         return result[::-1]  # index 0 = latest day
 
-    def fill_infectiousness_history_map(self, current_day):
-        """
-        Populates past infectiousness values in the map.
-
-        Args:
-            current_day (int): day for which it infectiousness value need to be updated.
-        """
-        if (
-            self.conf['RISK_MODEL'] == "transformer"
-            or self.conf['COLLECT_TRAINING_DATA']
-        ):
-            # /!\ Only used for oracle and transformer
-            if current_day not in self.infectiousness_history_map:
-                # contrarily to risk, infectiousness only changes once a day (human behavior has no impact)
-                self.infectiousness_history_map[current_day] = calculate_average_infectiousness(self)
 
     ############################## RISK PREDICTION #################################
     def _exchange_app_messages(self, other_human, distance, duration):
@@ -0,0 +1,514 @@
+"""
+Columnar (zarr) layout of the training datasets written by the data collection server.
+
+The humans of a dataset are split in contiguous ranges (shards) that are written by independent
+writers (see `get_shard_ranges`). The root group only holds the manifest of the shards in its
+attributes (`shards`: list of `path`, `human_start` & `human_stop`), along with the total human &
+day counts, and each shard group holds the samples of its humans. In a shard group, each field of
+the `daily_output` dictionaries built for the risk model (see `_prepare_human` in `server_utils`)
+is stored in its own typed array, indexed by (day, hour, human - human_start):
+
+    is_filled: bool, days x 24 x humans; whether a sample was collected for that index;
+    dataset/<observed|unobserved>/<field>: days x 24 x humans (x field shape) for fixed-shape fields
+        (see `DAILY_OUTPUT_COLUMNS` for the per-field kinds & their `None` sentinels);
+    dataset/<observed|unobserved>/<field>/{values,offsets,lengths}: variable-length fields, where
+        `values` holds the rows of all samples back-to-back, and `offsets`/`lengths` (days x 24 x
+        humans) locate the rows of each sample;
+    dataset/_pickled/{values,offsets,lengths}: pickled samples that do not fit the schema (e.g. the
+        human object copies of the tracker), stored as variable-length bytes.
+
+Chunks hold a single (day, hour) slot, so the writer can buffer one slot at a time and flush it in a
+single write per column, and readers can load a slot without unpickling anything. The current day
+and human id are implied by the sample index, and the risk mapping is stored once in the attributes
+of each shard.
+"""
+
+import bisect
+import pickle
+import typing
+
+import numpy as np
+import zarr
+
+from covid19sim.inference.wire_format import _decode_optional_float, _decode_timestamp, \
+    _encode_optional_float, _encode_timestamp, _none_timestamp
+
+DATASET_FORMAT_VERSION = 2
+
+DAILY_OUTPUT_COLUMNS = (
+    # (group, field name, kind)
+    ("observed", "reported_symptoms", "array"),
+    ("observed", "candidate_encounters", "ragged"),
+    ("observed", "test_results", "array"),
+    ("observed", "preexisting_conditions", "array"),
+    ("observed", "age", "int"),
+    ("observed", "sex", "int"),
+    ("observed", "risk_mapping", "constant"),
+    ("unobserved", "human_id", "human_id"),
+    ("unobserved", "incubation_days", "optional_float"),
+    ("unobserved", "recovery_days", "optional_float"),
+    ("unobserved", "true_symptoms", "array"),
+    ("unobserved", "is_exposed", "bool"),
+    ("unobserved", "exposure_encounter", "ragged"),
+    ("unobserved", "exposure_day", "optional_int"),
+    ("unobserved", "is_recovered", "bool"),
+    ("unobserved", "recovery_day", "optional_int"),
+    ("unobserved", "infectiousness", "ragged"),
+    ("unobserved", "true_preexisting_conditions", "array"),
+    ("unobserved", "true_age", "int"),
+    ("unobserved", "true_sex", "int"),
+    ("unobserved", "viral_load_to_infectiousness_multiplier", "optional_float"),
+    ("unobserved", "infection_timestamp", "timestamp"),
+    ("unobserved", "recovered_timestamp", "timestamp"),
+)
+
+PICKLED_COLUMN = "_pickled"
+SHARD_PATH_PATTERN = "shard-{}"
+
+default_flush_lag_hours = 2
+default_ragged_chunk_rows = 1 << 16
+
+_none_int = np.iinfo(np.int64).min
+_column_kinds = {f"{group}/{name}": kind for group, name, kind in DAILY_OUTPUT_COLUMNS}
+_scalar_kinds = {
+    # kind: (dtype, fill value)
+    "int": (np.int64, 0),
+    "optional_int": (np.int64, _none_int),
+    "optional_float": (np.float64, np.nan),
+    "bool": (bool, False),
+    "timestamp": (np.int64, _none_timestamp),
+}
+
+
+def get_human_id(human_idx: int) -> str:
+    """Returns the real user id of the human at the given index (see `_prepare_human`)."""
+    return f"human:{human_idx}"
+
+
+def get_shard_ranges(human_count: int, n_shards: int) -> typing.List[typing.Tuple[int, int]]:
+    """Splits the human indices in `n_shards` contiguous (start, stop) ranges of (almost) equal sizes."""
+    assert 0 < n_shards <= max(human_count, 1), f"invalid shard count: {n_shards}"
+    bounds = [(human_count * shard_idx) // n_shards for shard_idx in range(n_shards + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def create_dataset(
+        data_output_path: typing.AnyStr,
+        human_count: int,
+        simulation_days: int,
+        n_shards: int = 1,
+        attrs: typing.Optional[typing.Dict] = None,
+):
+    """
+    Creates an empty dataset and its shard manifest (overwriting any existing one at the same path).
+
+    The shards are then filled by independent `DatasetWriter` instances (e.g. one per process).
+
+    Args:
+        data_output_path: the path where the dataset should be created.
+        human_count: the number of humans in the simulation.
+        simulation_days: the number of simulated days.
+        n_shards: the number of shards (i.e. of writers) the humans are split into.
+        attrs: extra attributes to store in the dataset root (e.g. the simulation config).
+    """
+    fd = zarr.open(data_output_path, "w")
+    fd.attrs.update(attrs or {})
+    fd.attrs.update({
+        "format_version": DATASET_FORMAT_VERSION,
+        "human_count": human_count,
+        "simulation_days": simulation_days,
+        "shards": [
+            {"path": SHARD_PATH_PATTERN.format(shard_idx), "human_start": start, "human_stop": stop}
+            for shard_idx, (start, stop) in enumerate(get_shard_ranges(human_count, n_shards))
+        ],
+    })
+
+
+def _encode_scalar(kind: str, value: typing.Any) -> typing.Any:
+    if kind == "int":
+        assert value is not None and int(value) == value
+        return int(value)
+    if kind == "optional_int":
+        assert value is None or int(value) == value
+        return _none_int if value is None else int(value)
+    if kind == "optional_float":
+        return _encode_optional_float(None if value is None else float(value))
+    if kind == "bool":
+        assert value is not None
+        return bool(value)
+    if kind == "timestamp":
+        return _encode_timestamp(value)
+    raise ValueError(f"unknown kind: {kind}")
+
+
+def _decode_scalar(kind: str, value: typing.Any) -> typing.Any:
+    if kind == "int":
+        return int(value)
+    if kind == "optional_int":
+        return None if value == _none_int else int(value)
+    if kind == "optional_float":
+        return _decode_optional_float(value)
+    if kind == "bool":
+        return bool(value)
+    if kind == "timestamp":
+        return _decode_timestamp(value)
+    raise ValueError(f"unknown kind: {kind}")
+
+
+class _SlotBuffer:
+    """Samples of a single (day, hour) slot, buffered column by column until the slot is flushed."""
+
+    def __init__(self, human_count: int):
+        self.is_filled = np.zeros(human_count, dtype=bool)
+        self.columns = {}  # column path --> array of human_count rows
+        self.ragged_columns = {}  # column path --> {human idx: rows}
+        self.pickled = {}  # human idx --> pickled sample
+
+
+class DatasetWriter:
+    """
+    Writes the samples of a shard of humans to a columnar dataset (see the module docstring for the
+    layout); the dataset must have been created with `create_dataset` beforehand.
+
+    Samples can be written in any order: the samples of the most recent (day, hour) slots are
+    buffered, and older slots are flushed once they lag `flush_lag_hours` behind the latest slot.
+    Samples for slots that were already flushed are written directly (one element at a time).
+    """
+
+    def __init__(
+            self,
+            data_output_path: typing.AnyStr,
+            shard_idx: int = 0,
+            flush_lag_hours: int = default_flush_lag_hours,
+    ):
+        """
+        Creates the group of a shard in an existing dataset.
+
+        Args:
+            data_output_path: the path of the dataset created with `create_dataset`.
+            shard_idx: the index of the shard (in the dataset manifest) that will be written.
+            flush_lag_hours: how many hours a slot stays buffered after a more recent one started.
+        """
+        root = zarr.open(data_output_path, "r+")
+        assert root.attrs.get("format_version") == DATASET_FORMAT_VERSION, "unexpected dataset format"
+        shard = root.attrs["shards"][shard_idx]
+        self.shard_idx = shard_idx
+        self.human_start, self.human_stop = shard["human_start"], shard["human_stop"]
+        self.human_count = self.human_stop - self.human_start
+        self.simulation_days = root.attrs["simulation_days"]
+        self.flush_lag_hours = flush_lag_hours
+        self.fd = root.create_group(shard["path"], overwrite=True)
+        self.fd.attrs.update({"human_start": self.human_start, "human_stop": self.human_stop})
+        self.is_filled = self.fd.create_dataset(
+            "is_filled",
+            shape=(self.simulation_days, 24, self.human_count),
+            chunks=(1, 1, max(self.human_count, 1)),
+            dtype=bool,
+            fill_value=False,
+        )
+        self.dataset = self.fd.create_group("dataset")
+        # column path --> (dtype, shape) of the first sample (of its rows, for ragged columns)
+        self.column_specs = {PICKLED_COLUMN: (np.dtype(np.uint8), ())}
+        self.risk_mapping = None
+        self.slot_buffers = {}  # (day, hour) --> _SlotBuffer
+        self.flushed_slots = set()
+        self.latest_slot = None
+        self.total_samples = 0
+
+    def write(self, day_idx: int, hour_idx: int, human_idx: int, sample: typing.Any):
+        """Writes a sample; `daily_output` dictionaries are split into columns, others are pickled."""
+        assert 0 <= day_idx < self.simulation_days and 0 <= hour_idx < 24 and \
+            self.human_start <= human_idx < self.human_stop
+        columns = self._split_columns(day_idx, human_idx, sample)
+        human_idx -= self.human_start  # samples are indexed from the start of the shard from now on
+        slot = (day_idx, hour_idx)
+        if slot in self.flushed_slots:
+            self._write_element(slot, human_idx, sample, columns)
+        else:
+            buffer = self.slot_buffers.get(slot)
+            if buffer is None:
+                buffer = self.slot_buffers[slot] = _SlotBuffer(self.human_count)
+            self._buffer_sample(buffer, human_idx, sample, columns)
+        self.total_samples += 1
+        if self.latest_slot is None or slot > self.latest_slot:
+            self.latest_slot = slot
+            self.flush(self._to_slot_idx(slot) - self.flush_lag_hours)
+
+    def flush(self, max_slot_idx: typing.Optional[int] = None):
+        """Writes the buffered slots (only up to the given day * 24 + hour index, if specified)."""
+        for slot in sorted(self.slot_buffers):
+            if max_slot_idx is not None and self._to_slot_idx(slot) > max_slot_idx:
+                break
+            self._write_slot(slot, self.slot_buffers.pop(slot))
+            self.flushed_slots.add(slot)
+
+    def close(self, **attrs):
+        """Flushes all the buffered slots, and stores the given attributes in the shard's dataset group."""
+        self.flush()
+        self.dataset.attrs.update(attrs)
+        self.dataset.attrs["total_samples"] = self.total_samples
+
+    @staticmethod
+    def _to_slot_idx(slot: typing.Tuple[int, int]) -> int:
+        return slot[0] * 24 + slot[1]
+
+    def _split_columns(self, day_idx, human_idx, sample) -> typing.Optional[typing.Dict]:
+        """Returns the per-column values of a `daily_output` sample, or `None` if it must be pickled."""
+        if not isinstance(sample, dict) or sample.get("current_day") != day_idx or \
+                not all([isinstance(sample.get(group), dict) for group in ("observed", "unobserved")]):
+            return None
+        columns = {}
+        try:
+            for group, name, kind in DAILY_OUTPUT_COLUMNS:
+                value = sample[group][name]
+                path = f"{group}/{name}"
+                if kind == "human_id":
+                    if value != get_human_id(human_idx):
+                        return None
+                elif kind == "constant":
+                    if self.risk_mapping is None:
+                        self.risk_mapping = value
+                        self.fd.attrs["risk_mapping"] = np.asarray(value).tolist()
+                    elif not np.array_equal(self.risk_mapping, value):
+                        return None
+                elif kind in ("array", "ragged"):
+                    value = np.asarray(value)
+                    if kind == "ragged" and not len(value):
+                        columns[path] = None  # fits any row shape
+                        continue
+                    shape = value.shape if kind == "array" else value.shape[1:]
+                    if value.dtype == object or value.ndim == 0 or \
+                            self.column_specs.get(path, (value.dtype, shape)) != (value.dtype, shape):
+                        return None
+                    columns[path] = value
+                else:
+                    columns[path] = _encode_scalar(kind, value)
+        except (AssertionError, KeyError, TypeError, ValueError):
+            return None
+        for path, value in columns.items():
+            if _column_kinds[path] in ("array", "ragged") and value is not None:
+                self.column_specs.setdefault(path, (value.dtype, value.shape[_column_kinds[path] == "ragged":]))
+        return columns
+
+    def _get_column(self, path, kind):
+        """Returns the zarr array(s) of a column, creating them on first use."""
+        if kind == "ragged":
+            if path not in self.dataset:
+                group = self.dataset.create_group(path)
+                for index_name in ("offsets", "lengths"):
+                    group.create_dataset(
+                        index_name,
+                        shape=(self.simulation_days, 24, self.human_count),
+                        chunks=(1, 1, max(self.human_count, 1)),
+                        dtype=np.int64,
+                        fill_value=0,
+                    )
+            group = self.dataset[path]
+            if "values" not in group and path in self.column_specs:
+                # the rows are typed after the first non-empty sample of the column
+                dtype, row_shape = self.column_specs[path]
+                group.create_dataset(
+                    "values",
+                    shape=(0, *row_shape),
+                    chunks=(default_ragged_chunk_rows, *row_shape),
+                    dtype=dtype,
+                )
+            return group.get("values"), group["offsets"], group["lengths"]
+        if path not in self.dataset:
+            if kind == "array":
+                dtype, shape = self.column_specs[path]
+                fill_value = 0
+            else:
+                (dtype, fill_value), shape = _scalar_kinds[kind], ()
+            self.dataset.create_dataset(
+                path,
+                shape=(self.simulation_days, 24, self.human_count, *shape),
+                chunks=(1, 1, max(self.human_count, 1), *shape),
+                dtype=dtype,
+                fill_value=fill_value,
+            )
+        return self.dataset[path]
+
+    def _iter_columns(self, columns):
+        for group, name, kind in DAILY_OUTPUT_COLUMNS:
+            path = f"{group}/{name}"
+            if path in columns:
+                yield path, kind, columns[path]
+
+    def _buffer_sample(self, buffer, human_idx, sample, columns):
+        buffer.is_filled[human_idx] = True
+        if columns is None:
+            buffer.pickled[human_idx] = pickle.dumps(sample)
+            return
+        for path, kind, value in self._iter_columns(columns):
+            if kind == "ragged":
+                buffer.ragged_columns.setdefault(path, {})[human_idx] = value
+                continue
+            if path not in buffer.columns:
+                if kind == "array":
+                    dtype, shape = self.column_specs[path]
+                    fill_value = 0
+                else:
+                    (dtype, fill_value), shape = _scalar_kinds[kind], ()
+                buffer.columns[path] = np.full((self.human_count, *shape), fill_value, dtype=dtype)
+            buffer.columns[path][human_idx] = value
+
+    def _append_ragged(self, path, kind, rows_by_human):
+        """Appends the rows of some humans to a ragged column, and returns their (offsets, lengths)."""
+        values, _, _ = self._get_column(path, kind)
+        human_idxs = sorted(rows_by_human)
+        lengths = np.array([0 if rows_by_human[idx] is None else len(rows_by_human[idx]) for idx in human_idxs])
+        offsets = (0 if values is None else len(values)) + np.cumsum(lengths) - lengths
+        if lengths.sum():
+            values.append(np.concatenate([rows_by_human[idx] for idx, length in zip(human_idxs, lengths) if length]))
+        return human_idxs, offsets, lengths
+
+    def _write_slot(self, slot, buffer):
+        day_idx, hour_idx = slot
+        self.is_filled[day_idx, hour_idx] = buffer.is_filled
+        for path, column in buffer.columns.items():
+            self._get_column(path, _column_kinds[path])[day_idx, hour_idx] = column
+        ragged_columns = dict(buffer.ragged_columns)
+        if buffer.pickled:
+            ragged_columns[PICKLED_COLUMN] = {
+                idx: np.frombuffer(pickled, dtype=np.uint8) for idx, pickled in buffer.pickled.items()
+            }
+        for path, rows_by_human in ragged_columns.items():
+            _, offsets, lengths = self._get_column(path, "ragged")
+            human_idxs, human_offsets, human_lengths = self._append_ragged(path, "ragged", rows_by_human)
+            slot_offsets = np.zeros(self.human_count, dtype=np.int64)
+            slot_lengths = np.zeros(self.human_count, dtype=np.int64)
+            slot_offsets[human_idxs], slot_lengths[human_idxs] = human_offsets, human_lengths
+            offsets[day_idx, hour_idx], lengths[day_idx, hour_idx] = slot_offsets, slot_lengths
+
+    def _write_element(self, slot, human_idx, sample, columns):
+        day_idx, hour_idx = slot
+        self.is_filled[day_idx, hour_idx, human_idx] = True
+        if columns is None:
+            columns = {PICKLED_COLUMN: np.frombuffer(pickle.dumps(sample), dtype=np.uint8)}
+        for path, value in columns.items():
+            kind = _column_kinds.get(path, "ragged")
+            if kind == "ragged":
+                _, offsets, lengths = self._get_column(path, "ragged")
+                _, (offset,), (length,) = self._append_ragged(path, "ragged", {human_idx: value})
+                offsets[day_idx, hour_idx, human_idx], lengths[day_idx, hour_idx, human_idx] = offset, length
+            else:
+                self._get_column(path, kind)[day_idx, hour_idx, human_idx] = value
+
+
+class _ShardReader:
+    """Reads the samples of a single shard of humans (indexed from the start of the shard)."""
+
+    def __init__(self, fd: zarr.hierarchy.Group):
+        self.fd = fd
+        self.human_start, self.human_stop = fd.attrs["human_start"], fd.attrs["human_stop"]
+        self.is_filled = fd["is_filled"]
+        self.dataset = fd["dataset"]
+        self.risk_mapping = fd.attrs.get("risk_mapping")
+
+    def __getitem__(self, index):
+        if len(index) == 3:
+            day_idx, hour_idx, human_idx = index
+            if not self.is_filled[day_idx, hour_idx, human_idx]:
+                return None
+            return self._read_slot(day_idx, hour_idx, np.array([human_idx]))[0]
+        day_idx, hour_idx = index
+        human_idxs = np.flatnonzero(self.is_filled[day_idx, hour_idx])
+        return self._read_slot(day_idx, hour_idx, human_idxs)
+
+    def _read_ragged(self, path, day_idx, hour_idx, human_idxs):
+        if path not in self.dataset:
+            return [None] * len(human_idxs)
+        group = self.dataset[path]
+        offsets = group["offsets"][day_idx, hour_idx][human_idxs]
+        lengths = group["lengths"][day_idx, hour_idx][human_idxs]
+        if not lengths.any():
+            empty = group["values"][:0] if "values" in group else np.zeros(0)
+            return [empty for _ in human_idxs]
+        values = group["values"]
+        # rows of a slot are mostly contiguous, so they are fetched with a single read
+        start, stop = offsets[lengths > 0].min(), (offsets + lengths).max()
+        rows = values[start:stop]
+        return [rows[offset - start:offset - start + length] for offset, length in zip(offsets, lengths)]
+
+    def _read_slot(self, day_idx, hour_idx, human_idxs):
+        if not len(human_idxs):
+            return []
+        pickled = self._read_ragged(PICKLED_COLUMN, day_idx, hour_idx, human_idxs)
+        columns = {}
+        for group, name, kind in DAILY_OUTPUT_COLUMNS:
+            path = f"{group}/{name}"
+            if kind == "ragged":
+                columns[path] = self._read_ragged(path, day_idx, hour_idx, human_idxs)
+            elif kind not in ("constant", "human_id") and path in self.dataset:
+                columns[path] = self.dataset[path][day_idx, hour_idx][human_idxs]
+        samples = []
+        for sample_idx, human_idx in enumerate(human_idxs):
+            if pickled[sample_idx] is not None and len(pickled[sample_idx]):
+                samples.append(pickle.loads(pickled[sample_idx].tobytes()))
+                continue
+            sample = {"current_day": day_idx, "observed": {}, "unobserved": {}}
+            for group, name, kind in DAILY_OUTPUT_COLUMNS:
+                path = f"{group}/{name}"
+                if kind == "constant":
+                    value = self.risk_mapping
+                elif kind == "human_id":
+                    value = get_human_id(self.human_start + int(human_idx))
+                elif kind in ("array", "ragged"):
+                    value = columns[path][sample_idx]
+                else:
+                    value = _decode_scalar(kind, columns[path][sample_idx])
+                sample[group][name] = value
+            samples.append(sample)
+        return samples
+
+
+class DatasetReader:
+    """
+    Reads the samples of a columnar dataset written by `DatasetWriter`(s).
+
+    Indexing the reader with (day, hour) returns the samples of all the humans that were collected
+    in that slot (in human index order, across all shards), and with (day, hour, human) returns a
+    single sample (or `None` if it was never collected).
+    """
+
+    def __init__(self, data_path: typing.AnyStr):
+        self.fd = zarr.open(data_path, "r")
+        assert self.fd.attrs.get("format_version") == DATASET_FORMAT_VERSION, "unexpected dataset format"
+        self.human_count = self.fd.attrs["human_count"]
+        self.simulation_days = self.fd.attrs["simulation_days"]
+        # shards that were never opened by a writer are considered empty
+        self.shards = [_ShardReader(self.fd[shard["path"]])
+                       for shard in self.fd.attrs["shards"] if shard["path"] in self.fd]
+        self.shard_starts = [shard.human_start for shard in self.shards]
+
+    @property
+    def attrs(self):
+        return self.fd.attrs
+
+    @property
+    def total_samples(self) -> int:
+        return sum([shard.dataset.attrs.get("total_samples", 0) for shard in self.shards])
+
+    @property
+    def risk_mapping(self):
+        return next((shard.risk_mapping for shard in self.shards if shard.risk_mapping is not None), None)
+
+    def get_is_filled(self) -> np.ndarray:
+        """Returns whether a sample was collected for each (day, hour, human) index, for all shards."""
+        is_filled = np.zeros((self.simulation_days, 24, self.human_count), dtype=bool)
+        for shard in self.shards:
+            is_filled[:, :, shard.human_start:shard.human_stop] = shard.is_filled[:]
+        return is_filled
+
+    def __getitem__(self, index):
+        if len(index) == 3:
+            day_idx, hour_idx, human_idx = index
+            shard_idx = bisect.bisect_right(self.shard_starts, human_idx) - 1
+            if shard_idx < 0 or human_idx >= self.shards[shard_idx].human_stop:
+                return None
+            return self.shards[shard_idx][day_idx, hour_idx, human_idx - self.shard_starts[shard_idx]]
+        samples = []
+        for shard in self.shards:
+            samples.extend(shard[index])
+        return samples
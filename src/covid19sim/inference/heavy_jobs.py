@@ -2,13 +2,16 @@
 Handles querying the inference server with serialized humans and their messages.
 """
 
+import collections
+import concurrent.futures
 import datetime
 import os
 import functools
 import typing
 from joblib import Parallel, delayed
 
-from covid19sim.inference.server_utils import InferenceClient, InferenceEngineWrapper, proc_human_batch
+from covid19sim.inference.server_utils import InferenceEngineWrapper, UnknownConfigError, default_shard_count, \
+    get_cluster_mgr_hash, get_shard_idx, inference_client_pool, proc_human_batch
 from covid19sim.inference.clustering.base import ClusterManagerBase
 from covid19sim.inference.human_as_message import make_human_as_message
 if typing.TYPE_CHECKING:
@@ -20,12 +23,35 @@ class DummyMemManager:
     """Dummy memory manager used when running in a single process."""
 
     global_cluster_map: typing.Dict[str, ClusterManagerBase] = {}
+    global_config_map: typing.Dict[int, typing.Dict] = {}
     global_inference_engine: InferenceEngineWrapper = None
+    global_heavy_jobs_executor: typing.Optional[concurrent.futures.ThreadPoolExecutor] = None
+    global_heavy_jobs_executor_pid: typing.Optional[int] = None
+    registered_config_keys: typing.Set[typing.Tuple[typing.Optional[str], int]] = set()
 
     @classmethod
     def get_cluster_mgr_map(cls) -> typing.Dict[str, ClusterManagerBase]:
         return cls.global_cluster_map
 
+    @classmethod
+    def get_config_map(cls) -> typing.Dict[int, typing.Dict]:
+        return cls.global_config_map
+
+    @classmethod
+    def register_config(cls, city_hash, start, conf, server_address=None, force=False):
+        """
+        Registers the simulation config of a city, once, locally or on the inference server. With `force`, the
+        config is registered on the server again (e.g. after it restarted and forgot it).
+        """
+        if conf.get('USE_INFERENCE_SERVER'):
+            if force or (server_address, city_hash) not in cls.registered_config_keys:
+                cls.registered_config_keys.discard((server_address, city_hash))
+                with inference_client_pool.client(server_address) as client:
+                    client.register_config(city_hash, start, conf)
+                cls.registered_config_keys.add((server_address, city_hash))
+        else:
+            cls.global_config_map[city_hash] = {"start": start, "conf": conf}
+
     @classmethod
     def get_engine(cls, conf) -> InferenceEngineWrapper:
         if (
@@ -36,6 +62,66 @@ class DummyMemManager:
             cls.global_inference_engine = InferenceEngineWrapper(conf.get('TRANSFORMER_EXP_PATH'))
         return cls.global_inference_engine
 
+    @classmethod
+    def get_heavy_jobs_executor(cls) -> concurrent.futures.ThreadPoolExecutor:
+        # a single thread, so that the heavy jobs of two timeslots never run out of order; forked
+        # processes (e.g. intervention scenarios) do not inherit the thread, and need their own
+        if cls.global_heavy_jobs_executor is None or cls.global_heavy_jobs_executor_pid != os.getpid():
+            cls.global_heavy_jobs_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="heavy_jobs",
+            )
+            cls.global_heavy_jobs_executor_pid = os.getpid()
+        return cls.global_heavy_jobs_executor
+
+    @classmethod
+    def reset(cls):
+        """
+        Forgets the clusters and configs of the simulations run so far by this process, before it runs other ones
+        (see `covid19sim.batch`). The inference engine and the heavy jobs executor are kept for the next simulations.
+        """
+        cls.global_cluster_map = {}
+        cls.global_config_map = {}
+        cls.registered_config_keys = set()
+
+
+class PendingHeavyJobs:
+    """Handle on the heavy jobs of a timeslot, which may still be running in the background."""
+
+    def __init__(
+            self,
+            hd: typing.Dict[str, "Human"],
+            current_day_idx: int,
+            conf: typing.Dict,
+            results: typing.Union[concurrent.futures.Future, typing.List[typing.Tuple]],
+    ):
+        self.hd = hd
+        self.current_day_idx = current_day_idx
+        self.conf = conf
+        self.results = results
+
+    def done(self) -> bool:
+        """Returns whether the results are ready (i.e. whether `join` would not block)."""
+        return not isinstance(self.results, concurrent.futures.Future) or self.results.done()
+
+    def wait(self):
+        """Waits for the results of the heavy jobs, without applying them (see `join`)."""
+        if isinstance(self.results, concurrent.futures.Future):
+            concurrent.futures.wait([self.results])
+
+    def join(self):
+        """Waits for the results of the heavy jobs, and applies the risk updates to the humans."""
+        results = self.results
+        if isinstance(results, concurrent.futures.Future):
+            results = results.result()
+        for name, risk_history in results:
+            human = self.hd[name]
+            if self.conf.get('RISK_MODEL') == "transformer":
+                if risk_history is not None:
+                    human.apply_transformer_risk_updates(
+                        current_day_idx=self.current_day_idx,
+                        risk_history=risk_history,
+                    )
+
 
 def batch_run_timeslot_heavy_jobs(
         humans: typing.Iterable["Human"],
@@ -51,6 +137,8 @@ def batch_run_timeslot_heavy_jobs(
 
     The heavy stuff here is the clustering and risk level inference using a 3rd party model.
     These steps can be delegated to a remote server if the simulator is configured that way.
+    This function blocks until the risk updates are applied; see `submit_timeslot_heavy_jobs`
+    for the non-blocking version.
 
     Args:
         humans: the list of all humans in the zone.
@@ -64,7 +152,52 @@ def batch_run_timeslot_heavy_jobs(
         city_hash: a hash used to tag this city's humans on an inference server that may be used by
             multiple cities in parallel. Bad mojo will happen if two cities have the same hash...
     Returns:
-        A tuple consisting of the updated humans & of the newly generated update messages to register.
+        The updated humans.
+    """
+    submit_timeslot_heavy_jobs(
+        humans=humans,
+        init_timestamp=init_timestamp,
+        current_timestamp=current_timestamp,
+        global_mailbox=global_mailbox,
+        time_slot=time_slot,
+        conf=conf,
+        city_hash=city_hash,
+        run_in_background=False,
+    ).join()
+    return humans
+
+
+def submit_timeslot_heavy_jobs(
+        humans: typing.Iterable["Human"],
+        init_timestamp: datetime.datetime,
+        current_timestamp: datetime.datetime,
+        global_mailbox: "SimulatorMailboxType",
+        time_slot: int,
+        conf: typing.Dict,
+        city_hash: int = 0,
+        run_in_background: bool = True,
+) -> PendingHeavyJobs:
+    """
+    Submits the 'heavy' processes of a timeslot, and returns a handle to join them later.
+
+    The humans are serialized right away (so their state can keep changing afterwards), but the
+    clustering and risk level inference run in a background thread, overlapping with whatever the
+    simulation does until `PendingHeavyJobs.join` is called to apply the risk updates.
+
+    Args:
+        humans: the list of all humans in the zone.
+        init_timestamp: initialization timestamp of the simulation.
+        current_timestamp: the current timestamp of the simulation.
+        global_mailbox: the global mailbox dictionary used to fetch already-existing updates from.
+            Note that messages can be removed from this mailbox in this function, but not added, as
+            that is delegated to the caller (see the return values).
+        time_slot: the current timeslot of the day (i.e. an integer that corresponds to the hour).
+        conf: YAML configuration dictionary with all relevant settings for the simulation.
+        city_hash: a hash used to tag this city's humans on an inference server that may be used by
+            multiple cities in parallel. Bad mojo will happen if two cities have the same hash...
+        run_in_background: toggles whether to run the jobs in a background thread or right away.
+    Returns:
+        The handle on the (pending) heavy jobs.
     """
     current_day_idx = (current_timestamp - init_timestamp).days
     assert current_day_idx >= 0
@@ -80,8 +213,8 @@ def batch_run_timeslot_heavy_jobs(
         ):
             continue
 
+        # note: the simulation config (start time + conf) is registered once per city instead
         all_params.append({
-            "start": init_timestamp,
             "current_day": current_day_idx,
             "human": make_human_as_message(
                 human=human,
@@ -89,45 +222,68 @@ def batch_run_timeslot_heavy_jobs(
                 conf=conf
             ),
             "time_slot": time_slot,
-            "conf": conf,
             "city_hash": city_hash,
         })
 
+    inference_frontend_address = conf.get('INFERENCE_SERVER_ADDRESS', None)
+    DummyMemManager.register_config(city_hash, init_timestamp, conf, server_address=inference_frontend_address)
+
+    if run_in_background:
+        results = DummyMemManager.get_heavy_jobs_executor().submit(
+            _run_heavy_jobs, all_params, init_timestamp, conf, city_hash, inference_frontend_address,
+        )
+    else:
+        results = _run_heavy_jobs(all_params, init_timestamp, conf, city_hash, inference_frontend_address)
+    return PendingHeavyJobs(hd=hd, current_day_idx=current_day_idx, conf=conf, results=results)
+
+
+def _run_heavy_jobs(
+        all_params: typing.List[typing.Dict],
+        init_timestamp: datetime.datetime,
+        conf: typing.Dict,
+        city_hash: int,
+        inference_frontend_address: typing.Optional[str],
+) -> typing.List[typing.Tuple]:
+    """Runs the clustering + inference for serialized humans, locally or on the inference server."""
     if conf.get('USE_INFERENCE_SERVER'):
-        batch_start_offset = 0
         batch_size = conf.get('INFERENCE_REQ_BATCH_SIZE', 100)
+        n_shards = conf.get('INFERENCE_REQ_SHARDS', default_shard_count)
+        # requests only contain humans of a single shard so that the server can route them to the
+        # worker that already holds their clustering state
+        sharded_params = collections.defaultdict(list)
+        for params in all_params:
+            cluster_mgr_hash = get_cluster_mgr_hash(city_hash, params["human"].name)
+            sharded_params[get_shard_idx(cluster_mgr_hash, n_shards)].append(params)
         batched_params = []
-        while batch_start_offset < len(all_params):
-            batch_end_offset = min(batch_start_offset + batch_size, len(all_params))
-            batched_params.append(all_params[batch_start_offset:batch_end_offset])
-            batch_start_offset += batch_size
+        for shard_idx, shard_params in sorted(sharded_params.items()):
+            for batch_start_offset in range(0, len(shard_params), batch_size):
+                batched_params.append((shard_idx, shard_params[batch_start_offset:batch_start_offset + batch_size]))
         parallel_reqs = conf.get('INFERENCE_REQ_PARALLEL_JOBS', 16)
         parallel_reqs = max(min(parallel_reqs, len(batched_params)), 1)
 
-        def query_inference_server(params, **inf_client_kwargs):
-            # lambda used to create one socket per request (so we can request in parallel)
-            client = InferenceClient(**inf_client_kwargs)
-            return client.infer(params)
+        def query_inference_server(shard_idx, params, server_address):
+            # each parallel request checks out its own (pooled, already connected) socket
+            try:
+                with inference_client_pool.client(server_address) as client:
+                    return client.infer(params, shard_idx=shard_idx, n_shards=n_shards)
+            except UnknownConfigError:
+                # the server restarted since the config of the city was registered: register it again
+                DummyMemManager.register_config(city_hash, init_timestamp, conf, server_address, force=True)
+                with inference_client_pool.client(server_address) as client:
+                    return client.infer(params, shard_idx=shard_idx, n_shards=n_shards)
 
-        inference_frontend_address = conf.get('INFERENCE_SERVER_ADDRESS', None)
         query_func = functools.partial(query_inference_server, server_address=inference_frontend_address)
 
         with Parallel(n_jobs=parallel_reqs, prefer="threads") as parallel:
-            batched_results = parallel((delayed(query_func)(params) for params in batched_params))
+            batched_results = parallel((
+                delayed(query_func)(shard_idx, params) for shard_idx, params in batched_params
+            ))
         results = []
         for b in batched_results:
             results.extend(b)
     else:
         cluster_mgr_map = DummyMemManager.get_cluster_mgr_map()
         engine = DummyMemManager.get_engine(conf)
-        results = proc_human_batch(all_params, engine, cluster_mgr_map)
-
-    for name, risk_history in results:
-        human = hd[name]
-        if conf.get('RISK_MODEL') == "transformer":
-            if risk_history is not None:
-                human.apply_transformer_risk_updates(
-                    current_day_idx=current_day_idx,
-                    risk_history=risk_history,
-                )
-    return humans
+        config_map = DummyMemManager.get_config_map()
+        results = proc_human_batch(all_params, engine, cluster_mgr_map, config_map)
+    return results
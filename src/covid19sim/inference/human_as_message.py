@@ -53,13 +53,8 @@ def make_human_as_message(
     rolling_all_symptoms = symptoms_to_np(human.rolling_all_symptoms, conf)
     rolling_all_reported_symptoms = symptoms_to_np(human.rolling_all_reported_symptoms, conf)
 
-    # TODO: we could index the global mailbox by day, it might be faster that way
-    target_mailbox_keys = [key for keys in human.contact_book.mailbox_keys_by_day.values() for key in keys]
-    update_messages = []
-    for key in target_mailbox_keys:
-        if key in personal_mailbox:
-            assert isinstance(personal_mailbox[key], list)
-            update_messages.extend(personal_mailbox.pop(key))
+    # the mailbox is indexed by encounter day, so we pop the days that are still in the contact book
+    update_messages = personal_mailbox.pop_messages(human.contact_book.encounter_day_idxs)
 
     return HumanAsMessage(
         name=human.name,
@@ -6,6 +6,7 @@ import typing
 import numpy as np
 
 from covid19sim.utils.constants import POSITIVE_TEST_RESULT, NEGATIVE_TEST_RESULT
+from covid19sim.utils.utils import _proba_to_risk
 if typing.TYPE_CHECKING:
     from covid19sim.human import Human
     from covid19sim.interventions.tracing import BaseMethod
@@ -147,7 +148,7 @@ def exchange_encounter_messages(
         env_timestamp: datetime.datetime,
         initial_timestamp: datetime.datetime,
         use_gaen_key: bool = False,
-) -> typing.Tuple[EncounterMessage, EncounterMessage]:
+) -> typing.Tuple["EncounterHandle", "EncounterHandle"]:
     """Creates & exchanges encounter messages between two humans.
 
     This function is written as part of the GAEN refactoring. This means that the only data that
@@ -158,26 +159,30 @@ def exchange_encounter_messages(
     In reality, the mailbox key would be updated every 15 minutes by each user, but here, for
     simplicity, we just create a new key for every encounter inside this function.
 
-    Returns both newly created encounter messages, which contain the mailbox keys as uids. The
-    contact books of both users will be updated by this function.
+    Returns handles to both newly stored encounters (see `EncounterHandle`), whose uids are the
+    mailbox keys. The contact books of both users will be updated by this function.
     """
-    h1_msg = generate_encounter_message(h1, h2, env_timestamp, use_gaen_key=use_gaen_key)
-    h2_msg = generate_encounter_message(h2, h1, env_timestamp, use_gaen_key=use_gaen_key)
-    # the encounter messages above are essentially reminders that we need to update that contact
+    # the encounters are essentially reminders that we need to update that contact
     curr_day_idx = (env_timestamp - initial_timestamp).days
     assert 0 <= curr_day_idx
-    if curr_day_idx not in h1.contact_book.encounters_by_day:
-        assert curr_day_idx not in h1.contact_book.mailbox_keys_by_day
-        h1.contact_book.encounters_by_day[curr_day_idx] = []
-        h1.contact_book.mailbox_keys_by_day[curr_day_idx] = []
-    h1.contact_book.encounters_by_day[curr_day_idx].append(h1_msg)
-    h1.contact_book.mailbox_keys_by_day[curr_day_idx].append(h2_msg.uid)  # message uid == mailbox key
-    if curr_day_idx not in h2.contact_book.encounters_by_day:
-        assert curr_day_idx not in h2.contact_book.mailbox_keys_by_day
-        h2.contact_book.encounters_by_day[curr_day_idx] = []
-        h2.contact_book.mailbox_keys_by_day[curr_day_idx] = []
-    h2.contact_book.encounters_by_day[curr_day_idx].append(h2_msg)
-    h2.contact_book.mailbox_keys_by_day[curr_day_idx].append(h1_msg.uid)  # message uid == mailbox key
+    h1_uid = create_new_uid() if use_gaen_key else None
+    h2_uid = create_new_uid() if use_gaen_key else None
+    h1_msg = h1.contact_book.add_encounter(
+        day_idx=curr_day_idx,
+        real_encounter_time=env_timestamp,
+        initial_timestamp=initial_timestamp,
+        uid=h1_uid,
+        mailbox_key=h2_uid,  # message uid == mailbox key
+        receiver_uid=h2.name,
+    )
+    h2_msg = h2.contact_book.add_encounter(
+        day_idx=curr_day_idx,
+        real_encounter_time=env_timestamp,
+        initial_timestamp=initial_timestamp,
+        uid=h2_uid,
+        mailbox_key=h1_uid,  # message uid == mailbox key
+        receiver_uid=h1.name,
+    )
     return h1_msg, h2_msg
 
 
@@ -322,6 +327,96 @@ def combine_update_messages(
     )
 
 
+ENCOUNTER_DTYPE = np.dtype([
+    ("uid_hi", np.uint64),  # upper 64 bits of the uid of the stored (sent) encounter message
+    ("uid_lo", np.uint64),  # lower 64 bits of the uid of the stored (sent) encounter message
+    ("key_hi", np.uint64),  # upper 64 bits of the mailbox key (uid of the received encounter message)
+    ("key_lo", np.uint64),  # lower 64 bits of the mailbox key (uid of the received encounter message)
+    ("has_uid", np.bool_),  # False if no GAEN keys are used (uid and mailbox key are then `None`)
+    ("risk_level", np.int8),  # -1 until the initial update carrying the risk level is sent
+    ("real_encounter_offset", np.float64),  # seconds between the initial and the real encounter timestamps
+    ("receiver", np.int32),  # index of the receiver in `ContactBook.contact_uids`
+    ("exposition", np.bool_),  # whether this encounter corresponds to an exposition event for the receiver
+    ("update_count", np.uint16),  # number of update messages applied to this encounter
+])
+"""Layout of the encounters stored in `ContactBook`, one row per 15-minute exchange."""
+
+_uid_lo_mask = (1 << 64) - 1
+
+
+def _split_uid(uid: typing.Optional[UIDType]) -> typing.Tuple[int, int]:
+    """Splits a (up to) 128-bit uid in two 64-bit halves; `None` is stored as zeros."""
+    if uid is None:
+        return 0, 0
+    assert 0 <= uid <= message_uid_mask
+    return uid >> 64, uid & _uid_lo_mask
+
+
+def _join_uid(hi: np.uint64, lo: np.uint64, has_uid: bool) -> typing.Optional[UIDType]:
+    """Rebuilds the python-int uid from its two 64-bit halves."""
+    if not has_uid:
+        return None
+    return UIDType((int(hi) << 64) | int(lo))
+
+
+class EncounterDayBuffer:
+    """
+    Growable structured array (see `ENCOUNTER_DTYPE`) holding the encounters of one day.
+
+    Args:
+        capacity: number of rows to preallocate. The buffer doubles in size when full.
+    """
+
+    def __init__(self, capacity: int = 16):
+        self.data = np.zeros(capacity, dtype=ENCOUNTER_DTYPE)
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def append(self) -> int:
+        """Allocates a new (zeroed) row and returns its index."""
+        if self.n == len(self.data):
+            data = np.zeros(2 * len(self.data), dtype=ENCOUNTER_DTYPE)
+            data[:self.n] = self.data
+            self.data = data
+        self.n += 1
+        return self.n - 1
+
+    @property
+    def rows(self) -> np.ndarray:
+        """View over the rows that are in use."""
+        return self.data[:self.n]
+
+
+class EncounterHandle:
+    """
+    Reference to an encounter stored in a `ContactBook`.
+
+    It exposes the unobserved `_exposition_event` flag of the encounter so that it can be set when
+    the encounter leads to an infection (see `Human.check_covid_contagion`).
+    """
+
+    __slots__ = ("contact_book", "day_idx", "row")
+
+    def __init__(self, contact_book: "ContactBook", day_idx: int, row: int):
+        self.contact_book = contact_book
+        self.day_idx = day_idx
+        self.row = row
+
+    @property
+    def _exposition_event(self) -> bool:
+        return bool(self.contact_book._days[self.day_idx].data["exposition"][self.row])
+
+    @_exposition_event.setter
+    def _exposition_event(self, value: bool):
+        self.contact_book._days[self.day_idx].data["exposition"][self.row] = bool(value)
+
+    def to_message(self) -> EncounterMessage:
+        """Returns the encounter as an `EncounterMessage` object."""
+        return self.contact_book._get_encounter_message(self.day_idx, self.row)
+
+
 class ContactBook:
     """
     Contact book used to store all past encounters & provide a simple interface to query information
@@ -330,26 +425,123 @@ class ContactBook:
     Each human owns a contact book. This contact book can be used (for simulation tracing only!) to
     gather statistics on the Nth-order contacts of its owner. By default, it will simply provide a
     way to know who to inform when update messages must be generated.
+
+    Encounters are stored as one structured NumPy array per day (see `ENCOUNTER_DTYPE`) instead of
+    `EncounterMessage` objects; `encounters_by_day` and `mailbox_keys_by_day` rebuild the objects on
+    demand. Days older than the tracing history are dropped as a whole by `cleanup_contacts`.
     """
 
     def __init__(
             self,
             tracing_n_days_history: int,
+            owner_uid: typing.Optional[RealUserIDType] = None,
     ):
         """
         Initializes the contact book.
 
         Args:
             tracing_n_days_history: length of the contact history to keep in this object.
+            owner_uid: real unique identifier of the human who owns this contact book (i.e. the
+                sender of all the encounter messages stored here).
         """
         self.tracing_n_days_history = tracing_n_days_history
-        # the encounters we keep here are the messages we sent, not the ones we received
-        self.encounters_by_day: typing.Dict[int, typing.List[EncounterMessage]] = {}
-        # the mailbox keys are used to fetch update messages and provide them to the clustering algo
-        self.mailbox_keys_by_day: typing.Dict[int, typing.List[UIDType]] = {}
+        self.owner_uid = owner_uid
+        # the encounters we keep here are the messages we sent, not the ones we received; each
+        # row also holds the mailbox key used to fetch update messages for the clustering algo
+        self._days: typing.Dict[int, EncounterDayBuffer] = {}
+        # real unique identifiers of the receivers, indexed by the `receiver` column
+        self.contact_uids: typing.List[RealUserIDType] = []
+        self._contact_idx: typing.Dict[RealUserIDType, int] = {}
+        self._initial_timestamp: typing.Optional[TimestampType] = None
         self.latest_update_time = datetime.datetime.min
         self._is_being_traced = False  # used for internal tracing only
 
+    def add_encounter(
+            self,
+            day_idx: int,
+            real_encounter_time: TimestampType,
+            initial_timestamp: TimestampType,
+            uid: typing.Optional[UIDType],
+            mailbox_key: typing.Optional[UIDType],
+            receiver_uid: RealUserIDType,
+    ) -> EncounterHandle:
+        """Stores a new encounter (without risk level) and returns a handle to it.
+
+        Args:
+            day_idx: index of the day of the encounter inside the simulation.
+            real_encounter_time: real timestamp of the encounter.
+            initial_timestamp: initialization timestamp of the simulation.
+            uid: unique identifier of the encounter message sent to the receiver.
+            mailbox_key: unique identifier of the encounter message received from the receiver.
+            receiver_uid: real unique identifier of the encountered human.
+
+        Returns:
+            A handle to the stored encounter.
+        """
+        assert (uid is None) == (mailbox_key is None), "either both or none of the humans use GAEN keys"
+        if self._initial_timestamp is None:
+            self._initial_timestamp = initial_timestamp
+        assert self._initial_timestamp == initial_timestamp
+        if receiver_uid not in self._contact_idx:
+            self._contact_idx[receiver_uid] = len(self.contact_uids)
+            self.contact_uids.append(receiver_uid)
+        if day_idx not in self._days:
+            self._days[day_idx] = EncounterDayBuffer()
+        day = self._days[day_idx]
+        row = day.append()
+        day.data[row] = (
+            *_split_uid(uid),
+            *_split_uid(mailbox_key),
+            uid is not None,
+            -1,
+            (real_encounter_time - initial_timestamp).total_seconds(),
+            self._contact_idx[receiver_uid],
+            False,
+            0,
+        )
+        return EncounterHandle(self, day_idx, row)
+
+    def _get_encounter_message(self, day_idx: int, row: int) -> EncounterMessage:
+        """Rebuilds the `EncounterMessage` object of a stored encounter."""
+        encounter = self._days[day_idx].data[row]
+        real_encounter_time = self._initial_timestamp + \
+            datetime.timedelta(seconds=float(encounter["real_encounter_offset"]))
+        return EncounterMessage(
+            uid=_join_uid(encounter["uid_hi"], encounter["uid_lo"], encounter["has_uid"]),
+            risk_level=int(encounter["risk_level"]) if encounter["risk_level"] >= 0 else None,
+            encounter_time=datetime.datetime.combine(real_encounter_time.date(), datetime.datetime.min.time()),
+            _sender_uid=self.owner_uid,
+            _receiver_uid=self.contact_uids[encounter["receiver"]],
+            _real_encounter_time=real_encounter_time,
+            _exposition_event=True if encounter["exposition"] else None,
+            _applied_update_count=int(encounter["update_count"]) if encounter["update_count"] else None,
+        )
+
+    @property
+    def encounters_by_day(self) -> typing.Dict[int, typing.List[EncounterMessage]]:
+        """Stored encounters as `EncounterMessage` objects, by day index (rebuilt at every call)."""
+        return {
+            day_idx: [self._get_encounter_message(day_idx, row) for row in range(len(day))]
+            for day_idx, day in self._days.items()
+        }
+
+    @property
+    def mailbox_keys_by_day(self) -> typing.Dict[int, typing.List[UIDType]]:
+        """Mailbox keys of the stored encounters, by day index (rebuilt at every call)."""
+        return {
+            day_idx: [_join_uid(e["key_hi"], e["key_lo"], e["has_uid"]) for e in day.rows]
+            for day_idx, day in self._days.items()
+        }
+
+    @property
+    def encounter_day_idxs(self) -> typing.List[int]:
+        """Day indices of the stored encounters, oldest day first."""
+        return [day_idx for day_idx, day in self._days.items() if len(day)]
+
+    def get_mailbox_keys(self) -> typing.List[UIDType]:
+        """Returns the mailbox keys of all stored encounters, oldest day first."""
+        return [key for keys in self.mailbox_keys_by_day.values() for key in keys]
+
     def get_contacts(
             self,
             humans_map: typing.Dict[str, "Human"],
@@ -363,20 +555,25 @@ class ContactBook:
         #        this is an approximation of what would really happen however, since we would need
         #        to check whether we have actually received an update from that contact
         output = {}
-        real_human_encounter_times = collections.defaultdict(set)
-        for day, msgs in self.encounters_by_day.items():
-            for msg in msgs:
-                if make_sure_15min_minimum_between_contacts:
-                    real_human_encounter_times[msg._receiver_uid].add(msg._real_encounter_time)
-                if msg._receiver_uid not in output and \
-                        (not only_with_initial_update or msg.risk_level is not None):
-                    output[msg._receiver_uid] = humans_map[msg._receiver_uid]
+        real_human_encounter_offsets = collections.defaultdict(set)
+        for day_idx, day in self._days.items():
+            encounters = day.rows
+            if only_with_initial_update:
+                encounters = encounters[encounters["risk_level"] >= 0]
+            # receivers in order of first encounter
+            receivers = encounters["receiver"]
+            _, first_rows = np.unique(receivers, return_index=True)
+            for receiver in receivers[np.sort(first_rows)]:
+                receiver_uid = self.contact_uids[receiver]
+                if receiver_uid not in output:
+                    output[receiver_uid] = humans_map[receiver_uid]
+            if make_sure_15min_minimum_between_contacts:
+                for encounter in day.rows:
+                    real_human_encounter_offsets[encounter["receiver"]].add(float(encounter["real_encounter_offset"]))
         if make_sure_15min_minimum_between_contacts:
-            for human_name, encounter_times in real_human_encounter_times.items():
-                encounter_times = sorted(list(encounter_times))
-                for encounter_time_idx in range(1, len(encounter_times)):
-                    assert (encounter_times[encounter_time_idx] -
-                            encounter_times[encounter_time_idx - 1]) >= datetime.timedelta(minutes=15)
+            for receiver, encounter_offsets in real_human_encounter_offsets.items():
+                encounter_offsets = np.sort(np.array(list(encounter_offsets)))
+                assert (np.diff(encounter_offsets) >= datetime.timedelta(minutes=15).total_seconds()).all()
         return list(output.values())
 
     def get_positive_contacts_counts(
@@ -442,7 +639,7 @@ class ContactBook:
         for day_idx in set(prev_risk_history_map.keys()) & set(curr_risk_history_map.keys()):
             old_risk_level = min(proba_to_risk_level_map(prev_risk_history_map[day_idx]), 15)
             curr_risk_level = min(proba_to_risk_level_map(curr_risk_history_map[day_idx]), 15)
-            n_encs_for_day = len(self.encounters_by_day.get(day_idx, []))
+            n_encs_for_day = len(self._days[day_idx]) if day_idx in self._days else 0
             change += abs(curr_risk_level - old_risk_level) * n_encs_for_day
         return change  # Danger potential PII => fewer bits
 
@@ -453,14 +650,26 @@ class ContactBook:
     ):
         """Removes all sent/received encounter messages older than TRACING_N_DAYS_HISTORY."""
         current_day_idx = (current_timestamp - init_timestamp).days
-        self.encounters_by_day = {
-            day: msgs for day, msgs in self.encounters_by_day.items()
-            if day >= current_day_idx - self.tracing_n_days_history
-        }
-        self.mailbox_keys_by_day = {
-            day: keys for day, keys in self.mailbox_keys_by_day.items()
-            if day >= current_day_idx - self.tracing_n_days_history
-        }
+        for day_idx in [day_idx for day_idx in self._days if day_idx < current_day_idx - self.tracing_n_days_history]:
+            del self._days[day_idx]
+
+    def _create_update_messages(
+            self,
+            day_idx: int,
+            rows: np.ndarray,
+            new_risk_level: int,
+            current_timestamp: datetime.datetime,
+            update_reason: str,
+    ) -> typing.List[UpdateMessage]:
+        """Creates the update messages carrying `new_risk_level` for the given encounters (rows) of a day."""
+        return [
+            create_update_message(
+                encounter_message=self._get_encounter_message(day_idx, row),
+                new_risk_level=RiskLevelType(new_risk_level),
+                current_time=current_timestamp,
+                update_reason=update_reason,
+            ) for row in rows
+        ]
 
     def generate_initial_updates(
             self,
@@ -490,23 +699,21 @@ class ContactBook:
         if intervention is None:
             return update_messages  # no need to generate update messages until tracing is enabled
         assert current_day_idx >= 0
-        for encounter_day_idx, encounter_messages in self.encounters_by_day.items():
-            for encounter_message in encounter_messages:
-                if encounter_message.risk_level is None:  # we never sent the first update w/ the risk level
-                    assert 0 <= encounter_day_idx <= current_day_idx, \
-                        "can't have encounters before init or after today...?"
-                    assert encounter_day_idx in risk_history_map, \
-                        "how could we have an encounter without a risk at that point? use default?"
-                    encounter_message.risk_level = \
-                        min(proba_to_risk_level_map(risk_history_map[encounter_day_idx]), 15)
-                    update_messages.append(
-                        create_update_message(
-                            encounter_message=encounter_message,
-                            new_risk_level=RiskLevelType(encounter_message.risk_level),
-                            current_time=current_timestamp,
-                            update_reason="contact",
-                        )
-                    )
+        for encounter_day_idx, day in self._days.items():
+            encounters = day.rows
+            # we never sent the first update w/ the risk level for these
+            rows = np.flatnonzero(encounters["risk_level"] < 0)
+            if not len(rows):
+                continue
+            assert 0 <= encounter_day_idx <= current_day_idx, \
+                "can't have encounters before init or after today...?"
+            assert encounter_day_idx in risk_history_map, \
+                "how could we have an encounter without a risk at that point? use default?"
+            risk_level = min(proba_to_risk_level_map(risk_history_map[encounter_day_idx]), 15)
+            encounters["risk_level"][rows] = risk_level
+            update_messages.extend(self._create_update_messages(
+                encounter_day_idx, rows, risk_level, current_timestamp, update_reason="contact",
+            ))
         return update_messages
 
     def generate_updates(
@@ -541,7 +748,7 @@ class ContactBook:
         if intervention is None:
             return update_messages  # no need to generate update messages until tracing is enabled
         assert current_day_idx >= 0
-        for encounter_day_idx, encounter_messages in self.encounters_by_day.items():
+        for encounter_day_idx, day in self._days.items():
             assert current_day_idx - encounter_day_idx <= self.tracing_n_days_history, \
                 "contact book should have been cleaned up before calling update method...?"
             if encounter_day_idx not in prev_risk_history_map.keys():
@@ -550,28 +757,275 @@ class ContactBook:
             old_risk_level = min(proba_to_risk_level_map(prev_risk_history_map[encounter_day_idx]), 15)
             new_risk_level = min(proba_to_risk_level_map(curr_risk_history_map[encounter_day_idx]), 15)
             if old_risk_level != new_risk_level:
-                for encounter_idx, encounter_message in enumerate(encounter_messages):
-                    assert encounter_message.risk_level is not None, \
-                        "should have already initialized all encounters before updating...?"
-                    assert encounter_message.risk_level == old_risk_level or \
-                        encounter_message.risk_level == new_risk_level, \
-                        "encounter message risk mismatch (should have old level if already initialized " \
-                        "or new level if it was initialized just now, but nothing else)"
-                    if encounter_message.risk_level != new_risk_level:
-                        update_messages.append(
-                            create_update_message(
-                                encounter_message=encounter_message,
-                                new_risk_level=RiskLevelType(new_risk_level),
-                                current_time=current_timestamp,
-                                update_reason=update_reason,
-                            )
-                        )
-                        encounter_messages[encounter_idx] = create_updated_encounter_with_message(
-                            encounter_message, update_messages[-1],  # to keep track of applied updates internally...
-                        )
+                encounters = day.rows
+                risk_levels = encounters["risk_level"]
+                assert (risk_levels >= 0).all(), \
+                    "should have already initialized all encounters before updating...?"
+                assert ((risk_levels == old_risk_level) | (risk_levels == new_risk_level)).all(), \
+                    "encounter message risk mismatch (should have old level if already initialized " \
+                    "or new level if it was initialized just now, but nothing else)"
+                rows = np.flatnonzero(risk_levels != new_risk_level)
+                if not len(rows):
+                    continue
+                update_messages.extend(self._create_update_messages(
+                    encounter_day_idx, rows, new_risk_level, current_timestamp, update_reason=update_reason,
+                ))
+                # keep track of applied updates internally...
+                encounters["risk_level"][rows] = new_risk_level
+                encounters["update_count"][rows] += 1
         return update_messages
 
 
+UPDATE_DTYPE = np.dtype([
+    ("sender", np.int32),  # index of the sender's contact book in `UpdateMessageBatch.contact_books`
+    ("uid_hi", np.uint64),  # upper 64 bits of the uid of the updated encounter message
+    ("uid_lo", np.uint64),  # lower 64 bits of the uid of the updated encounter message
+    ("has_uid", np.bool_),  # False if no GAEN keys are used (the uid is then `None`)
+    ("old_risk_level", np.int8),
+    ("new_risk_level", np.int8),
+    ("receiver", np.int32),  # index of the receiver in the sender's `ContactBook.contact_uids`
+    ("real_encounter_offset", np.float64),  # seconds between the initial and the real encounter timestamps
+    ("exposition", np.bool_),
+    ("reason", np.int8),  # index of the update reason in `UPDATE_REASONS`
+])
+"""Layout of the update messages generated by `generate_batched_updates`, one row per message."""
+
+UPDATE_REASONS = ("contact", "unknown")
+
+
+class UpdateMessageBatch:
+    """
+    Update messages generated for several contact books at once, stored as a structured array
+    (see `UPDATE_DTYPE`). `UpdateMessage` objects are only built when the batch is iterated.
+
+    Args:
+        contact_books: the contact books of the senders, indexed by the `sender` column.
+        data: the update messages, grouped by sender.
+        update_time: the (real) timestamp at which the updates were generated.
+    """
+
+    def __init__(
+            self,
+            contact_books: typing.Sequence[ContactBook],
+            data: np.ndarray,
+            update_time: datetime.datetime,
+    ):
+        self.contact_books = contact_books
+        self.data = data
+        self.update_time = update_time
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self) -> typing.Iterator[UpdateMessage]:
+        for idx in range(len(self.data)):
+            yield self.to_message(idx)
+
+    @property
+    def encounter_day_idxs(self) -> np.ndarray:
+        """Day indices (inside the simulation) of the encounters targeted by the updates."""
+        return (self.data["real_encounter_offset"] // datetime.timedelta(days=1).total_seconds()).astype(int)
+
+    @property
+    def sender_uids(self) -> typing.Set[RealUserIDType]:
+        """Real unique identifiers of the humans that generated at least one update."""
+        return {self.contact_books[sender].owner_uid for sender in np.unique(self.data["sender"])}
+
+    def to_message(self, idx: int) -> UpdateMessage:
+        """Returns the `idx`-th update of the batch as an `UpdateMessage` object."""
+        update = self.data[idx]
+        contact_book = self.contact_books[update["sender"]]
+        real_encounter_time = contact_book._initial_timestamp + \
+            datetime.timedelta(seconds=float(update["real_encounter_offset"]))
+        return UpdateMessage(
+            uid=_join_uid(update["uid_hi"], update["uid_lo"], update["has_uid"]),
+            old_risk_level=RiskLevelType(update["old_risk_level"]),
+            new_risk_level=RiskLevelType(update["new_risk_level"]),
+            encounter_time=datetime.datetime.combine(real_encounter_time.date(), datetime.datetime.min.time()),
+            update_time=datetime.datetime.combine(self.update_time.date(), datetime.datetime.min.time()),
+            _sender_uid=contact_book.owner_uid,
+            _receiver_uid=contact_book.contact_uids[update["receiver"]],
+            _real_encounter_time=real_encounter_time,
+            _real_update_time=self.update_time,
+            _exposition_event=True if update["exposition"] else None,
+            _update_reason=UPDATE_REASONS[update["reason"]],
+        )
+
+
+def risk_history_maps_to_array(
+        risk_history_maps: typing.Sequence[typing.Dict[int, float]],
+        current_day_idx: int,
+        n_days: int,
+) -> np.ndarray:
+    """
+    Stacks risk history maps into a `(len(risk_history_maps), n_days)` array.
+
+    Column `k` holds the risk of day `current_day_idx - k`; days missing from a map are NaN.
+    """
+    risks = np.full((len(risk_history_maps), n_days), np.nan)
+    for idx, risk_history_map in enumerate(risk_history_maps):
+        for day_idx, risk in risk_history_map.items():
+            offset = current_day_idx - day_idx
+            if 0 <= offset < n_days:
+                risks[idx, offset] = risk
+    return risks
+
+
+def _probas_to_risk_levels(probas: np.ndarray, risk_mapping: np.ndarray) -> np.ndarray:
+    """Maps risk probabilities to (capped) risk levels, like `proba_to_risk_fn` followed by `min(level, 15)`."""
+    return np.minimum(_proba_to_risk(probas, risk_mapping), 15)
+
+
+def generate_batched_updates(
+        contact_books: typing.Sequence[ContactBook],
+        current_day_idx: int,
+        current_timestamp: datetime.datetime,
+        prev_risk_histories: np.ndarray,
+        curr_risk_histories: np.ndarray,
+        risk_mapping: np.ndarray,
+        update_reason: str = "unknown",
+) -> UpdateMessageBatch:
+    """
+    Generates the initial and risk level update messages of several contact books at once.
+
+    This is the batched equivalent of calling `ContactBook.generate_initial_updates` followed by
+    `ContactBook.generate_updates` for each contact book: the encounters of all books are gathered
+    in flat arrays, and the risk levels of all owners are mapped with a single `np.searchsorted`.
+    Updates are returned grouped by sender, with the initial updates of a sender first.
+
+    Args:
+        contact_books: the contact books of the humans for which to generate updates (tracing must
+            be enabled for all of them).
+        current_day_idx: the current day index inside the simulation.
+        current_timestamp: the current timestamp of the simulation.
+        prev_risk_histories: the previous risk histories of the owners of the contact books (see
+            `risk_history_maps_to_array`).
+        curr_risk_histories: the current risk histories of the owners of the contact books.
+        risk_mapping: the risk-probability-to-risk-level mapping array.
+        update_reason: defines the root cause of the non-initial updates (as a string).
+
+    Returns:
+        The batch of update messages to send out to contacts (if any).
+    """
+    assert current_day_idx >= 0
+    assert prev_risk_histories.shape == curr_risk_histories.shape == \
+        (len(contact_books), prev_risk_histories.shape[1])
+    n_days = prev_risk_histories.shape[1]
+    prev_levels = _probas_to_risk_levels(prev_risk_histories, risk_mapping)
+    curr_levels = _probas_to_risk_levels(curr_risk_histories, risk_mapping)
+
+    # gather the encounters of all contact books in flat arrays (one segment per book & day)
+    segments, senders, offsets = [], [], []
+    for sender, contact_book in enumerate(contact_books):
+        for encounter_day_idx, day in contact_book._days.items():
+            if not len(day):
+                continue
+            offset = current_day_idx - encounter_day_idx
+            assert 0 <= offset < n_days, "contact book should have been cleaned up before calling update method...?"
+            segments.append(day)
+            senders.append(np.full(len(day), sender, dtype=np.int32))
+            offsets.append(np.full(len(day), offset, dtype=np.int32))
+    if not segments:
+        return UpdateMessageBatch(contact_books, np.zeros(0, dtype=UPDATE_DTYPE), current_timestamp)
+    encounters = np.concatenate([day.rows for day in segments])
+    senders, offsets = np.concatenate(senders), np.concatenate(offsets)
+    risk_levels = encounters["risk_level"].copy()
+    update_counts = encounters["update_count"].copy()
+
+    # we never sent the first update w/ the risk level for these
+    initial_mask = risk_levels < 0
+    assert not np.isnan(curr_risk_histories[senders[initial_mask], offsets[initial_mask]]).any(), \
+        "how could we have an encounter without a risk at that point? use default?"
+    initial_levels = curr_levels[senders[initial_mask], offsets[initial_mask]]
+    risk_levels[initial_mask] = initial_levels
+    initial_updates = _make_update_rows(encounters[initial_mask], senders[initial_mask],
+                                        initial_levels, initial_levels, UPDATE_REASONS.index("contact"))
+
+    # then, the updates for the encounters whose day risk level changed since the last timeslot
+    # (days without a previous risk are skipped, as the previous map will be overridden by the caller)
+    old_levels = prev_levels[senders, offsets]
+    new_levels = curr_levels[senders, offsets]
+    changed = ~np.isnan(prev_risk_histories[senders, offsets]) & (old_levels != new_levels)
+    assert ((risk_levels[changed] == old_levels[changed]) | (risk_levels[changed] == new_levels[changed])).all(), \
+        "encounter message risk mismatch (should have old level if already initialized " \
+        "or new level if it was initialized just now, but nothing else)"
+    update_mask = changed & (risk_levels != new_levels)
+    updates = _make_update_rows(encounters[update_mask], senders[update_mask], risk_levels[update_mask],
+                                new_levels[update_mask], UPDATE_REASONS.index(update_reason))
+    # keep track of applied updates internally...
+    risk_levels[update_mask] = new_levels[update_mask]
+    update_counts[update_mask] += 1
+
+    # write the new encounter states back into the contact books
+    start = 0
+    for day in segments:
+        stop = start + len(day)
+        day.data["risk_level"][:len(day)] = risk_levels[start:stop]
+        day.data["update_count"][:len(day)] = update_counts[start:stop]
+        start = stop
+
+    data = np.concatenate([initial_updates, updates])
+    data = data[np.argsort(data["sender"], kind="stable")]
+    return UpdateMessageBatch(contact_books, data, current_timestamp)
+
+
+def _make_update_rows(
+        encounters: np.ndarray,
+        senders: np.ndarray,
+        old_risk_levels: np.ndarray,
+        new_risk_levels: np.ndarray,
+        reason: int,
+) -> np.ndarray:
+    """Builds the update message rows (see `UPDATE_DTYPE`) for the given encounter rows."""
+    updates = np.zeros(len(encounters), dtype=UPDATE_DTYPE)
+    updates["sender"] = senders
+    for field in ("uid_hi", "uid_lo", "has_uid", "receiver", "real_encounter_offset", "exposition"):
+        updates[field] = encounters[field]
+    updates["old_risk_level"] = old_risk_levels
+    updates["new_risk_level"] = new_risk_levels
+    updates["reason"] = reason
+    return updates
+
+
+class PersonalMailbox:
+    """
+    Update messages received by a human, bucketed by the day index of the encounter they refer to.
+
+    Messages are stored under their mailbox key (i.e. the uid of the updated encounter message) in
+    the bucket of their encounter day. Since the receiver's contact book stores the same encounter
+    under the same day index, the messages of a human can be fetched by popping the buckets of the
+    days in its contact book, and expired messages can be dropped one day at a time. Note that
+    buckets are indexed using the real (unobserved) encounter time, so this is a simulation-only
+    structure.
+    """
+
+    def __init__(self):
+        self._days: typing.Dict[int, typing.Dict[UIDType, typing.List[UpdateMessage]]] = {}
+
+    def __len__(self):
+        return sum(len(messages) for day in self._days.values() for messages in day.values())
+
+    def add_message(self, day_idx: int, mailbox_key: UIDType, message: UpdateMessage):
+        """Adds an update message to the bucket of its encounter day."""
+        day = self._days.setdefault(day_idx, {})
+        if mailbox_key not in day:
+            day[mailbox_key] = []
+        day[mailbox_key].append(message)
+
+    def pop_messages(self, day_idxs: typing.Iterable[int]) -> typing.List[UpdateMessage]:
+        """Removes and returns all messages of the given encounter days (in day, then arrival order)."""
+        messages = []
+        for day_idx in day_idxs:
+            for key_messages in self._days.pop(day_idx, {}).values():
+                messages.extend(key_messages)
+        return messages
+
+    def cleanup(self, min_day_idx: int):
+        """Drops the buckets of all encounter days older than `min_day_idx`."""
+        for day_idx in [day_idx for day_idx in self._days if day_idx < min_day_idx]:
+            del self._days[day_idx]
+
+
 def batch_messages(
         messages: typing.List[GenericMessageType],
 ) -> typing.List[typing.Dict[TimestampType, typing.List[GenericMessageType]]]:
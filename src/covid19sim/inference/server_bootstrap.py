@@ -54,6 +54,12 @@ def parse_args(args=None):
     weights_path_doc = "Path to the specific weights to reload inside the inference engine(s). " \
                        "Will use the 'best checkpoint' weights if not specified."
     inference_argparser.add_argument("--weights-path", default=None, type=str, help=weights_path_doc)
+    default_steal_threshold = covid19sim.inference.server_utils.default_steal_threshold
+    steal_threshold_doc = "Minimum number of requests waiting for a worker before idle workers can steal " \
+                          f"them (along with their shard of humans). Will use {default_steal_threshold} " \
+                          "by default."
+    inference_argparser.add_argument("--steal-threshold", default=default_steal_threshold,
+                                     type=int, help=steal_threshold_doc)
     datacollect_argparser = subparsers.add_parser("datacollect", help="Create a data collection server")
     data_output_path_doc = "Path to the HDF5 file that will contain all collected data samples."
     datacollect_argparser.add_argument("-o", "--out-path", type=str, help=data_output_path_doc)
@@ -63,6 +69,13 @@ def parse_args(args=None):
                            "by default."
     datacollect_argparser.add_argument("--buffer-size", default=default_data_buffer_size,
                                        type=int, help=data_buffer_size_doc)
+    human_count_doc = "Number of humans in the simulation(s) whose data will be collected."
+    datacollect_argparser.add_argument("--human-count", type=int, required=True, help=human_count_doc)
+    simulation_days_doc = "Number of simulated days whose data will be collected."
+    datacollect_argparser.add_argument("--simulation-days", type=int, required=True, help=simulation_days_doc)
+    datacollect_workers_doc = "Number of data writers to spawn, each owning a range of human indices. " \
+                              "Will use a single writer by default."
+    datacollect_argparser.add_argument("-w", "--workers", default=1, type=int, help=datacollect_workers_doc)
     args = argparser.parse_args(args)
     if args.frontend is not None:
         if args.frontend.isdigit():
@@ -76,6 +89,8 @@ def parse_args(args=None):
         if args.workers is None:
             args.workers = default_workers
         assert args.workers > 0, f"invalid worker count: {args.workers}"
+    elif args.type == "datacollect":
+        assert 0 < args.workers <= args.human_count, f"invalid worker count: {args.workers}"
     return args
 
 
@@ -112,6 +127,7 @@ def main(args=None):
             frontend_address=frontend_address,
             backend_address=backend_address,
             weights_path=args.weights_path,
+            steal_threshold=args.steal_threshold,
             verbose=args.verbose,
         )
     elif args.type == "datacollect":
@@ -121,7 +137,10 @@ def main(args=None):
             backend_address = covid19sim.inference.server_utils.default_datacollect_backend_address
         broker = covid19sim.inference.server_utils.DataCollectionBroker(
             data_output_path=args.out_path,
+            human_count=args.human_count,
+            simulation_days=args.simulation_days,
             data_buffer_size=args.buffer_size,
+            workers=args.workers,
             frontend_address=frontend_address,
             backend_address=backend_address,
             verbose=args.verbose,
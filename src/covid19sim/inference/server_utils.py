@@ -2,10 +2,11 @@
 Contains utility classes for remote inference inside the simulation.
 """
 
+import bisect
+import collections
+import contextlib
 import datetime
 # import h5py
-import zarr
-import numcodecs
 import json
 import multiprocessing
 import multiprocessing.managers
@@ -15,28 +16,49 @@ import pickle
 import platform
 import subprocess
 import sys
+import threading
 import time
 import typing
+import warnings
 import xdelta3
+import zlib
 import zmq
 from pathlib import Path
 from ctt.inference.infer import InferenceEngine
+try:
+    import torch
+except ImportError:  # e.g. with the tensorflow version of ctt, whose engines are not batched (see `infer_batch`)
+    torch = None
 
 import covid19sim.inference.clustering.base
+import covid19sim.inference.dataset_format
 import covid19sim.inference.message_utils
 import covid19sim.inference.helper
 import covid19sim.inference.oracle
+import covid19sim.inference.wire_format
 import covid19sim.utils.utils
 
 expected_raw_packet_param_names = [
     "start", "current_day", "human", "time_slot", "conf"
 ]
+expected_human_packet_param_names = [
+    "current_day", "human", "time_slot", "city_hash"
+]
+expected_config_param_names = [
+    "start", "conf"
+]
+config_request_prefix = b"CONFIG"
+unknown_config_reply = b"UNKNOWN_CONFIG"  # replied to samples of cities whose config is not registered
 expected_processed_packet_param_names = [
     "current_day", "observed", "unobserved"
 ]
 
 default_poll_delay_ms = 500
 default_data_buffer_size = ((10 * 1024) * 1024)  # 10MB
+default_shard_count = 32
+default_steal_threshold = 2
+default_push_linger_ms = 10000
+default_recv_timeout_ms = 10 * 60 * 1000  # replies not received by then are considered lost (e.g. server restart)
 
 if os.environ.get("RAVEN_DIR", None) is not None:
     # if on MPI-IS cluster (htcondor + raven)
@@ -165,6 +187,315 @@ class BaseBroker:
         self.stop_flag.set()
 
 
+class UnknownConfigError(Exception):
+    """Raised by clients when the server does not know the config of a city (e.g. it restarted since it was registered)."""
+
+
+class BaseClient:
+    """Base class for clients exchanging requests with a broker through a REQ (or PUSH) socket."""
+
+    default_server_address: typing.AnyStr = None
+    socket_type: int = zmq.REQ
+    recv_timeout_ms: int = default_recv_timeout_ms  # -1 to wait for replies forever
+
+    def __init__(
+            self,
+            server_address: typing.Optional[typing.AnyStr] = None,
+            context: typing.Optional[zmq.Context] = None,
+    ):
+        """
+        Initializes the client's attributes (socket, context).
+
+        Args:
+            server_address: address of the server frontend to send requests to.
+            context: zmq context to create i/o objects from.
+        """
+        if context is None:
+            context = zmq.Context()
+        self.context = context
+        if server_address is None:
+            server_address = self.default_server_address
+        self.server_address = server_address
+        self._connect()
+
+    def _connect(self):
+        """Creates the socket of this client, and connects it to the server."""
+        self.socket = self.context.socket(self.socket_type)
+        self.socket.setsockopt(zmq.RCVTIMEO, self.recv_timeout_ms)
+        self.socket.connect(self.server_address)
+        self._awaiting_reply = False
+
+    def _send(self, frames: typing.List[typing.Any]):
+        """Sends a (multipart) request; with REQ sockets, its reply must be received before sending another one."""
+        self.socket.send_multipart(frames, copy=False)
+        self._awaiting_reply = self.socket_type == zmq.REQ
+
+    def _recv(self) -> bytes:
+        """
+        Receives the reply to the last request. If it does not come within `recv_timeout_ms`, the socket (which
+        would otherwise wait for it forever) is replaced by a new one, and a `TimeoutError` is raised.
+        """
+        try:
+            response = self.socket.recv()
+        except zmq.error.Again:
+            self.close()
+            self._connect()
+            raise TimeoutError(f"no reply from {self.server_address} within {self.recv_timeout_ms}ms")
+        self._awaiting_reply = False
+        return response
+
+    def is_healthy(self) -> bool:
+        """Returns whether the client can send a new request (i.e. it is not stuck on a previous one)."""
+        return not self.socket.closed and not self._awaiting_reply
+
+    def close(self):
+        """Closes the socket of this client, dropping any pending message."""
+        self.socket.close(linger=0)
+
+    def request_reset(self):
+        self._send([b"RESET"])
+        response = self._recv()
+        assert response == b"READY"
+
+
+class ClientPool:
+    """
+    Thread-safe pool of connected clients that are reused across requests (batches, timeslots, ...).
+
+    A client is checked out by a single thread at a time (zmq sockets are not thread-safe) and goes
+    back to the pool once its request is answered. Clients whose request failed (including requests
+    whose reply timed out, see `BaseClient.recv_timeout_ms`), or that are still waiting for a reply,
+    are closed; a new connection is then made on the next checkout. Pools are reset in forked
+    processes, as sockets cannot be shared across processes.
+    """
+
+    def __init__(self, client_type: typing.Type[BaseClient]):
+        self.client_type = client_type
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._context = None
+        self._idle_clients = collections.defaultdict(list)
+
+    @contextlib.contextmanager
+    def client(self, server_address: typing.Optional[typing.AnyStr] = None):
+        """Context manager that checks out a connected client, and returns it to the pool after use."""
+        client = self._checkout(server_address)
+        try:
+            yield client
+        except BaseException:
+            client.close()
+            raise
+        self._checkin(server_address, client)
+
+    def _checkout(self, server_address):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if self._context is None:
+                self._context = zmq.Context()
+            idle_clients = self._idle_clients[server_address]
+            while idle_clients:
+                client = idle_clients.pop()
+                if client.is_healthy():
+                    return client
+                client.close()
+            context = self._context
+        return self.client_type(server_address=server_address, context=context)
+
+    def _checkin(self, server_address, client):
+        with self._lock:
+            if self._pid == os.getpid() and client.is_healthy():
+                self._idle_clients[server_address].append(client)
+                return
+        client.close()
+
+    def close(self):
+        """Closes all the idle clients of the pool."""
+        with self._lock:
+            for clients in self._idle_clients.values():
+                for client in clients:
+                    client.close()
+            self._idle_clients.clear()
+
+
+class ConfigCache(dict):
+    """
+    Process-local cache of the simulation configs registered on the broker, indexed by city hash.
+
+    Configs never change once registered for a city, so each worker only needs to fetch them once
+    from the shared (managed) map.
+    """
+
+    def __init__(self, shared_config_map: typing.Mapping):
+        super().__init__()
+        self.shared_config_map = shared_config_map
+
+    def __missing__(self, city_hash):
+        config = self[city_hash] = self.shared_config_map[city_hash]
+        return config
+
+    def is_registered(self, city_hash) -> bool:
+        """Returns whether the config of a city was registered on the broker."""
+        return city_hash in self or city_hash in self.shared_config_map
+
+
+def get_cluster_mgr_hash(city_hash: int, human_name: str) -> str:
+    """Returns the key of a human's cluster manager (humans of different cities may share a server)."""
+    return str(city_hash) + ":" + human_name
+
+
+def get_shard_idx(cluster_mgr_hash: str, n_shards: int) -> int:
+    """Returns the shard a human belongs to (stable across processes, unlike the builtin `hash`)."""
+    return zlib.crc32(cluster_mgr_hash.encode()) % n_shards
+
+
+class ClusterMgrCache:
+    """
+    Worker-local cache in front of the cluster manager map shared by all inference workers.
+
+    The broker routes each shard of humans to a single worker (see `ShardRouter`), so that worker can
+    keep the cluster managers of its shards in memory instead of unpickling them from the shared map
+    for every request. Updates are still written through to the shared map so that shards can migrate
+    to another worker at any time; the shard epoch sent along with each request tells the worker that
+    its local copies of a shard may be outdated (i.e. that another worker owned the shard meanwhile).
+    """
+
+    def __init__(self, shared_cluster_mgr_map: typing.MutableMapping):
+        self.shared_cluster_mgr_map = shared_cluster_mgr_map
+        self.local_cluster_mgr_maps = {}  # shard index to map of cluster manager hash to cluster manager
+        self.shard_epochs = {}
+        self.route = None  # (shard index, shard count) of the request being processed
+
+    def set_route(
+            self,
+            shard_idx: typing.Optional[int] = None,
+            n_shards: typing.Optional[int] = None,
+            shard_epoch: typing.Optional[int] = None,
+    ):
+        """Sets the shard of the next request to process (unrouted requests bypass the cache)."""
+        if shard_idx is None:
+            self.route = None
+            return
+        if self.shard_epochs.get(shard_idx) != shard_epoch:
+            self.local_cluster_mgr_maps.pop(shard_idx, None)
+            self.shard_epochs[shard_idx] = shard_epoch
+        self.route = (shard_idx, n_shards)
+
+    def clear(self):
+        """Drops all local copies of the cluster managers (e.g. when the shared map is reset)."""
+        self.local_cluster_mgr_maps.clear()
+        self.shard_epochs.clear()
+
+    def _get_local_map(self, cluster_mgr_hash):
+        if self.route is None:
+            return None
+        shard_idx, n_shards = self.route
+        assert get_shard_idx(cluster_mgr_hash, n_shards) == shard_idx, \
+            "sharded inference requests should only contain humans of their own shard"
+        return self.local_cluster_mgr_maps.setdefault(shard_idx, {})
+
+    def __contains__(self, cluster_mgr_hash):
+        local_map = self._get_local_map(cluster_mgr_hash)
+        if local_map is not None and cluster_mgr_hash in local_map:
+            return True
+        return cluster_mgr_hash in self.shared_cluster_mgr_map
+
+    def __getitem__(self, cluster_mgr_hash):
+        local_map = self._get_local_map(cluster_mgr_hash)
+        if local_map is not None and cluster_mgr_hash in local_map:
+            return local_map[cluster_mgr_hash]
+        cluster_mgr = self.shared_cluster_mgr_map[cluster_mgr_hash]
+        if local_map is not None:
+            local_map[cluster_mgr_hash] = cluster_mgr
+        return cluster_mgr
+
+    def __setitem__(self, cluster_mgr_hash, cluster_mgr):
+        local_map = self._get_local_map(cluster_mgr_hash)
+        if local_map is not None:
+            local_map[cluster_mgr_hash] = cluster_mgr
+        self.shared_cluster_mgr_map[cluster_mgr_hash] = cluster_mgr
+
+
+class ShardRouter:
+    """
+    Assigns shards of humans to inference workers, and queues the requests waiting for each worker.
+
+    Shards are initially assigned with a consistent hash ring, so that the humans of a shard are always
+    processed by the same worker (which keeps their clustering state in memory, see `ClusterMgrCache`).
+    When a worker runs out of work while another one has at least `steal_threshold` requests waiting,
+    it steals the most recent of them, and the corresponding shard migrates to it (which bumps the
+    shard epoch, letting the previous owner know that its local state for that shard is outdated).
+    """
+
+    def __init__(
+            self,
+            worker_ids: typing.Iterable[typing.Any],
+            virtual_nodes: int = 64,
+            steal_threshold: int = default_steal_threshold,
+    ):
+        """
+        Initializes the hash ring and the (empty) request queues.
+
+        Args:
+            worker_ids: identifiers of the workers to route requests to.
+            virtual_nodes: number of points per worker on the hash ring (more = better balanced).
+            steal_threshold: minimum queue length of a worker before others may steal its requests.
+        """
+        ring = sorted([
+            (zlib.crc32(f"{worker_id}#{node_idx}".encode()), worker_id)
+            for worker_id in worker_ids for node_idx in range(virtual_nodes)
+        ])
+        self.ring_keys = [key for key, _ in ring]
+        self.ring_worker_ids = [worker_id for _, worker_id in ring]
+        self.steal_threshold = steal_threshold
+        self.shard_owners = {}
+        self.shard_epochs = collections.defaultdict(int)
+        self.worker_queues = {worker_id: collections.deque() for worker_id in worker_ids}
+        self.unrouted_queue = collections.deque()
+
+    def __len__(self):
+        """Returns the number of requests waiting to be dispatched."""
+        return len(self.unrouted_queue) + sum([len(queue) for queue in self.worker_queues.values()])
+
+    def get_owner(self, shard_idx: int):
+        """Returns the identifier of the worker currently owning a shard."""
+        if shard_idx not in self.shard_owners:
+            ring_idx = bisect.bisect(self.ring_keys, zlib.crc32(f"shard:{shard_idx}".encode()))
+            self.shard_owners[shard_idx] = self.ring_worker_ids[ring_idx % len(self.ring_keys)]
+        return self.shard_owners[shard_idx]
+
+    def push(self, request: typing.Any, shard_idx: typing.Optional[int] = None):
+        """Queues a request for the owner of its shard (or for any worker, if it has no shard)."""
+        if shard_idx is None:
+            self.unrouted_queue.append(request)
+        else:
+            self.worker_queues[self.get_owner(shard_idx)].append((shard_idx, request))
+
+    def pop(self, worker_id: typing.Any) -> typing.Optional[typing.Tuple]:
+        """
+        Returns the next request to dispatch to an idle worker, if any.
+
+        The worker first gets the requests of its own shards, then unrouted requests, and finally
+        requests stolen from the most loaded worker. The returned tuple contains the shard index and
+        shard epoch to send along with the request (both `None` for unrouted requests).
+        """
+        if self.worker_queues[worker_id]:
+            shard_idx, request = self.worker_queues[worker_id].popleft()
+        elif self.unrouted_queue:
+            return None, None, self.unrouted_queue.popleft()
+        else:
+            victim_id = max(self.worker_queues, key=lambda w: len(self.worker_queues[w]))
+            if len(self.worker_queues[victim_id]) < self.steal_threshold:
+                return None
+            shard_idx, request = self.worker_queues[victim_id].pop()
+            self.shard_owners[shard_idx] = worker_id
+            self.shard_epochs[shard_idx] += 1
+        return shard_idx, self.shard_epochs[shard_idx], request
+
+
 class InferenceWorker(BaseWorker):
     """
     Spawns a single inference worker instance.
@@ -179,6 +510,7 @@ class InferenceWorker(BaseWorker):
             backend_address: typing.AnyStr,
             identifier: typing.Any,
             cluster_mgr_map: typing.Dict,
+            config_map: typing.Dict,
             weights_path: typing.Optional[typing.AnyStr] = None,
     ):
         """
@@ -188,7 +520,8 @@ class InferenceWorker(BaseWorker):
             experiment_directory: the path to the experiment directory to pass to the inference engine.
             backend_address: address through which to exchange inference requests with the broker.
             identifier: identifier for this worker (name, used for debug purposes only).
-            cluster_mgr_map: map of human-to-cluster-managers to use for clustering.
+            cluster_mgr_map: map of human-to-cluster-managers shared by all workers for clustering.
+            config_map: map of city-hash-to-simulation-configs registered by the clients.
             weights_path: the path to the specific weight file to use. If not, will use the 'best
                 checkpoint weights' inside the experiment directory.
         """
@@ -196,6 +529,7 @@ class InferenceWorker(BaseWorker):
         self.experiment_directory = experiment_directory
         self.weights_path = weights_path
         self.cluster_mgr_map = cluster_mgr_map
+        self.config_map = config_map
 
     def run(self):
         """Main loop of the inference worker process.
@@ -204,6 +538,8 @@ class InferenceWorker(BaseWorker):
         with the result through the broker.
         """
         engine = InferenceEngineWrapper(self.experiment_directory, self.weights_path)
+        config_cache = ConfigCache(self.config_map)
+        cluster_mgr_cache = ClusterMgrCache(self.cluster_mgr_map)
         context = zmq.Context()
         socket = context.socket(zmq.REQ)
         socket.identity = self.identifier.encode()
@@ -218,21 +554,36 @@ class InferenceWorker(BaseWorker):
         self.running_flag.value = 1
         while not self.stop_flag.is_set():
             if self.reset_flag.is_set():
-                self.time_counter.value = 0.0
-                self.packet_counter.value = 0
-                self.time_init.value = 0.0
-                self.reset_flag.clear()
+                self._reset(cluster_mgr_cache)
             evts = dict(poller.poll(default_poll_delay_ms))
             if socket in evts and evts[socket] == zmq.POLLIN:
                 proc_start_time = time.time()
-                address, empty, buffer = socket.recv_multipart()
-                sample = pickle.loads(buffer)
-                response = proc_human_batch(
-                    sample=sample,
-                    engine=engine,
-                    cluster_mgr_map=self.cluster_mgr_map,
-                )
-                response = pickle.dumps(response)
+                address, empty, *frames = socket.recv_multipart(copy=False)
+                if self.reset_flag.is_set():
+                    # the reset may have been acknowledged while we were waiting for this request
+                    self._reset(cluster_mgr_cache)
+                buffers = [frame.buffer for frame in frames]
+                if covid19sim.inference.wire_format.is_routing_frame(buffers[0]):
+                    cluster_mgr_cache.set_route(*covid19sim.inference.wire_format.decode_routing_frame(buffers[0]))
+                    buffers = buffers[1:]
+                else:
+                    cluster_mgr_cache.set_route(None)
+                if covid19sim.inference.wire_format.is_human_batch(buffers):
+                    sample = covid19sim.inference.wire_format.decode_human_batch(buffers)
+                else:
+                    sample = pickle.loads(buffers[0])
+                if isinstance(sample, list) and \
+                        not all([config_cache.is_registered(params.get("city_hash")) for params in sample]):
+                    # e.g. the server restarted since the client registered the config of the city
+                    response = unknown_config_reply
+                else:
+                    response = proc_human_batch(
+                        sample=sample,
+                        engine=engine,
+                        cluster_mgr_map=cluster_mgr_cache,
+                        config_map=config_cache,
+                    )
+                    response = pickle.dumps(response)
                 socket.send_multipart([address, b"", response])
                 with self.time_counter.get_lock():
                     self.time_counter.value += time.time() - proc_start_time
@@ -241,9 +592,23 @@ class InferenceWorker(BaseWorker):
         self.running_flag.value = 0
         socket.close()
 
+    def _reset(self, cluster_mgr_cache: ClusterMgrCache):
+        """Resets the worker's counters and drops its local copies of the (cleared) cluster managers."""
+        self.time_counter.value = 0.0
+        self.packet_counter.value = 0
+        self.time_init.value = 0.0
+        cluster_mgr_cache.clear()
+        self.reset_flag.clear()
+
 
 class InferenceBroker(BaseBroker):
-    """Manages inference workers through a backend connection for load balancing."""
+    """
+    Manages inference workers through a backend connection for load balancing.
+
+    Requests prefixed by a routing frame (see `wire_format`) are dispatched to the worker owning their
+    shard of humans, with work stealing between workers (see `ShardRouter`); other requests go to the
+    first available worker.
+    """
 
     def __init__(
             self,
@@ -254,6 +619,7 @@ class InferenceBroker(BaseBroker):
             verbose: bool = False,
             verbose_print_delay: float = 5.,
             weights_path: typing.Optional[typing.AnyStr] = None,
+            steal_threshold: int = default_steal_threshold,
     ):
         """
         Initializes the inference broker's attributes (counters, condvars, ...).
@@ -267,6 +633,8 @@ class InferenceBroker(BaseBroker):
             verbose_print_delay: specifies how often the extra debug info should be printed.
             weights_path: the path to the specific weight file to use. If not, will use the 'best
                 checkpoint weights' inside the experiment directory.
+            steal_threshold: minimum number of requests waiting for a worker before idle workers
+                may steal them (and take over the ownership of their shards).
         """
         super().__init__(
             workers=workers,
@@ -277,6 +645,7 @@ class InferenceBroker(BaseBroker):
         )
         self.model_exp_path = model_exp_path
         self.weights_path = weights_path
+        self.steal_threshold = steal_threshold
 
     def run(self):
         """Main loop of the inference broker process.
@@ -300,6 +669,7 @@ class InferenceBroker(BaseBroker):
         with multiprocessing.Manager() as mem_manager:
             worker_map = {}
             cluster_mgr_map = mem_manager.dict()
+            config_map = mem_manager.dict()
             available_worker_ids = []
             for worker_idx in range(self.workers):
                 worker_id = f"worker:{worker_idx}"
@@ -309,6 +679,7 @@ class InferenceBroker(BaseBroker):
                     backend_address=worker_backend_address,
                     identifier=worker_id,
                     cluster_mgr_map=cluster_mgr_map,
+                    config_map=config_map,
                     weights_path=self.weights_path,
                 )
                 worker_map[worker_id] = worker
@@ -317,6 +688,7 @@ class InferenceBroker(BaseBroker):
                 worker_id, empty, response = request[:3]
                 assert worker_id == worker.identifier.encode() and response == b"READY"
                 available_worker_ids.append(worker.identifier.encode())
+            router = ShardRouter(available_worker_ids, steal_threshold=self.steal_threshold)
             last_update_timestamp = time.time()
             print("Entering dispatch loop...", flush=True)
             while not self.stop_flag.is_set():
@@ -329,19 +701,43 @@ class InferenceBroker(BaseBroker):
                     available_worker_ids.append(worker_id)
                     empty, reply = request[3:]
                     frontend.send_multipart([client, b"", reply])
-                if available_worker_ids and frontend in evts and evts[frontend] == zmq.POLLIN:
-                    client, empty, request = frontend.recv_multipart()
-                    if request == b"RESET":
+                if frontend in evts and evts[frontend] == zmq.POLLIN:
+                    # requests may span multiple frames (see `wire_format`), which we forward without copies
+                    client, empty, *request = frontend.recv_multipart(copy=False)
+                    if len(request) == 1 and request[0].buffer == b"RESET":
                         print("got reset request, will clear all clusters", flush=True)
-                        assert len(available_worker_ids) == self.workers
+                        assert len(available_worker_ids) == self.workers and not len(router)
                         for k in list(cluster_mgr_map.keys()):
                             del cluster_mgr_map[k]
                         for worker in worker_map.values():
                             worker.reset_flag.set()
                         frontend.send_multipart([client, b"", b"READY"])
+                    elif len(request) == 1 and \
+                            request[0].buffer[:len(config_request_prefix)] == config_request_prefix:
+                        # configs are registered once per city, and then shared by all its requests
+                        city_hash, config = pickle.loads(request[0].buffer[len(config_request_prefix):])
+                        assert all([p in config for p in expected_config_param_names])
+                        config_map[city_hash] = config
+                        frontend.send_multipart([client, b"", b"READY"])
+                    elif covid19sim.inference.wire_format.is_routing_frame(request[0].buffer):
+                        shard_idx, n_shards, _ = \
+                            covid19sim.inference.wire_format.decode_routing_frame(request[0].buffer)
+                        router.push((client, n_shards, request[1:]), shard_idx=shard_idx)
                     else:
-                        worker_id = available_worker_ids.pop(0)
-                        backend.send_multipart([worker_id, b"", client, b"", request])
+                        router.push((client, None, request))
+                for worker_id in list(available_worker_ids):
+                    # idle workers get the requests of their own shards first, and then steal others
+                    next_request = router.pop(worker_id)
+                    if next_request is None:
+                        continue
+                    shard_idx, shard_epoch, (client, n_shards, request) = next_request
+                    if shard_idx is not None:
+                        routing_frame = covid19sim.inference.wire_format.encode_routing_frame(
+                            shard_idx, n_shards, shard_epoch,
+                        )
+                        request = [routing_frame, *request]
+                    available_worker_ids.remove(worker_id)
+                    backend.send_multipart([worker_id, b"", client, b"", *request], copy=False)
                 if self.verbose and time.time() - last_update_timestamp > self.verbose_print_delay:
                     print(f" {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} stats:")
                     for worker_id, worker in worker_map.items():
@@ -351,6 +747,7 @@ class InferenceBroker(BaseBroker):
                         print(
                             f"  {worker_id}:"
                             f"  running={worker.is_running()}"
+                            f"  queued={len(router.worker_queues[worker_id.encode()])}"
                             f"  packets={packets}"
                             f"  avg_delay={delay:.6f}sec"
                             f"  proc_time_ratio={uptime:.1%}"
@@ -363,15 +760,16 @@ class InferenceBroker(BaseBroker):
                 w.join()
 
 
-class InferenceClient:
+class InferenceClient(BaseClient):
     """
     Creates a client through which data samples can be sent for inference.
 
     This object will automatically be able to pick a proper remote inference
-    engine. This object should be fairly lightweight and low-cost, so creating
-    it once per day, per human *should* not create a significant overhead.
+    engine. Clients can be reused across requests through `inference_client_pool`.
     """
 
+    default_server_address = default_inference_frontend_address
+
     def __init__(
             self,
             server_address: typing.Optional[typing.AnyStr] = default_inference_frontend_address,
@@ -384,22 +782,39 @@ class InferenceClient:
             server_address: address of the inference server frontend to send requests to.
             context: zmq context to create i/o objects from.
         """
-        if context is None:
-            context = zmq.Context()
-        self.context = context
-        self.socket = self.context.socket(zmq.REQ)
-        if server_address is None:
-            server_address = default_inference_frontend_address
-        self.socket.connect(server_address)
+        super().__init__(server_address=server_address, context=context)
 
-    def infer(self, sample):
-        """Forwards a data sample for the inference engine using pickle."""
-        self.socket.send_pyobj(sample)
-        return self.socket.recv_pyobj()
+    def infer(self, sample, shard_idx: typing.Optional[int] = None, n_shards: typing.Optional[int] = None):
+        """Forwards a data sample for the inference engine.
 
-    def request_reset(self):
-        self.socket.send(b"RESET")
-        response = self.socket.recv()
+        Batches of per-human packets are sent with the binary wire format (see `wire_format`);
+        anything else is pickled. If a shard is given, all humans in the sample must belong to it
+        (see `get_shard_idx`), and the broker will route the request to the worker owning that shard.
+
+        Raises an `UnknownConfigError` if the server does not know the config of the city of a human
+        (e.g. it restarted since `register_config` was called); the config must then be registered again.
+        """
+        if covid19sim.inference.wire_format.can_encode_human_batch(sample):
+            frames = covid19sim.inference.wire_format.encode_human_batch(sample)
+        else:
+            frames = [pickle.dumps(sample)]
+        if shard_idx is not None:
+            frames = [covid19sim.inference.wire_format.encode_routing_frame(shard_idx, n_shards), *frames]
+        self._send(frames)
+        response = self._recv()
+        if response == unknown_config_reply:
+            raise UnknownConfigError("the inference server does not know the config of the city of the sample")
+        return pickle.loads(response)
+
+    def register_config(self, city_hash, start, conf):
+        """Registers the simulation config of a city on the server.
+
+        The config is sent only once per city; inference samples then only carry the per-human
+        data along with the city hash (see `expected_human_packet_param_names`).
+        """
+        config = {"start": start, "conf": conf}
+        self._send([config_request_prefix + pickle.dumps((city_hash, config))])
+        response = self._recv()
         assert response == b"READY"
 
 
@@ -426,38 +841,105 @@ class InferenceEngineWrapper(InferenceEngine):
             experiment_directory = experiment_subdirectories[0]
         super().__init__(experiment_directory, *args, **kwargs)
 
+    max_batch_size = 256
+    """Maximum number of humans stacked in a single (padded) forward pass of the risk model."""
+
+    def supports_padded_batches(self) -> bool:
+        """
+        Returns whether humans can be stacked in padded batches, i.e. whether the engine is a pytorch model
+        fed by a ctt `ContactPreprocessor` (whose `preprocess` and `collate_fn` build the batches of `infer`).
+        """
+        return (
+            torch is not None
+            and isinstance(getattr(self, "model", None), torch.nn.Module)
+            and hasattr(getattr(self, "preprocessor", None), "preprocess")
+            and hasattr(getattr(self, "preprocessor", None), "collate_fn")
+        )
+
+    def infer_batch(self, daily_outputs: typing.List[typing.Dict]) -> typing.List[typing.Optional[typing.Dict]]:
+        """
+        Runs inference for several humans at once, returning one `infer`-like result per human.
+
+        Humans without candidate encounters are skipped by the engine (their result is `None`), so
+        they still go through the regular `infer` path; all other humans are preprocessed one by one,
+        padded/stacked into a single batch, and fed to the model in one forward pass. Engines that
+        do not support padded batches (see `supports_padded_batches`) run one forward pass per human,
+        with a warning.
+        """
+        results = [None] * len(daily_outputs)
+        batch_idxs = []
+        for idx, daily_output in enumerate(daily_outputs):
+            if len(daily_output["observed"]["candidate_encounters"]):
+                batch_idxs.append(idx)
+            else:
+                results[idx] = self.infer(daily_output)
+        if not self.supports_padded_batches():
+            warnings.warn(
+                f"{type(self).__name__} does not support padded batches, running one forward pass per human",
+                RuntimeWarning,
+            )
+            for idx in batch_idxs:
+                results[idx] = self.infer(daily_outputs[idx])
+            return results
+        for batch_start_offset in range(0, len(batch_idxs), self.max_batch_size):
+            chunk_idxs = batch_idxs[batch_start_offset:batch_start_offset + self.max_batch_size]
+            chunk_results = self._infer_padded_batch([daily_outputs[idx] for idx in chunk_idxs])
+            for idx, result in zip(chunk_idxs, chunk_results):
+                results[idx] = result
+        return results
+
+    def _infer_padded_batch(self, daily_outputs: typing.List[typing.Dict]) -> typing.List[typing.Dict]:
+        """Stacks the preprocessed daily outputs into one padded batch and scatters the model outputs."""
+        device = next(self.model.parameters()).device
+        with torch.no_grad():
+            samples = [self.preprocessor.preprocess(daily_output, as_batch=False)
+                       for daily_output in daily_outputs]
+            model_input = {
+                key: value.to(device) if torch.is_tensor(value) else value
+                for key, value in self.preprocessor.collate_fn(samples).to_dict().items()
+            }
+            model_output = self.model(model_input)
+            contagion_probas = model_output["encounter_variables"].sigmoid().cpu().numpy()
+            infectiousnesses = model_output["latent_variable"].cpu().numpy()
+        results = []
+        for batch_idx, daily_output in enumerate(daily_outputs):
+            n_encounters = len(daily_output["observed"]["candidate_encounters"])
+            results.append({
+                # padded encounters are masked in the model, we just need to drop them here
+                "contagion_proba": contagion_probas[batch_idx, :n_encounters, 0],
+                "infectiousness": infectiousnesses[batch_idx, :, 0],
+            })
+        return results
+
 
 class DataCollectionWorker(BaseWorker):
     """
     Spawns a data collection worker instance.
 
-    This workers is managed by the DataCollectionBroker class. It communicates with
-    the broker using a backend connection.
+    These workers are managed by the DataCollectionBroker class. Each of them owns a shard (i.e. a
+    range of human indices) of the dataset, and writes the samples of its humans forwarded by the
+    broker through a backend connection (see `covid19sim.inference.dataset_format`).
     """
 
     def __init__(
             self,
             data_output_path: typing.AnyStr,
             backend_address: typing.AnyStr,
-            human_count: int,
-            simulation_days: int,
+            shard_idx: int = 0,
             compression: typing.Optional[typing.AnyStr] = "lzf",
             compression_opts: typing.Optional[typing.Any] = None,
-            config_backup: typing.Optional[typing.Dict] = None,
     ):
         """
         Initializes the data collection worker's attributes (counters, condvars, ...).
 
         Args:
-            data_output_path: the path where the collected data should be saved.
-            backend_address: address through which to exchange data collection requests with the broker.
+            data_output_path: the path of the dataset (created by the broker) where to save the data.
+            backend_address: address through which to pull data collection requests from the broker.
+            shard_idx: the index of the shard of humans written by this worker.
         """
-        super().__init__(backend_address=backend_address, identifier="data-collector")
+        super().__init__(backend_address=backend_address, identifier=f"shard:{shard_idx}")
         self.data_output_path = data_output_path
-        self.human_count = human_count
-        self.simulation_days = simulation_days
-        self.config_backup = config_backup
-        self.chunk_size = 1
+        self.shard_idx = shard_idx
         # These are not used anymore!
         # It's because zarr uses a meta-compressor (Blosc) to figure out which
         # compressor to use, and it appears to work well.
@@ -467,99 +949,60 @@ class DataCollectionWorker(BaseWorker):
     def run(self):
         """Main loop of the data collection worker process.
 
-        Will receive brokered requests from the frontend, process them, and respond
-        with the result through the broker.
+        Will receive the requests forwarded by the broker and write them to the dataset. Once
+        stopped, the requests that are still in flight are written before the dataset is closed.
         """
+        writer = covid19sim.inference.dataset_format.DatasetWriter(
+            data_output_path=self.data_output_path,
+            shard_idx=self.shard_idx,
+        )
         context = zmq.Context()
-        socket = context.socket(zmq.REP)
+        socket = context.socket(zmq.DEALER)
+        socket.setsockopt(zmq.IDENTITY, self.identifier.encode())
         socket.setsockopt(zmq.RCVTIMEO, default_poll_delay_ms)
         socket.connect(self.backend_address)
+        socket.send(b"READY")
         self.time_init.value = time.time()
         self.time_counter.value = 0.0
         self.packet_counter.value = 0
         self.running_flag.value = 1
-        print(f"creating zarr collection file at: {self.data_output_path}, "
-              f"but ignoring compression flag {self.compression}", flush=True)
-        fd = zarr.open(self.data_output_path, "w")
-        try:
-            fd.attrs["git_hash"] = covid19sim.utils.utils.get_git_revision_hash()
-        except subprocess.CalledProcessError:
-            fd.attrs["git_hash"] = "NO_GIT"
-        fd.attrs["creation_date"] = datetime.datetime.now().isoformat()
-        fd.attrs["creator"] = str(platform.node())
-        config_backup = json.dumps(covid19sim.utils.utils.dumps_conf(self.config_backup)) \
-            if self.config_backup else None
-        fd.attrs["config"] = config_backup
-        dataset = fd.create_dataset(
-            "dataset",
-            shape=(self.simulation_days, 24, self.human_count,),
-            chunks=(1, None, None),  # 1 x 6 x human_count
-            dtype=object,
-            object_codec=numcodecs.Pickle(),
-        )
-        is_filled = fd.create_dataset(
-            "is_filled",
-            shape=(self.simulation_days, 24, self.human_count,),
-            dtype=bool,
-            fillvalue=False
-        )
         total_dataset_bytes = 0
-        sample_idx = 0
-        current_day = 0
-        dataset_cache_factory = lambda: np.zeros(shape=(24, self.human_count),
-                                                 dtype=object)
-        is_filled_cache_factory = lambda: np.zeros(shape=(24, self.human_count), dtype=bool)
-        dataset_cache = dataset_cache_factory()
-        is_filled_cache = is_filled_cache_factory()
-        while not self.stop_flag.is_set():
+        while True:
             if self.reset_flag.is_set():
                 self.time_counter.value = 0.0
                 self.packet_counter.value = 0
                 self.time_init.value = 0.0
                 self.reset_flag.clear()
             try:
-                buffer = socket.recv()
+                frames = socket.recv_multipart(copy=False)
             except zmq.error.Again:
+                if self.stop_flag.is_set():
+                    break  # nothing left in flight
                 continue
             proc_start_time = time.time()
-            day_idx, hour_idx, human_idx, buffer = pickle.loads(buffer)
-            total_dataset_bytes += len(buffer)
-            if day_idx == (current_day + 1):
-                # It's a new day
-                # Dump the cache
-                dataset[current_day, :, :] = dataset_cache
-                is_filled[current_day, :, :] = is_filled_cache
-                # Make a new cache
-                dataset_cache = dataset_cache_factory()
-                is_filled_cache = is_filled_cache_factory()
-                # Update the current_day counter
-                current_day += 1
-            elif day_idx == current_day:
-                pass
-            else:
-                raise RuntimeError(f"The worker was at day {current_day}, but got a "
-                                   f"message from day {day_idx}. Bonk!")
-
-            # Write the pickle and is_filled to cache
-            dataset_cache[hour_idx, human_idx] = pickle.loads(buffer)
-            is_filled_cache[hour_idx, human_idx] = True
-            # Note to future self: this is what it used to be:
-            #    dataset[day_idx, hour_idx, human_idx] = pickle.loads(buffer)
-            #    is_filled[day_idx, hour_idx, human_idx] = True
-            socket.send(str(sample_idx).encode())
-            sample_idx += 1
+            header, buffers = covid19sim.inference.wire_format.decode_collection_batch(
+                [frame.buffer for frame in frames],
+            )
+            for (day_idx, hour_idx, human_idx), buffer in zip(header.tolist(), buffers):
+                total_dataset_bytes += len(buffer)
+                writer.write(day_idx, hour_idx, human_idx, pickle.loads(buffer))
             with self.time_counter.get_lock():
                 self.time_counter.value += time.time() - proc_start_time
             with self.packet_counter.get_lock():
-                self.packet_counter.value += 1
+                self.packet_counter.value += len(buffers)
+        writer.close(total_bytes=total_dataset_bytes)
         self.running_flag.value = 0
         socket.close()
-        dataset.attrs["total_samples"] = sample_idx
-        dataset.attrs["total_bytes"] = total_dataset_bytes
 
 
 class DataCollectionBroker(BaseBroker):
-    """Manages exchanges with the data collection worker by buffering client requests."""
+    """
+    Manages exchanges with the data collection workers by buffering client requests.
+
+    Clients push their requests without waiting for acknowledgements, so many of them can be
+    pipelined (and sent from many clients) while the workers write the previous ones. Each worker
+    writes its own shard of humans, so batched requests are split by shard before being forwarded.
+    """
 
     def __init__(
             self,
@@ -567,6 +1010,7 @@ class DataCollectionBroker(BaseBroker):
             human_count: int,
             simulation_days: int,
             data_buffer_size: int = default_data_buffer_size,  # NOTE: in bytes!
+            workers: int = 1,
             frontend_address: typing.AnyStr = default_datacollect_frontend_address,
             backend_address: typing.AnyStr = default_datacollect_backend_address,
             compression: typing.Optional[typing.AnyStr] = "lzf",
@@ -580,14 +1024,17 @@ class DataCollectionBroker(BaseBroker):
 
         Args:
             data_output_path: the path where the collected data should be saved.
+            human_count: the number of humans in the simulation.
+            simulation_days: the number of simulated days.
             data_buffer_size: the amount of data that can be buffered by the broker (in bytes).
-            frontend_address: address through which to exchange data logging requests with clients.
-            backend_address: address through which to exchange data logging requests with the worker.
+            workers: the number of writer processes, each owning a range of human indices.
+            frontend_address: address through which to pull data logging requests from clients.
+            backend_address: address through which to push data logging requests to the workers.
             verbose: toggles whether to print extra debug information while running.
             verbose_print_delay: specifies how often the extra debug info should be printed.
         """
         super().__init__(
-            workers=1,  # cannot safely write more than one sample at a time with this impl
+            workers=workers,
             frontend_address=frontend_address,
             backend_address=backend_address,
             verbose=verbose,
@@ -601,90 +1048,141 @@ class DataCollectionBroker(BaseBroker):
         self.compression_opts = compression_opts
         self.config_backup = config_backup
 
+    def _create_dataset(self):
+        """Creates the (empty) dataset along with the manifest of the shards written by the workers."""
+        print(f"creating zarr collection file at: {self.data_output_path}, "
+              f"but ignoring compression flag {self.compression}", flush=True)
+        try:
+            git_hash = covid19sim.utils.utils.get_git_revision_hash()
+        except subprocess.CalledProcessError:
+            git_hash = "NO_GIT"
+        config_backup = json.dumps(covid19sim.utils.utils.dumps_conf(self.config_backup)) \
+            if self.config_backup else None
+        covid19sim.inference.dataset_format.create_dataset(
+            data_output_path=self.data_output_path,
+            human_count=self.human_count,
+            simulation_days=self.simulation_days,
+            n_shards=self.workers,
+            attrs={
+                "git_hash": git_hash,
+                "creation_date": datetime.datetime.now().isoformat(),
+                "creator": str(platform.node()),
+                "config": config_backup,
+            },
+        )
+
+    def _split_request(self, request, shard_starts):
+        """
+        Splits the frames of a (batched) request into per-shard requests, without copying samples.
+
+        Raises a `ValueError` if a sample is for a human index out of [0, human_count), which no writer owns.
+        """
+        header, buffers = covid19sim.inference.wire_format.decode_collection_batch(
+            [frame.buffer for frame in request[:1]] + request[1:],
+        )
+        invalid_human_idxs = header["human_idx"][(header["human_idx"] < 0) | (header["human_idx"] >= self.human_count)]
+        if len(invalid_human_idxs):
+            raise ValueError(f"human indices out of [0, {self.human_count}): {sorted(set(invalid_human_idxs.tolist()))}")
+        shard_idxs = np.searchsorted(shard_starts, header["human_idx"], side="right") - 1
+        for shard_idx in np.unique(shard_idxs):
+            sample_idxs = np.flatnonzero(shard_idxs == shard_idx)
+            if len(sample_idxs) == len(buffers):
+                yield int(shard_idx), request
+            else:
+                yield int(shard_idx), [header[sample_idxs].tobytes(), *[buffers[idx] for idx in sample_idxs]]
+
     def run(self):
         """Main loop of the data collection broker process.
 
-        Will received requests from clients and dispatch them to the data collection worker.
+        Will received requests from clients and dispatch them to the data collection workers. Once
+        stopped, the requests that were already pushed by clients are still forwarded to the workers.
         """
+        self._create_dataset()
+        shard_starts = [start for start, _ in
+                        covid19sim.inference.dataset_format.get_shard_ranges(self.human_count, self.workers)]
         context = zmq.Context()
-        frontend = context.socket(zmq.ROUTER)
+        frontend = context.socket(zmq.PULL)
         print(f"Will listen for data collection requests at: {self.frontend_address}", flush=True)
         frontend.bind(self.frontend_address)
-        backend = context.socket(zmq.REQ)
+        backend = context.socket(zmq.ROUTER)
+        backend.setsockopt(zmq.ROUTER_MANDATORY, 1)  # full worker queues raise instead of dropping
         print(f"Will dispatch data collection work at: {self.backend_address}", flush=True)
         backend.bind(self.backend_address)
         worker_backend_address = self.backend_address.replace("*", "localhost")
         worker_poller = zmq.Poller()
         worker_poller.register(frontend, zmq.POLLIN)
-        print(f"Launching worker...", flush=True)
-        worker = DataCollectionWorker(
-            data_output_path=self.data_output_path,
-            backend_address=worker_backend_address,
-            human_count=self.human_count,
-            simulation_days=self.simulation_days,
-            compression=self.compression,
-            compression_opts=self.compression_opts,
-            config_backup=self.config_backup,
-        )
-        worker.start()
-        backend.setsockopt(zmq.SNDTIMEO, 5)
+        workers = []
+        for shard_idx in range(self.workers):
+            print(f"Launching worker for shard {shard_idx}...", flush=True)
+            worker = DataCollectionWorker(
+                data_output_path=self.data_output_path,
+                backend_address=worker_backend_address,
+                shard_idx=shard_idx,
+                compression=self.compression,
+                compression_opts=self.compression_opts,
+            )
+            worker.start()
+            worker_id, response = backend.recv_multipart()
+            assert worker_id == worker.identifier.encode() and response == b"READY"
+            workers.append(worker)
         last_update_timestamp = time.time()
         curr_queue_size = 0
-        expected_sample_idx = 0
-        request_queue = []
+        request_queues = [collections.deque() for _ in workers]
         print("Entering dispatch loop...", flush=True)
-        while not self.stop_flag.is_set():
-            evts = dict(worker_poller.poll(default_poll_delay_ms if not request_queue else 1))
+        while True:
+            has_queued_requests = any(request_queues)
+            evts = dict(worker_poller.poll(default_poll_delay_ms if not has_queued_requests else 1))
+            if not evts and not has_queued_requests and self.stop_flag.is_set():
+                break  # nothing left to forward
             if curr_queue_size < self.data_buffer_size and \
                     frontend in evts and evts[frontend] == zmq.POLLIN:
-                client, empty, request = frontend.recv_multipart()
-                if request == b"RESET":
-                    worker.reset_flag.set()
-                    frontend.send_multipart([client, b"", b"READY"])
+                request = frontend.recv_multipart(copy=False)
+                if len(request) == 1 and request[0].buffer == b"RESET":
+                    for worker in workers:
+                        worker.reset_flag.set()
                 else:
-                    request_queue.append(request)
-                    curr_queue_size += len(request)
-                    frontend.send_multipart([client, b"", b"GOTCHA"])
-            if request_queue:
-                next_packet = request_queue[0]
-                assert curr_queue_size >= len(next_packet)
-                try:
-                    backend.send(next_packet)
-                    written_sample_idx_str = backend.recv()
-                    assert expected_sample_idx == int(written_sample_idx_str.decode())
-                    expected_sample_idx = expected_sample_idx + 1
-                    curr_queue_size -= len(next_packet)
-                    request_queue.pop(0)
-                except zmq.error.Again:
-                    pass
+                    for shard_idx, shard_request in self._split_request(request, shard_starts):
+                        request_queues[shard_idx].append(shard_request)
+                        curr_queue_size += sum([len(frame) for frame in shard_request])
+            for worker, request_queue in zip(workers, request_queues):
+                worker_id = worker.identifier.encode()
+                while request_queue:
+                    try:
+                        backend.send_multipart([worker_id, *request_queue[0]], flags=zmq.NOBLOCK, copy=False)
+                    except zmq.error.Again:
+                        break  # this worker is not keeping up, we will keep buffering its requests
+                    curr_queue_size -= sum([len(frame) for frame in request_queue.popleft()])
             if self.verbose and time.time() - last_update_timestamp > self.verbose_print_delay:
                 print(f" {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} stats:")
-                packets = worker.get_processed_count()
-                delay = worker.get_averge_processing_delay()
-                uptime = worker.get_processing_uptime()
-                print(
-                    f"  running={worker.is_running()}  packets={packets}"
-                    f"  avg_delay={delay:.6f}sec  proc_time_ratio={uptime:.1%}",
-                    flush=True,
-                )
+                for worker, request_queue in zip(workers, request_queues):
+                    packets = worker.get_processed_count()
+                    delay = worker.get_averge_processing_delay()
+                    uptime = worker.get_processing_uptime()
+                    print(
+                        f"  {worker.identifier}:"
+                        f"  running={worker.is_running()}  packets={packets}  queued={len(request_queue)}"
+                        f"  avg_delay={delay:.6f}sec  proc_time_ratio={uptime:.1%}"
+                    )
+                sys.stdout.flush()
                 last_update_timestamp = time.time()
-        backend.setsockopt(zmq.SNDTIMEO, -1)
-        while request_queue:
-            next_packet = request_queue.pop(0)
-            backend.send_multipart(next_packet)
-            curr_queue_size -= len(next_packet[-1])
-        worker.stop_gracefully()
-        worker.join()
+        for worker in workers:
+            worker.stop_gracefully()
+            worker.join()
+        frontend.close()
+        backend.close()
 
 
-class DataCollectionClient:
+class DataCollectionClient(BaseClient):
     """
-    Creates a client through which data samples can be sent for collection.
+    Creates a client through which data samples can be pushed for collection.
 
-    This object should be fairly lightweight and low-cost, so creating
-    it once per day, per human *should* not create a significant overhead.
+    Samples are not acknowledged by the server, so `write` only blocks when the outgoing queue of
+    the socket is full. Clients can be reused across requests through `datacollect_client_pool`.
     """
 
+    default_server_address = default_datacollect_frontend_address
+    socket_type = zmq.PUSH
+
     def __init__(
             self,
             server_address: typing.Optional[typing.AnyStr] = default_datacollect_frontend_address,
@@ -697,24 +1195,30 @@ class DataCollectionClient:
             server_address: address of the data collection server frontend to send requests to.
             context: zmq context to create i/o objects from.
         """
-        if context is None:
-            context = zmq.Context()
-        self.context = context
-        self.socket = self.context.socket(zmq.REQ)
-        if server_address is None:
-            server_address = default_datacollect_frontend_address
-        self.socket.connect(server_address)
+        super().__init__(server_address=server_address, context=context)
+        # pending samples get some time to be pushed when the socket is closed (or garbage-collected)
+        self.socket.setsockopt(zmq.LINGER, default_push_linger_ms)
 
     def write(self, day_idx, hour_idx, human_idx, sample):
-        """Forwards a data sample for the data writer using pickle."""
-        self.socket.send_pyobj((day_idx, hour_idx, human_idx, pickle.dumps(sample)))
-        response = self.socket.recv()
-        assert response == b"GOTCHA"
+        """Forwards a data sample for the data writer (pickled, after a fixed-layout header frame)."""
+        self.write_batch([(day_idx, hour_idx, human_idx, sample)])
+
+    def write_batch(self, samples: typing.Sequence[typing.Tuple[int, int, int, typing.Any]]):
+        """Forwards many (day, hour, human, sample) data samples for the data writers in a single request."""
+        if not samples:
+            return
+        frames = covid19sim.inference.wire_format.encode_collection_batch(
+            [(day_idx, hour_idx, human_idx) for day_idx, hour_idx, human_idx, _ in samples],
+            [pickle.dumps(sample) for _, _, _, sample in samples],
+        )
+        self._send(frames)
+
+    def close(self):
+        """Closes the socket of this client, after giving it some time to push the pending samples."""
+        self.socket.close()
 
     def request_reset(self):
-        self.socket.send(b"RESET")
-        response = self.socket.recv()
-        assert response == b"READY"
+        self._send([b"RESET"])
 
 
 class DataCollectionServer(DataCollectionBroker, multiprocessing.Process):
@@ -725,20 +1229,27 @@ class DataCollectionServer(DataCollectionBroker, multiprocessing.Process):
         DataCollectionBroker.__init__(self, **kwargs)
 
 
+inference_client_pool = ClientPool(InferenceClient)
+datacollect_client_pool = ClientPool(DataCollectionClient)
+
+
 def proc_human_batch(
         sample,
         engine,
         cluster_mgr_map,
+        config_map,
         clusters_dump_path: typing.Optional[typing.AnyStr] = None,
 ):
     """
     Processes a chunk of human data, clustering messages and computing new risk levels.
 
     Args:
-        sample: a dictionary of data necessary for clustering+inference.
-        engine: the inference engine, pre-instantiated with the right experiment config.
+        sample: a list of per-human dictionaries of data necessary for clustering+inference.
+        engine: the inference engine, pre-instantiated with the right experiment config. All humans
+            of the chunk are clustered first, and then go through its `infer_batch` (if available)
+            together, so that the risk model only runs once per chunk.
         cluster_mgr_map: map of human-to-cluster-managers to use for clustering.
-        n_parallel_procs: internal joblib parallel process count for clustering+inference.
+        config_map: map of city-hash-to-simulation-configs used to complete the per-human data.
         clusters_dump_path: defines where to dump clusters (if required).
 
     Returns:
@@ -748,13 +1259,16 @@ def proc_human_batch(
     ref_timestamp = None
 
     for params in sample:
+        assert all([p in params for p in expected_human_packet_param_names]), \
+            "unexpected/broken proc_human_batch input format between simulator and inference service"
+        params.update(config_map[params["city_hash"]])
         human_name = params["human"].name
         timestamp = params["start"] + datetime.timedelta(days=params["current_day"], hours=params["time_slot"])
         if ref_timestamp is None:
             ref_timestamp = timestamp
         else:
             assert ref_timestamp == timestamp, "how can we possibly have different timestamps here"
-        cluster_mgr_hash = str(params["city_hash"]) + ":" + human_name
+        cluster_mgr_hash = get_cluster_mgr_hash(params["city_hash"], human_name)
         params["cluster_mgr_hash"] = cluster_mgr_hash
         if cluster_mgr_hash not in cluster_mgr_map:
             cluster_algo_type = covid19sim.inference.clustering.base.get_cluster_manager_type(
@@ -771,7 +1285,9 @@ def proc_human_batch(
         assert not cluster_mgr._is_being_used, "two processes should never try to access the same human"
         cluster_mgr._is_being_used = True
         params["cluster_mgr"] = cluster_mgr
-    results = [_proc_human(params, engine) for params in sample]
+    daily_outputs = [_prepare_human(params) for params in sample]
+    _collect_daily_outputs(sample, daily_outputs)
+    results = _infer_human_batch(sample, daily_outputs, engine)
     for params in sample:
         cluster_mgr = params["cluster_mgr"]
         assert cluster_mgr._is_being_used
@@ -789,11 +1305,11 @@ def proc_human_batch(
     return results
 
 
-def _proc_human(params, inference_engine):
-    """Internal implementation of the `proc_human_batch` function."""
+def _prepare_human(params):
+    """Clusters the messages of a human and builds its daily (model input) output."""
     assert isinstance(params, dict) and \
            all([p in params for p in expected_raw_packet_param_names]), \
-        "unexpected/broken _proc_human input format between simulator and inference service"
+        "unexpected/broken _prepare_human input format between simulator and inference service"
     conf = params["conf"]
     todays_date = params["start"] + datetime.timedelta(days=params["current_day"], hours=params["time_slot"])
     human, cluster_mgr = params["human"], params["cluster_mgr"]
@@ -850,19 +1366,41 @@ def _proc_human(params, inference_engine):
             "recovered_timestamp": human.recovered_timestamp,
         }
     }
-
-    if conf.get("COLLECT_TRAINING_DATA"):
-        data_collect_client = DataCollectionClient(
-            server_address=conf.get("data_collection_server_address", default_datacollect_frontend_address),
-        )
-        human_id = int(human.name.split(":")[-1])
-        data_collect_client.write(params["current_day"], params["time_slot"], human_id, daily_output)
-    inference_result, risk_history = None, None
-    if conf.get("USE_ORACLE"):
-        risk_history = covid19sim.inference.oracle.oracle(human, conf)
-    elif conf.get("RISK_MODEL") == "transformer":
-        # no need to do actual inference if the cluster count is zero
-        inference_result = inference_engine.infer(daily_output)
-        if inference_result is not None:
-            risk_history = inference_result['infectiousness']
-    return human.name, risk_history
+    return daily_output
+
+
+def _collect_daily_outputs(sample, daily_outputs):
+    """Pushes the daily outputs of a batch to the data collection server(s), with one request per server."""
+    requests = collections.defaultdict(list)
+    for params, daily_output in zip(sample, daily_outputs):
+        conf = params["conf"]
+        if conf.get("COLLECT_TRAINING_DATA"):
+            server_address = conf.get("data_collection_server_address", default_datacollect_frontend_address)
+            human_id = int(params["human"].name.split(":")[-1])
+            requests[server_address].append((params["current_day"], params["time_slot"], human_id, daily_output))
+    for server_address, samples in requests.items():
+        with datacollect_client_pool.client(server_address) as data_collect_client:
+            data_collect_client.write_batch(samples)
+
+
+def _infer_human_batch(sample, daily_outputs, inference_engine):
+    """Computes the risk histories of all humans in a batch, running the risk model only once."""
+    risk_histories = [None] * len(sample)
+    inference_idxs = []
+    for idx, params in enumerate(sample):
+        conf = params["conf"]
+        if conf.get("USE_ORACLE"):
+            risk_histories[idx] = covid19sim.inference.oracle.oracle(params["human"], conf)
+        elif conf.get("RISK_MODEL") == "transformer":
+            inference_idxs.append(idx)
+    if inference_idxs:
+        inference_inputs = [daily_outputs[idx] for idx in inference_idxs]
+        if hasattr(inference_engine, "infer_batch"):
+            inference_results = inference_engine.infer_batch(inference_inputs)
+        else:
+            inference_results = [inference_engine.infer(daily_output) for daily_output in inference_inputs]
+        for idx, inference_result in zip(inference_idxs, inference_results):
+            # no actual inference is done (and the result is None) if the cluster count is zero
+            if inference_result is not None:
+                risk_histories[idx] = inference_result['infectiousness']
+    return [(params["human"].name, risk_history) for params, risk_history in zip(sample, risk_histories)]
@@ -0,0 +1,359 @@
+"""
+Binary (multipart) wire format used to exchange human data with the inference & data collection servers.
+
+A batch of per-human inference packets (see `expected_human_packet_param_names` in `server_utils`) is
+encoded as a list of frames holding contiguous arrays (one row per human or per update message),
+so that the receiver can rebuild them with `np.frombuffer` instead of unpickling object graphs:
+
+    0. header (`BATCH_HEADER_DTYPE`): magic, version, and dimensions of the other frames;
+    1. JSON list of the real user ids (human names, senders & receivers) referenced by index;
+    2. per-human scalars (`HUMAN_WIRE_DTYPE`);
+    3. preexisting conditions (uint8, n_humans x 2 x n_conditions; true then observed);
+    4. infectiousnesses (float64, n_humans x n_days);
+    5. test results (int8, n_humans x n_days);
+    6. symptoms (uint8, n_humans x 2 x n_days x n_symptoms; true then reported);
+    7. update messages (`UPDATE_WIRE_DTYPE`), grouped by human.
+
+Timestamps are stored as int64 seconds since the (naive) epoch.
+
+Inference requests may also be prefixed by a routing frame (`ROUTING_FRAME_DTYPE`) that tells the
+broker which shard of humans they belong to (see `InferenceBroker`).
+"""
+
+import datetime
+import json
+import typing
+
+import numpy as np
+
+from covid19sim.inference.human_as_message import HumanAsMessage
+from covid19sim.inference.message_utils import RiskLevelType, UpdateMessage, UPDATE_REASONS, \
+    _join_uid, _split_uid
+
+WIRE_FORMAT_MAGIC = b"C19H"
+WIRE_FORMAT_VERSION = 1
+
+BATCH_HEADER_DTYPE = np.dtype([
+    ("magic", "S4"),
+    ("version", np.uint16),
+    ("n_humans", np.uint32),
+    ("n_days", np.uint32),
+    ("n_symptoms", np.uint32),
+    ("n_conditions", np.uint32),
+    ("n_updates", np.uint64),
+])
+"""Layout of the first frame of an encoded batch."""
+
+HUMAN_WIRE_DTYPE = np.dtype([
+    ("name", np.int32),  # index in the real user ids frame
+    ("current_day", np.int32),
+    ("time_slot", np.int8),
+    ("city_hash", np.int64),
+    ("age", np.int16),
+    ("sex", np.int8),
+    ("obs_age", np.int16),
+    ("obs_sex", np.int8),
+    ("infection_timestamp", np.int64),
+    ("recovered_timestamp", np.int64),
+    ("incubation_days", np.float64),  # NaN if None
+    ("recovery_days", np.float64),  # NaN if None
+    ("viral_load_to_infectiousness_multiplier", np.float64),
+    ("carefulness", np.float64),
+    ("has_app", np.bool_),
+    ("oracle_noise_random_seed", np.int64),
+    ("n_updates", np.uint32),
+])
+"""Layout of the per-human scalars of an encoded batch."""
+
+UPDATE_WIRE_DTYPE = np.dtype([
+    ("uid_hi", np.uint64),
+    ("uid_lo", np.uint64),
+    ("has_uid", np.bool_),
+    ("old_risk_level", np.uint8),
+    ("new_risk_level", np.uint8),
+    ("encounter_time", np.int64),
+    ("update_time", np.int64),
+    ("sender", np.int32),  # index in the real user ids frame (-1 if None)
+    ("receiver", np.int32),  # index in the real user ids frame (-1 if None)
+    ("real_encounter_time", np.int64),
+    ("real_update_time", np.int64),
+    ("exposition", np.int8),  # -1 if None
+    ("reason", np.int8),  # index in `UPDATE_REASONS` (-1 if None)
+])
+"""Layout of the update messages of an encoded batch."""
+
+COLLECTION_HEADER_DTYPE = np.dtype([
+    ("day_idx", np.int32),
+    ("hour_idx", np.int8),
+    ("human_idx", np.int64),
+])
+"""Layout of the rows of the first frame of a data collection request (one per sample, whose pickled
+buffers are sent in the next frames)."""
+
+ROUTING_FRAME_MAGIC = b"C19R"
+
+ROUTING_FRAME_DTYPE = np.dtype([
+    ("magic", "S4"),
+    ("shard_idx", np.uint32),
+    ("n_shards", np.uint32),
+    ("shard_epoch", np.uint32),  # filled by the broker when dispatching the request
+])
+"""Layout of the (optional) routing frame that prefixes sharded inference requests."""
+
+_epoch = datetime.datetime(1970, 1, 1)
+_none_timestamp = np.iinfo(np.int64).min
+_max_timestamp = np.iinfo(np.int64).max
+_none_seed = np.iinfo(np.int64).min
+
+
+def _encode_timestamp(timestamp: typing.Optional[datetime.datetime]) -> int:
+    """Converts a timestamp to int64 seconds (with sentinels for `None` and `datetime.max`)."""
+    if timestamp is None:
+        return _none_timestamp
+    if timestamp == datetime.datetime.max:
+        return _max_timestamp
+    return (timestamp - _epoch) // datetime.timedelta(seconds=1)
+
+
+def _decode_timestamp(timestamp: np.int64) -> typing.Optional[datetime.datetime]:
+    """Converts int64 seconds back to a timestamp (see `_encode_timestamp`)."""
+    if timestamp == _none_timestamp:
+        return None
+    if timestamp == _max_timestamp:
+        return datetime.datetime.max
+    return _epoch + datetime.timedelta(seconds=int(timestamp))
+
+
+def _encode_optional_float(value: typing.Optional[float]) -> float:
+    return np.nan if value is None else value
+
+
+def _decode_optional_float(value: np.float64) -> typing.Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+def is_human_batch(frames: typing.Sequence[typing.Any]) -> bool:
+    """Returns whether the given (buffer) frames hold a batch encoded with `encode_human_batch`."""
+    return len(frames) == 8 and bytes(memoryview(frames[0])[:len(WIRE_FORMAT_MAGIC)]) == WIRE_FORMAT_MAGIC
+
+
+def can_encode_human_batch(sample: typing.Any) -> bool:
+    """Returns whether a sample is a list of per-human packets that `encode_human_batch` can encode."""
+    return isinstance(sample, list) and len(sample) > 0 and \
+        all([isinstance(p, dict) and isinstance(p.get("human"), HumanAsMessage) for p in sample])
+
+
+def encode_human_batch(sample: typing.List[typing.Dict]) -> typing.List[bytes]:
+    """
+    Encodes a list of per-human inference packets into frames (see the module docstring).
+
+    Args:
+        sample: the per-human packets, each holding the current day, the time slot, the city hash
+            and the `HumanAsMessage` object to encode.
+
+    Returns:
+        The list of frames to send (e.g. with `zmq.Socket.send_multipart`).
+    """
+    humans = [params["human"] for params in sample]
+    symptoms_shape = np.shape(humans[0].rolling_all_symptoms)
+    n_days, n_symptoms = symptoms_shape
+    n_conditions = len(humans[0].preexisting_conditions)
+    real_uids, real_uid_idxs = [], {}
+
+    def get_real_uid_idx(real_uid):
+        if real_uid is None:
+            return -1
+        if real_uid not in real_uid_idxs:
+            real_uid_idxs[real_uid] = len(real_uids)
+            real_uids.append(real_uid)
+        return real_uid_idxs[real_uid]
+
+    n_updates = sum([len(human.update_messages) for human in humans])
+    human_rows = np.zeros(len(humans), dtype=HUMAN_WIRE_DTYPE)
+    conditions = np.zeros((len(humans), 2, n_conditions), dtype=np.uint8)
+    infectiousnesses = np.zeros((len(humans), n_days), dtype=np.float64)
+    test_results = np.zeros((len(humans), n_days), dtype=np.int8)
+    symptoms = np.zeros((len(humans), 2, n_days, n_symptoms), dtype=np.uint8)
+    update_rows = np.zeros(n_updates, dtype=UPDATE_WIRE_DTYPE)
+    update_idx = 0
+    for human_idx, (params, human) in enumerate(zip(sample, humans)):
+        human_rows[human_idx] = (
+            get_real_uid_idx(human.name),
+            params["current_day"],
+            params["time_slot"],
+            params["city_hash"],
+            human.age,
+            human.sex,
+            human.obs_age,
+            human.obs_sex,
+            _encode_timestamp(human.infection_timestamp),
+            _encode_timestamp(human.recovered_timestamp),
+            _encode_optional_float(human.incubation_days),
+            _encode_optional_float(human.recovery_days),
+            human.viral_load_to_infectiousness_multiplier,
+            human.carefulness,
+            human.has_app,
+            _none_seed if human.oracle_noise_random_seed is None else human.oracle_noise_random_seed,
+            len(human.update_messages),
+        )
+        conditions[human_idx, 0] = human.preexisting_conditions
+        conditions[human_idx, 1] = human.obs_preexisting_conditions
+        infectiousnesses[human_idx] = human.infectiousnesses
+        test_results[human_idx] = human.test_results
+        assert np.shape(human.rolling_all_symptoms) == symptoms_shape
+        symptoms[human_idx, 0] = human.rolling_all_symptoms
+        symptoms[human_idx, 1] = human.rolling_all_reported_symptoms
+        for update_message in human.update_messages:
+            assert update_message.old_risk_level is not None
+            update_rows[update_idx] = (
+                *_split_uid(update_message.uid),
+                update_message.uid is not None,
+                update_message.old_risk_level,
+                update_message.new_risk_level,
+                _encode_timestamp(update_message.encounter_time),
+                _encode_timestamp(update_message.update_time),
+                get_real_uid_idx(update_message._sender_uid),
+                get_real_uid_idx(update_message._receiver_uid),
+                _encode_timestamp(update_message._real_encounter_time),
+                _encode_timestamp(update_message._real_update_time),
+                -1 if update_message._exposition_event is None else update_message._exposition_event,
+                -1 if update_message._update_reason is None
+                else UPDATE_REASONS.index(update_message._update_reason),
+            )
+            update_idx += 1
+
+    header = np.array([(
+        WIRE_FORMAT_MAGIC, WIRE_FORMAT_VERSION, len(humans), n_days, n_symptoms, n_conditions, n_updates,
+    )], dtype=BATCH_HEADER_DTYPE)
+    return [
+        header.tobytes(),
+        json.dumps(real_uids).encode(),
+        human_rows.tobytes(),
+        conditions.tobytes(),
+        infectiousnesses.tobytes(),
+        test_results.tobytes(),
+        symptoms.tobytes(),
+        update_rows.tobytes(),
+    ]
+
+
+def decode_human_batch(frames: typing.Sequence[typing.Any]) -> typing.List[typing.Dict]:
+    """
+    Decodes the frames produced by `encode_human_batch` back into per-human inference packets.
+
+    The arrays are read in place from the frame buffers (e.g. `zmq.Frame.buffer`).
+    """
+    assert is_human_batch(frames), "unexpected frames (not an encoded human batch)"
+    header = np.frombuffer(frames[0], dtype=BATCH_HEADER_DTYPE)[0]
+    assert header["version"] == WIRE_FORMAT_VERSION, \
+        f"unsupported wire format version ({header['version']} vs {WIRE_FORMAT_VERSION})"
+    n_humans, n_days = int(header["n_humans"]), int(header["n_days"])
+    n_symptoms, n_conditions = int(header["n_symptoms"]), int(header["n_conditions"])
+    real_uids = json.loads(bytes(frames[1]).decode())
+    human_rows = np.frombuffer(frames[2], dtype=HUMAN_WIRE_DTYPE)
+    conditions = np.frombuffer(frames[3], dtype=np.uint8).reshape((n_humans, 2, n_conditions))
+    infectiousnesses = np.frombuffer(frames[4], dtype=np.float64).reshape((n_humans, n_days))
+    test_results = np.frombuffer(frames[5], dtype=np.int8).reshape((n_humans, n_days))
+    symptoms = np.frombuffer(frames[6], dtype=np.uint8).reshape((n_humans, 2, n_days, n_symptoms))
+    update_rows = np.frombuffer(frames[7], dtype=UPDATE_WIRE_DTYPE)
+    assert len(human_rows) == n_humans and len(update_rows) == header["n_updates"]
+
+    def get_real_uid(real_uid_idx):
+        return None if real_uid_idx < 0 else real_uids[real_uid_idx]
+
+    sample, update_idx = [], 0
+    for human_idx, row in enumerate(human_rows):
+        update_messages = []
+        for update in update_rows[update_idx:update_idx + row["n_updates"]]:
+            update_messages.append(UpdateMessage(
+                uid=_join_uid(update["uid_hi"], update["uid_lo"], update["has_uid"]),
+                old_risk_level=RiskLevelType(update["old_risk_level"]),
+                new_risk_level=RiskLevelType(update["new_risk_level"]),
+                encounter_time=_decode_timestamp(update["encounter_time"]),
+                update_time=_decode_timestamp(update["update_time"]),
+                _sender_uid=get_real_uid(update["sender"]),
+                _receiver_uid=get_real_uid(update["receiver"]),
+                _real_encounter_time=_decode_timestamp(update["real_encounter_time"]),
+                _real_update_time=_decode_timestamp(update["real_update_time"]),
+                _exposition_event=None if update["exposition"] < 0 else bool(update["exposition"]),
+                _update_reason=None if update["reason"] < 0 else UPDATE_REASONS[update["reason"]],
+            ))
+        update_idx += row["n_updates"]
+        human = HumanAsMessage(
+            name=get_real_uid(row["name"]),
+            age=int(row["age"]),
+            sex=int(row["sex"]),
+            obs_age=int(row["obs_age"]),
+            obs_sex=int(row["obs_sex"]),
+            preexisting_conditions=conditions[human_idx, 0].astype(np.float64),
+            obs_preexisting_conditions=conditions[human_idx, 1].astype(np.float64),
+            infectiousnesses=infectiousnesses[human_idx].tolist(),
+            infection_timestamp=_decode_timestamp(row["infection_timestamp"]),
+            recovered_timestamp=_decode_timestamp(row["recovered_timestamp"]),
+            test_results=test_results[human_idx].astype(np.float64),
+            rolling_all_symptoms=symptoms[human_idx, 0].astype(np.float64),
+            rolling_all_reported_symptoms=symptoms[human_idx, 1].astype(np.float64),
+            incubation_days=_decode_optional_float(row["incubation_days"]),
+            recovery_days=_decode_optional_float(row["recovery_days"]),
+            viral_load_to_infectiousness_multiplier=float(row["viral_load_to_infectiousness_multiplier"]),
+            update_messages=update_messages,
+            carefulness=float(row["carefulness"]),
+            has_app=bool(row["has_app"]),
+            oracle_noise_random_seed=None if row["oracle_noise_random_seed"] == _none_seed
+            else int(row["oracle_noise_random_seed"]),
+        )
+        sample.append({
+            "current_day": int(row["current_day"]),
+            "human": human,
+            "time_slot": int(row["time_slot"]),
+            "city_hash": int(row["city_hash"]),
+        })
+    return sample
+
+
+def encode_collection_batch(
+        indices: typing.Sequence[typing.Tuple[int, int, int]],
+        buffers: typing.Sequence[bytes],
+) -> typing.List[bytes]:
+    """Encodes a batch of data collection requests as a header frame with one row of (day, hour, human)
+    indices per sample, followed by the (pickled) buffers of the samples, in the same order."""
+    assert len(indices) == len(buffers) and len(indices) > 0
+    header = np.array(list(indices), dtype=COLLECTION_HEADER_DTYPE)
+    return [header.tobytes(), *buffers]
+
+
+def decode_collection_batch(frames: typing.Sequence[typing.Any]) -> typing.Tuple[np.ndarray, typing.List]:
+    """Decodes the frames produced by `encode_collection_batch` into the header rows & sample buffers."""
+    header = np.frombuffer(frames[0], dtype=COLLECTION_HEADER_DTYPE)
+    assert len(header) == len(frames) - 1, "unexpected data collection request format"
+    return header, list(frames[1:])
+
+
+def encode_collection_request(day_idx: int, hour_idx: int, human_idx: int, buffer: bytes) -> typing.List[bytes]:
+    """Encodes a single data collection request (i.e. a batch of one sample)."""
+    return encode_collection_batch([(day_idx, hour_idx, human_idx)], [buffer])
+
+
+def decode_collection_request(frames: typing.Sequence[typing.Any]) -> typing.Tuple[int, int, int, typing.Any]:
+    """Decodes the frames produced by `encode_collection_request`."""
+    assert len(frames) == 2, "unexpected data collection request format"
+    header, (buffer,) = decode_collection_batch(frames)
+    return int(header[0]["day_idx"]), int(header[0]["hour_idx"]), int(header[0]["human_idx"]), buffer
+
+
+def is_routing_frame(frame: typing.Any) -> bool:
+    """Returns whether the given (buffer) frame is a routing frame encoded with `encode_routing_frame`."""
+    return len(frame) == ROUTING_FRAME_DTYPE.itemsize and \
+        bytes(memoryview(frame)[:len(ROUTING_FRAME_MAGIC)]) == ROUTING_FRAME_MAGIC
+
+
+def encode_routing_frame(shard_idx: int, n_shards: int, shard_epoch: int = 0) -> bytes:
+    """Encodes the routing frame that prefixes the frames of a sharded inference request."""
+    assert 0 <= shard_idx < n_shards
+    return np.array([(ROUTING_FRAME_MAGIC, shard_idx, n_shards, shard_epoch)], dtype=ROUTING_FRAME_DTYPE).tobytes()
+
+
+def decode_routing_frame(frame: typing.Any) -> typing.Tuple[int, int, int]:
+    """Decodes the (shard index, shard count, shard epoch) of a routing frame."""
+    routing = np.frombuffer(frame, dtype=ROUTING_FRAME_DTYPE)[0]
+    return int(routing["shard_idx"]), int(routing["n_shards"]), int(routing["shard_epoch"])
@@ -210,14 +210,33 @@ class IntervenedBehavior(object):
         self.conf = conf
         self.rng = human.rng
 
+        self._set_behavior_levels()
+        self._behavior_level = 0 # true behavior level
+        self.behavior_level = 0 # its a property.setter
+
+        # start everyone at the zero level by default (unmitigated scenario i.e. no reduction in contacts)
+        self.quarantine = Quarantine(self, self.human, self.env, self.conf)
+        self.set_behavior(level=0, reasons=[INITIALIZED_BEHAVIOR])
+
+        # dropout
+        self._follow_recommendation_today = None
+        self.last_date_to_decide_dropout = None
+
+        #
+        self.intervention_started = False
+        self.pay_no_attention_to_triggers = False
+
+    def _set_behavior_levels(self):
+        """
+        Sets up the behavior levels, and their reduction in contacts, from the intervention parameters of the configuration.
+        """
+        conf = self.conf
         assert conf['N_BEHAVIOR_LEVELS'] >= 2, "At least 2 behavior levels are required to model behavior changes"
 
         # we reserve 0-index
         self.n_behavior_levels = conf['N_BEHAVIOR_LEVELS'] + 1
         self.quarantine_idx = self.n_behavior_levels - 1
         self.baseline_behavior_idx = 1
-        self._behavior_level = 0 # true behavior level
-        self.behavior_level = 0 # its a property.setter
 
         # start filling the reduction levels from the end
         reduction_levels = {
@@ -256,18 +275,6 @@ class IntervenedBehavior(object):
 
         self.reduction_levels = reduction_levels
 
-        # start everyone at the zero level by default (unmitigated scenario i.e. no reduction in contacts)
-        self.quarantine = Quarantine(self, self.human, self.env, self.conf)
-        self.set_behavior(level=0, reasons=[INITIALIZED_BEHAVIOR])
-
-        # dropout
-        self._follow_recommendation_today = None
-        self.last_date_to_decide_dropout = None
-
-        #
-        self.intervention_started = False
-        self.pay_no_attention_to_triggers = False
-
     def initialize(self, check_has_app=False):
         """
         Sets up a baseline behavior on the day intervention starts.
@@ -276,6 +283,9 @@ class IntervenedBehavior(object):
             check_has_app (bool): whether to initialize a baseline beahvior only for humans with the app
         """
         assert self.conf['INTERVENTION_DAY'] >= 0, "negative intervention day and yet intialization is called."
+        # the intervention parameters may have changed since the human was created (e.g. in a forked scenario)
+        self._set_behavior_levels()
+        self.quarantine.quarantine_idx = self.quarantine_idx
         assert self.n_behavior_levels >= 2, "with 2 behavior levels and a risk model, behavior level 1 will quarantine everyone"
 
         if check_has_app and self.human.has_app:
@@ -1,8 +1,10 @@
 import datetime
 import itertools
 import os
+import shlex
 import shutil
 import subprocess
+import sys
 import tempfile
 from collections import defaultdict
 from pathlib import Path
@@ -14,6 +16,7 @@ import numpy as np
 import yaml
 from omegaconf import DictConfig
 
+from covid19sim.job_scripts.local_executor import DEFAULT_N_PEOPLE, LocalExecutor
 from covid19sim.plotting.utils import env_to_path
 from covid19sim.utils.utils import parse_search_configuration, is_app_based_tracing_intervention, NpEncoder
 
@@ -186,6 +189,11 @@ def check_conf(conf):
         raise RandomSearchError(
             "zip_outdir must be true when using tmpdir (use_tmpdir)"
         )
+    if infra == "local":
+        if use_tmpdir:
+            raise RandomSearchError("Cannot use $SLURM_TMPDIR (use_tmpdir) with infra=local")
+        if conf.get("USE_INFERENCE_SERVER") is True:
+            raise RandomSearchError("Cannot use an inference server (USE_INFERENCE_SERVER) with infra=local")
 
 
 def compute_n_search(conf):
@@ -430,6 +438,9 @@ def load_template(infra):
         str: template string full of "{variable_name}"
     """
     base = Path(__file__).resolve().parent
+    if infra == "local":
+        # no job script: runs are started by a `LocalExecutor`
+        return ""
     if infra == "mila":
         with (base / "mila_sbatch_template.sh").open("r") as f:
             return f.read()
@@ -716,7 +727,7 @@ def main(conf: DictConfig) -> None:
         "env_name",  # conda environment to load
         "code_loc",  # where to find the source code, will cd there
         "weights",  # where to find the transformer's weights
-        "infra",  # using Mila or Intel cluster?
+        "infra",  # using Mila, Beluga or Intel cluster, or the local machine?
         "now_str",  # naming scheme
         "parallel_search",  # run with & at the end instead of ; to run in subshells
         "ipc",  # run with & at the end instead of ; to run in subshells
@@ -729,6 +740,14 @@ def main(conf: DictConfig) -> None:
         "normalization_folder",  # if this is a normalization run
         "exp_name",  # folder name in base_dir => base_dir/exp_name/method/...
         "email_id", # email id where you can receive notifications regarding jobs (began, completed, failed)
+        "local_n_workers",  # infra=local: maximum number of runs at a time
+        "local_cpus_per_run",  # infra=local: number of cpus of each run
+        "local_pin_cpus",  # infra=local: pin each run to its cpus
+        "local_mem_budget",  # infra=local: memory available to the runs (GB)
+        "local_mem_per_run",  # infra=local: memory of a run regardless of n_people (GB)
+        "local_mem_per_person",  # infra=local: memory of a run per human (MB)
+        "local_max_retries",  # infra=local: number of times a failed run is retried
+        "local_resume",  # infra=local: skip the runs that already completed
     }
 
     # move back to original directory because hydra moved
@@ -808,6 +827,25 @@ def main(conf: DictConfig) -> None:
         Path(copy_dest).mkdir(parents=True, exist_ok=True)
         shutil.copy(exp_file_path, Path(copy_dest) / exp_file_path.name)
 
+    executor = None
+    if infra == "local":
+        executor = LocalExecutor(
+            log_dir=Path(copy_dest) / "local_logs",
+            journal_path=Path(copy_dest) / "local_runs.json",
+            n_workers=conf.get("local_n_workers"),
+            cpus_per_run=conf.get("local_cpus_per_run", 1),
+            pin_cpus=conf.get("local_pin_cpus", True),
+            mem_budget=conf.get("local_mem_budget"),
+            mem_per_run=conf.get("local_mem_per_run", 1.0),
+            mem_per_person=conf.get("local_mem_per_person", 1.0),
+            max_retries=conf.get("local_max_retries", 1),
+            resume=conf.get("local_resume", True),
+        )
+        code_loc = Path(conf.get("code_loc") or Path(__file__).resolve().parent.parent)
+        if not code_loc.exists():
+            print(f"Unknown code_loc {str(code_loc)}, running this installation's run.py")
+            code_loc = Path(__file__).resolve().parent.parent
+
     # run n_search jobs
     printlines()
     old_opts = set()
@@ -823,6 +861,8 @@ def main(conf: DictConfig) -> None:
             job_str = fill_beluga_template(template_str, conf)
         elif infra == "intel":
             job_str = fill_intel_template(template_str, conf)
+        elif infra == "local":
+            job_str = template_str
         else:
             raise ValueError("Unknown infra " + str(infra))
 
@@ -934,6 +974,17 @@ def main(conf: DictConfig) -> None:
                 exclude.add("intervention")
             hydra_args = get_hydra_args(opts, exclude)
 
+            # infra=local: queue the run in the executor instead of writing it to a job script
+            if infra == "local":
+                command = [sys.executable, "run.py"] + shlex.split(hydra_args)
+                if dev:
+                    print("\n>>> ", " ".join(command))
+                else:
+                    executor.submit(
+                        run_idx - 1, command, n_people=opts.get("n_people", DEFAULT_N_PEOPLE), cwd=code_loc
+                    )
+                continue
+
             # echo commandlines run in job
             if not dev:
                 job_str += f"\necho 'python run.py {hydra_args}'\n"
@@ -952,7 +1003,7 @@ def main(conf: DictConfig) -> None:
             job_str += "\n{}{}".format("python run.py" + hydra_args, command_suffix)
             # sample next params
 
-        if skipped:
+        if skipped or infra == "local":
             continue
         # output in slurm_tmpdir and move zips to original outdir specified
         if use_tmpdir and infra != "intel":
@@ -991,6 +1042,17 @@ def main(conf: DictConfig) -> None:
         print()
         printlines()
 
+    if executor is not None and not dev:
+        statuses = executor.run()
+        for status in ["done", "resumed", "failed"]:
+            print("{:8}: {} runs".format(status, sum(s == status for s in statuses.values())))
+        resume_index = executor.get_resume_index()
+        if resume_index is not None:
+            print(
+                "Some runs failed: launch the same search again to retry them (completed runs are skipped),"
+                + f" starting from start_index={resume_index} at the earliest"
+            )
+
 
 if __name__ == "__main__":
     main()
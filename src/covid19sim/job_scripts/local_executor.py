@@ -0,0 +1,223 @@
+"""
+Local backend of `experiment.py` (`infra=local`): runs the sampled simulations on the current machine, in a
+bounded pool of `python run.py ...` processes instead of sbatch scripts.
+
+Runs are started in order (retried ones going back to the end of the queue) as long as:
+    * fewer than `n_workers` runs are running. With `pin_cpus`, each worker owns `cpus_per_run` cpus of the machine
+        and its runs are pinned to them;
+    * the memory estimated for the running simulations and the next one fits in `mem_budget` (see `estimate_mem`).
+        A run that does not fit in the budget on its own is still started when no other run is running.
+
+The status of each run is recorded in a journal (`run index --> {"command", "status", "attempts"}`) so that a search
+that was interrupted or had failures can be resumed: launching `experiment.py` again (e.g. with the `start_index` of
+the first unfinished run) skips the runs that already completed with the same command.
+"""
+
+import json
+import os
+import subprocess
+import time
+from pathlib import Path
+
+DEFAULT_N_PEOPLE = 1000  # see configs/simulation/base_method.yaml
+
+
+def get_available_cpus():
+    """Returns the sorted cpus this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def get_total_mem():
+    """Returns the physical memory of the machine, in GB."""
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 3
+
+
+class LocalExecutor:
+    """
+    Schedules commands on a bounded pool of local processes (see the module docstring).
+
+    Args:
+        log_dir (str | pathlib.Path): where the output of each run is written, in `run_<run index>.out`
+        journal_path (str | pathlib.Path): json file recording the status of the runs. None to not record them.
+        n_workers (int): maximum number of runs at a time. Defaults to the number of cpus // `cpus_per_run`
+        cpus_per_run (int): number of cpus of each run (also sets the number of threads of numerical libraries)
+        pin_cpus (bool): pin each run to the `cpus_per_run` cpus of its worker
+        mem_budget (float): memory available to the runs, in GB. Defaults to 90% of the physical memory
+        mem_per_run (float): memory of a run regardless of its population (interpreter, modules, ...), in GB
+        mem_per_person (float): memory of a run per simulated human, in MB
+        max_retries (int): number of times a failed run is retried
+        resume (bool): skip the runs that completed with the same command according to the journal
+        poll_interval (float): seconds between checks of the running processes
+    """
+
+    def __init__(
+        self,
+        log_dir,
+        journal_path=None,
+        n_workers=None,
+        cpus_per_run=1,
+        pin_cpus=True,
+        mem_budget=None,
+        mem_per_run=1.0,
+        mem_per_person=1.0,
+        max_retries=1,
+        resume=True,
+        poll_interval=1.0,
+    ):
+        cpus = get_available_cpus()
+        assert cpus_per_run >= 1, f"invalid cpus_per_run: {cpus_per_run}"
+        self.cpu_slots = [cpus[i:i + cpus_per_run] for i in range(0, len(cpus) - cpus_per_run + 1, cpus_per_run)]
+        if n_workers is None:
+            n_workers = max(1, len(self.cpu_slots))
+        assert n_workers >= 1, f"invalid n_workers: {n_workers}"
+        if pin_cpus and not (hasattr(os, "sched_setaffinity") and n_workers <= len(self.cpu_slots)):
+            print(f"Not pinning runs: cannot give {cpus_per_run} cpus to each of {n_workers} workers")
+            pin_cpus = False
+
+        self.log_dir = Path(log_dir)
+        self.journal_path = Path(journal_path) if journal_path is not None else None
+        self.n_workers = n_workers
+        self.cpus_per_run = cpus_per_run
+        self.pin_cpus = pin_cpus
+        self.mem_budget = mem_budget if mem_budget is not None else 0.9 * get_total_mem()
+        self.mem_per_run = mem_per_run
+        self.mem_per_person = mem_per_person
+        self.max_retries = max_retries
+        self.resume = resume
+        self.poll_interval = poll_interval
+
+        self.journal = self._read_journal()
+        self.pending = []  # runs waiting to be started, as dicts of run_idx, command, cwd, mem, attempts
+        self.statuses = {}  # run index --> "done", "failed" or "resumed" (completed in a previous launch)
+
+    def _read_journal(self):
+        if self.journal_path is None or not self.journal_path.exists():
+            return {}
+        with self.journal_path.open("r") as f:
+            return json.load(f)
+
+    def _write_journal(self):
+        if self.journal_path is None:
+            return
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.journal_path.with_name(self.journal_path.name + ".tmp")
+        with tmp_path.open("w") as f:
+            json.dump(self.journal, f, indent=2, sort_keys=True)
+        os.replace(str(tmp_path), str(self.journal_path))
+
+    def _set_status(self, run, status):
+        self.journal[str(run["run_idx"])] = {
+            "command": run["command"], "status": status, "attempts": run["attempts"],
+        }
+        self._write_journal()
+
+    def estimate_mem(self, n_people):
+        """Returns the memory (in GB) a simulation of `n_people` humans is expected to need."""
+        return self.mem_per_run + self.mem_per_person * n_people / 1024
+
+    def submit(self, run_idx, command, n_people=DEFAULT_N_PEOPLE, cwd=None):
+        """
+        Queues a run, unless it completed with the same command in a previous launch (and `resume` is set).
+
+        Args:
+            run_idx (int): index of the run in the search (as in `start_index`)
+            command (list): the arguments of the command of the run
+            n_people (int): the number of humans of the simulation, to estimate its memory
+            cwd (str | pathlib.Path): the directory to run the command from
+
+        Returns:
+            (bool): whether the run was queued
+        """
+        command = [str(c) for c in command]
+        previous = self.journal.get(str(run_idx))
+        if self.resume and previous is not None and previous["status"] == "done" and previous["command"] == command:
+            self.statuses[run_idx] = "resumed"
+            return False
+        self.pending.append({
+            "run_idx": run_idx,
+            "command": command,
+            "cwd": str(cwd) if cwd is not None else None,
+            "mem": self.estimate_mem(n_people),
+            "attempts": 0,
+        })
+        return True
+
+    def _can_start(self, run, running):
+        if len(running) >= self.n_workers:
+            return False
+        if not running:
+            return True
+        return sum(r["mem"] for r in running.values()) + run["mem"] <= self.mem_budget
+
+    def _start(self, run, slot):
+        run["attempts"] += 1
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        log = (self.log_dir / f"run_{run['run_idx']}.out").open("a")
+        log.write(f"# attempt {run['attempts']}: {' '.join(run['command'])}\n")
+        log.flush()
+
+        env = dict(os.environ)
+        for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+            env.setdefault(var, str(self.cpus_per_run))
+        preexec_fn = None
+        if self.pin_cpus:
+            cpus = self.cpu_slots[slot]
+            preexec_fn = lambda: os.sched_setaffinity(0, cpus)
+
+        run["log"] = log
+        run["process"] = subprocess.Popen(
+            run["command"], cwd=run["cwd"], env=env, stdout=log, stderr=subprocess.STDOUT, preexec_fn=preexec_fn,
+        )
+        self._set_status(run, "running")
+
+    def _finish(self, run):
+        run["log"].close()
+        returncode = run.pop("process").returncode
+        del run["log"]
+        if returncode == 0:
+            self.statuses[run["run_idx"]] = "done"
+            self._set_status(run, "done")
+        elif run["attempts"] <= self.max_retries:
+            print(f"Run {run['run_idx']} failed (exit code {returncode}), retrying")
+            self.pending.append(run)
+        else:
+            print(f"Run {run['run_idx']} failed (exit code {returncode}), see {self.log_dir}/run_{run['run_idx']}.out")
+            self.statuses[run["run_idx"]] = "failed"
+            self._set_status(run, "failed")
+
+    def run(self):
+        """
+        Runs the queued commands until they all completed or failed `max_retries` + 1 times.
+        If interrupted, the running processes are terminated (and recorded as such in the journal).
+
+        Returns:
+            (dict): run index --> "done", "failed" or "resumed" (completed in a previous launch)
+        """
+        running = {}  # worker slot --> run
+        try:
+            while self.pending or running:
+                while self.pending and self._can_start(self.pending[0], running):
+                    slot = min(set(range(self.n_workers)) - set(running))
+                    running[slot] = self.pending.pop(0)
+                    self._start(running[slot], slot)
+                time.sleep(self.poll_interval)
+                for slot, run in list(running.items()):
+                    if run["process"].poll() is not None:
+                        del running[slot]
+                        self._finish(run)
+        except KeyboardInterrupt:
+            for run in running.values():
+                run["process"].terminate()
+                run["process"].wait()
+                run["log"].close()
+                self._set_status(run, "interrupted")
+            raise
+        return self.statuses
+
+    def get_resume_index(self):
+        """Returns the index of the first run that did not complete (the `start_index` to resume from), if any."""
+        unfinished = [run_idx for run_idx, status in self.statuses.items() if status == "failed"]
+        unfinished += [run["run_idx"] for run in self.pending]
+        return min(unfinished) if unfinished else None
@@ -13,22 +13,27 @@ import typing
 from collections import defaultdict, Counter
 from orderedset import OrderedSet
 
-from covid19sim.utils.utils import compute_distance, _get_random_area, relativefreq2absolutefreq, _convert_bin_5s_to_bin_10s, log
+from covid19sim.utils.utils import _get_random_area, relativefreq2absolutefreq, _convert_bin_5s_to_bin_10s, log, \
+    calculate_average_infectiousnesses
 from covid19sim.utils.demographics import get_humans_with_age, assign_households_to_humans, create_locations_and_assign_workplace_to_humans
+from covid19sim.utils.mobility_planner import presample_durations_in_parallel
 from covid19sim.log.track import Tracker
-from covid19sim.inference.heavy_jobs import batch_run_timeslot_heavy_jobs
+from covid19sim.inference.heavy_jobs import submit_timeslot_heavy_jobs
 from covid19sim.interventions.tracing import BaseMethod
-from covid19sim.inference.message_utils import UIDType, UpdateMessage, RealUserIDType
+from covid19sim.inference.message_utils import PersonalMailbox, UpdateMessageBatch, RealUserIDType, \
+    generate_batched_updates, risk_history_maps_to_array
 from covid19sim.distribution_normalization.dist_utils import get_rec_level_transition_matrix
 from covid19sim.interventions.tracing_utils import get_tracing_method
 from covid19sim.locations.test_facility import TestFacility
+from covid19sim.utils.population import PopulationTable
+from covid19sim.utils.location_index import LocationIndex
 
 
 if typing.TYPE_CHECKING:
     from covid19sim.human import Human
     from covid19sim.utils.env import Env
 
-PersonalMailboxType = typing.Dict[UIDType, typing.List[UpdateMessage]]
+PersonalMailboxType = PersonalMailbox
 SimulatorMailboxType = typing.Dict[RealUserIDType, PersonalMailboxType]
 
 
@@ -96,6 +101,9 @@ class City:
         self.households = OrderedSet()
         self.age_histogram = None
 
+        # (optional) columnar store of the per-human state that is queried for everyone at every hour
+        self.population = PopulationTable(env, capacity=n_people) if conf.get("USE_POPULATION_TABLE") else None
+
         log("Initializing humans ...", self.logfile)
         self.initialize_humans_and_locations()
 
@@ -116,7 +124,9 @@ class City:
         # database diffs between their last timeslot and their current timeslot; instead, we
         # will give them the global mailbox object (a dictionary) and have them 'pop' all
         # messages they consume from their own (simulation-only!) personal mailbox
-        self.global_mailbox: SimulatorMailboxType = defaultdict(dict)
+        self.global_mailbox: SimulatorMailboxType = defaultdict(PersonalMailbox)
+        # app jobs submitted by `submit_app_jobs` that have yet to be joined by `join_app_jobs`
+        self.pending_app_jobs = None
         self.tracker.initialize()
 
     def cleanup_global_mailbox(
@@ -126,24 +136,17 @@ class City:
         """Removes all messages older than 14 days from the global mailbox."""
         # note that to keep the simulator efficient, users will directly pop the update messages that
         # they consume, so this is only necessary for edge cases (e.g. dead people can't update)
+        # (mailboxes are bucketed by encounter day, so whole days are dropped at once)
         max_encounter_age = self.conf.get('TRACING_N_DAYS_HISTORY')
-        new_global_mailbox = defaultdict(dict)
-        for user_key, personal_mailbox in self.global_mailbox.items():
-            new_personal_mailbox = {}
-            for mailbox_key, messages in personal_mailbox.items():
-                for message in messages:
-                    if (current_timestamp - message.encounter_time).days <= max_encounter_age:
-                        if mailbox_key not in new_personal_mailbox:
-                            new_personal_mailbox[mailbox_key] = []
-                        new_personal_mailbox[mailbox_key].append(message)
-            new_global_mailbox[user_key] = new_personal_mailbox
-        self.global_mailbox = new_global_mailbox
+        current_day_idx = (current_timestamp - self.start_time).days
+        for personal_mailbox in self.global_mailbox.values():
+            personal_mailbox.cleanup(min_day_idx=current_day_idx - max_encounter_age)
 
     def register_new_messages(
             self,
             current_day_idx: int,
             current_timestamp: datetime.datetime,
-            update_messages: typing.List[UpdateMessage],
+            update_messages: UpdateMessageBatch,
             prev_human_risk_history_maps: typing.Dict["Human", typing.Dict[int, float]],
             new_human_risk_history_maps: typing.Dict["Human", typing.Dict[int, float]],
     ):
@@ -155,7 +158,9 @@ class City:
         careful how we use this data in a safe fashion so that (in real life) only non-PII info
         needs to be transmitted to the server for filtering.
         """
-        humans_with_updates = {self.hd[m._sender_uid] for m in update_messages}
+        if not len(update_messages):
+            return
+        humans_with_updates = {self.hd[uid] for uid in update_messages.sender_uids}
 
         if self.conf.get("USE_GAEN"):
             # update risk level change histogram using scores of new updaters
@@ -175,7 +180,7 @@ class City:
 
         # note that to keep the simulator efficient, users will have their own private mailbox inside
         # the global mailbox (this replaces the database diff logic & allows faster access)
-        for update_message in update_messages:
+        for update_message, encounter_day_idx in zip(update_messages, update_messages.encounter_day_idxs):
             source_human = self.hd[update_message._sender_uid]
             destination_human = self.hd[update_message._receiver_uid]
 
@@ -207,10 +212,9 @@ class City:
             source_human.contact_book.latest_update_time = \
                 max(source_human.contact_book.latest_update_time, current_timestamp)
             mailbox_key = update_message.uid  # mailbox key = message uid
-            personal_mailbox = self.global_mailbox[destination_human.name]
-            if mailbox_key not in personal_mailbox:
-                personal_mailbox[mailbox_key] = []
-            personal_mailbox[mailbox_key].append(update_message)
+            self.global_mailbox[destination_human.name].add_message(
+                day_idx=encounter_day_idx, mailbox_key=mailbox_key, message=update_message,
+            )
 
     def _check_should_send_message_gaen(
             self,
@@ -296,13 +300,18 @@ class City:
         # prepare schedule
         log("Preparing schedule ... ")
         start_time = datetime.datetime.now()
-        # TODO - parallelize this for speedup in initialization
+        # (optional) the durations of the schedules are presampled by a pool of processes
+        presampled_durations = {}
+        if self.conf.get("INIT_N_JOBS", 1) > 1:
+            presampled_durations = presample_durations_in_parallel(self.humans, self.conf, self.env.timestamp, self.conf["INIT_N_JOBS"])
         for human in self.humans:
-            human.mobility_planner.initialize()
+            human.mobility_planner.initialize(presampled_durations.get(human))
 
         timedelta = (datetime.datetime.now() - start_time).total_seconds()
         log(f"Schedule prepared (Took {timedelta:2.3f}s)", self.logfile)
         self.hd = {human.name: human for human in self.humans}
+        if self.population is not None:
+            self.population.set_order(self.humans)
 
     def _initiate_infection_spread_and_modify_mixing_if_needed(self):
         """
@@ -440,11 +449,15 @@ class City:
     def _compute_preferences(self):
         """
         Compute preferred distribution of each human for park, stores, etc.
-        /!\ Modifies each human's stores_preferences and parks_preferences
+        /!\ Builds `self.location_index`, which holds the preferences of each household for its nearest parks and stores
         """
-        for h in self.humans:
-            h.stores_preferences = [(compute_distance(h.household, s) + 1e-1) ** -1 for s in self.stores]
-            h.parks_preferences = [(compute_distance(h.household, s) + 1e-1) ** -1 for s in self.parks]
+        self.location_index = LocationIndex(
+            {"STORE": self.stores, "PARK": self.parks, "MISC": self.miscs, "HOSPITAL": self.hospitals},
+            top_k=self.conf.get("LOCATION_PREFERENCE_TOP_K"),
+        )
+        households = OrderedSet(h.household for h in self.humans)
+        self.location_index.compute_preferences("STORE", households)
+        self.location_index.compute_preferences("PARK", households)
 
     def run(self, duration, outfile):
         """
@@ -514,28 +527,30 @@ class City:
             # TODO: testing budget is used up at hour 0 if its small
             self.covid_testing_facility.clear_test_queue()
 
-            alive_humans = []
+            if self.population is not None:
+                alive_mask = self.population.alive_mask()
+                alive_humans = self.population.select(alive_mask)
+            else:
+                alive_mask = None
+                alive_humans = [human for human in self.humans if not human.is_dead]
 
             # run non-app-related-stuff for all humans here (test seeking, infectiousness updates)
-            for human in self.humans:
-                if not human.is_dead:
-                    human.check_if_needs_covid_test()  # humans can decide to get tested whenever
-                    human.check_covid_symptom_start()
-                    human.check_covid_recovery()
-                    human.fill_infectiousness_history_map(current_day)
-                    alive_humans.append(human)
+            for human in alive_humans:
+                human.check_if_needs_covid_test()  # humans can decide to get tested whenever
+                human.check_covid_symptom_start()
+                human.check_covid_recovery()
+            self.fill_infectiousness_history_maps(current_day, alive_humans)
 
             # now, run app-related stuff (risk assessment, message preparation, ...)
-            prev_risk_history_maps, update_messages = self.run_app(current_day, outfile, alive_humans)
-
-            # update messages may not be sent if the distribution strategy (e.g. GAEN) chooses to filter them
-            self.register_new_messages(
-                current_day_idx=current_day,
-                current_timestamp=self.env.timestamp,
-                update_messages=update_messages,
-                prev_human_risk_history_maps=prev_risk_history_maps,
-                new_human_risk_history_maps={h: h.risk_history_map for h in self.humans},
-            )
+            if self.conf.get("ASYNC_HEAVY_JOBS"):
+                # the heavy jobs of the previous timeslot ran in the background while its humans
+                # moved around; join them before any message is generated, then submit ours
+                if self.pending_app_jobs is not None:
+                    self._register_app_updates(current_day, *self.join_app_jobs())
+                self.submit_app_jobs(current_day, alive_humans, alive_mask)
+            else:
+                prev_risk_history_maps, update_messages = self.run_app(current_day, outfile, alive_humans, alive_mask)
+                self._register_app_updates(current_day, prev_risk_history_maps, update_messages)
 
             # for debugging/plotting a posteriori, track all human/location attributes...
             self.tracker.track_humans(hd=self.hd, current_timestamp=self.env.timestamp)
@@ -544,12 +559,45 @@ class City:
             yield self.env.timeout(int(duration))
             # finally, run end-of-day activities (if possible); these include mailbox cleanups, symptom updates, ...
             if current_day != last_day_idx:
-                alive_humans = [human for human in self.humans if not human.is_dead]
+                if self.population is not None:
+                    alive_humans = self.population.select(self.population.alive_mask())
+                else:
+                    alive_humans = [human for human in self.humans if not human.is_dead]
                 last_day_idx = current_day
                 if self.conf.get("DIRECT_INTERVENTION", -1) == current_day:
                     self.conf['GLOBAL_MOBILITY_SCALING_FACTOR'] = self.conf['GLOBAL_MOBILITY_SCALING_FACTOR']  / 2
                 self.do_daily_activies(current_day, alive_humans)
 
+    def _register_app_updates(
+            self,
+            current_day: int,
+            prev_risk_history_maps: typing.Dict,
+            update_messages: UpdateMessageBatch,
+    ):
+        """Registers the update messages returned by `run_app` (or `join_app_jobs`)."""
+        # update messages may not be sent if the distribution strategy (e.g. GAEN) chooses to filter them
+        self.register_new_messages(
+            current_day_idx=current_day,
+            current_timestamp=self.env.timestamp,
+            update_messages=update_messages,
+            prev_human_risk_history_maps=prev_risk_history_maps,
+            new_human_risk_history_maps={h: h.risk_history_map for h in self.humans},
+        )
+
+    def fill_infectiousness_history_maps(
+            self,
+            current_day: int,
+            alive_humans: typing.Iterable["Human"],
+    ):
+        """Populates the infectiousness of the day in the maps of all humans that are still alive."""
+        if self.conf['RISK_MODEL'] != "transformer" and not self.conf['COLLECT_TRAINING_DATA']:
+            return
+        # /!\ Only used for oracle and transformer
+        # contrarily to risk, infectiousness only changes once a day (human behavior has no impact)
+        humans = [human for human in alive_humans if current_day not in human.infectiousness_history_map]
+        for human, infectiousness in zip(humans, calculate_average_infectiousnesses(humans)):
+            human.infectiousness_history_map[current_day] = infectiousness
+
     def do_daily_activies(
             self,
             current_day: int,
@@ -583,8 +631,9 @@ class City:
             self,
             current_day: int,
             outfile: typing.AnyStr,
-            alive_humans: typing.Iterable["Human"]
-    ) -> typing.Tuple[typing.Dict, typing.List[UpdateMessage]]:
+            alive_humans: typing.Iterable["Human"],
+            alive_mask: typing.Optional[np.ndarray] = None,
+    ) -> typing.Tuple[typing.Dict, UpdateMessageBatch]:
         """Runs the application logic for all humans that are still alive.
 
         The logic is split into three parts. First, 'lightweight' jobs will run. These include
@@ -593,16 +642,40 @@ class City:
         training data, batches of humans will be used to do clustering and to call the model. Finally,
         the recommendation level of all humans will be updated, they will generate update messages
         (if necessary), and the tracker will be updated with the state of all humans.
+
+        If the city keeps a population table, `alive_mask` is the mask of `alive_humans` over its rows.
         """
+        self.submit_app_jobs(current_day, alive_humans, alive_mask, run_in_background=False)
+        return self.join_app_jobs()
+
+    def submit_app_jobs(
+            self,
+            current_day: int,
+            alive_humans: typing.Iterable["Human"],
+            alive_mask: typing.Optional[np.ndarray] = None,
+            run_in_background: bool = True,
+    ):
+        """Runs the 'lightweight' app jobs, and submits the 'heavy' ones (see `run_app`).
+
+        The heavy jobs (clustering + risk prediction) run in the background until `join_app_jobs` is
+        called; with `ASYNC_HEAVY_JOBS`, this happens at the next timeslot, so the recommendation levels
+        and update messages of the humans lag one timeslot behind the synchronous mode.
+        """
+        assert self.pending_app_jobs is None, "previous app jobs were never joined"
         backup_human_init_risks = {}  # backs up human risks before any update takes place
 
+        # humans with the app whose timeslot is now
+        if alive_mask is not None:
+            app_mask = alive_mask & self.population.app_holders_in_timeslot_mask(self.env.timestamp.hour)
+            app_humans = self.population.select(app_mask)
+        else:
+            app_humans = [
+                human for human in alive_humans
+                if human.has_app and self.env.timestamp.hour in human.time_slots
+            ]
+
         # iterate over humans, and if it's their timeslot, then update their state
-        for human in alive_humans:
-            if (
-                not human.has_app
-                or self.env.timestamp.hour not in human.time_slots
-            ):
-                continue
+        for human in app_humans:
             # set the human's risk to a correct value for the day (if it does not exist already)
             human.initialize_daily_risk(current_day)
             # keep a backup of the current risk map before infering anything, in case GAEN needs it
@@ -615,12 +688,13 @@ class City:
             )
 
         # now, batch-run the clustering + risk prediction using an ML model (if we need it)
+        pending_heavy_jobs = None
         if (
             self.conf.get("RISK_MODEL") == "transformer"
             or "heuristic" in self.conf.get("RISK_MODEL")
             or self.conf.get("COLLECT_TRAINING_DATA")
         ):
-            self.humans = batch_run_timeslot_heavy_jobs(
+            pending_heavy_jobs = submit_timeslot_heavy_jobs(
                 humans=self.humans,
                 init_timestamp=self.start_time,
                 current_timestamp=self.env.timestamp,
@@ -628,14 +702,20 @@ class City:
                 time_slot=self.env.timestamp.hour,
                 conf=self.conf,
                 city_hash=self.hash,
+                run_in_background=run_in_background,
             )
-
-        # iterate over humans again, and if it's their timeslot, then prepare risk update messages
-        update_messages = []
-        for human in alive_humans:
-            if not human.has_app or self.env.timestamp.hour not in human.time_slots:
-                continue
-
+        self.pending_app_jobs = (current_day, app_humans, backup_human_init_risks, pending_heavy_jobs)
+
+    def join_app_jobs(self) -> typing.Tuple[typing.Dict, UpdateMessageBatch]:
+        """Joins the app jobs submitted by `submit_app_jobs`, and prepares the update messages to send."""
+        assert self.pending_app_jobs is not None, "no app jobs were submitted"
+        current_day, app_humans, backup_human_init_risks, pending_heavy_jobs = self.pending_app_jobs
+        self.pending_app_jobs = None
+        if pending_heavy_jobs is not None:
+            pending_heavy_jobs.join()
+
+        # iterate over humans again, and if it's their timeslot, then update their rec level
+        for human in app_humans:
             # overwrite risk values to 1.0 if human has positive test result (for all tracing methods)
             if human.reported_test_result == "positive":
                 for day_offset in range(self.conf.get("TRACING_N_DAYS_HISTORY")):
@@ -644,33 +724,38 @@ class City:
             # using the risk history map & the risk level map, update the human's rec level
             human.update_recommendations_level()
 
-            # if we had any encounters for which we have not sent an initial message, do it now
-            update_messages.extend(human.contact_book.generate_initial_updates(
-                current_day_idx=current_day,
-                current_timestamp=self.env.timestamp,
-                risk_history_map=human.risk_history_map,
-                proba_to_risk_level_map=human.proba_to_risk_level_map,
-                intervention=human.intervention,
-            ))
-
-            # then, generate risk level update messages for all other encounters (if needed)
-            update_messages.extend(human.contact_book.generate_updates(
-                current_day_idx=current_day,
-                current_timestamp=self.env.timestamp,
-                prev_risk_history_map=human.prev_risk_history_map,
-                curr_risk_history_map=human.risk_history_map,
-                proba_to_risk_level_map=human.proba_to_risk_level_map,
-                update_reason="unknown",
-                intervention=human.intervention,
-            ))
-
-            # finally, override the 'previous' risk history map with the updated values of the current
-            # map so that the next call can look at the proper difference between the two
+        # prepare the initial risk messages for new encounters & the risk level update messages for
+        # all other encounters of the humans that use tracing (batched across humans)
+        tracing_humans = [human for human in app_humans if human.intervention is not None]
+        n_days = self.conf.get("TRACING_N_DAYS_HISTORY") + 1
+        update_messages = generate_batched_updates(
+            contact_books=[human.contact_book for human in tracing_humans],
+            current_day_idx=current_day,
+            current_timestamp=self.env.timestamp,
+            prev_risk_histories=risk_history_maps_to_array(
+                [human.prev_risk_history_map for human in tracing_humans], current_day, n_days,
+            ),
+            curr_risk_histories=risk_history_maps_to_array(
+                [human.risk_history_map for human in tracing_humans], current_day, n_days,
+            ),
+            risk_mapping=np.array(self.conf.get("RISK_MAPPING")),
+            update_reason="unknown",
+        )
+
+        # finally, override the 'previous' risk history map with the updated values of the current
+        # map so that the next call can look at the proper difference between the two
+        for human in app_humans:
             for day_idx, risk_val in human.risk_history_map.items():
                 human.prev_risk_history_map[day_idx] = risk_val
 
         return backup_human_init_risks, update_messages
 
+    def finish_app_jobs(self):
+        """Joins the app jobs still pending when the simulation stops (with `ASYNC_HEAVY_JOBS`), and registers their updates."""
+        if self.pending_app_jobs is not None:
+            current_day = self.pending_app_jobs[0]
+            self._register_app_updates(current_day, *self.join_app_jobs())
+
 
 class EmptyCity(City):
     """
@@ -720,6 +805,7 @@ class EmptyCity(City):
 
         self.humans = []
         self.hd = {}
+        self.population = None
         self.households = OrderedSet()
         self.stores = []
         self.senior_residences = []
@@ -728,7 +814,8 @@ class EmptyCity(City):
         self.parks = []
         self.schools = []
         self.workplaces = []
-        self.global_mailbox: SimulatorMailboxType = defaultdict(dict)
+        self.global_mailbox: SimulatorMailboxType = defaultdict(PersonalMailbox)
+        self.pending_app_jobs = None
         self.n_init_infected  = 0
         self.init_fraction_sick = 0
 
@@ -10,7 +10,7 @@ from collections import namedtuple
 import numpy as np
 import warnings
 
-from covid19sim.utils.utils import _sample_positive_normal
+from covid19sim.utils.utils import _sample_positive_normal_array
 from covid19sim.epidemiology.p_infection import get_environment_human_p_transmission
 from covid19sim.epidemiology.viral_load import compute_covid_properties
 
@@ -21,13 +21,40 @@ from covid19sim.utils.constants import QUARANTINE_HOUSEHOLD
 
 DistanceProfile = namedtuple("DistanceProfile", ['encounter_term', 'social_distancing_term', 'packing_term', 'distance'])
 
-def _extract_attrs(human, candidate, location):
-    return (
-        candidate,
-        candidate.age_bin_width_5.index,
-        candidate in human.known_connections,
-        human.intervened_behavior.daily_interaction_reduction_factor(location)
-    )
+def _swap_remove(items, positions, item):
+    """
+    Removes `item` from `items` in O(1) by moving the last element of `items` into its slot.
+
+    Args:
+        items (list): list from which `item` is to be removed
+        positions (dict): maps each element of `items` to its position in `items`. It is updated in place.
+        item (object): element to remove
+    """
+    idx = positions.pop(item)
+    last = items.pop()
+    if last is not item:
+        items[idx] = last
+        positions[last] = idx
+
+def _pick_excluding(items, exclude_idx, u):
+    """
+    Picks an element of `items` other than the one at `exclude_idx` using a uniform random number `u` in [0, 1).
+
+    Args:
+        items (list): list of elements to pick from
+        exclude_idx (int): position of the element that should not be picked. None if all elements can be picked.
+        u (float): uniform random number in [0, 1)
+
+    Returns:
+        (object): picked element
+    """
+    if exclude_idx is None:
+        return items[int(u * len(items))]
+
+    idx = int(u * (len(items) - 1))
+    if idx >= exclude_idx:
+        idx += 1
+    return items[idx]
 
 def _adjust_surveyed_contacts_to_regional_contacts(MEAN_DAILY_KNOWN_CONTACTS_FOR_AGEGROUP, conf, MEAN_DAILY_KNOWN_CONTACTS=None):
     """
@@ -94,7 +121,15 @@ class Location(simpy.Resource):
         self.contamination_timestamp = datetime.datetime.min
         self.max_day_contamination = 0
         self.is_open_for_business = True
-        self.binned_humans = {bin:OrderedSet() for bin in AGE_BIN_WIDTH_5}
+
+        # array-backed index of current occupants; kept up to date in add_human/remove_human so that
+        # sampling interactees is O(bins + k) instead of a scan over everyone at the location
+        self._occupants = []  # swap-remove list of humans at the location
+        self._occupant_idx = {}  # human --> position in self._occupants
+        self._binned_occupants = [[] for _ in AGE_BIN_WIDTH_5]  # swap-remove list of humans per age bin (width 5)
+        self._binned_occupant_idx = {}  # human --> position in self._binned_occupants[age_bin]
+        self._binned_counts = np.zeros(len(AGE_BIN_WIDTH_5), dtype=np.int64)  # number of humans per age bin
+        self._leaving_humans = []  # (human, unknown_only, event) waiting for interactions to be sampled in batch
         self.social_contact_factor = conf[f'{location_type}_CONTACT_FACTOR']
         self.contaminated_surface_probability = conf[f'{location_type}_SURFACE_PROB']
 
@@ -156,8 +191,18 @@ class Location(simpy.Resource):
         Args:
             human (covid19sim.human.Human): The human to add.
         """
+        if human in self.humans:
+            return
+
         self.humans.add(human)
-        self.binned_humans[human.age_bin_width_5.bin].add(human)
+
+        # index the occupant
+        age_bin = human.age_bin_width_5.index
+        self._occupant_idx[human] = len(self._occupants)
+        self._occupants.append(human)
+        self._binned_occupant_idx[human] = len(self._binned_occupants[age_bin])
+        self._binned_occupants[age_bin].append(human)
+        self._binned_counts[age_bin] += 1
 
     def remove_human(self, human):
         """
@@ -182,7 +227,12 @@ class Location(simpy.Resource):
                 ))
                 self.max_day_contamination = max(self.max_day_contamination, rnd_surface)
             self.humans.remove(human)
-            self.binned_humans[human.age_bin_width_5.bin].remove(human)
+
+            # remove the occupant from the index (swap with the last element to keep it O(1))
+            age_bin = human.age_bin_width_5.index
+            _swap_remove(self._occupants, self._occupant_idx, human)
+            _swap_remove(self._binned_occupants[age_bin], self._binned_occupant_idx, human)
+            self._binned_counts[age_bin] -= 1
 
     @property
     def is_contaminated(self):
@@ -233,7 +283,13 @@ class Location(simpy.Resource):
 
     def _sample_interactee(self, type, human, n=1):
         """
-        Samples encounter partner of `type` for `human`
+        Samples encounter partner of `type` for `human`.
+
+        For "known" interactions, probability of sampling `other_human` is proportional to
+        P_CONTACT[other_human's age bin, human's age bin] * ((1 - PREFERENTIAL_ATTACHMENT_FACTOR) + is_known * PREFERENTIAL_ATTACHMENT_FACTOR).
+        We sample an age bin first and then a member of that bin, so that the cost of a draw depends on the
+        number of age bins and the number of `human`'s known connections that are present, and not on the number
+        of humans at this location.
 
         Args:
             type (string): type of interaction to sample. expects "known", "unknown"
@@ -252,107 +308,149 @@ class Location(simpy.Resource):
             if len(self.humans) - 1 == n:
                 return [h for h in self.humans if h != human and h in human.known_connections]
 
-            human_bin = human.age_bin_width_5.index
-            candidate_humans = [h for h in self.humans if human != h]
-            other_humans, h_vector, known_vector, reduction_factor = list(zip(*[_extract_attrs(human, h, self) for h in candidate_humans]))
-
-            p_contact = self.P_CONTACT[h_vector, human_bin] * (1 - PREFERENTIAL_ATTACHMENT_FACTOR)
-            p_contact += np.array(known_vector) * self.P_CONTACT[h_vector, human_bin] * PREFERENTIAL_ATTACHMENT_FACTOR
             # reduction factor is due to mutual interaction sampling where other_human's reduction factor is taken into account
-            p_contact *= (1 - np.array(reduction_factor))
-            if p_contact.sum() == 0:
+            # /!\ it is the same for all candidates, so it only matters when it rules out all interactions
+            reduction_factor = human.intervened_behavior.daily_interaction_reduction_factor(self)
+            if reduction_factor == 1:
                 return [None]
 
-            p_contact /= p_contact.sum()
+            human_bin = human.age_bin_width_5.index
+            human_binned_idx = self._binned_occupant_idx.get(human, None)
+            n_candidates = self._binned_counts.copy()
+            if human_binned_idx is not None:
+                n_candidates[human_bin] -= 1
+
+            # known connections that are currently here (ordered by their position at the location for determinism)
+            if len(human.known_connections) < len(self._occupants):
+                known_here = [h for h in human.known_connections if h in self._occupant_idx]
+                known_here.sort(key=self._occupant_idx.__getitem__)
+            else:
+                known_here = [h for h in self._occupants if h in human.known_connections]
+
+            known_here_by_bin = [[] for _ in AGE_BIN_WIDTH_5]
+            for h in known_here:
+                known_here_by_bin[h.age_bin_width_5.index].append(h)
+            n_known = np.array([len(x) for x in known_here_by_bin])
+
+            # total weight of each age bin
+            p_contact_bin = self.P_CONTACT[:, human_bin]
+            weight_all = p_contact_bin * n_candidates * (1 - PREFERENTIAL_ATTACHMENT_FACTOR)
+            weight_known = p_contact_bin * n_known * PREFERENTIAL_ATTACHMENT_FACTOR
+            weight = weight_all + weight_known
+            if weight.sum() == 0:
+                return [None]
+
+            bins = self.rng.choice(len(weight), size=n, p=weight / weight.sum(), replace=True)
+            u_known, u_member = self.rng.random(n), self.rng.random(n)
+
+            # within a bin, a member is either sampled uniformly (base weight) or from the known connections (attachment weight)
+            interactees = []
+            for bin, u1, u2 in zip(bins, u_known, u_member):
+                if u1 * weight[bin] < weight_known[bin]:
+                    interactees.append(known_here_by_bin[bin][int(u2 * n_known[bin])])
+                else:
+                    exclude_idx = human_binned_idx if bin == human_bin else None
+                    interactees.append(_pick_excluding(self._binned_occupants[bin], exclude_idx, u2))
+            return interactees
 
         elif type == "unknown":
             if len(self.humans) - 1 == n:
                 return [h for h in self.humans if h != human]
 
-            other_humans = [x for x in self.humans if x != human]
-            p_contact = np.ones_like(other_humans, dtype=np.float) / len(other_humans)
+            exclude_idx = self._occupant_idx.get(human, None)
+            return [_pick_excluding(self._occupants, exclude_idx, u) for u in self.rng.random(n)]
 
         else:
             raise
 
-        return self.rng.choice(other_humans, size=n, p=p_contact, replace=True).tolist()
-
-    def _sample_interaction_with_type(self, type, human):
+    def _sample_interactions_with_type(self, type, humans):
         """
-        Samples interactions of type `type` for `human`.
+        Samples interactions of type `type` for each human in `humans`.
+        Number of interactions, distances, and durations are sampled for all the encounters at once.
 
         Args:
             type (string): type of interaction to sample. expects "known", "unknown"
-            human (covid19sim.human.Human): human who will interact with the sampled human
+            humans (list): humans (covid19sim.human.Human) at this location for whom interactions need to be sampled
 
         Returns:
-            interactions (list): each element is as follows -
+            interactions (list): list of interactions for each human in `humans`. Each interaction is as follows -
                 human (covid19sim.human.Human): other human with whom to have `type` of interaction
                 distance_profile (covid19sim.locations.location.DistanceProfile): distance from which these two humans met (cms)
                 duration (float): duration for which this encounter took place (seconds)
         """
+        interactions = [[] for _ in humans]
+        if len(humans) == 0:
+            return interactions
 
         if type == "known":
-            mean_daily_interactions = self.MEAN_DAILY_KNOWN_CONTACTS_FOR_AGEGROUP[human.age_bin_width_5.index]
-            mean_daily_interactions *= (1 - human.intervened_behavior.daily_interaction_reduction_factor(self))
+            age_bins = np.array([human.age_bin_width_5.index for human in humans])
+            reduction_factors = np.array([human.intervened_behavior.daily_interaction_reduction_factor(self) for human in humans])
+            mean_daily_interactions = self.MEAN_DAILY_KNOWN_CONTACTS_FOR_AGEGROUP[age_bins] * (1 - reduction_factors)
             min_dist_encounter = self.conf['MIN_DIST_KNOWN_CONTACT']
             max_dist_encounter = self.conf['MAX_DIST_KNOWN_CONTACT']
-            mean_interaction_time = None
         elif type == "unknown":
-            mean_daily_interactions = self.conf['_MEAN_DAILY_UNKNOWN_CONTACTS']
+            mean_daily_interactions = np.full(len(humans), self.conf['_MEAN_DAILY_UNKNOWN_CONTACTS'], dtype=np.float64)
             min_dist_encounter = self.conf['MIN_DIST_UNKNOWN_CONTACT']
             max_dist_encounter = self.conf['MAX_DIST_UNKNOWN_CONTACT']
             mean_interaction_time = self.conf["GAMMA_UNKNOWN_CONTACT_DURATION"]
         else:
-            raise
+            raise ValueError(f"Unknown interaction type: {type}")
 
         mean_daily_interactions += 1e-6 # to avoid error in sampling with 0 mean from negative binomial
         scale_factor_interaction_time = self.conf['SCALE_FACTOR_CONTACT_DURATION']
         # (assumption) maximum allowable distance is when humans are uniformly spaced
         packing_term = 100 * np.sqrt(self.area/len(self.humans))
 
-        interactions = []
-        n_interactions = min(len(self.humans) - 1, self.rng.negative_binomial(mean_daily_interactions, 0.5))
-        interactees = self._sample_interactee(type, human, n=n_interactions)
-        for other_human in interactees:
-            if other_human is None:
-                continue
-
-            assert other_human != human, "sampling with self is not allowed"
-            # sample duration of encounter (seconds)
-            t_overlap = (min(human.location_leaving_time, other_human.location_leaving_time) -
-                         max(human.location_start_time,   other_human.location_start_time))
-
-            # if the overlap duration is less than a relevant duration for infection, it is of no use.
-            if t_overlap < min(self.conf['MIN_MESSAGE_PASSING_DURATION'], self.conf['INFECTION_DURATION']):
+        # sample partners of all humans; encounters are then processed as flat arrays
+        n_interactions = np.minimum(len(self.humans) - 1, self.rng.negative_binomial(mean_daily_interactions, 0.5))
+        encounter_idx, other_humans = [], []
+        for i, (human, n) in enumerate(zip(humans, n_interactions)):
+            if n == 0:
                 continue
+            for other_human in self._sample_interactee(type, human, n=n):
+                if other_human is None:
+                    continue
+                assert other_human != human, "sampling with self is not allowed"
+                encounter_idx.append(i)
+                other_humans.append(other_human)
+
+        if len(other_humans) == 0:
+            return interactions
+
+        # overlap duration of encounter (seconds)
+        encounter_idx = np.array(encounter_idx)
+        start_time = np.array([human.location_start_time for human in humans])[encounter_idx]
+        leaving_time = np.array([human.location_leaving_time for human in humans])[encounter_idx]
+        other_start_time = np.array([other_human.location_start_time for other_human in other_humans])
+        other_leaving_time = np.array([other_human.location_leaving_time for other_human in other_humans])
+        t_overlap = np.minimum(leaving_time, other_leaving_time) - np.maximum(start_time, other_start_time)
+
+        # if the overlap duration is less than a relevant duration for infection, it is of no use.
+        relevant = np.flatnonzero(t_overlap >= min(self.conf['MIN_MESSAGE_PASSING_DURATION'], self.conf['INFECTION_DURATION']))
+        if len(relevant) == 0:
+            return interactions
+        encounter_idx, t_overlap = encounter_idx[relevant], t_overlap[relevant]
+        other_humans = [other_humans[j] for j in relevant]
+
+        # sample distance of encounter
+        encounter_terms = self.rng.uniform(min_dist_encounter, max_dist_encounter, size=len(relevant))
+        distances = np.clip(encounter_terms, a_min=0, a_max=packing_term)
+
+        # sample duration of encounter (seconds)
+        if type == "known":
+            age_bins = age_bins[encounter_idx]
+            other_age_bins = np.array([other_human.age_bin_width_5.index for other_human in other_humans])
+            mean_duration = self.MEAN_DAILY_CONTACT_DURATION_SECONDS[other_age_bins, age_bins]
+            sigma_duration = self.STDDEV_DAILY_CONTACT_DURATION_SECONDS[other_age_bins, age_bins]
+            # surveyed data gives us minutes per day. Here we use it to sample rate of minutes spend per second of overlap in an encounter.
+            durations = _sample_positive_normal_array(mean_duration, sigma_duration, self.rng, upper_limit=t_overlap)
+        else:
+            durations = self.rng.gamma(mean_interaction_time/scale_factor_interaction_time, scale_factor_interaction_time, size=len(relevant))
 
-            # sample distance of encounter
-            encounter_term = self.rng.uniform(min_dist_encounter, max_dist_encounter)
-            distance = np.clip(encounter_term, a_min=0, a_max=packing_term)
+        # add to the list
+        for i, other_human, encounter_term, distance, duration in zip(encounter_idx, other_humans, encounter_terms, distances, durations):
             distance_profile = DistanceProfile(encounter_term=encounter_term, packing_term=packing_term, social_distancing_term=None, distance=distance)
-
-            if type == "known":
-                age_bin = human.age_bin_width_5.index
-                other_bin = other_human.age_bin_width_5.index
-                mean_duration = self.MEAN_DAILY_CONTACT_DURATION_SECONDS[other_bin, age_bin]
-                sigma_duration = self.STDDEV_DAILY_CONTACT_DURATION_SECONDS[other_bin, age_bin]
-                # surveyed data gives us minutes per day. Here we use it to sample rate of minutes spend per second of overlap in an encounter.
-                # duration = (_sample_positive_normal(mean_duration, sigma_duration, self.rng) / SECONDS_PER_DAY) * t_overlap * SECONDS_PER_MINUTE
-                duration = _sample_positive_normal(mean_duration, sigma_duration, self.rng, upper_limit=t_overlap)
-
-            elif type == "unknown":
-                duration = self.rng.gamma(mean_interaction_time/scale_factor_interaction_time, scale_factor_interaction_time)
-
-            else:
-                raise ValueError(f"Unknown interaction type: {type}")
-
-            # (debug)
-            # if self.location_type ==  "HOUSEHOLD" and type == "known" and human.mobility_planner.current_activity.name != "socialize":# and human.workplace != self:
-            #     print(human, "-->", other_human, "for", duration / SECONDS_PER_MINUTE, "tota humans", len(self.humans), "t_overlap", t_overlap / SECONDS_PER_MINUTE, human.mobility_planner.current_activity)
-
-            # add to the list
-            interactions.append((other_human, distance_profile, duration))
+            interactions[i].append((other_human, distance_profile, duration))
 
         return interactions
 
@@ -379,12 +477,64 @@ class Location(simpy.Resource):
             assert human == self.humans[0]
             return [], []
 
-        known_interactions = []
-        unknown_interactions = self._sample_interaction_with_type("unknown", human)
-        if not unknown_only:
-            known_interactions = self._sample_interaction_with_type("known", human)
+        return self.sample_interactions_batch([human], [unknown_only])[0]
+
+    def sample_interactions_batch(self, humans, unknown_only):
+        """
+        Samples interactions for all `humans` at this location at once.
+
+        Args:
+            humans (list): humans (covid19sim.human.Human) at this location for whom interactions need to be sampled
+            unknown_only (list): whether to sample interactions of type `unknown` only, for each human in `humans`
+
+        Returns:
+            (list): (known_interactions, unknown_interactions) for each human in `humans`. See `sample_interactions`.
+        """
+        if len(self.humans) <= 1:
+            return [([], []) for _ in humans]
 
-        return known_interactions, unknown_interactions
+        unknown_interactions = self._sample_interactions_with_type("unknown", humans)
+
+        known_interactions = [[] for _ in humans]
+        known_idx = [i for i, x in enumerate(unknown_only) if not x]
+        sampled = self._sample_interactions_with_type("known", [humans[i] for i in known_idx])
+        for i, interactions in zip(known_idx, sampled):
+            known_interactions[i] = interactions
+
+        return list(zip(known_interactions, unknown_interactions))
+
+    def request_interactions(self, human, unknown_only=False):
+        """
+        Registers `human` as leaving this location at the current time. Interactions of all the humans leaving
+        at the same time are sampled together once all of them are registered (see `_sample_leaving_humans`).
+
+        Args:
+            human (covid19sim.human.Human): human for whom interactions need to be sampled
+            unknown_only (bool): whether to sample interactions of type `unknown` only
+
+        Returns:
+            (simpy.events.Event): event whose value is (known_interactions, unknown_interactions) for `human`
+        """
+        event = self.env.event()
+        if len(self._leaving_humans) == 0:
+            self.env.process(self._sample_leaving_humans())
+        self._leaving_humans.append((human, unknown_only, event))
+        return event
+
+    def _sample_leaving_humans(self):
+        """
+        Samples interactions for all humans registered through `request_interactions`.
+        The zero timeout puts this process behind all the events that are already scheduled for the current time,
+        so that all the humans leaving at this time are registered when the sampling takes place.
+
+        Yields:
+            (simpy.events.Timeout)
+        """
+        yield self.env.timeout(0)
+        leaving_humans, self._leaving_humans = self._leaving_humans, []
+        humans, unknown_only, events = zip(*leaving_humans)
+        for event, interactions in zip(events, self.sample_interactions_batch(humans, unknown_only)):
+            event.succeed(interactions)
 
     def check_environmental_infection(self, human):
         """
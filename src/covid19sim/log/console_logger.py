@@ -101,7 +101,11 @@ Legend -
             flu = sum(h.has_flu for h in city.humans)
 
             # intervention related
-            n_quarantine = sum(h.intervened_behavior.is_under_quarantine for h in city.humans if not h.is_dead)
+            if city.population is not None:
+                alive_humans = city.population.select(city.population.alive_mask())
+            else:
+                alive_humans = [h for h in city.humans if not h.is_dead]
+            n_quarantine = sum(h.intervened_behavior.is_under_quarantine for h in alive_humans)
 
             # prepare string
             nd = str(len(str(city.n_people)))
@@ -0,0 +1,299 @@
+"""
+Columnar (zarr) streams of the events recorded by the `Tracker` over a simulation (infections, tests, ...).
+
+Instead of keeping a growing list of per-event dictionaries in memory for the whole simulation, an
+`EventStream` buffers at most `chunk_size` events and appends them to the typed arrays of its zarr group
+whenever the buffer is full. Each group holds one 1-D array per field of the events, indexed by event,
+along with the schema of the stream in its attributes:
+
+    schema: list of (field name, kind) (see `EVENT_KINDS` for the kinds & their `None` sentinels);
+    row_type: "dict" if events are dictionaries of fields, "tuple" if they are tuples of the fields in order;
+    key: name of the field holding the keys of the events, for streams that mimic a dictionary of lists of events
+        (see `EventStream.__setitem__`). None otherwise.
+
+Only full chunks are written during the simulation, so a crash loses at most the events of the last chunk of
+each stream. The events can be read back with `read_event_stream`, and `StreamedEvents` placeholders stand in
+for the streams in the tracker data dumped at the end of the simulation (see `load_streamed_events`).
+"""
+
+import datetime
+import os
+import pickle
+import typing
+
+import numpy as np
+import zarr
+
+EVENT_STREAMS_DIRNAME = "tracker_events"
+
+_epoch = datetime.datetime(1970, 1, 1)
+_epoch_date = _epoch.date()
+_none_int = np.iinfo(np.int64).min
+_max_int = np.iinfo(np.int64).max
+_none_str = "\x00"
+
+EVENT_KINDS = {
+    # kind: (dtype, `None` sentinel or None if the kind is not nullable)
+    "int": (np.int64, None),
+    "optional_int": (np.int64, _none_int),
+    "optional_float": (np.float64, np.nan),
+    "bool": (bool, None),
+    "optional_bool": (np.int8, -1),
+    "timestamp": (np.int64, _none_int),  # microseconds since epoch; `datetime.max` is stored as the max int64
+    "date": (np.int32, np.iinfo(np.int32).min),  # days since epoch
+    "str": (str, _none_str),
+    "pickle": (bytes, None),  # anything else (e.g. sets of reasons, lists of symptoms), pickled
+}
+
+
+def _encode(kind: str, value: typing.Any) -> typing.Any:
+    if value is None:
+        sentinel = EVENT_KINDS[kind][1]
+        assert sentinel is not None or kind == "pickle", f"None is not a valid {kind}"
+        if kind != "pickle":
+            return sentinel
+    if kind in ("int", "optional_int"):
+        return int(value)
+    if kind == "optional_float":
+        return float(value)
+    if kind == "bool":
+        return bool(value)
+    if kind == "optional_bool":
+        return int(bool(value))
+    if kind == "timestamp":
+        if value == datetime.datetime.max:
+            return _max_int
+        return (value - _epoch) // datetime.timedelta(microseconds=1)
+    if kind == "date":
+        return (value - _epoch_date).days
+    if kind == "str":
+        return str(value)
+    if kind == "pickle":
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    raise ValueError(f"unknown kind: {kind}")
+
+
+def _decode(kind: str, value: typing.Any) -> typing.Any:
+    sentinel = EVENT_KINDS[kind][1]
+    if sentinel is not None and kind != "optional_float" and value == sentinel:
+        return None
+    if kind in ("int", "optional_int"):
+        return int(value)
+    if kind == "optional_float":
+        return None if np.isnan(value) else float(value)
+    if kind == "bool":
+        return bool(value)
+    if kind == "optional_bool":
+        return bool(value)
+    if kind == "timestamp":
+        if value == _max_int:
+            return datetime.datetime.max
+        return _epoch + datetime.timedelta(microseconds=int(value))
+    if kind == "date":
+        return _epoch_date + datetime.timedelta(days=int(value))
+    if kind == "str":
+        return value
+    if kind == "pickle":
+        return pickle.loads(value)
+    raise ValueError(f"unknown kind: {kind}")
+
+
+def get_event_stream_path(outdir: typing.AnyStr, name: str) -> str:
+    """Returns the path of the group of the event stream `name` in the output directory of a simulation."""
+    return os.path.join(outdir, EVENT_STREAMS_DIRNAME, name)
+
+
+class EventStream:
+    """
+    Appends events to a new zarr group chunk by chunk (see the module docstring for the layout).
+
+    The stream behaves like the list of its events (`append`, `extend`, `len`, iteration), or like a dictionary of
+    lists of events if it was created with a `key` field (`stream[key] = events`).
+    """
+
+    def __init__(
+            self,
+            path: typing.AnyStr,
+            schema: typing.Sequence[typing.Tuple[str, str]],
+            chunk_size: int,
+            row_type: str = "dict",
+            key: typing.Optional[str] = None,
+    ):
+        """
+        Creates the group of the stream (overwriting any existing one at the same path).
+
+        Args:
+            path: the path of the zarr group of the stream.
+            schema: the (field name, kind) of the fields of the events.
+            chunk_size: the number of events that are buffered before they are written.
+            row_type: "dict" for events that are dictionaries, "tuple" for events that are tuples of the fields.
+            key: for streams that mimic a dictionary of lists of events, name of the field holding the keys.
+        """
+        assert chunk_size > 0, f"invalid chunk size: {chunk_size}"
+        assert row_type in ("dict", "tuple"), f"unknown row type: {row_type}"
+        assert key is None or (row_type == "dict" and key in dict(schema)), f"invalid key: {key}"
+        assert all(kind in EVENT_KINDS for _, kind in schema), f"unknown kinds in schema: {schema}"
+        self.schema = [(name, kind) for name, kind in schema]
+        self.chunk_size = chunk_size
+        self.row_type = row_type
+        self.key = key
+        self.buffer = []
+        self.n_flushed = 0
+        self._create(path)
+
+    def _create(self, path: typing.AnyStr):
+        self.path = str(path)
+        self.fd = zarr.open_group(self.path, "w")
+        self.fd.attrs.update({"schema": self.schema, "row_type": self.row_type, "key": self.key})
+        for name, kind in self.schema:
+            self.fd.zeros(name, shape=(0,), chunks=(self.chunk_size,), dtype=EVENT_KINDS[kind][0])
+
+    def __len__(self) -> int:
+        return self.n_flushed + len(self.buffer)
+
+    def __iter__(self) -> typing.Iterator[typing.Any]:
+        """Iterates over the events appended so far (reading the written ones back chunk by chunk)."""
+        for start in range(0, self.n_flushed, self.chunk_size):
+            yield from _read_rows(self.fd, self.schema, self.row_type, start, min(start + self.chunk_size, self.n_flushed))
+        yield from list(self.buffer)
+
+    def append(self, event: typing.Any):
+        """Appends an event (a dictionary or a tuple of fields, depending on the row type of the stream)."""
+        self.buffer.append(event)
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def extend(self, events: typing.Iterable[typing.Any]):
+        for event in events:
+            self.append(event)
+
+    def __setitem__(self, key: typing.Any, events: typing.Iterable[typing.Dict]):
+        """Appends `events` with their key field set to `key` (e.g. `human_monitor[date] = rows`)."""
+        assert self.key is not None, "the stream was not created with a key field"
+        self.extend({**event, self.key: key} for event in events)
+
+    def flush(self):
+        """Writes the buffered events."""
+        if not self.buffer:
+            return
+        for idx, (name, kind) in enumerate(self.schema):
+            if self.row_type == "dict":
+                values = [_encode(kind, event[name]) for event in self.buffer]
+            else:
+                values = [_encode(kind, event[idx]) for event in self.buffer]
+            dtype = EVENT_KINDS[kind][0]
+            self.fd[name].append(np.array(values, dtype=object if dtype in (str, bytes) else dtype))
+        self.n_flushed += len(self.buffer)
+        self.buffer = []
+
+    def fork(self, path: typing.AnyStr):
+        """
+        Continues the stream in a new group at `path`, starting with a copy of the events appended so far.
+        Used by forked simulations, while the original stream keeps being appended to by the parent process.
+        """
+        fd, n_flushed = self.fd, self.n_flushed
+        self._create(path)
+        for start in range(0, n_flushed, self.chunk_size):
+            stop = min(start + self.chunk_size, n_flushed)
+            for name, _ in self.schema:
+                self.fd[name].append(fd[name][start:stop])
+        self.n_flushed = n_flushed
+
+
+def _read_rows(
+        fd: zarr.Group,
+        schema: typing.Sequence[typing.Tuple[str, str]],
+        row_type: str,
+        start: int,
+        stop: int,
+) -> typing.List[typing.Any]:
+    columns = [[_decode(kind, value) for value in fd[name][start:stop]] for name, kind in schema]
+    if row_type == "tuple":
+        return list(zip(*columns))
+    names = [name for name, _ in schema]
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def read_event_columns(
+        path: typing.AnyStr,
+        fields: typing.Optional[typing.Sequence[str]] = None,
+) -> typing.Dict[str, np.ndarray]:
+    """
+    Reads the raw (encoded) arrays of the fields of a stream, without building any event.
+
+    Args:
+        path: the path of the group of the stream.
+        fields: the names of the fields to read. Defaults to all of them.
+
+    Returns:
+        A dictionary of field name --> 1-D array of the values of all events (see `EVENT_KINDS` for encodings).
+    """
+    fd = zarr.open_group(str(path), "r")
+    if fields is None:
+        fields = [name for name, _ in fd.attrs["schema"]]
+    return {name: fd[name][:] for name in fields}
+
+
+def read_event_stream(path: typing.AnyStr) -> typing.Union[typing.List, typing.Dict]:
+    """
+    Reads all the events of a stream back as they were appended.
+
+    Args:
+        path: the path of the group of the stream.
+
+    Returns:
+        The list of events of the stream, or for streams with a key field, a dictionary of key --> list of
+        events (without the key field), in order of first appearance of the keys.
+    """
+    fd = zarr.open_group(str(path), "r")
+    schema, row_type, key = fd.attrs["schema"], fd.attrs["row_type"], fd.attrs["key"]
+    n_events = fd[schema[0][0]].shape[0] if schema else 0
+    chunk_size = fd[schema[0][0]].chunks[0] if schema else 1
+    events = []
+    for start in range(0, n_events, chunk_size):
+        events.extend(_read_rows(fd, schema, row_type, start, min(start + chunk_size, n_events)))
+    if key is None:
+        return events
+    events_by_key = {}
+    for event in events:
+        events_by_key.setdefault(event.pop(key), []).append(event)
+    return events_by_key
+
+
+class StreamedEvents:
+    """
+    Stands in for the events of a stream in the dumped tracker data (see `load_streamed_events`).
+
+    Args:
+        name: the name of the stream, i.e. of its group in the `EVENT_STREAMS_DIRNAME` folder of the output directory.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self):
+        return f"StreamedEvents({self.name!r})"
+
+    def load(self, outdir: typing.AnyStr) -> typing.Union[typing.List, typing.Dict]:
+        """Reads the events of the stream from the output directory of the simulation."""
+        return read_event_stream(get_event_stream_path(outdir, self.name))
+
+
+def load_streamed_events(data: typing.Any, outdir: typing.AnyStr) -> typing.Any:
+    """
+    Replaces the `StreamedEvents` placeholders of the tracker data (also in nested dictionaries) by their events.
+
+    Args:
+        data: the tracker data (see `covid19sim.utils.utils.extract_tracker_data`), modified in place.
+        outdir: the output directory of the simulation, i.e. the directory of the dumped tracker data.
+
+    Returns:
+        The tracker data.
+    """
+    if isinstance(data, StreamedEvents):
+        return data.load(outdir)
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if isinstance(value, (StreamedEvents, dict)):
+                data[key] = load_streamed_events(value, outdir)
+    return data
@@ -22,6 +22,7 @@ from covid19sim.utils.constants import AGE_BIN_WIDTH_5, ALL_LOCATIONS, SECONDS_P
 from covid19sim.epidemiology.symptoms import MILD, MODERATE, SEVERE, EXTREMELY_SEVERE
 from covid19sim.inference.server_utils import DataCollectionServer, DataCollectionClient, \
     default_datacollect_frontend_address
+from covid19sim.log.event_streams import EventStream, StreamedEvents, get_event_stream_path
 from covid19sim.utils.utils import log, copy_obj_array_except_env
 from covid19sim.utils.constants import SECONDS_PER_DAY, SECONDS_PER_MINUTE
 from covid19sim.interventions.tracing import Heuristic
@@ -35,6 +36,42 @@ SNAPSHOT_PERCENT_INFECTED_THRESHOLD = 2 # take a snapshot every time percent inf
 LOCATION_TYPES_TO_TRACK_MIXING = ["house", "work", "school", "other", "all"]
 WORK_ACTIVITY_STATUS = ["WORK", "WORK-CANCEL--KID", "WORK-CANCEL--ILL", "WORK-CANCEL--QUARANTINE"]
 
+# (field name, kind) of the events that are streamed to `outdir` if `STREAM_TRACKER_EVENTS` is set (see `covid19sim.log.event_streams`)
+INFECTION_MONITOR_SCHEMA = [
+    ("from", "str"), ("from_risk", "optional_float"), ("from_risk_level", "optional_int"),
+    ("from_rec_level", "optional_int"), ("from_infection_timestamp", "timestamp"),
+    ("from_is_asymptomatic", "optional_bool"), ("from_has_app", "optional_bool"), ("to", "str"),
+    ("to_risk", "optional_float"), ("to_risk_level", "optional_int"), ("to_rec_level", "optional_int"),
+    ("infection_date", "date"), ("infection_timestamp", "timestamp"), ("to_is_asymptomatic", "optional_bool"),
+    ("to_has_app", "bool"), ("location_type", "str"), ("location", "str"), ("p_infection", "optional_float"),
+    ("to_human_infectiousness_onset_days", "optional_float"),
+]
+P_INFECTION_AT_CONTACT_SCHEMA = [
+    ("success", "bool"), ("p_infection", "optional_float"), ("viral_load", "optional_float"),
+    ("infectiousness", "optional_float"),
+]
+HUMAN_MONITOR_SCHEMA = [
+    ("date", "date"), ("infection_timestamp", "timestamp"), ("n_infectious_contacts", "int"),
+    ("risk", "optional_float"), ("risk_level", "optional_int"), ("rec_level", "optional_int"), ("state", "int"),
+    ("test_result", "str"), ("n_symptoms", "int"), ("symptom_severity", "int"), ("reported_symptom_severity", "int"),
+    ("name", "str"), ("dead", "bool"), ("reported_test_result", "str"), ("n_reported_symptoms", "int"),
+    ("age", "int"), ("is_in_hospital", "bool"), ("is_in_ICU", "bool"),
+]
+TEST_MONITOR_SCHEMA = [
+    ("name", "str"), ("symptoms", "pickle"), ("test_time", "timestamp"), ("result_time", "timestamp"),
+    ("test_type", "str"), ("test_result", "str"), ("infection_timestamp", "timestamp"),
+    ("infectiousness_onset_days", "optional_float"), ("symptom_start_time", "timestamp"),
+    ("cold_timestamp", "timestamp"), ("flu_timestamp", "timestamp"), ("allergy_symptom_onset", "timestamp"),
+]
+RISK_ATTRIBUTES_SCHEMA = [
+    ("has_app", "bool"), ("risk", "optional_float"), ("risk_level", "optional_int"), ("reason", "pickle"),
+    ("rec_level", "optional_int"), ("exposed", "bool"), ("infectious", "bool"), ("symptoms", "int"),
+    ("symptom_names", "pickle"), ("clusters", "pickle"), ("test", "str"), ("recovered", "bool"),
+    ("timestamp", "timestamp"), ("test_recommended", "bool"), ("name", "str"), ("order_1_is_exposed", "bool"),
+    ("order_1_is_infectious", "bool"), ("order_1_is_presymptomatic", "bool"), ("order_1_is_symptomatic", "bool"),
+    ("order_1_is_tested", "bool"),
+]
+
 def check_if_tracking(f):
     def wrapper(*args, **kwargs):
         if args[0].start_tracking:
@@ -155,6 +192,7 @@ class Tracker(object):
         self.city = city
         self.conf = conf
         self.logfile = logfile
+        self.event_streams = {}  # name --> EventStream, for the events that are streamed to `outdir`
         today = self.env.timestamp.date()
         self.start_tracking = False # flag to indicate if infections have been seeded in the population
         self.init_infected = []
@@ -265,8 +303,8 @@ class Tracker(object):
 
         self.average_infectious_contacts = defaultdict(lambda : {'infection_count':0, 'humans':set()})
         self.p_infection_at_contact = {
-            "human": [],
-            "environment": []
+            "human": self._get_event_stream("p_infection_at_contact_human", P_INFECTION_AT_CONTACT_SCHEMA, [], row_type="tuple"),
+            "environment": self._get_event_stream("p_infection_at_contact_environment", P_INFECTION_AT_CONTACT_SCHEMA, [], row_type="tuple")
         }
 
         # mobility
@@ -350,7 +388,7 @@ class Tracker(object):
         # risk model
         self.risk_values = []
         self.avg_infectiousness_per_day = []
-        self.risk_attributes = []
+        self.risk_attributes = self._get_event_stream("risk_attributes", RISK_ATTRIBUTES_SCHEMA, [])
         self.tracing_started = False
 
         # behavior
@@ -363,9 +401,9 @@ class Tracker(object):
         self.quarantine_monitor = []
 
         # monitors
-        self.human_monitor = {}
-        self.infection_monitor = []
-        self.test_monitor = []
+        self.human_monitor = self._get_event_stream("human_monitor", HUMAN_MONITOR_SCHEMA, {}, key="date")
+        self.infection_monitor = self._get_event_stream("infection_monitor", INFECTION_MONITOR_SCHEMA, [])
+        self.test_monitor = self._get_event_stream("test_monitor", TEST_MONITOR_SCHEMA, [])
 
         # update messages
         self.infector_infectee_update_messages = defaultdict(lambda :defaultdict(lambda : defaultdict(lambda :{'unknown':{}, 'contact':{}})))
@@ -383,6 +421,7 @@ class Tracker(object):
                 data_output_path=os.path.join(city.conf["outdir"], "human_backups.hdf5"),
                 human_count=city.conf["n_people"],
                 simulation_days=city.conf["simulation_days"],
+                workers=city.conf.get("DATA_COLLECTION_WORKERS", 1),
                 config_backup=city.conf,
             )
             self.collection_server.start()
@@ -613,6 +652,51 @@ class Tracker(object):
         # risk model
         self.risk_precision_daily = [self.compute_risk_precision()]
 
+    def _get_event_stream(self, name, schema, default, **kwargs):
+        """
+        Creates a stream writing the events `name` to `outdir` if `STREAM_TRACKER_EVENTS` is set.
+
+        Args:
+            name (str): name of the events
+            schema (list): (field name, kind) of the fields of the events
+            default (list or dict): in-memory container of the events, used when they are not streamed
+            **kwargs: passed to `EventStream`
+
+        Returns:
+            (EventStream or list or dict): container to which events are appended
+        """
+        if not self.conf.get("STREAM_TRACKER_EVENTS") or self.conf.get("outdir") is None:
+            return default
+        path = get_event_stream_path(self.conf['outdir'], name)
+        self.event_streams[name] = EventStream(path, schema, self.conf.get("TRACKER_EVENTS_CHUNK_SIZE"), **kwargs)
+        return self.event_streams[name]
+
+    def get_dumpable_events(self, events):
+        """
+        Returns `events` as they should be dumped along with the other tracked metrics.
+        Streamed events are flushed and replaced by a `StreamedEvents` placeholder.
+
+        Args:
+            events (EventStream or list or dict): events tracked by `self`
+
+        Returns:
+            (StreamedEvents or list or dict): events, or their placeholder
+        """
+        if isinstance(events, EventStream):
+            events.flush()
+            return StreamedEvents(os.path.basename(events.path))
+        return events
+
+    def fork_event_streams(self, outdir):
+        """
+        Continues the streams of events in `outdir`, e.g. in a simulation forked from the current one.
+
+        Args:
+            outdir (str): new output directory of the simulation
+        """
+        for name, stream in self.event_streams.items():
+            stream.fork(get_event_stream_path(outdir, name))
+
     def compute_generation_time(self):
         """
         Generation time is the time from exposure day until an infection occurs.
@@ -700,10 +784,17 @@ class Tracker(object):
 
         self.cases_per_day.append(0)
 
-        self.s_per_day.append(sum(h.is_susceptible for h in self.city.humans))
-        self.e_per_day.append(sum(h.is_exposed for h in self.city.humans))
-        self.i_per_day.append(sum(h.is_infectious for h in self.city.humans))
-        self.r_per_day.append(sum(h.is_removed for h in self.city.humans))
+        if self.city.population is not None:
+            S, E, I, R = self.city.population.seir_counts()
+        else:
+            S = sum(h.is_susceptible for h in self.city.humans)
+            E = sum(h.is_exposed for h in self.city.humans)
+            I = sum(h.is_infectious for h in self.city.humans)
+            R = sum(h.is_removed for h in self.city.humans)
+        self.s_per_day.append(S)
+        self.e_per_day.append(E)
+        self.i_per_day.append(I)
+        self.r_per_day.append(R)
         self.ei_per_day.append(self.e_per_day[-1] + self.i_per_day[-1])
 
         for human in self.city.humans:
@@ -917,10 +1008,11 @@ class Tracker(object):
         if self.keep_full_human_copies:
             assert self.collection_client is not None
             human_backups = copy_obj_array_except_env(hd)
-            for name, human in human_backups.items():
-                human_id = int(name.split(":")[-1]) - 1
-                current_day = (current_timestamp - self.city.start_time).days
-                self.collection_client.write(current_day, current_timestamp.hour, human_id, human)
+            current_day = (current_timestamp - self.city.start_time).days
+            self.collection_client.write_batch([
+                (current_day, current_timestamp.hour, int(name.split(":")[-1]), human)
+                for name, human in human_backups.items()
+            ])
 
         # @@@@@ TODO: do something with location backups
         # location_backups = copy_obj_array_except_env(self.city.get_all_locations())
@@ -929,7 +1021,11 @@ class Tracker(object):
         """
         Stores app adoption rate and humans who have the app.
         """
-        self.adoption_rate = sum(h.has_app for h in self.city.humans) / self.n_people
+        if self.city.population is not None:
+            n_app_users = int(self.city.population.has_app[:len(self.city.population)].sum())
+        else:
+            n_app_users = sum(h.has_app for h in self.city.humans)
+        self.adoption_rate = n_app_users / self.n_people
         log(f"adoption rate: {100*self.adoption_rate:3.2f} %\n", self.logfile)
         self.human_has_app = set([h.name for h in self.city.humans if h.has_app])
 
@@ -1678,8 +1774,8 @@ class Tracker(object):
             "human_human_infection_matrix": self.human_human_infection_matrix,
             "environment_human_infection_histogram": self.environment_human_infection_histogram,
             "average_infectious_contacts": aic,
-            "p_infection_at_contact_human": self.p_infection_at_contact["human"],
-            "p_infection_at_contact_environment": self.p_infection_at_contact["environment"],
+            "p_infection_at_contact_human": self.get_dumpable_events(self.p_infection_at_contact["human"]),
+            "p_infection_at_contact_environment": self.get_dumpable_events(self.p_infection_at_contact["environment"]),
             "next_generation_matrix_snapshots": self.next_generation_matrix['snapshots']
         }
 
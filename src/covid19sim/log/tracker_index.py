@@ -0,0 +1,175 @@
+"""
+Sidecar index of the tracker data dumped at the end of a simulation, for tools that load a few keys of many runs
+(e.g. `covid19sim.plotting.utils.get_all_data`).
+
+The index is a directory next to the tracker data, holding one `.npy` file per array so that keys can be loaded
+(or memory-mapped) independently, and an `index.json` manifest with the scalars and the description of each
+indexed key (see `INDEX_KINDS`). Keys whose values do not fit any kind (e.g. lists of dictionaries that are not
+streamed) are only in the tracker data, and readers fall back to unpickling it for them.
+"""
+
+import datetime
+import json
+import os
+import typing
+
+import numpy as np
+
+from covid19sim.log.event_streams import StreamedEvents
+
+TRACKER_INDEX_DIRNAME = "tracker_index"
+TRACKER_INDEX_VERSION = 1
+
+INDEX_KINDS = {
+    # kind: description of the indexed value
+    "scalar": "None, bool, int, float or str, stored in the manifest",
+    "timestamp": "datetime.datetime or datetime.date, stored in the manifest in iso format",
+    "array": "list (of lists or tuples) or array of numbers, booleans or strings, stored in `<key>.npy`",
+    "table": "dict of names --> equal-length lists, stored in `<key>.npy` (one row per name) and `<key>.names.npy`",
+    "events": "`StreamedEvents` placeholder, stored in the manifest",
+}
+_array_dtype_kinds = "biufU"
+
+
+def _is_same_value(value: typing.Any, other: typing.Any) -> bool:
+    """Returns whether `other` equals `value` with elements of the same types (e.g. no number turned into a string)."""
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return isinstance(other, (list, tuple)) and len(value) == len(other) and \
+            all(_is_same_value(v, o) for v, o in zip(value, other))
+    if isinstance(value, np.generic):
+        value = value.item()
+    if type(value) is not type(other):
+        return False
+    return value == other or (value != value and other != other)  # NaNs are equal here
+
+
+def _as_array(values: typing.Any) -> typing.Optional[np.ndarray]:
+    """
+    Returns `values` as an array with a fixed-size dtype, or None if it has none (e.g. ragged values), or if lists
+    would not be read back as they are (e.g. mixed numbers and strings, which numpy would turn into strings).
+    """
+    try:
+        array = np.asarray(values)
+    except ValueError:
+        return None
+    if array.dtype.kind not in _array_dtype_kinds or array.ndim == 0:
+        return None
+    if not isinstance(values, np.ndarray) and not _is_same_value(values, array.tolist()):
+        return None
+    return array
+
+
+def _get_container(values: typing.Any) -> str:
+    """Returns the type of the outer and inner sequences of `values`, to rebuild them from their array."""
+    if isinstance(values, np.ndarray):
+        return "ndarray"
+    inner = next(iter(values), None)
+    if isinstance(inner, tuple):
+        return "list_of_tuples"
+    if isinstance(inner, (list, np.ndarray)):
+        return "list_of_lists"
+    return "list"
+
+
+def _from_container(array: np.ndarray, container: str) -> typing.Any:
+    if container == "ndarray":
+        return array
+    if container == "list_of_tuples":
+        return [tuple(row) for row in array.tolist()]
+    return array.tolist()
+
+
+def dump_tracker_index(data: typing.Dict, outdir: typing.AnyStr, tracker_filename: str):
+    """
+    Writes the index of the tracker data dumped in `outdir/tracker_filename` (overwriting any existing index).
+
+    Args:
+        data: the tracker data (see `covid19sim.utils.utils.extract_tracker_data`).
+        outdir: the directory where the tracker data was dumped.
+        tracker_filename: the name of the file of the tracker data.
+    """
+    index_dir = os.path.join(outdir, TRACKER_INDEX_DIRNAME)
+    os.makedirs(index_dir, exist_ok=True)
+    keys = {}
+    for key, value in data.items():
+        if isinstance(value, np.generic):
+            value = value.item()
+        if value is None or isinstance(value, (bool, int, float, str)):
+            keys[key] = {"kind": "scalar", "value": value}
+        elif isinstance(value, (datetime.datetime, datetime.date)):
+            is_datetime = isinstance(value, datetime.datetime)
+            keys[key] = {"kind": "timestamp", "value": value.isoformat(), "is_datetime": is_datetime}
+        elif isinstance(value, StreamedEvents):
+            keys[key] = {"kind": "events", "name": value.name}
+        elif isinstance(value, (list, tuple, np.ndarray)) and len(value) > 0:
+            array = _as_array(value)
+            if array is not None:
+                np.save(os.path.join(index_dir, f"{key}.npy"), array)
+                keys[key] = {"kind": "array", "container": _get_container(value)}
+        elif isinstance(value, dict) and len(value) > 0 and all(isinstance(name, str) for name in value):
+            rows = list(value.values())
+            array = _as_array(rows) if all(isinstance(row, (list, tuple)) for row in rows) else None
+            if array is not None and array.ndim == 2:
+                np.save(os.path.join(index_dir, f"{key}.npy"), array)
+                np.save(os.path.join(index_dir, f"{key}.names.npy"), np.asarray(list(value.keys())))
+                keys[key] = {"kind": "table"}
+
+    manifest = {"version": TRACKER_INDEX_VERSION, "tracker_filename": tracker_filename, "keys": keys}
+    # the manifest is written last (and atomically): an index without one is incomplete and ignored by readers
+    manifest_path = os.path.join(index_dir, "index.json")
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def read_tracker_index(
+        outdir: typing.AnyStr,
+        keys: typing.Iterable[str],
+        tracker_filename: typing.Optional[str] = None,
+        mmap_mode: typing.Optional[str] = None,
+) -> typing.Tuple[typing.Dict, typing.Set[str]]:
+    """
+    Reads the requested keys of the tracker data of a run from its index, without unpickling the tracker data.
+
+    Args:
+        outdir: the directory where the tracker data was dumped.
+        keys: the keys to read.
+        tracker_filename: the name of the file of the tracker data. If specified, an index of another file is ignored.
+        mmap_mode: passed to `np.load`. Arrays are only kept as (memory-mapped) arrays if they were dumped as
+            arrays; lists and dictionaries are rebuilt as such.
+
+    Returns:
+        The values of the keys found in the index (as they were in the tracker data, except for
+        `StreamedEvents`, which are kept as placeholders), and the set of keys that were not found.
+    """
+    index_dir = os.path.join(outdir, TRACKER_INDEX_DIRNAME)
+    manifest_path = os.path.join(index_dir, "index.json")
+    keys = set(keys)
+    if not os.path.exists(manifest_path):
+        return {}, keys
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != TRACKER_INDEX_VERSION or \
+            tracker_filename not in (None, manifest.get("tracker_filename")):
+        return {}, keys
+
+    data = {}
+    for key in keys & set(manifest["keys"]):
+        spec = manifest["keys"][key]
+        if spec["kind"] == "scalar":
+            data[key] = spec["value"]
+        elif spec["kind"] == "timestamp":
+            value = datetime.datetime.fromisoformat(spec["value"])
+            data[key] = value if spec["is_datetime"] else value.date()
+        elif spec["kind"] == "events":
+            data[key] = StreamedEvents(spec["name"])
+        elif spec["kind"] == "array":
+            array = np.load(os.path.join(index_dir, f"{key}.npy"), mmap_mode=mmap_mode)
+            data[key] = _from_container(array, spec["container"])
+        elif spec["kind"] == "table":
+            names = np.load(os.path.join(index_dir, f"{key}.names.npy")).tolist()
+            array = np.load(os.path.join(index_dir, f"{key}.npy"), mmap_mode=mmap_mode)
+            data[key] = dict(zip(names, array.tolist()))
+    return data, keys - set(data)
@@ -49,6 +49,16 @@ static BaseHumanObject*       BaseHuman_new                     (PyTypeObject* t
     self->ts_covid19_symptomatic = INFINITY;
     self->ts_covid19_recovery    = INFINITY;
     self->ts_covid19_immunity    = INFINITY;
+    
+    
+    /* The viral load curve is flat at 0 until it is sampled upon infection. */
+    self->viral_load_peak_start      = 0;
+    self->viral_load_peak_height     = 0;
+    self->viral_load_plateau_start   = 0;
+    self->viral_load_plateau_end     = 0;
+    self->viral_load_plateau_height  = 0;
+    self->peak_plateau_slope         = 0;
+    self->plateau_end_recovery_slope = 0;
     if(!self->name){
         Py_INCREF(Py_None);
         self->name = Py_None;
@@ -813,6 +823,89 @@ static PyObject*              BaseHuman_get_days_since_allergies(BaseHumanObject
 }
 
 
+/* BaseHuman Viral Load */
+int                           BaseHuman_viral_load_at           (BaseHumanObject* self, double ts, double* viral_load){
+    /**
+     * Piecewise-linear viral load curve, in days relative to the onset of
+     * infectiousness:
+     * 
+     *     rise to viral_load_peak_height, descent to viral_load_plateau_height,
+     *     plateau, then linear recovery clipped at 0.
+     * 
+     * The curve is 0 for humans who do not have COVID-19 *now* (env.ts_now),
+     * regardless of ts. Returns -1 with an AssertionError set if the curve was
+     * badly parametrized.
+     */
+    
+    int    is_removed = self->env->ts_now >= self->ts_covid19_immunity ||
+                        self->env->ts_now >= self->ts_death;
+    double td_infected = self->env->ts_now - self->ts_covid19_infection;
+    double days_infectious;
+    double cur_viral_load;
+    
+    *viral_load = 0.;
+    if(is_removed || !(td_infected >= 0))
+        return 0;
+    
+    days_infectious = (ts - self->ts_covid19_infection) / SECONDS_PER_EPHEMERIS_DAY -
+                      self->infectiousness_onset_days;
+    if(days_infectious < 0)
+        return 0;
+    
+    if(days_infectious < self->viral_load_peak_start){
+        /* Rising to peak */
+        cur_viral_load = self->viral_load_peak_height * days_infectious / (self->viral_load_peak_start);
+    }else if(days_infectious < self->viral_load_plateau_start){
+        /* Descending to plateau from peak */
+        cur_viral_load = self->viral_load_peak_height - self->peak_plateau_slope *
+                         (days_infectious - self->viral_load_peak_start);
+    }else if(days_infectious < self->viral_load_plateau_end){
+        /* Plateau duration */
+        cur_viral_load = self->viral_load_plateau_height;
+    }else{
+        /* During recovery */
+        cur_viral_load = self->viral_load_plateau_height - self->plateau_end_recovery_slope *
+                         (days_infectious - self->viral_load_plateau_end);
+        cur_viral_load = cur_viral_load > 0 ? cur_viral_load : 0;
+    }
+    
+    if(!(cur_viral_load >= 0 && cur_viral_load <= 1)){
+        PyObject* val = PyFloat_FromDouble(cur_viral_load);
+        if(val){
+            PyErr_Format(PyExc_AssertionError, "effective viral load out of bounds. viral load:%R", val);
+            Py_DECREF(val);
+        }
+        return -1;
+    }
+    
+    *viral_load = cur_viral_load;
+    return 0;
+}
+static PyObject*              BaseHuman_viral_load_for_day      (BaseHumanObject* self, PyObject* arg){
+    double ts = PyFloat_AsDouble(arg);
+    double viral_load;
+    if(PyErr_Occurred())
+        return NULL;
+    if(BaseHuman_viral_load_at(self, ts, &viral_load) < 0)
+        return NULL;
+    return PyFloat_FromDouble(viral_load);
+}
+static PyObject*              BaseHuman_viral_load_area         (BaseHumanObject* self, PyObject* args){
+    /**
+     * Area under the viral load curve between ts and ts + duration (seconds),
+     * in viral-load-days, using the trapezoidal rule on the two endpoints.
+     */
+    
+    double ts, duration, start_viral_load, end_viral_load;
+    if(!PyArg_ParseTuple(args, "dd", &ts, &duration))
+        return NULL;
+    if(BaseHuman_viral_load_at(self, ts,            &start_viral_load) < 0 ||
+       BaseHuman_viral_load_at(self, ts + duration, &end_viral_load)   < 0)
+        return NULL;
+    return PyFloat_FromDouble((duration / SECONDS_PER_EPHEMERIS_DAY) * (start_viral_load + end_viral_load) / 2);
+}
+
+
 /**
  * PyMemberDef
  * 
@@ -862,6 +955,13 @@ static PyMemberDef BaseHuman_members[] = {
     {"ts_covid19_immunity",        T_DOUBLE,    offsetof(BaseHumanObject, ts_covid19_immunity),       0,        "POSIX timestamp of Human COVID-19 immunity."},
     {"infectiousness_onset_days",  T_DOUBLE,    offsetof(BaseHumanObject, infectiousness_onset_days), 0,        "Time from infection to beginning of infectiousness, in days."},
     {"incubation_days",            T_DOUBLE,    offsetof(BaseHumanObject, incubation_days),           0,        "Time from infection to beginning of symptoms (incubation time), in days."},
+    {"viral_load_peak_start",      T_DOUBLE,    offsetof(BaseHumanObject, viral_load_peak_start),     0,        "Time from infectiousness onset to viral load peak, in days."},
+    {"viral_load_peak_height",     T_DOUBLE,    offsetof(BaseHumanObject, viral_load_peak_height),    0,        "Height of the viral load peak."},
+    {"viral_load_plateau_start",   T_DOUBLE,    offsetof(BaseHumanObject, viral_load_plateau_start),  0,        "Time from infectiousness onset to viral load plateau start, in days."},
+    {"viral_load_plateau_end",     T_DOUBLE,    offsetof(BaseHumanObject, viral_load_plateau_end),    0,        "Time from infectiousness onset to viral load plateau end, in days."},
+    {"viral_load_plateau_height",  T_DOUBLE,    offsetof(BaseHumanObject, viral_load_plateau_height), 0,        "Height of the viral load plateau."},
+    {"peak_plateau_slope",         T_DOUBLE,    offsetof(BaseHumanObject, peak_plateau_slope),        0,        "Rate of descent of the viral load from peak to plateau, per day."},
+    {"plateau_end_recovery_slope", T_DOUBLE,    offsetof(BaseHumanObject, plateau_end_recovery_slope),0,        "Rate of descent of the viral load from plateau end to recovery, per day."},
     {"is_asymptomatic",            T_BOOL,      offsetof(BaseHumanObject, is_asymptomatic),           0,        "Whether Human is COVID-19 asymptomatic."},
     {NULL},
 };
@@ -883,6 +983,8 @@ static PyMemberDef BaseHuman_members[] = {
  */
 
 static PyMethodDef BaseHuman_methods[] = {
+    {"viral_load_for_day", (PyCFunction)BaseHuman_viral_load_for_day, METH_O,       "Viral load of Human at a POSIX timestamp."},
+    {"viral_load_area",    (PyCFunction)BaseHuman_viral_load_area,    METH_VARARGS, "Area under the viral load curve of Human between a POSIX timestamp and a duration (in seconds) later, in days."},
     {NULL},
 };
 
@@ -12,6 +12,77 @@ extern "C" {
 #endif
 
 
+/* Module-level Methods */
+
+PyObject*                     _native_viral_load_for_days       (PyObject*        module,
+                                                                 PyObject*        args){
+    /**
+     * Batched BaseHuman.viral_load_for_day().
+     * 
+     * Takes a sequence of N BaseHuman objects and either a single POSIX
+     * timestamp or a sequence of N of them, and returns a list of N viral loads.
+     */
+    
+    PyObject* humans_arg     = NULL;
+    PyObject* timestamps_arg = NULL;
+    PyObject* humans         = NULL;
+    PyObject* timestamps     = NULL;
+    PyObject* viral_loads    = NULL;
+    PyObject* viral_load_obj = NULL;
+    Py_ssize_t i, n;
+    double    ts = 0, viral_load;
+    (void)module;
+    
+    if(!PyArg_ParseTuple(args, "OO", &humans_arg, &timestamps_arg))
+        return NULL;
+    
+    humans = PySequence_Fast(humans_arg, "Expected a sequence of BaseHuman instances!");
+    if(!humans)           goto fail;
+    n = PySequence_Fast_GET_SIZE(humans);
+    if(PyNumber_Check(timestamps_arg)){
+        ts = PyFloat_AsDouble(timestamps_arg);
+        if(PyErr_Occurred()) goto fail;
+    }else{
+        timestamps = PySequence_Fast(timestamps_arg, "Expected a timestamp or a sequence of timestamps!");
+        if(!timestamps)   goto fail;
+        if(PySequence_Fast_GET_SIZE(timestamps) != n){
+            PyErr_Format(PyExc_ValueError, "Expected as many timestamps as humans!");
+            goto fail;
+        }
+    }
+    
+    viral_loads = PyList_New(n);
+    if(!viral_loads)      goto fail;
+    for(i=0;i<n;i++){
+        PyObject* human = PySequence_Fast_GET_ITEM(humans, i);
+        if(!PyObject_TypeCheck(human, &BaseHumanType)){
+            PyErr_Format(PyExc_TypeError, "Expected BaseHuman instance!");
+            goto fail;
+        }
+        if(timestamps){
+            ts = PyFloat_AsDouble(PySequence_Fast_GET_ITEM(timestamps, i));
+            if(PyErr_Occurred()) goto fail;
+        }
+        if(BaseHuman_viral_load_at((BaseHumanObject*)human, ts, &viral_load) < 0)
+            goto fail;
+        viral_load_obj = PyFloat_FromDouble(viral_load);
+        if(!viral_load_obj) goto fail;
+        PyList_SET_ITEM(viral_loads, i, viral_load_obj);
+    }
+    
+    Py_DECREF(humans);
+    Py_XDECREF(timestamps);
+    return viral_loads;
+    
+    /* Abort path. */
+    fail:
+    Py_XDECREF(humans);
+    Py_XDECREF(timestamps);
+    Py_XDECREF(viral_loads);
+    return NULL;
+}
+
+
 /* Module-level Methods Table */
 
 /**
@@ -31,6 +102,7 @@ extern "C" {
  */
 
 static PyMethodDef _native_METHODS[] = {
+    {"viral_load_for_days", (PyCFunction)_native_viral_load_for_days, METH_VARARGS, "Viral loads of a sequence of humans at one or a sequence of POSIX timestamps."},
     {NULL},  /* Sentinel */
 };
 
@@ -121,10 +121,19 @@ struct BaseHumanObject{
                            ts_covid19_recovery,  ts_covid19_immunity;
     double                 infectiousness_onset_days;
     double                 incubation_days;
+    double                 viral_load_peak_start,    viral_load_peak_height,
+                           viral_load_plateau_start, viral_load_plateau_end, viral_load_plateau_height,
+                           peak_plateau_slope,       plateau_end_recovery_slope;
     char                   is_asymptomatic;
 };
 
 
+/* Functions shared between translation units */
+int                           BaseHuman_viral_load_at           (BaseHumanObject* self, double ts, double* viral_load);
+PyObject*                     _native_viral_load_for_days       (PyObject*        module,
+                                                                 PyObject*        args);
+
+
 /* End Extern "C" Guard */
 #ifdef __cplusplus
 }
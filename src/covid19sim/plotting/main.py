@@ -4,7 +4,6 @@ import traceback
 from collections import defaultdict
 from pathlib import Path
 from time import time
-import dill
 import pickle
 import os
 import shutil
@@ -29,15 +28,6 @@ print("Ok.")
 HYDRA_CONF_PATH = Path(__file__).resolve().parent.parent / "configs" / "plot"
 
 
-def sizeof(path, suffix="B"):
-    num = path.stat().st_size
-    for unit in ["", "K", "M", "G", "T", "P", "E", "Z"]:
-        if abs(num) < 1024.0:
-            return "%3.1f%s%s" % (num, unit, suffix)
-        num /= 1024.0
-    return "%.1f%s%s" % (num, "Y", suffix)
-
-
 def help(all_plots):
     print("Available plotting options:")
     print("    * " + "\n    * ".join(all_plots.keys()))
@@ -163,7 +153,7 @@ def main(conf):
         shutil.rmtree(plot_path)
     plot_path.mkdir(parents=True, exist_ok=True)
     assert plot_path.exists()
-    cache_path = root_path / "cache.pkl"
+    cache_path = root_path / ".plot_cache"
 
     # -------------------
     # -----  Help?  -----
@@ -285,72 +275,29 @@ def main(conf):
             "test_monitor"
         ])
 
-    # ------------------------------------
-    # -----  Load pre-computed data  -----
-    # ------------------------------------
-    cache = None
+    # ---------------------------------------------------
+    # -----  Load Data (through the per-run caches)  -----
+    # ---------------------------------------------------
+    # a run without a cache yet (e.g. on the first call) is a cache miss: its data is read and its cache dumped
     use_cache = conf.get("use_cache", True)
-    load_cache = conf.get("load_cache", use_cache)
-    if load_cache:
-        assert cache_path.exists(), f"Cache {str(cache_path)} doesn't exist."
-    if use_cache:
-        data = {}
-        if load_cache:
-            try:
-                print(
-                    "Using cached data ({}): {}...".format(
-                        sizeof(cache_path), str(cache_path)
-                    )
-                )
-                with cache_path.open("rb") as f:
-                    cache = dill.load(f)
-
-                # check that the loaded data contains what is required by current `plots`
-                if "plots" not in cache or not all(p in cache["plots"] for p in plots):
-                    print(
-                        "Missing some data for plots {} in cache.pkl".format(
-                            ", ".join([p for p in plots if p not in cache["plots"]])
-                        )
-                    )
-                    use_cache = False
-                else:
-                    data = cache["data"]
-                    check_data(data)
-
-            except Exception:
-                print(
-                    "{}\n{}\n{}\n\nCould not load {}. Recomputing data.".format(
-                        "*" * 30, traceback.format_exc(), "*" * 30, str(cache_path),
-                    )
-                )
-    else:
-        # --------------------------
-        # -----  Compute Data  -----
-        # --------------------------
-        print("Reading configs from {}:".format(str(root_path)))
-        rtime = time()
-        all_data = get_all_data(
-            root_path, keep_pkl_keys, conf.get("multithreading", False), limit=5000
-        )
-        print("\nDone in {:.2f}s.\n".format(time() - rtime))
-        summarize_configs(all_data)
-        data = map_conf_to_models(all_data, conf)
-        check_data(data)
-
-        # -------------------------------
-        # -----  Dump if requested  -----
-        # -------------------------------
-        if conf.get("dump_cache", True):
-            print("Dumping cache...", end="", flush=True)
-            t = time()
-            with cache_path.open("wb") as f:
-                if cache is None:
-                    cache = {"plots": plots, "data": data}
-                else:
-                    cache["plots"] = list(set(cache["plots"] + plots))
-                    cache["data"] = {**cache["data"], **data}
-                dill.dump(cache, f)
-            print("Done in {}s ({})".format(int(time() - t), sizeof(cache_path)))
+    if use_cache and cache_path.exists():
+        print("Using cached data from {}...".format(str(cache_path)))
+    print("Reading configs from {}:".format(str(root_path)))
+    rtime = time()
+    all_data = get_all_data(
+        root_path,
+        keep_pkl_keys,
+        conf.get("multithreading", False),
+        limit=5000,
+        n_jobs=conf.get("n_jobs", 1),
+        cache_dir=cache_path,
+        use_cache=use_cache,
+        dump_cache=conf.get("dump_cache", True),
+    )
+    print("\nDone in {:.2f}s.\n".format(time() - rtime))
+    summarize_configs(all_data)
+    data = map_conf_to_models(all_data, conf)
+    check_data(data)
 
     for plot in plots:
         func = all_plots[plot].run
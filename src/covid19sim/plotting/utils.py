@@ -1,5 +1,6 @@
 import numpy as np
 import os
+import hashlib
 import math
 import warnings
 import multiprocessing as mp
@@ -17,6 +18,11 @@ import matplotlib.pyplot as plt
 
 from covid19sim.plotting.extract_tracker_metrics import _daily_false_quarantine, _daily_false_susceptible_recovered
 from covid19sim.utils.utils import is_app_based_tracing_intervention
+from covid19sim.log.event_streams import load_streamed_events
+from covid19sim.log.tracker_index import read_tracker_index
+
+# version of the data extracted from the runs for the plots: bump it when that data changes, to invalidate the caches
+PLOT_CACHE_VERSION = 1
 
 def env_to_path(path):
     """Transorms an environment variable mention in a json
@@ -73,7 +79,7 @@ def get_data(filename=None, data=None):
     elif filename:
         with open(filename, "rb") as f:
             data = pickle.load(f)
-        return data
+        return load_streamed_events(data, os.path.dirname(filename))
     else:
         raise ValueError("Please provide either filename, or data")
 
@@ -268,7 +274,30 @@ def absolute_file_paths(directory):
     return to_return
 
 
-def get_all_data(base_path, keep_pkl_keys, multi_thread=False, limit=100000):
+def get_all_data(
+    base_path, keep_pkl_keys, multi_thread=False, limit=100000, n_jobs=1, cache_dir=None, use_cache=True, dump_cache=False
+):
+    """
+    Loads the configuration and the `keep_pkl_keys` of the tracker data of all the runs in `base_path`.
+    The keys are read from the tracker index of each run when it has them (see `covid19sim.log.tracker_index`).
+
+    With a `cache_dir`, the keys loaded for each run are cached in `<cache_dir>/<method>/<run>.pkl`, along with the
+    content hash of its tracker data and `PLOT_CACHE_VERSION`: the next calls only load the keys (or runs) that are
+    missing from the cache, and the cache of a run is discarded if its tracker data changed (see `thread_read_run`).
+
+    Args:
+        base_path (str): directory holding one directory per method, holding one directory per run
+        keep_pkl_keys (set): keys of the tracker data to load
+        multi_thread (bool): load the runs of a method in a pool of threads
+        limit (int): maximum number of runs loaded per method
+        n_jobs (int): number of processes loading the runs of a method in parallel (overrides `multi_thread`)
+        cache_dir (str): directory of the per-run caches. None to disable caching.
+        use_cache (bool): serve the keys from the caches of the runs (otherwise, they are all loaded again)
+        dump_cache (bool): add the loaded keys to the caches of the runs
+
+    Returns:
+        (dict): method --> run --> {"conf": configuration of the run, "pkl": loaded keys}
+    """
     base_path = Path(base_path).resolve()
     assert base_path.exists()
     methods = [
@@ -283,6 +312,8 @@ def get_all_data(base_path, keep_pkl_keys, multi_thread=False, limit=100000):
         + " (expecting <base_path_you_provided>/<method>/<run>/tracker*.pkl)"
     )
 
+    if cache_dir is not None:
+        cache_dir = Path(cache_dir).resolve()
     all_data = {str(m): {} for m in methods}
     for m in methods:
         sm = str(m)
@@ -297,11 +328,15 @@ def get_all_data(base_path, keep_pkl_keys, multi_thread=False, limit=100000):
 
         try:
             runs = runs[:limit]
-            if multi_thread:
+            if multi_thread or n_jobs > 1:
                 print("Loading runs in", m.name, "...", end="\r")
-                with concurrent.futures.ThreadPoolExecutor() as executor:
+                if n_jobs > 1:
+                    executor = concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs)
+                else:
+                    executor = concurrent.futures.ThreadPoolExecutor()
+                with executor:
                     futures = [
-                        executor.submit(thread_read_run, (r, keep_pkl_keys))
+                        executor.submit(thread_read_run, (r, keep_pkl_keys, cache_dir, use_cache, dump_cache))
                         for r in runs
                     ]
                     runs_data = [f.result() for f in futures]
@@ -320,7 +355,7 @@ def get_all_data(base_path, keep_pkl_keys, multi_thread=False, limit=100000):
                         "... ({}/{})".format(i + 1, len(runs)),
                         end="\r",
                     )
-                    r, conf, pkl = thread_read_run((r, keep_pkl_keys))
+                    r, conf, pkl = thread_read_run((r, keep_pkl_keys, cache_dir, use_cache, dump_cache))
                     sr = str(r)
                     all_data[sm][sr] = {}
                     all_data[sm][sr]["conf"] = conf
@@ -344,18 +379,105 @@ def default_to_regular_dict(d):
     return d
 
 
+def get_file_hash(path):
+    """Returns the sha1 digest of the content of the file at `path`, read chunk by chunk."""
+    digest = hashlib.sha1()
+    with open(str(path), "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_run_cache(cache_path, tracker_path):
+    """
+    Reads the cache of a run (see `thread_read_run`).
+
+    Args:
+        cache_path (pathlib.Path): path of the cache of the run
+        tracker_path (pathlib.Path): path of the tracker data of the run
+
+    Returns:
+        (dict): the cache, or None if there is none, or if it was not built from the current tracker data with the
+            current `PLOT_CACHE_VERSION`. The tracker data is only hashed again if its size or modification time
+            changed.
+    """
+    if not cache_path.exists():
+        return None
+    try:
+        with cache_path.open("rb") as f:
+            cache = pickle.load(f)
+    except Exception:
+        return None
+    if cache.get("version") != PLOT_CACHE_VERSION or cache.get("tracker_filename") != tracker_path.name:
+        return None
+    stat = tracker_path.stat()
+    if (cache["size"], cache["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+        if cache["tracker_hash"] != get_file_hash(tracker_path):
+            return None
+    return cache
+
+
+def dump_run_cache(cache_path, cache):
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    # written atomically, as runs may be loaded by concurrent plotting jobs
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    with tmp_path.open("wb") as f:
+        pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(str(tmp_path), str(cache_path))
+
+
 def thread_read_run(args):
-    r, keep_pkl_keys = args
+    """
+    Loads the configuration and the `keep_pkl_keys` of the tracker data of the run in directory `r`.
+
+    `args` is `(r, keep_pkl_keys)`, or `(r, keep_pkl_keys, cache_dir, use_cache, dump_cache)` to go through the
+    cache of the run in `<cache_dir>/<method>/<run>.pkl` (see `get_all_data`). The cache holds the keys loaded so far
+    (and the ones the tracker data does not have), so that only the other ones are loaded from the tracker data.
+    """
+    r, keep_pkl_keys, cache_dir, use_cache, dump_cache = (tuple(args) + (None, True, False))[:5]
     with (r / "full_configuration.yaml").open("r") as f:
         conf = yaml.safe_load(f)
-    with open(str(list(r.glob("tracker*.pkl"))[0]), "rb") as f:
-        pkl_data = pickle.load(f)
-        pkl = {
-            k: default_to_regular_dict(v)
-            for k, v in pkl_data.items()
-            if k in keep_pkl_keys
+    tracker_path = list(r.glob("tracker*.pkl"))[0]
+    keep_pkl_keys = set(keep_pkl_keys)
+
+    cache, cache_path = None, None
+    if cache_dir is not None:
+        cache_path = Path(cache_dir) / r.parent.name / f"{r.name}.pkl"
+        cache = read_run_cache(cache_path, tracker_path)
+    stat = tracker_path.stat()
+    # a cache whose tracker data was touched (but not changed) is dumped again with the new stats, to not hash it again
+    stat_changed = cache is not None and (cache["size"], cache["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns)
+    if cache is None:
+        cache = {
+            "version": PLOT_CACHE_VERSION,
+            "tracker_filename": tracker_path.name,
+            "tracker_hash": None,
+            "pkl": {},
+            "absent": set(),
         }
+    cache.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    if not use_cache:
+        cache.update(pkl={}, absent=set())
+
+    missing_keys = keep_pkl_keys - set(cache["pkl"]) - cache["absent"]
+    if missing_keys:
+        # the tracker data is only unpickled for the keys that are not in its index
+        pkl_data, unindexed_keys = read_tracker_index(r, missing_keys, tracker_filename=tracker_path.name)
+        if unindexed_keys:
+            with open(str(tracker_path), "rb") as f:
+                pkl_data.update({k: v for k, v in pickle.load(f).items() if k in unindexed_keys})
+        cache["pkl"].update({
+            k: default_to_regular_dict(v)
+            for k, v in load_streamed_events(pkl_data, r).items()
+        })
+        cache["absent"] |= missing_keys - set(pkl_data)
+
+    if cache_path is not None and dump_cache and (missing_keys or stat_changed):
+        if cache["tracker_hash"] is None:
+            cache["tracker_hash"] = get_file_hash(tracker_path)
+        dump_run_cache(cache_path, cache)
 
+    pkl = {k: v for k, v in cache["pkl"].items() if k in keep_pkl_keys}
     return (r, conf, pkl)
 
 
@@ -7,7 +7,9 @@ All settings provided via commandline will override the ones loaded through the
 import datetime
 import logging
 import os
+import sys
 import time
+import traceback
 import typing
 from pathlib import Path
 
@@ -20,7 +22,8 @@ from covid19sim.utils.env import Env
 from covid19sim.utils.constants import SECONDS_PER_DAY, SECONDS_PER_HOUR
 from covid19sim.log.console_logger import ConsoleLogger
 from covid19sim.inference.server_utils import DataCollectionServer
-from covid19sim.utils.utils import dump_conf, dump_tracker_data, extract_tracker_data, parse_configuration, log
+from covid19sim.utils.utils import dump_conf, dump_tracker_data, extract_tracker_data, load_intervention_conf, \
+    parse_configuration, log
 
 def _get_intervention_string(conf):
     """
@@ -89,7 +92,21 @@ def main(conf: DictConfig):
     # -----  Load the experimental configuration  -----
     # -------------------------------------------------
     conf = parse_configuration(conf)
+    run_simulation(conf)
+    return conf
+
 
+def run_simulation(conf):
+    """
+    Runs the simulation of a parsed configuration as `python run.py` does, writing its outputs in a new
+    subfolder of `conf["outdir"]` (also used by `covid19sim.batch` to run simulations in-process).
+
+    Args:
+        conf (dict): parsed configuration of the experiment (see `covid19sim.utils.utils.parse_configuration`)
+
+    Returns:
+        city (covid19sim.locations.city.City): The city object referencing people, locations, and the tracker post-simulation.
+    """
     # -------------------------------------
     # -----  Create Output Directory  -----
     # -------------------------------------
@@ -151,11 +168,15 @@ def main(conf: DictConfig):
             config_backup=conf,
             human_count=conf['n_people'],
             simulation_days=conf['simulation_days'],
+            workers=conf.get('DATA_COLLECTION_WORKERS', 1),
         )
         collection_server.start()
     else:
         collection_server = None
 
+    # the interventions forked from this run on its intervention day, to share the days before it
+    intervention_scenarios = [load_intervention_conf(name) for name in conf.get('INTERVENTION_SCENARIOS', [])]
+
     conf["outfile"] = outfile
     city = simulate(
         n_people=conf["n_people"],
@@ -166,14 +187,13 @@ def main(conf: DictConfig):
         out_chunk_size=conf["out_chunk_size"],
         seed=conf["seed"],
         conf=conf,
-        logfile=logfile
+        logfile=logfile,
+        intervention_scenarios=intervention_scenarios,
+        on_scenario_end=_dump_simulation_outputs,
     )
 
-    # write the full configuration file along with git commit hash
-    dump_conf(city.conf, "{}/full_configuration.yaml".format(city.conf["outdir"]))
-
-    # log the simulation statistics
-    city.tracker.write_metrics()
+    # write the configuration, metrics and tracker data of the simulation
+    _dump_simulation_outputs(city)
 
     # (baseball-cards) write full simulation data
     if hasattr(city, "tracker") and \
@@ -183,6 +203,36 @@ def main(conf: DictConfig):
         city.tracker.collection_server.stop_gracefully()
         city.tracker.collection_server.join()
 
+    # Shutdown the data collection server if one's running
+    if collection_server is not None:
+        collection_server.stop_gracefully()
+        collection_server.join()
+        # Remove the IPCs if they were stored somewhere custom
+        if os.environ.get("COVID19SIM_IPC_PATH", None) is not None:
+            print("<<<<<<<< Cleaning Up >>>>>>>>")
+            for file in Path(os.environ.get("COVID19SIM_IPC_PATH")).iterdir():
+                if file.name.endswith(".ipc"):
+                    print(f"Removing {str(file)}...")
+                    os.remove(str(file))
+    return city
+
+
+def _dump_simulation_outputs(city):
+    """
+    Writes the outputs of a simulation (full configuration, metrics, tracker data) to its output directory.
+
+    Args:
+        city (covid19sim.locations.city.City): The city object referencing people, locations, and the tracker post-simulation.
+    """
+    conf = city.conf
+    logfile = conf['logfile']
+
+    # write the full configuration file along with git commit hash
+    dump_conf(conf, "{}/full_configuration.yaml".format(conf["outdir"]))
+
+    # log the simulation statistics
+    city.tracker.write_metrics()
+
     # if COLLECT_TRAINING_DATA is true
     if not conf["tune"]:
         # ----------------------------------------------
@@ -210,18 +260,6 @@ def main(conf: DictConfig):
         filename = f"tracker_data_n_{conf['n_people']}_seed_{conf['seed']}_{timenow}.pkl"
         data = extract_tracker_data(city.tracker, conf)
         dump_tracker_data(data, conf["outdir"], filename)
-    # Shutdown the data collection server if one's running
-    if collection_server is not None:
-        collection_server.stop_gracefully()
-        collection_server.join()
-        # Remove the IPCs if they were stored somewhere custom
-        if os.environ.get("COVID19SIM_IPC_PATH", None) is not None:
-            print("<<<<<<<< Cleaning Up >>>>>>>>")
-            for file in Path(os.environ.get("COVID19SIM_IPC_PATH")).iterdir():
-                if file.name.endswith(".ipc"):
-                    print(f"Removing {str(file)}...")
-                    os.remove(str(file))
-    return conf
 
 
 def simulate(
@@ -234,10 +272,21 @@ def simulate(
     seed: int = 0,
     conf: typing.Optional[typing.Dict] = None,
     logfile: str = None,
+    intervention_scenarios: typing.Optional[typing.List[typing.Dict]] = None,
+    on_scenario_end: typing.Optional[typing.Callable] = None,
 ):
     """
     Runs a simulation.
 
+    If intervention scenarios are given, the simulation is run once up to the intervention day, and the
+    process is then forked once per scenario. Each fork resumes from that state with the scenario's
+    parameters overriding the configuration, and writes its logs to a `scenario-<idx>` subfolder of
+    `outdir`; `on_scenario_end` is called with its city once it is done. This function returns once all
+    forks exited, with the city of the (unforked) configuration it was given. A fork matches the simulation
+    of its scenario run from scratch as long as the scenario only changes parameters that take effect on
+    the intervention day (e.g. one tracing method for another); the behavior levels of a lockdown, or the
+    effective contacts counted without a risk model, already apply to the days before it.
+
     Args:
         n_people (int, optional): population size in simulation. Defaults to 1000.
         init_fraction_sick (float, optional): population fraction initialized with Covid-19. Defaults to 0.01.
@@ -248,6 +297,8 @@ def simulate(
         seed (int, optional): [description]. Defaults to 0.
         conf (dict): yaml configuration of the experiment.
         logfile (str): filepath where the console output and final tracked metrics will be logged. Prints to the console only if None.
+        intervention_scenarios (list, optional): parameters of the interventions to fork on the intervention day. Defaults to None.
+        on_scenario_end (callable, optional): called with the city of each scenario at the end of its simulation. Defaults to None.
 
     Returns:
         city (covid19sim.locations.city.City): The city object referencing people, locations, and the tracker post-simulation.
@@ -280,6 +331,10 @@ def simulate(
     if intervention_start_days >= 0:
         conf['INTERVENTION_START_TIME'] = start_time + datetime.timedelta(days=intervention_start_days)
 
+    if intervention_scenarios:
+        assert conf['INTERVENTION_START_TIME'] is not None, "intervention scenarios require an intervention day"
+        assert not conf.get('COLLECT_TRAINING_DATA'), "intervention scenarios would write to the same dataset"
+
     # start of simulation without COVID
     start_time -= datetime.timedelta(days=start_time_offset_days)
     conf['SIMULATION_START_TIME'] = str(start_time)
@@ -325,10 +380,117 @@ def simulate(
     env.process(console_logger.run(env, city=city))
 
     # Run simulation until termination
-    env.run(until=env.ts_initial + simulation_days * SECONDS_PER_DAY)
+    end_time = env.ts_initial + simulation_days * SECONDS_PER_DAY
+    scenario_statuses = {}
+    if intervention_scenarios:
+        # stop right before the intervention is applied at that time (`until` is processed before other events)
+        intervention_time = env.ts_initial + (conf['INTERVENTION_START_TIME'] - env.initial_timestamp).total_seconds()
+        if intervention_time > env.now:
+            env.run(until=intervention_time)
+        scenario_statuses = _fork_intervention_scenarios(
+            env, city, console_logger, intervention_scenarios, end_time, on_scenario_end
+        )
+    env.run(until=end_time)
+    city.finish_app_jobs()
 
+    _wait_for_intervention_scenarios(scenario_statuses)
     return city
 
 
+def _fork_intervention_scenarios(env, city, console_logger, intervention_scenarios, end_time, on_scenario_end):
+    """
+    Forks one process per intervention scenario, each running the simulation from its current state until `end_time`.
+
+    The forks exit at the end of their simulation, and only the parent process returns. At most
+    `MAX_CONCURRENT_INTERVENTION_SCENARIOS` forks run at the same time (along with the parent process): the next
+    scenarios are only forked once the previous ones exited.
+
+    Args:
+        env (covid19sim.utils.env.Env): environment of the simulation, stopped right before the intervention.
+        city (covid19sim.locations.city.City): city of the simulation.
+        console_logger (covid19sim.log.console_logger.ConsoleLogger): logger of the simulation.
+        intervention_scenarios (list): parameters of each intervention, overriding the configuration in its fork.
+        end_time (float): time at which the simulations end.
+        on_scenario_end (callable): called with the city of a scenario at the end of its simulation. May be None.
+
+    Returns:
+        (dict): id of each forked process --> its exit status if it was already waited for, None otherwise.
+    """
+    # the heavy jobs running in the background would be lost by the forks
+    if city.pending_app_jobs is not None and city.pending_app_jobs[-1] is not None:
+        city.pending_app_jobs[-1].wait()
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    max_running_scenarios = city.conf.get('MAX_CONCURRENT_INTERVENTION_SCENARIOS')
+    if max_running_scenarios is None:
+        max_running_scenarios = max(1, (os.cpu_count() or 1) - 1)
+    assert max_running_scenarios >= 1, f"invalid MAX_CONCURRENT_INTERVENTION_SCENARIOS: {max_running_scenarios}"
+
+    scenario_statuses = {}
+    for scenario_idx, scenario in enumerate(intervention_scenarios):
+        running_pids = [pid for pid, status in scenario_statuses.items() if status is None]
+        if len(running_pids) >= max_running_scenarios:
+            # scenarios run for about as long as each other: the oldest one is the first to exit
+            _, scenario_statuses[running_pids[0]] = os.waitpid(running_pids[0], 0)
+
+        pid = os.fork()
+        if pid:
+            scenario_statuses[pid] = None
+            continue
+
+        exit_code = 1
+        try:
+            conf = city.conf
+            # all scenarios start on the intervention day of the simulation they are forked from
+            conf.update({key: value for key, value in scenario.items() if key != "INTERVENTION_DAY"})
+            conf['INTERVENTION'] = _get_intervention_string(conf)
+            conf['INTERVENTION_SCENARIO_IDX'] = scenario_idx
+            if conf.get('outdir') is not None:
+                conf['outdir'] = os.path.join(conf['outdir'], f"scenario-{scenario_idx}")
+                os.makedirs(conf['outdir'], exist_ok=True)
+                if conf['logfile'] is not None:
+                    conf['logfile'] = os.path.join(conf['outdir'], os.path.basename(conf['logfile']))
+                    city.logfile = city.tracker.logfile = console_logger.logfile = conf['logfile']
+                city.tracker.fork_event_streams(conf['outdir'])
+            # nobody has the app before the intervention, so there are no clusters to carry over to the new hash
+            city.hash = int(time.time_ns())
+
+            env.run(until=end_time)
+            city.finish_app_jobs()
+            if on_scenario_end is not None:
+                on_scenario_end(city)
+            exit_code = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)
+
+    return scenario_statuses
+
+
+def _wait_for_intervention_scenarios(scenario_statuses):
+    """
+    Waits for the forked intervention scenarios to exit.
+
+    Args:
+        scenario_statuses (dict): id of each forked process --> its exit status if it was already waited for, None otherwise.
+
+    Raises:
+        (RuntimeError): if a scenario failed
+    """
+    failed_scenario_pids = []
+    for pid, status in scenario_statuses.items():
+        if status is None:
+            _, status = os.waitpid(pid, 0)
+        # a scenario killed by a signal failed as well
+        if not (os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0):
+            failed_scenario_pids.append(pid)
+    if failed_scenario_pids:
+        raise RuntimeError(f"intervention scenarios failed in processes {failed_scenario_pids}")
+
+
 if __name__ == "__main__":
     main()
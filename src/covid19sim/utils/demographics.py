@@ -66,6 +66,56 @@ class HouseType(object):
         self.n_people_generation = [n_grandparents, n_parents, n_kids]
         assert sum(self.n_people_generation) == self.n_humans, "size does not match"
 
+class HumanPool(object):
+    """
+    Class to hold the humans of an age bin that are yet to be allocated a household.
+    Humans are removed in constant time by swapping them with the last human of the pool, so the order
+    of the humans is not preserved.
+
+    Args:
+        humans (list): humans to put in the pool. Defaults to None.
+    """
+    def __init__(self, humans=None):
+        self.humans = list(humans) if humans is not None else []
+        self.positions = {human: idx for idx, human in enumerate(self.humans)}
+
+    def __len__(self):
+        return len(self.humans)
+
+    def __iter__(self):
+        # iterate over a copy so that humans can be removed meanwhile
+        return iter(list(self.humans))
+
+    def __contains__(self, human):
+        return human in self.positions
+
+    def append(self, human):
+        assert human not in self.positions, f"{human} is already in the pool"
+        self.positions[human] = len(self.humans)
+        self.humans.append(human)
+
+    def remove(self, human):
+        idx = self.positions.pop(human)
+        last_human = self.humans.pop()
+        if last_human is not human:
+            self.humans[idx] = last_human
+            self.positions[last_human] = idx
+
+    def sample(self, rng):
+        """
+        Removes a human drawn uniformly at random from the pool.
+
+        Args:
+            rng (np.random.RandomState): Random number generator
+
+        Returns:
+            (covid19sim.human.Human): sampled human
+        """
+        # same draw as rng.choice(self.humans, size=1)
+        human = self.humans[rng.randint(len(self.humans), size=1).item()]
+        self.remove(human)
+        return human
+
 def get_humans_with_age(city, age_histogram, conf, rng):
     """
     Creats human objects corresponding to the numbers in `age_histogram`.
@@ -660,7 +710,7 @@ def assign_households_to_humans(humans, city, conf, logfile=None):
     assert abs(sum(P_TYPES) - 1) < 1e-2, "Probabilities do not sum to 1."
 
     n_people = city.n_people
-    unassigned_humans = humans
+    unassigned_humans = defaultdict(HumanPool, {bin: HumanPool(humans_in_bin) for bin, humans_in_bin in humans.items()})
     age_bins = sorted(humans.keys(), key=lambda x:x[0])
     allocated_humans = []
 
@@ -697,8 +747,8 @@ def assign_households_to_humans(humans, city, conf, logfile=None):
 
     housetypes = [deepcopy(x) for x, i in housetypes.items() for _ in range(i)]
 
-    # initialize with unallocated houses
-    unallocated_houses = defaultdict(list)
+    # initialize with unallocated houses (dicts are used as ordered sets to remove houses in constant time)
+    unallocated_houses = defaultdict(dict)
     for housetype in housetypes:
         # determine if multiple generations live together or not
         # all possiblities are listed here - [number of grandparents, parents, kids] and sampled uniformly given a size
@@ -714,9 +764,9 @@ def assign_households_to_humans(humans, city, conf, logfile=None):
                 n_people_generation = [[2, 1, 2], [2, 2, 1], [1, 2, 2], [1, 1, 3]]
             n_grandparents, n_parents, n_kids = _random_choice(n_people_generation, rng=city.rng, size=1)[0]
             housetype.set_generations(n_grandparents, n_parents, n_kids)
-            unallocated_houses['multigenerational'].append(housetype) # needed to prioritize these houses to fill first
+            unallocated_houses['multigenerational'][housetype] = None # needed to prioritize these houses to fill first
 
-        unallocated_houses[housetype.n_kids].append(housetype)
+        unallocated_houses[housetype.n_kids][housetype] = None
 
     # start sampling
     n_failed_attempts = 0
@@ -759,7 +809,7 @@ def assign_households_to_humans(humans, city, conf, logfile=None):
         humans_with_same_house, unassigned_humans = _sample_other_residents(housetype, unassigned_humans, city.rng, conf, with_kid=kid)
         if humans_with_same_house:
             allocated_humans = create_and_assign_household(humans_with_same_house, housetype, conf, city, allocated_humans)
-            unallocated_houses[housetype.n_kids].remove(housetype)
+            del unallocated_houses[housetype.n_kids][housetype]
         else:
             n_failed_attempts += 1
             unassigned_humans = _revert_allocation([kid], unassigned_humans)
@@ -775,7 +825,7 @@ def assign_households_to_humans(humans, city, conf, logfile=None):
 
     # Step 2: remaining living arrangements are - "couple" (with 0 kids), "other" (not multigenerational), "solo"
     while len(unallocated_houses[0]) > 0:
-        housetype = unallocated_houses[0].pop()
+        housetype, _ = unallocated_houses[0].popitem()
         humans_with_same_house, unassigned_humans = _sample_other_residents(housetype, unassigned_humans, city.rng, conf, with_kid=None)
         if humans_with_same_house:
             allocated_humans = create_and_assign_household(humans_with_same_house, housetype, conf, city, allocated_humans)
@@ -804,8 +854,8 @@ def assign_households_to_humans(humans, city, conf, logfile=None):
     if not start_search_for_kids or n_failed_attempts == 2 * MAX_FAILED_ATTEMPTS_ALLOWED or random_allocation_of_kids:
         # something is wrong with the algo.
         log(f"Could not find suitable housing for the population. Allocating solo residences.\nFailed attempt - {n_failed_attempts}. Total allocated:{len(allocated_humans)}", logfile)
-        for bin, humans in unassigned_humans.items():
-            for human in humans:
+        for bin, humans_in_bin in unassigned_humans.items():
+            for human in humans_in_bin:
                 unassigned_humans[bin].remove(human)
                 housetype = HouseType("solo", 0, 1, P_HOUSEHOLD_SIZE[0])
                 housetype.random = True
@@ -832,7 +882,7 @@ def _sample_house_type(unallocated_houses, rng, housetypes, kid=True):
     Samples house type from `unallocated_houses`.
 
     Args:
-        unallocated_houses (dict): keys are number of kids in house and values are a list of `HouseType` objects
+        unallocated_houses (dict): keys are number of kids in house and values are `HouseType` objects (as keys of an ordered dict)
         rng (np.random.RandomState): Random number generator
         kid (bool): whether to sample of the houses with kids. Defaults to True.
 
@@ -842,7 +892,7 @@ def _sample_house_type(unallocated_houses, rng, housetypes, kid=True):
     if kid:
         # send multigenerational households first as they have more constraints to satisfy in regards to age
         if unallocated_houses['multigenerational']:
-            housetype = unallocated_houses['multigenerational'].pop()
+            housetype, _ = unallocated_houses['multigenerational'].popitem()
             return housetype
         else:
             unallocated_houses.pop('multigenerational')
@@ -857,7 +907,7 @@ def _sample_house_type(unallocated_houses, rng, housetypes, kid=True):
         count = np.array(count)
         p = count / count.sum()
         n_kids = rng.choice(n_kids, size=1, p=p).item()
-        return unallocated_houses[n_kids][0]
+        return next(iter(unallocated_houses[n_kids]))
     else:
         return housetypes['unallocated'][0][0]
 
@@ -867,7 +917,7 @@ def _sample_other_residents(housetype, unassigned_humans, rng, conf, with_kid=No
 
     Args:
         housetype (HouseType): type of house to assign humans to.
-        unassigned_humans (dict): keys are age bin (tuple) and values are humans that do not have a household allocated
+        unassigned_humans (dict): keys are age bin (tuple) and values are `HumanPool`s of humans that do not have a household allocated
         rng (np.random.RandomState): Random number generator
         conf (dict): yaml configuration of the experiment
         with_kid (covid19sim.human.Human): a presampled kid. Default to None.
@@ -968,7 +1018,7 @@ def _sample_n_parents(valid_age_bins, conf, unassigned_humans, rng, n, p_bin):
     Args:
         valid_age_bins (list): age bins that qualify to sample humans
         conf (dict): yaml configuration of the experiment
-        unassigned_humans (dict): keys are age bin (tuple) and values are humans that do not have a household allocated
+        unassigned_humans (dict): keys are age bin (tuple) and values are `HumanPool`s of humans that do not have a household allocated
         rng (np.random.RandomState): Random number generator
         n (int): number of kids to sample. Defaults to 0.
         p_bin (list): probability to sample a bin in `valid_age_bins`. Defaults to None.
@@ -991,8 +1041,7 @@ def _sample_n_parents(valid_age_bins, conf, unassigned_humans, rng, n, p_bin):
     # single parent
     if n == 1:
         older_bin = _random_choice(valid_age_bins, rng, size=1, P=p_bin)[0]
-        parent = rng.choice(unassigned_humans[older_bin], size=1).item()
-        unassigned_humans[older_bin].remove(parent)
+        parent = unassigned_humans[older_bin].sample(rng)
         sampled_parents = [parent]
 
     # n=2 couple parent
@@ -1011,7 +1060,7 @@ def _sample_couple(valid_age_bins, conf, unassigned_humans, rng, p_bin=None, ret
     Args:
         valid_age_bins (list): age bins that qualify to sample humans
         conf (dict): yaml configuration of the experiment
-        unassigned_humans (dict): keys are age bin (tuple) and values are humans that do not have a household allocated
+        unassigned_humans (dict): keys are age bin (tuple) and values are `HumanPool`s of humans that do not have a household allocated
         rng (np.random.RandomState): Random number generator
         n (int): number of kids to sample. Defaults to 0.
         p_bin (list): probability to sample a bin in `valid_age_bins`. Defaults to None.
@@ -1058,11 +1107,8 @@ def _sample_couple(valid_age_bins, conf, unassigned_humans, rng, p_bin=None, ret
 
     two_bins = _random_choice(valid_couple_bins, rng, size=1, P=p_couple)[0]
 
-    human1 = rng.choice(unassigned_humans[two_bins[0]], size=1).item()
-    unassigned_humans[two_bins[0]].remove(human1)
-
-    human2 = rng.choice(unassigned_humans[two_bins[1]], size=1).item()
-    unassigned_humans[two_bins[1]].remove(human2)
+    human1 = unassigned_humans[two_bins[0]].sample(rng)
+    human2 = unassigned_humans[two_bins[1]].sample(rng)
 
     sampled_humans += [human1, human2]
 
@@ -1075,7 +1121,7 @@ def _sample_solo_dweller(valid_age_bins, conf, unassigned_humans, rng):
     Args:
         valid_age_bins (list): age bins that qualify to sample humans
         conf (dict): yaml configuration of the experiment
-        unassigned_humans (dict): keys are age bin (tuple) and values are humans that do not have a household allocated
+        unassigned_humans (dict): keys are age bin (tuple) and values are `HumanPool`s of humans that do not have a household allocated
         rng (np.random.RandomState): Random number generator
 
     Returns:
@@ -1093,8 +1139,7 @@ def _sample_solo_dweller(valid_age_bins, conf, unassigned_humans, rng):
         P = [P_AGE_SOLO[i] for i in valid_idx]
         P = [i / sum(P) for i in P]
         age_bin = _random_choice(valid_age_bins, rng, 1, P)[0]
-        human = rng.choice(unassigned_humans[age_bin], size=1).tolist()
-        unassigned_humans[age_bin].remove(human[0])
+        human = [unassigned_humans[age_bin].sample(rng)]
 
     return human
 
@@ -1105,7 +1150,7 @@ def _sample_random_humans(valid_other_bins, conf, unassigned_humans, rng, size):
     Args:
         valid_age_bins (list): age bins that qualify to sample humans
         conf (dict): yaml configuration of the experiment
-        unassigned_humans (dict): keys are age bin (tuple) and values are humans that do not have a household allocated
+        unassigned_humans (dict): keys are age bin (tuple) and values are `HumanPool`s of humans that do not have a household allocated
         rng (np.random.RandomState): Random number generator
         size (int): number of humans to sample
 
@@ -1114,8 +1159,7 @@ def _sample_random_humans(valid_other_bins, conf, unassigned_humans, rng, size):
     """
     ASSORTATIVITY_STRENGTH = conf['HOUSEHOLD_ASSORTATIVITY_STRENGTH']
 
-    all_humans = [(y,x) for x in valid_other_bins for y in unassigned_humans[x]]
-    if len(all_humans) < size:
+    if sum(len(unassigned_humans[x]) for x in valid_other_bins) < size:
         return []
 
     valid_other_bins = sorted(valid_other_bins, key=lambda x:x[0])
@@ -1125,9 +1169,8 @@ def _sample_random_humans(valid_other_bins, conf, unassigned_humans, rng, size):
     while len(humans) < size:
         p = p_bin / p_bin.sum()
         bin = _random_choice(valid_other_bins, rng=rng, size=1, P=p)[0]
-        human = rng.choice(unassigned_humans[bin], size=1).item()
+        human = unassigned_humans[bin].sample(rng)
         humans.append(human)
-        unassigned_humans[bin].remove(human)
 
         # reassign probabilities
         idx = valid_other_bins.index(bin)
@@ -1151,7 +1194,7 @@ def _sample_n_kids(valid_age_bins, conf, unassigned_humans, rng, size, with_kid=
     Args:
         valid_age_bins (list): age bins that qualify to sample humans
         conf (dict): yaml configuration of the experiment
-        unassigned_humans (dict): keys are age bin (tuple) and values are humans that do not have a household allocated
+        unassigned_humans (dict): keys are age bin (tuple) and values are `HumanPool`s of humans that do not have a household allocated
         rng (np.random.RandomState): Random number generator
         size (int): number of humans to sample
 
@@ -1177,9 +1220,8 @@ def _sample_n_kids(valid_age_bins, conf, unassigned_humans, rng, size, with_kid=
     while len(kids) < total_kids:
         p_bin = p_bin / p_bin.sum()
         bin = _random_choice(valid_younger_bins, rng=rng, size=1, P=p_bin)[0]
-        kid = rng.choice(unassigned_humans[bin], size=1).item()
+        kid = unassigned_humans[bin].sample(rng)
         kids.append(kid)
-        unassigned_humans[bin].remove(kid)
 
         # reassign probabilities
         idx = valid_younger_bins.index(bin)
@@ -1260,7 +1302,7 @@ def _assign_household(human, res, allocated_humans):
     Returns:
         allocated_humans (list): a list of humans that have been allocated a household
     """
-    assert human not in allocated_humans, f"reassigning household to human:{human}"
+    assert human.household is None, f"reassigning household to human:{human}"
     human.assign_household(res)
     res.residents.append(human)
     allocated_humans.append(human)
@@ -1280,7 +1322,7 @@ def create_and_assign_household(humans_with_same_house, housetype, conf, city, a
     Returns:
         allocated_humans (list): a list of humans that have been allocated a household
     """
-    assert all(human not in allocated_humans for human in humans_with_same_house), f"reassigning household to human"
+    assert all(human.household is None for human in humans_with_same_house), f"reassigning household to human"
     res =  Household(
             env=city.env,
             rng=np.random.RandomState(city.rng.randint(2 ** 16)),
@@ -1343,10 +1385,10 @@ def _revert_allocation(humans, unassigned_humans):
 
     Args:
         humans (list): list of humans to be put back in their respective bins
-        unassigned_humans (dict): keys are age bin (tuple) and values are humans that do not have a household allocated
+        unassigned_humans (dict): keys are age bin (tuple) and values are `HumanPool`s of humans that do not have a household allocated
 
     Returns:
-        unassigned_humans (dict): keys are age bin (tuple) and values are humans that do not have a household allocated
+        unassigned_humans (dict): keys are age bin (tuple) and values are `HumanPool`s of humans that do not have a household allocated
     """
     for human in humans:
         if human not in unassigned_humans[human.age_bin_width_5.bin]:
@@ -0,0 +1,131 @@
+"""
+Spatial index over the locations of a city, used to pick the places that humans visit without computing their
+distance to every location of a type at each visit.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def _get_preference(distances):
+    """
+    Preference of a human for a location at `distances` from them.
+
+    Args:
+        distances (np.ndarray): distances to the locations
+
+    Returns:
+        (np.ndarray): unnormalized preferences of the same shape as `distances`
+    """
+    return (distances + 1e-1) ** -1
+
+
+class LocationIndex(object):
+    """
+    Holds a k-d tree over the coordinates of the locations of each type, and the preferences of the origins that
+    are queried over and over (households) for the `top_k` locations of a type that are nearest to them.
+    Preferences are stored as one row per origin of two (n_origins, top_k) arrays, which are shared by all the
+    humans of a household.
+
+    Args:
+        locations (dict): location type (str) -> list of `Location`s of this type
+        top_k (int): number of nearest locations that are considered from an origin. None considers all of them.
+    """
+
+    def __init__(self, locations, top_k=None):
+        assert top_k is None or top_k > 0, f"top_k should be positive. Got {top_k}"
+        self.top_k = top_k
+        self.locations = {}
+        self.trees = {}
+        for location_type, locations_of_type in locations.items():
+            self.locations[location_type] = list(locations_of_type)
+            if locations_of_type:
+                coordinates = np.array([[loc.lat, loc.lon] for loc in locations_of_type], dtype=np.float64)
+                self.trees[location_type] = cKDTree(coordinates)
+
+        # location type -> (origin name -> row, (n_origins, k) location indices, (n_origins, k) preferences)
+        self.preferences = {}
+
+    def _get_k(self, location_type, k):
+        """
+        Clips the number of nearest locations to look up to the number of locations of `location_type`.
+        """
+        n_locations = len(self.locations.get(location_type, []))
+        return n_locations if k is None else min(k, n_locations)
+
+    def query(self, location_type, coordinates, k=None):
+        """
+        Looks up the `k` locations of `location_type` nearest to each of `coordinates`.
+
+        Args:
+            location_type (str): type of the locations to look up
+            coordinates (np.ndarray): (n, 2) lat and lon of the points to look up from
+            k (int): number of nearest locations to return. None returns all of them.
+
+        Returns:
+            idxs (np.ndarray): (n, k) indices of the nearest locations in `self.locations[location_type]`, nearest first
+            distances (np.ndarray): (n, k) distances to these locations
+        """
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        k = self._get_k(location_type, k)
+        if k == 0:
+            return np.zeros((len(coordinates), 0), dtype=np.int64), np.zeros((len(coordinates), 0))
+        distances, idxs = self.trees[location_type].query(coordinates, k=k)
+        return idxs.reshape(len(coordinates), k), distances.reshape(len(coordinates), k)
+
+    def iter_nearest(self, location_type, location):
+        """
+        Iterates over the locations of `location_type` from the nearest to the farthest of `location`.
+        Only the number of locations that is actually consumed is looked up.
+
+        Args:
+            location_type (str): type of the locations to iterate over
+            location (covid19sim.locations.location.Location): location from which distances are computed
+
+        Yields:
+            (covid19sim.locations.location.Location): locations of `location_type`
+        """
+        locations = self.locations.get(location_type, [])
+        seen, k = set(), 1
+        while len(seen) < len(locations):
+            idxs, _ = self.query(location_type, [location.lat, location.lon], k=k)
+            for idx in idxs[0]:
+                if idx not in seen:
+                    seen.add(idx)
+                    yield locations[idx]
+            k *= 2
+
+    def compute_preferences(self, location_type, origins):
+        """
+        Computes and stores the preferences of `origins` for their `top_k` nearest locations of `location_type`.
+
+        Args:
+            location_type (str): type of the locations
+            origins (list): `Location`s from which preferences are looked up later on, e.g. households
+        """
+        origins = list(origins)
+        idxs, distances = self.query(location_type, [[o.lat, o.lon] for o in origins], k=self.top_k)
+        rows = {origin.name: row for row, origin in enumerate(origins)}
+        self.preferences[location_type] = (rows, idxs.astype(np.int32), _get_preference(distances).astype(np.float32))
+
+    def get_preferences(self, location_type, origin):
+        """
+        Returns the preferences of a human at `origin` for the `top_k` locations of `location_type` nearest to it.
+        Origins that were given to `compute_preferences` are looked up in constant time, other ones in the tree.
+
+        Args:
+            location_type (str): type of the locations
+            origin (covid19sim.locations.location.Location): location from which preferences are computed
+
+        Returns:
+            locations (list): `Location`s of `location_type`, nearest first
+            preferences (list): unnormalized preference (float) for each of `locations`
+        """
+        rows, idxs, preferences = self.preferences.get(location_type, ({}, None, None))
+        row = rows.get(origin.name)
+        if row is not None:
+            idxs, preferences = idxs[row], preferences[row]
+        else:
+            idxs, distances = self.query(location_type, [origin.lat, origin.lon], k=self.top_k)
+            idxs, preferences = idxs[0], _get_preference(distances[0])
+        locations = self.locations[location_type]
+        return [locations[idx] for idx in idxs], preferences.tolist()
@@ -10,8 +10,10 @@ import warnings
 import numpy as np
 from copy import deepcopy
 from collections import defaultdict, deque
+from joblib import Parallel, delayed
+from orderedset import OrderedSet
 
-from covid19sim.utils.utils import _random_choice, filter_queue_max, filter_open, compute_distance, _normalize_scores, _get_seconds_since_midnight, log
+from covid19sim.utils.utils import _random_choice, _normalize_scores, _get_seconds_since_midnight, log
 from covid19sim.utils.constants import SECONDS_PER_DAY, SECONDS_PER_HOUR, SECONDS_PER_MINUTE
 ACTIVITIES = ["work", "socialize", "exercise", "grocery"]
 
@@ -191,13 +193,18 @@ class MobilityPlanner(object):
         self.schedule_for_day = []
         self.full_schedule = []
         self.current_activity = None
+        # durations presampled for each day of the simulation (see `_plan_schedules`), and planning progress
+        self.presampled_durations = None
+        self.n_planned_days = 0
+        self.last_planned_activity = None
+        self.planning_start_timestamp = None
         self.follows_adult_schedule, self.adult_to_follow = False, []
         self.schedule_prepared = set()
         # since we pop the elements from full_schedule, we keep count of days passed
         self.schedule_day = -1 # denotes the number of schedules that full_schedule has already popped
 
         # inverted supervision - when kid needs to stay home and adult needs to be informed about this
-        self.inverted_supervision = set()
+        self.inverted_supervision = OrderedSet()  # OrderedSet instead of set for determinism when iterating
         self.adult_to_follow_today = None
 
         # flags affected by health induced mobility reduction
@@ -222,7 +229,7 @@ class MobilityPlanner(object):
     def __repr__(self):
         return f"<MobilityPlanner for {self.human}>"
 
-    def initialize(self):
+    def initialize(self, presampled_durations=None):
         """
         Initializes current activity to be sleeping until AVG_SLEEPING_MINUTES.
         Prepares a tentative schedule for the entire simulation so that only the location needs to be determined.
@@ -230,6 +237,9 @@ class MobilityPlanner(object):
             1. `human` is a kid that can't be without parent supervision
             2. `human` is a kid that can go to school, but needs parent supervision at other times
             3. `human` who is free to do anything.
+
+        Args:
+            presampled_durations (np.array): durations already sampled by `presample_durations_in_parallel` (case 3 only)
         """
         # start human from the activity of sleeping. (assuming everyone sleeps for same amount of time)
         AVERAGE_TIME_SLEEPING = self.conf['AVERAGE_TIME_SLEEPING']
@@ -255,55 +265,76 @@ class MobilityPlanner(object):
                 log(f"Improper housing allocation has led to {self.human} living without adult. MobilityPlanner will not keep them supervised.", self.human.city.logfile)
 
         if not self.follows_adult_schedule:
-            ## work
-            if self.human.does_not_work:
-                does_work = np.zeros(n_days)
-            else:
-                does_work = 1.0 * np.array([(todays_weekday + i) % 7 in self.human.working_days for i in range(n_days)])
-                n_working_days = (does_work > 0).sum()
-                does_work[does_work > 0] = [_sample_activity_duration("work", self.conf, self.rng) for _ in range(n_working_days)]
-
-            ## other activities
-            does_grocery = _presample_activity("grocery", self.conf, self.rng, n_days)
-            does_exercise = _presample_activity("exercise", self.conf, self.rng, n_days)
-            does_socialize = _presample_activity("socialize", self.conf, self.rng, n_days)
-
-            # schedule them all while satisfying sleep constraints
-            # Note: we sample locations on the day of activity
-            last_activity = self.current_activity
-            full_schedule = []
-            for i in range(n_days):
-                assert last_activity.name == "sleep", f"found {last_activity} and not sleep"
-
-                # Note: order of appending is important to _patch_schedule
-                # Note: duration of activities is equally important. A variance factor of 10 in the distribution
-                # might result in duration spanning two or more days which will violate the assumptions in this planner.
-                to_schedule = []
-                tentative_date = (self.env.timestamp + datetime.timedelta(days=i)).date()
-                to_schedule.append(Activity(None, does_work[i].item(), "work", self.human.workplace, self.human, tentative_date))
-                to_schedule.append(Activity(None, does_socialize[i].item(), "socialize", None, self.human, tentative_date))
-                to_schedule.append(Activity(None, does_grocery[i].item(), "grocery", None, self.human, tentative_date))
-                to_schedule.append(Activity(None, does_exercise[i].item(), "exercise", None, self.human, tentative_date))
-
-                # adds idle and sleep acivities too
-                schedule = _patch_schedule(self.human, last_activity, to_schedule, self.conf)
-                last_activity = schedule[-1]
-                full_schedule.append(schedule)
-                # (debug)
-                if last_activity.duration == 0:
-                    warnings.warn(f"{self.human} has 0 duration {last_activity}\nschedule:{schedule}\npenultimate:{full_schedule[-2]}")
-
-            assert all(schedule[-1].name == "sleep" for schedule in full_schedule), "sleep not found as last element in a schedule"
-            assert len(full_schedule) == n_days, "not enough schedule prepared"
+            if presampled_durations is None:
+                presampled_durations = _presample_durations(self.human.does_not_work, self.human.working_days, self.conf, self.rng, n_days, todays_weekday)
+            assert len(presampled_durations) == n_days, "not enough days presampled"
+
+            # only durations are kept for the entire simulation; `Activity`s are created for a few days at a time
+            # Note: all random draws happen here, so the schedules do not depend on how many days are planned ahead
+            self.presampled_durations = presampled_durations
+            self.last_planned_activity = self.current_activity
+            self.planning_start_timestamp = self.env.timestamp
+            self.full_schedule = deque()
+            self._plan_schedules()
+
+    def _plan_schedules(self, until=None):
+        """
+        Creates the `Activity`s of the next presampled days, so that `full_schedule` holds at least `SCHEDULE_HORIZON_DAYS`
+        schedules (or all of them if it is None). With `until`, keeps planning until the last planned schedule starts after it.
+        Schedules of a day are patched with the sleep of the previous day, so the schedules visible in `full_schedule[0]` are
+        never changed by planning more days.
+
+        Args:
+            until (datetime.datetime): time up to which all activities should be in `full_schedule`
+        """
+        if self.presampled_durations is None:
+            return
+
+        SCHEDULE_HORIZON_DAYS = self.conf.get('SCHEDULE_HORIZON_DAYS')
+        assert SCHEDULE_HORIZON_DAYS is None or SCHEDULE_HORIZON_DAYS >= 2, "the next schedule is needed to finalize the current one"
+        n_days = len(self.presampled_durations)
+        while self.n_planned_days < n_days:
+            if (
+                SCHEDULE_HORIZON_DAYS is not None
+                and len(self.full_schedule) >= SCHEDULE_HORIZON_DAYS
+                and (until is None or self.full_schedule[-1][0].start_time > until)
+            ):
+                break
 
+            i = self.n_planned_days
+            last_activity = self.last_planned_activity
+            assert last_activity.name == "sleep", f"found {last_activity} and not sleep"
+            work, socialize, grocery, exercise, awake, sleep = self.presampled_durations[i].tolist()
+
+            # Note: order of appending is important to _patch_schedule
+            # Note: duration of activities is equally important. A variance factor of 10 in the distribution
+            # might result in duration spanning two or more days which will violate the assumptions in this planner.
+            to_schedule = []
+            tentative_date = (self.planning_start_timestamp + datetime.timedelta(days=i)).date()
+            to_schedule.append(Activity(None, float(work), "work", self.human.workplace, self.human, tentative_date))
+            to_schedule.append(Activity(None, float(socialize), "socialize", None, self.human, tentative_date))
+            to_schedule.append(Activity(None, float(grocery), "grocery", None, self.human, tentative_date))
+            to_schedule.append(Activity(None, float(exercise), "exercise", None, self.human, tentative_date))
+
+            # adds idle and sleep acivities too
+            schedule = _patch_schedule(self.human, last_activity, to_schedule, self.conf, max_awake_duration=awake, sleep_duration=sleep)
+            assert schedule[-1].name == "sleep", "sleep not found as last element in a schedule"
+            self.last_planned_activity = schedule[-1]
+            self.full_schedule.append(schedule)
+            self.n_planned_days += 1
+            # (debug)
+            if self.last_planned_activity.duration == 0:
+                warnings.warn(f"{self.human} has 0 duration {self.last_planned_activity}\nschedule:{schedule}\nprevious:{last_activity}")
+
+        if self.n_planned_days == n_days and self.last_planned_activity.prepend_name != "filler":
             # fill the schedule with sleep if there is some time left at the end
-            time_left_to_simulation_end = (full_schedule[-1][-1].end_time -  self.env.timestamp).total_seconds()
+            last_activity = self.last_planned_activity
+            time_left_to_simulation_end = (last_activity.end_time - self.planning_start_timestamp).total_seconds()
             assert time_left_to_simulation_end > SECONDS_PER_DAY, "A full day's schedule has not been planned"
             if time_left_to_simulation_end < n_days * SECONDS_PER_DAY:
-                filler_schedule = deque([Activity(full_schedule[-1][-1].end_time, time_left_to_simulation_end, "sleep", self.human.household, self.human, prepend_name="filler")])
-                full_schedule.append(filler_schedule)
-
-            self.full_schedule = deque(full_schedule)
+                filler_schedule = deque([Activity(last_activity.end_time, time_left_to_simulation_end, "sleep", self.human.household, self.human, prepend_name="filler")])
+                self.full_schedule.append(filler_schedule)
+            self.presampled_durations = None  # everything has been planned
 
     def get_schedule(self, for_kids=False):
         """
@@ -492,6 +523,7 @@ class MobilityPlanner(object):
         else:
             schedule = self.full_schedule.popleft()
             self.schedule_day += 1
+            self._plan_schedules()
 
         return schedule
 
@@ -732,11 +764,108 @@ class MobilityPlanner(object):
         """
         self.schedule_for_day = []
         self.current_activity = None
+        self.presampled_durations = None
         while len(self.full_schedule) > 0:
             schedule = self.full_schedule.popleft()
             while len(schedule) > 0:
                 activity = schedule.popleft()
 
+def _presample_durations(does_not_work, working_days, conf, rng, n_days, todays_weekday):
+    """
+    Presamples the durations of the activities of a human that plans its own schedule for `n_days`.
+
+    Args:
+        does_not_work (bool): True if the human doesn't go to work
+        working_days (list): weekdays on which the human goes to work
+        conf (dict): yaml configuration of the experiment
+        rng (np.random.RandomState): Random number generator
+        n_days (int): number of days to sample for
+        todays_weekday (int): weekday of the first day
+
+    Returns:
+        (np.array): int32 array of shape (n_days, 6) with durations in seconds of work, socialize, grocery, exercise, awake and sleep
+    """
+    ## work
+    if does_not_work:
+        does_work = np.zeros(n_days)
+    else:
+        does_work = 1.0 * np.array([(todays_weekday + i) % 7 in working_days for i in range(n_days)])
+        n_working_days = (does_work > 0).sum()
+        does_work[does_work > 0] = [_sample_activity_duration("work", conf, rng) for _ in range(n_working_days)]
+
+    ## other activities
+    does_grocery = _presample_activity("grocery", conf, rng, n_days)
+    does_exercise = _presample_activity("exercise", conf, rng, n_days)
+    does_socialize = _presample_activity("socialize", conf, rng, n_days)
+
+    ## sleep constraints (drawn in this order by `_add_sleep_to_schedule` for each day)
+    awake_and_sleep = [
+        (_sample_activity_duration("awake", conf, rng), _sample_activity_duration("sleep", conf, rng))
+        for _ in range(n_days)
+    ]
+
+    return np.column_stack([does_work, does_socialize, does_grocery, does_exercise, awake_and_sleep]).astype(np.int32)
+
+def _presample_durations_shard(conf, n_days, todays_weekday, shard):
+    """
+    Presamples durations for a shard of humans in a worker process (see `presample_durations_in_parallel`).
+
+    Args:
+        conf (dict): yaml configuration of the experiment
+        n_days (int): number of days to sample for
+        todays_weekday (int): weekday of the first day
+        shard (list): list of (does_not_work, working_days, rng state) of each human
+
+    Returns:
+        (list): list of (durations, rng state after sampling) of each human
+    """
+    results = []
+    rng = np.random.RandomState()
+    for does_not_work, working_days, rng_state in shard:
+        rng.set_state(rng_state)
+        durations = _presample_durations(does_not_work, working_days, conf, rng, n_days, todays_weekday)
+        results.append((durations, rng.get_state()))
+    return results
+
+def presample_durations_in_parallel(humans, conf, start_time, n_jobs):
+    """
+    Presamples the activity durations of all the `humans` that plan their own schedule, in `n_jobs` processes.
+    Only these durations are drawn from the RNG of such humans in `MobilityPlanner.initialize`, so their RNG states
+    are sent to the workers and restored afterwards, which gives the same results as sampling them in sequence.
+
+    Args:
+        humans (list): list of `covid19sim.human.Human`s
+        conf (dict): yaml configuration of the experiment
+        start_time (datetime.datetime): time at which the schedules start
+        n_jobs (int): number of worker processes
+
+    Returns:
+        (dict): durations (see `_presample_durations`) of each human that plans its own schedule
+    """
+    MAX_AGE_CHILDREN_WITHOUT_SUPERVISION = conf['MAX_AGE_CHILDREN_WITHOUT_PARENT_SUPERVISION']
+    humans = [
+        human for human in humans
+        if human.age > MAX_AGE_CHILDREN_WITHOUT_SUPERVISION
+        or not any(h.age > MAX_AGE_CHILDREN_WITHOUT_SUPERVISION for h in human.household.residents)
+    ]
+    n_days = conf['simulation_days'] + 1
+    shard_size = max(math.ceil(len(humans) / n_jobs), 1)
+    shards = [humans[start:start + shard_size] for start in range(0, len(humans), shard_size)]
+    with Parallel(n_jobs=n_jobs) as parallel:
+        results = parallel(
+            delayed(_presample_durations_shard)(
+                conf, n_days, start_time.weekday(),
+                [(human.does_not_work, human.working_days, human.rng.get_state()) for human in shard],
+            ) for shard in shards
+        )
+
+    presampled_durations = {}
+    for shard, shard_results in zip(shards, results):
+        for human, (durations, rng_state) in zip(shard, shard_results):
+            human.rng.set_state(rng_state)
+            presampled_durations[human] = durations
+    return presampled_durations
+
 def _move_relevant_activities_to_hospital(human, mobility_planner, current_activity, rng, conf, hospital, critical=False):
     """
     Changes the schedule so that `human`s future activities are at a hospital.
@@ -764,6 +893,7 @@ def _move_relevant_activities_to_hospital(human, mobility_planner, current_activ
 
     acitivities_to_revert_back_to_normal = [] # if critical, change in recovery time will need previously modified activities to change back to normal
     activities_to_modify = []
+    mobility_planner._plan_schedules(until=recovery_time)
     for activity in [current_activity] + list(mobility_planner.schedule_for_day):
         if activity.end_time < recovery_time:
             activities_to_modify.append(activity)
@@ -1007,7 +1137,7 @@ def _patch_kid_schedule(human, adult_schedule, work_activity, current_activity,
 
     return deque(schedule)
 
-def _patch_schedule(human, last_activity, activities, conf):
+def _patch_schedule(human, last_activity, activities, conf, max_awake_duration=0, sleep_duration=None):
     """
     Makes a continuous schedule out of the list of `activities` in continuation to `last_activity` (expects "sleep") from previous schedule.
 
@@ -1016,6 +1146,8 @@ def _patch_schedule(human, last_activity, activities, conf):
         last_activity (Activity): last activity (expects sleep) that `human` was doing
         activities (list): list of `Activity`s to add to the schedule
         conf (dict): yaml configuration of the experiment
+        max_awake_duration (float): presampled awake duration in seconds (only used along with `sleep_duration`)
+        sleep_duration (float): presampled sleep duration in seconds. Both durations are sampled if it is None.
 
     Returns:
         schedule (deque): a deque of `Activity`s where the activities are arranged in increasing order of their starting time.
@@ -1041,7 +1173,7 @@ def _patch_schedule(human, last_activity, activities, conf):
         schedule, current_activity, awake_duration = _add_to_the_schedule(human, schedule, activity, current_activity, awake_duration)
 
     # finally, close the schedule by adding sleep
-    schedule, current_activity, awake_duration = _add_sleep_to_schedule(human, schedule, last_activity, current_activity, human.rng, conf, awake_duration)
+    schedule, current_activity, awake_duration = _add_sleep_to_schedule(human, schedule, last_activity, current_activity, human.rng, conf, awake_duration, max_awake_duration=max_awake_duration, sleep_duration=sleep_duration)
 
     return deque(schedule)
 
@@ -1102,7 +1234,7 @@ def _add_to_the_schedule(human, schedule, activity, last_activity, awake_duratio
     schedule.append(activity)
     return schedule, activity, awake_duration + activity.duration
 
-def _add_sleep_to_schedule(human, schedule, last_sleep_activity, last_activity, rng, conf, awake_duration, max_awake_duration=0):
+def _add_sleep_to_schedule(human, schedule, last_sleep_activity, last_activity, rng, conf, awake_duration, max_awake_duration=0, sleep_duration=None):
     """
     Adds sleep `Activity` to the schedule. We constrain everyone to have an awake duration during which they
     hop from one network to the other, and a sleep during which they are constrained to be at their respective household networks.
@@ -1115,6 +1247,8 @@ def _add_sleep_to_schedule(human, schedule, last_sleep_activity, last_activity,
         rng (np.random.RandomState): Random number generator
         conf (dict): yaml configuration of the experiment
         awake_duration (float): total amount of time in seconds that `human` had been awake
+        max_awake_duration (float): presampled awake duration in seconds. Sampled if it is not positive, unless `sleep_duration` is presampled too.
+        sleep_duration (float): presampled sleep duration in seconds. Sampled if it is None.
 
     Returns:
         schedule (list): list of `Activity`s with the last `Activity` as sleep
@@ -1122,9 +1256,11 @@ def _add_sleep_to_schedule(human, schedule, last_sleep_activity, last_activity,
         total_duration (float): total amount of time in seconds that `human` had spent across all the activities in the schedule.
     """
     # draw time for which `self` remains awake and sleeps
-    if max_awake_duration <= 0:
-        max_awake_duration = _sample_activity_duration("awake", conf, rng)
-    sleep_duration = _sample_activity_duration("sleep", conf, rng)
+    # Note: if `sleep_duration` is presampled, then `max_awake_duration` was presampled along with it
+    if sleep_duration is None:
+        if max_awake_duration <= 0:
+            max_awake_duration = _sample_activity_duration("awake", conf, rng)
+        sleep_duration = _sample_activity_duration("sleep", conf, rng)
 
     start_time = last_sleep_activity.end_time + datetime.timedelta(seconds=max_awake_duration)
     sleep_activity = Activity(start_time, sleep_duration, "sleep", human.household, human)
@@ -1367,26 +1503,26 @@ def _select_location(human, activity, city, rng, conf):
     """
     if activity == "exercise":
         S = human.visits.n_parks
-        pool_pref = human.parks_preferences
-        locs = filter_open(city.parks)
+        locs, pool_pref = city.location_index.get_preferences("PARK", human.household)
+        max_queue_length = None
         visited_locs = human.visits.parks
 
     elif activity == "grocery":
         S = human.visits.n_stores
-        pool_pref = human.stores_preferences
+        locs, pool_pref = city.location_index.get_preferences("STORE", human.household)
         # Only consider locations open for business and not too long queues
-        locs = filter_queue_max(filter_open(city.stores), conf.get("MAX_STORE_QUEUE_LENGTH"))
+        max_queue_length = conf.get("MAX_STORE_QUEUE_LENGTH")
         visited_locs = human.visits.stores
 
     elif activity == "hospital":
-        for hospital in sorted(filter_open(city.hospitals), key=lambda x:compute_distance(human.location, x)):
-            if hospital.n_patients < hospital.capacity:
+        for hospital in city.location_index.iter_nearest("HOSPITAL", human.location):
+            if hospital.is_open_for_business and hospital.n_patients < hospital.capacity:
                 return hospital
         return None
 
     elif activity == "hospital-icu":
-        for hospital in sorted(filter_open(city.hospitals), key=lambda x:compute_distance(human.location, x)):
-            if hospital.icu.n_patients < hospital.icu.capacity:
+        for hospital in city.location_index.iter_nearest("HOSPITAL", human.location):
+            if hospital.is_open_for_business and hospital.icu.n_patients < hospital.icu.capacity:
                 return hospital.icu
         return None
 
@@ -1398,11 +1534,10 @@ def _select_location(human, activity, city, rng, conf):
             return human.household
 
         S = human.visits.n_miscs
-        candidate_locs = city.miscs
-        pool_pref = [(compute_distance(human.location, m) + 1e-1) ** -1 for m in candidate_locs]
+        locs, pool_pref = city.location_index.get_preferences("MISC", human.location)
 
         # Only consider locations open for business and not too long queues
-        locs = filter_queue_max(filter_open(candidate_locs), conf.get("MAX_MISC_QUEUE_LENGTH"))
+        max_queue_length = conf.get("MAX_MISC_QUEUE_LENGTH")
         visited_locs = human.visits.miscs
 
     elif activity == "work":
@@ -1419,11 +1554,19 @@ def _select_location(human, activity, city, rng, conf):
     else:
         p_exp = human.rho * S ** (-human.gamma)
 
-    if rng.random() < p_exp and S != len(locs):
-        # explore
-        cands = [i for i in locs if i not in visited_locs]
-        cands = [(loc, pool_pref[i]) for i, loc in enumerate(cands)]
-    else:
+    cands = []
+    if rng.random() < p_exp:
+        # explore among the preferred locations that are open and have not been visited yet
+        # (nearest first, whatever LOCATION_PREFERENCE_TOP_K: a seed draws other locations than with candidates in city order)
+        cands = [
+            (loc, pref)
+            for loc, pref in zip(locs, pool_pref)
+            if loc.is_open_for_business
+            and (max_queue_length is None or len(loc.queue) <= max_queue_length)
+            and loc not in visited_locs
+        ]
+
+    if len(cands) == 0:
         # exploit, but can only return to locs that are open
         cands = [
             (i, count)
@@ -0,0 +1,226 @@
+"""
+Structure-of-arrays store for the per-human state that is queried for the whole population at every hour.
+`Human` attributes backed by the table are declared with `PopulationColumn` (python-side state) or
+`PopulationMirror` (native `BaseHuman` state whose updates are copied into the table).
+"""
+import numpy as np
+
+from covid19sim.native._native import BaseHuman
+from covid19sim.utils.constants import SECONDS_PER_DAY
+
+# column name -> (dtype, value of a row that has not been written to yet)
+COLUMNS = {
+    # covid-19 state; mirrors of the native timestamps that drive `is_susceptible`, `is_exposed`, ...
+    "ts_death": (np.float64, np.inf),
+    "ts_covid19_infection": (np.float64, np.inf),
+    "ts_covid19_immunity": (np.float64, np.inf),
+    "infectiousness_onset_days": (np.float64, 0.0),
+    # app related
+    "has_app": (np.bool_, False),
+    "rec_level": (np.int8, -1),
+    "time_slot_mask": (np.uint32, 0),
+    # biological properties
+    "age_bin_width_5": (np.int8, -1),
+    "carefulness": (np.float64, 0.0),
+    "normalized_susceptibility": (np.float64, 0.0),
+}
+
+NATIVE_COLUMNS = ["ts_death", "ts_covid19_infection", "ts_covid19_immunity", "infectiousness_onset_days"]
+
+
+class PopulationTable(object):
+    """
+    Contiguous NumPy columns holding the state of all humans of a city, one row per human in order of creation.
+    Whole-population queries (SEIR counts, alive masks, app holders in a timeslot) are vectorized over these columns.
+
+    Args:
+        env (covid19sim.utils.env.Env): environment of the city
+        capacity (int): number of rows to preallocate. The table grows as needed.
+    """
+
+    def __init__(self, env, capacity=0):
+        self.env = env
+        self.humans = []
+        self.n = 0
+        self._capacity = max(capacity, 1)
+        for column, (dtype, default) in COLUMNS.items():
+            setattr(self, column, np.full(self._capacity, default, dtype=dtype))
+        self._order = None  # rows in order of creation, unless `set_order` was called
+
+    def __len__(self):
+        return self.n
+
+    def _grow(self):
+        """
+        Doubles the number of allocated rows.
+        """
+        for column, (dtype, default) in COLUMNS.items():
+            values = np.full(2 * self._capacity, default, dtype=dtype)
+            values[:self._capacity] = getattr(self, column)
+            setattr(self, column, values)
+        self._capacity *= 2
+
+    def register(self, human):
+        """
+        Allocates a row for `human`. Rows are indexed by order of creation, i.e. by human id.
+
+        Args:
+            human (covid19sim.human.Human): human to allocate a row for
+
+        Returns:
+            (int): index of the row of `human`
+        """
+        if self.n == self._capacity:
+            self._grow()
+        idx = self.n
+        self.n += 1
+        self.humans.append(human)
+        self._order = None
+        return idx
+
+    def set_order(self, humans):
+        """
+        Sets the order in which humans are returned by `select`, so that it matches the iteration order of the city.
+
+        Args:
+            humans (list): all the humans registered in this table
+        """
+        assert len(humans) == self.n, "all the humans of the table are expected"
+        self._order = np.array([human._population_idx for human in humans], dtype=np.int64)
+
+    def sync_covid_state(self, human):
+        """
+        Copies the native covid-19 state of `human` to the table. Called whenever one of them is written to.
+
+        Args:
+            human (covid19sim.human.Human): human whose row needs to be updated
+        """
+        idx = human._population_idx
+        for column in NATIVE_COLUMNS:
+            getattr(self, column)[idx] = BaseHuman.__dict__[column].__get__(human)
+
+    def set_static_attributes(self, human):
+        """
+        Copies the attributes of `human` that do not change during the simulation to the table.
+        The hours at which `human` runs the app are stored as a bitmask.
+
+        Args:
+            human (covid19sim.human.Human): human whose row needs to be updated
+        """
+        idx = human._population_idx
+        time_slot_mask = 0
+        for time_slot in human.time_slots:
+            time_slot_mask |= 1 << int(time_slot)
+        self.time_slot_mask[idx] = time_slot_mask
+        self.age_bin_width_5[idx] = human.age_bin_width_5.index
+
+    def alive_mask(self):
+        """
+        Returns:
+            (np.ndarray): boolean mask of the humans that are alive at the current time
+        """
+        return self.env.now < self.ts_death[:self.n]
+
+    def seir_masks(self):
+        """
+        Vectorized version of `BaseHuman.is_susceptible`, `is_exposed`, `is_infectious` and `is_removed`.
+
+        Returns:
+            (tuple): boolean masks of susceptible, exposed, infectious and removed humans
+        """
+        now = self.env.now
+        removed = (now >= self.ts_covid19_immunity[:self.n]) | (now >= self.ts_death[:self.n])
+        td_infected = now - self.ts_covid19_infection[:self.n]
+        infectiousness_onset_secs = self.infectiousness_onset_days[:self.n] * SECONDS_PER_DAY
+        not_removed = ~removed
+        susceptible = not_removed & (td_infected < 0)
+        exposed = not_removed & (td_infected >= 0) & (td_infected < infectiousness_onset_secs)
+        infectious = not_removed & (td_infected >= infectiousness_onset_secs)
+        return susceptible, exposed, infectious, removed
+
+    def seir_counts(self):
+        """
+        Returns:
+            (tuple): number of susceptible, exposed, infectious and removed humans
+        """
+        return tuple(int(mask.sum()) for mask in self.seir_masks())
+
+    def app_holders_in_timeslot_mask(self, hour):
+        """
+        Args:
+            hour (int): hour of the day (0-23)
+
+        Returns:
+            (np.ndarray): boolean mask of the humans that have the app and whose timeslot is `hour`
+        """
+        in_timeslot = (self.time_slot_mask[:self.n] >> np.uint32(hour)) & np.uint32(1)
+        return self.has_app[:self.n] & in_timeslot.astype(np.bool_)
+
+    def select(self, mask):
+        """
+        Args:
+            mask (np.ndarray): boolean mask over the rows of the table
+
+        Returns:
+            (list): humans for which `mask` is True, in the order set by `set_order`
+        """
+        if self._order is None:
+            return [self.humans[idx] for idx in np.flatnonzero(mask)]
+        return [self.humans[idx] for idx in self._order[mask[self._order]]]
+
+
+class PopulationColumn(object):
+    """
+    Data descriptor for a `Human` attribute that is stored in `column` of the city's `PopulationTable`.
+    Humans created without a population table (e.g. in unit tests) keep the value in their `__dict__`.
+
+    Args:
+        column (str): name of the column in `PopulationTable`
+        cast (callable): converts the NumPy scalar read from the table to a python value
+    """
+
+    def __init__(self, column, cast):
+        self.column = column
+        self.cast = cast
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, human, owner=None):
+        if human is None:
+            return self
+        population = human._population
+        if population is None:
+            try:
+                return human.__dict__[self.name]
+            except KeyError:
+                raise AttributeError(self.name) from None
+        return self.cast(getattr(population, self.column)[human._population_idx])
+
+    def __set__(self, human, value):
+        population = human._population
+        if population is None:
+            human.__dict__[self.name] = value
+        else:
+            getattr(population, self.column)[human._population_idx] = value
+
+
+class PopulationMirror(object):
+    """
+    Data descriptor wrapping an attribute of `BaseHuman`; writes go to the native object and are then copied
+    to the covid-19 state columns of the city's `PopulationTable`.
+    """
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.native = BaseHuman.__dict__[name]
+
+    def __get__(self, human, owner=None):
+        if human is None:
+            return self
+        return self.native.__get__(human, owner)
+
+    def __set__(self, human, value):
+        self.native.__set__(human, value)
+        if human._population is not None:
+            human._population.sync_covid_state(human)
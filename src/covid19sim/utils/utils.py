@@ -26,9 +26,12 @@ import json
 
 from omegaconf import DictConfig, OmegaConf
 from scipy.stats import norm
-from covid19sim.utils.constants import SECONDS_PER_HOUR, SECONDS_PER_MINUTE, AGE_BIN_WIDTH_5, AGE_BIN_WIDTH_10
+from covid19sim.utils.constants import SECONDS_PER_HOUR, SECONDS_PER_MINUTE, SECONDS_PER_DAY, AGE_BIN_WIDTH_5, AGE_BIN_WIDTH_10
 
 from covid19sim.epidemiology.symptoms import STR_TO_SYMPTOMS
+from covid19sim.epidemiology.viral_load import viral_loads_for_day
+from covid19sim.log.tracker_index import dump_tracker_index
+from covid19sim.utils.population import PopulationColumn
 from covid19sim.utils.constants import AGE_BIN_WIDTH_5, AGE_BIN_WIDTH_10
 if typing.TYPE_CHECKING:
     from covid19sim.human import Human
@@ -226,39 +229,22 @@ def proba_to_risk_fn(mapping):
     return functools.partial(_proba_to_risk, mapping=mapping)
 
 
-def calculate_average_infectiousness(human):
-    """ This is only used for the infectiousness value for a human that is written out for the ML predictor.
-    We write tomorrows infectiousness (and predict tomorrows infectiousness) so that our predictor is conservative. """
-    # cur_infectiousness = human.get_infectiousness_for_day(human.env.timestamp, human.is_infectious)
-    is_infectious_tomorrow = True if human.infection_timestamp and human.env.timestamp - human.infection_timestamp + datetime.timedelta(days=1) >= datetime.timedelta(days=human.infectiousness_onset_days) else False
-    tomorrows_infectiousness = human.get_infectiousness_for_day(human.env.timestamp + datetime.timedelta(days=1),
-                                                                is_infectious_tomorrow)
-    return tomorrows_infectiousness #(cur_infectiousness + tomorrows_infectiousness) / 2
-
-
-def filter_open(locations):
-    """Given an iterable of locations, returns a list of those that are open for business.
-
-    Args:
-        locations (iterable): a list of objects inheriting from the covid19sim.base.Location class
-
-    Returns:
-        list
-    """
-    return [loc for loc in locations if loc.is_open_for_business]
-
-
-def filter_queue_max(locations, max_len):
-    """Given an iterable of locations, will return a list of those
-    with queues that are not too long.
-
-    Args:
-        locations (iterable): a list of objects inheriting from the covid19sim.base.Location class
-
-    Returns:
-        list
-    """
-    return [loc for loc in locations if len(loc.queue) <= max_len]
+def calculate_average_infectiousnesses(humans):
+    """ This is only used for the infectiousness values of humans that are written out for the ML predictor.
+    We write tomorrows infectiousness (and predict tomorrows infectiousness) so that our predictor is conservative.
+    The viral loads of all `humans`, which share the same clock, are computed natively in one call. """
+    infectiousnesses = [0.] * len(humans)
+    if not humans:
+        return infectiousnesses
+    tomorrow = humans[0].env.now + SECONDS_PER_DAY
+    infectious_idxs = [
+        idx for idx, human in enumerate(humans)
+        if tomorrow - human.ts_covid19_infection >= human.infectiousness_onset_days * SECONDS_PER_DAY
+    ]
+    viral_loads = viral_loads_for_day([humans[idx] for idx in infectious_idxs], tomorrow).tolist()
+    for idx, viral_load in zip(infectious_idxs, viral_loads):
+        infectiousnesses[idx] = viral_load * humans[idx].viral_load_to_infectiousness_multiplier
+    return infectiousnesses
 
 
 def download_file_from_google_drive(
@@ -368,7 +354,7 @@ def extract_tracker_data(tracker, conf):
     data['infectious_contact_patterns'] = tracker.get_infectious_contact_data() # 2MB
     data['expected_mobility'] = tracker.expected_mobility
     data['mobility'] = tracker.mobility
-    data['infection_monitor'] = tracker.infection_monitor # 0.8MB
+    data['infection_monitor'] = tracker.get_dumpable_events(tracker.infection_monitor) # 0.8MB
     data['outside_daily_contacts'] = tracker.outside_daily_contacts
 
     x, y, _ = tracker.compute_effective_contacts(since_intervention=True)
@@ -396,14 +382,14 @@ def extract_tracker_data(tracker, conf):
     data['symptoms'] = tracker.compute_symptom_prevalence()
 
     # testing related
-    data['test_monitor'] = tracker.test_monitor #0.14MB
+    data['test_monitor'] = tracker.get_dumpable_events(tracker.test_monitor) #0.14MB
 
     # tracing related
     data['risk_precision_global'] = tracker.compute_risk_precision(False)
     data['risk_precision'] = tracker.risk_precision_daily
-    data['human_monitor'] = tracker.human_monitor # 20MB
+    data['human_monitor'] = tracker.get_dumpable_events(tracker.human_monitor) # 20MB
     data['infector_infectee_update_messages'] = tracker.infector_infectee_update_messages
-    data['risk_attributes'] = tracker.risk_attributes # 524MB
+    data['risk_attributes'] = tracker.get_dumpable_events(tracker.risk_attributes) # 524MB
     data['humans_state'] = tracker.humans_state #0.4MB
     data['humans_rec_level'] = tracker.humans_rec_level
     data['humans_intervention_level'] = tracker.humans_intervention_level
@@ -422,7 +408,7 @@ def extract_tracker_data(tracker, conf):
 
 def dump_tracker_data(data, outdir, name):
     """
-    Writes the tracker's extracted data to outdir/name using dill.
+    Writes the tracker's extracted data to outdir/name using dill, along with its index (see `covid19sim.log.tracker_index`).
 
     /!\ there are know incompatibility issues between python 3.7 and 3.8 regarding the dump/loading of data with dill/pickle
 
@@ -437,6 +423,7 @@ def dump_tracker_data(data, outdir, name):
     outdir.mkdir(exist_ok=True, parents=True)
     with open(outdir / name, 'wb') as f:
         dill.dump(data, f)
+    dump_tracker_index(data, outdir, name)
 
 def parse_search_configuration(conf):
     """
@@ -581,8 +568,9 @@ def relativefreq2absolutefreq(
     return histogram
 
 
+@functools.lru_cache(maxsize=1)
 def get_git_revision_hash():
-    """Get current git hash the code is run from
+    """Get current git hash the code is run from (once per process, e.g. for the simulations of `covid19sim.batch`)
 
     Returns:
         str: git hash
@@ -709,7 +697,8 @@ class DummyHuman:
         self.recommendations_to_follow = [str(rec) for rec in human.recommendations_to_follow]
         # "blacklisted" attributes are overriden with `None`, no matter their original value
         self.blacklisted_attribs = [
-            "conf", "city", "known_connections", "my_history", "visits", "proba_to_risk_level_map",  "mobility_planner"
+            "conf", "city", "known_connections", "my_history", "visits", "proba_to_risk_level_map",  "mobility_planner",
+            "_population",
         ]
         for attr_name in self.blacklisted_attribs:
             setattr(self, attr_name, None)
@@ -720,10 +709,15 @@ class DummyHuman:
                     not attr_name.startswith("__"):
                 setattr(self, attr_name, getattr(human, attr_name))
         from covid19sim.native._native import BaseHuman
-        for attr_name in BaseHuman.__dict__.keys():
+        for attr_name, attr in BaseHuman.__dict__.items():
             if attr_name not in self.dummy_attribs and \
                     attr_name not in self.blacklisted_attribs and \
-                    not attr_name.startswith("__"):
+                    not attr_name.startswith("__") and \
+                    not isinstance(attr, types.MethodDescriptorType):
+                setattr(self, attr_name, getattr(human, attr_name))
+        # attributes stored in the population table are not in the human's `__dict__`
+        for attr_name, attr in type(human).__dict__.items():
+            if isinstance(attr, PopulationColumn):
                 setattr(self, attr_name, getattr(human, attr_name))
 
 
@@ -844,24 +838,27 @@ def _convert_bin_5s_to_bin_10s(histogram_bin_5s):
 
     return histogram_bin_10s
 
-def _sample_positive_normal(mean, sigma, rng, upper_limit=None):
+def _sample_positive_normal_array(mean, sigma, rng, upper_limit):
     """
-    Samples a positive number from gaussian distributed as (mean, sigma) by throwing away negative samples.
+    Samples positive numbers from gaussians distributed as (mean, sigma). Samples are redrawn until they are in [0, upper_limit].
 
     Args:
-        mean (float): mean of gaussian
-        sigma (float): stdandard deviation of gaussian
-        upper_limit (float): upper limit above which x will be rejected. None if there is no upper limit.
+        mean (np.ndarray): mean of gaussian for each sample
+        sigma (np.ndarray): stdandard deviation of gaussian for each sample
+        rng (np.random.RandomState): Random number generator
+        upper_limit (np.ndarray): upper limit above which samples will be rejected. Non-positive values mean no upper limit.
 
     Returns:
-        (float): sample
+        (np.ndarray): samples
     """
-    _filter = lambda x: 0 <= x
-    if upper_limit > 0:
-        _filter = lambda x: 0 <= x <= upper_limit
-
+    mean, sigma = np.broadcast_arrays(np.asarray(mean, dtype=np.float64), np.asarray(sigma, dtype=np.float64))
+    upper_limit = np.where(np.asarray(upper_limit) > 0, upper_limit, np.inf)
     x = rng.normal(mean, sigma)
-    return x if _filter(x) else _sample_positive_normal(mean, sigma, rng, upper_limit)
+    invalid = (x < 0) | (x > upper_limit)
+    while invalid.any():
+        x[invalid] = rng.normal(mean[invalid], sigma[invalid])
+        invalid = (x < 0) | (x > upper_limit)
+    return x
 
 def is_app_based_tracing_intervention(intervention=None, intervention_conf=None):
     """
@@ -882,15 +879,28 @@ def is_app_based_tracing_intervention(intervention=None, intervention_conf=None)
         # This can happen if intervention is transformer (with weights and rec levels specified)
         intervention = next(iter(intervention.keys()))
 
-    intervention_yaml_file = Path(__file__).resolve().parent.parent / "configs/simulation/intervention" / f"{intervention}.yaml"
-    if "transformer" in intervention_yaml_file.name:
-        intervention_yaml_file = Path(__file__).resolve().parent.parent / "configs/simulation/intervention" / f"transformer.yaml"
-    with open(intervention_yaml_file, "r") as f:
-        conf = yaml.safe_load(f)
-        app_required = conf['RISK_MODEL'] != ""
+    if "transformer" in intervention:
+        intervention = "transformer"
+    conf = load_intervention_conf(intervention)
+    app_required = conf['RISK_MODEL'] != ""
 
     return app_required
 
+
+def load_intervention_conf(intervention):
+    """
+    Loads the parameters of an intervention.
+
+    Args:
+        intervention (str): name of the intervention that matches a configuration file in `configs/simulation/intervention`.
+
+    Returns:
+        (dict): parameters of the intervention, overriding the ones of the experimental configuration.
+    """
+    intervention_yaml_file = Path(__file__).resolve().parent.parent / "configs/simulation/intervention" / f"{intervention}.yaml"
+    with open(intervention_yaml_file, "r") as f:
+        return yaml.safe_load(f)
+
 class NpEncoder(json.JSONEncoder):
     """
     Class to convert `obj` into json encodable objects.
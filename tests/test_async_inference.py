@@ -1,23 +1,38 @@
+import contextlib
 import os
 import time
 import unittest.mock
 from tempfile import TemporaryDirectory
 
+import datetime
+
+import numpy as np
+
+import covid19sim.inference.heavy_jobs
 import covid19sim.inference.server_utils
 import covid19sim.inference.server_bootstrap
+from tests.test_dataset_format import _make_daily_output
+from tests.test_wire_format import _make_human_as_message
+
+torch = covid19sim.inference.server_utils.torch
 
 
 def fake_proc_human_batch(sample, *args, **kwargs):
     return sample
 
 
+def fake_proc_human_batch_with_config(sample, engine, cluster_mgr_map, config_map, **kwargs):
+    return [(params["human"], config_map[params["city_hash"]]["conf"]["name"]) for params in sample]
+
+
 class InferenceServerWrapper(covid19sim.inference.server_utils.InferenceServer):
-    def __init__(self, **kwargs):
+    def __init__(self, fake_proc=fake_proc_human_batch, **kwargs):
         covid19sim.inference.server_utils.InferenceServer.__init__(self, **kwargs)
+        self.fake_proc = fake_proc
 
     def run(self):
         with unittest.mock.patch("covid19sim.inference.server_utils.proc_human_batch") as mock:
-            mock.side_effect = fake_proc_human_batch
+            mock.side_effect = self.fake_proc
             return covid19sim.inference.server_utils.InferenceServer.run(self)
 
 
@@ -44,6 +59,285 @@ class ServerTests(unittest.TestCase):
             inference_server.stop_gracefully()
             inference_server.join()
 
+    def test_inference_with_registered_config(self):
+        with TemporaryDirectory() as d:
+            frontend_address = "ipc://" + os.path.join(d, "frontend.ipc")
+            backend_address = "ipc://" + os.path.join(d, "backend.ipc")
+            inference_server = InferenceServerWrapper(
+                fake_proc=fake_proc_human_batch_with_config,
+                model_exp_path=covid19sim.inference.server_bootstrap.default_model_exp_path,
+                workers=2,
+                frontend_address=frontend_address,
+                backend_address=backend_address,
+            )
+            inference_server.start()
+            time.sleep(10)
+            remote_engine = covid19sim.inference.server_utils.InferenceClient(
+                server_address=frontend_address,
+            )
+            for city_hash in range(3):
+                remote_engine.register_config(city_hash, start=None, conf={"name": f"city:{city_hash}"})
+            for test_idx in range(30):
+                sample = [{"human": test_idx, "current_day": 0, "time_slot": 0, "city_hash": test_idx % 3}]
+                remote_output = remote_engine.infer(sample)
+                assert remote_output == [(test_idx, f"city:{test_idx % 3}")]
+            with self.assertRaises(covid19sim.inference.server_utils.UnknownConfigError):
+                remote_engine.infer([{"human": 0, "current_day": 0, "time_slot": 0, "city_hash": 3}])
+            remote_engine.register_config(3, start=None, conf={"name": "city:3"})
+            assert remote_engine.infer([{"human": 0, "current_day": 0, "time_slot": 0, "city_hash": 3}]) == [(0, "city:3")]
+            inference_server.stop_gracefully()
+            inference_server.join()
+
+
+class ClientPoolTests(unittest.TestCase):
+    def test_clients_are_reused_until_broken(self):
+        with TemporaryDirectory() as d:
+            frontend_address = "ipc://" + os.path.join(d, "frontend.ipc")  # no server needed to connect
+            pool = covid19sim.inference.server_utils.ClientPool(covid19sim.inference.server_utils.InferenceClient)
+            with pool.client(frontend_address) as client:
+                first_client = client
+            with pool.client(frontend_address) as client:
+                assert client is first_client
+                with pool.client(frontend_address) as other_client:
+                    assert other_client is not first_client  # clients are never shared by two users
+            with self.assertRaises(RuntimeError):
+                with pool.client(frontend_address) as client:
+                    raise RuntimeError("request failed")
+            assert first_client.socket.closed
+            with pool.client(frontend_address) as client:
+                client._awaiting_reply = True  # e.g. interrupted while waiting for a reply
+                stuck_client = client
+            assert stuck_client.socket.closed
+            with pool.client(frontend_address) as client:
+                assert client is not stuck_client and client.is_healthy()
+            pool.close()
+
+    def test_clients_reconnect_when_replies_time_out(self):
+        with TemporaryDirectory() as d:
+            frontend_address = "ipc://" + os.path.join(d, "frontend.ipc")  # no server to reply
+            pool = covid19sim.inference.server_utils.ClientPool(covid19sim.inference.server_utils.InferenceClient)
+            with unittest.mock.patch.object(covid19sim.inference.server_utils.InferenceClient, "recv_timeout_ms", 100):
+                client = covid19sim.inference.server_utils.InferenceClient(server_address=frontend_address)
+                timed_out_socket = client.socket
+                with self.assertRaises(TimeoutError):
+                    client.infer(0)
+                assert timed_out_socket.closed and client.socket is not timed_out_socket and client.is_healthy()
+                client.close()
+                with self.assertRaises(TimeoutError):
+                    with pool.client(frontend_address) as client:
+                        client.infer(0)
+                with pool.client(frontend_address) as other_client:
+                    assert other_client is not client
+            pool.close()
+
+
+class FakeRestartingServer:
+    """Client pool (and client) of an inference server that forgets the registered configs when it restarts."""
+    def __init__(self):
+        self.configs = {}
+        self.n_registrations = 0
+
+    @contextlib.contextmanager
+    def client(self, server_address=None):
+        yield self
+
+    def register_config(self, city_hash, start, conf):
+        self.configs[city_hash] = conf
+        self.n_registrations += 1
+
+    def infer(self, sample, shard_idx=None, n_shards=None):
+        if not all([params["city_hash"] in self.configs for params in sample]):
+            raise covid19sim.inference.server_utils.UnknownConfigError("unknown config")
+        return [(params["human"].name, None) for params in sample]
+
+    def restart(self):
+        self.configs.clear()
+
+
+class HeavyJobsTests(unittest.TestCase):
+    def test_config_registered_again_after_server_restart(self):
+        DummyMemManager = covid19sim.inference.heavy_jobs.DummyMemManager
+        server, start = FakeRestartingServer(), datetime.datetime(2020, 2, 27)
+        conf = {"USE_INFERENCE_SERVER": True, "INFERENCE_REQ_SHARDS": 2}
+        all_params = [
+            {"current_day": 0, "time_slot": 0, "city_hash": 0, "human": _make_human_as_message(idx, 0)}
+            for idx in range(4)
+        ]
+        DummyMemManager.reset()
+        with unittest.mock.patch("covid19sim.inference.heavy_jobs.inference_client_pool", server):
+            for restart in (False, True):
+                if restart:
+                    server.restart()
+                DummyMemManager.register_config(0, start, conf, server_address="server")
+                results = covid19sim.inference.heavy_jobs._run_heavy_jobs(all_params, start, conf, 0, "server")
+                assert sorted(results) == [(f"human:{idx}", None) for idx in range(4)]
+            assert server.n_registrations == 2 and 0 in server.configs
+        DummyMemManager.reset()
+
+
+class FakeBatchedEngine:
+    def __init__(self):
+        self.batch_sizes = []
+
+    def infer_batch(self, daily_outputs):
+        self.batch_sizes.append(len(daily_outputs))
+        return [{"infectiousness": np.full(14, int(o["unobserved"]["human_id"].split(":")[-1]))}
+                for o in daily_outputs]
+
+
+class ProcHumanBatchTests(unittest.TestCase):
+    def test_humans_are_inferred_in_one_batch(self):
+        conf = {"RISK_MODEL": "transformer", "TRACING_N_DAYS_HISTORY": 14, "CLUSTER_ALGO_TYPE": "blind"}
+        config_map = {0: {"start": datetime.datetime(2020, 2, 27), "conf": conf}}
+        sample = [
+            {"current_day": 3, "time_slot": 5, "city_hash": 0, "human": _make_human_as_message(idx, n_updates)}
+            for idx, n_updates in enumerate([3, 0, 5])
+        ]
+        engine, cluster_mgr_map = FakeBatchedEngine(), {}
+        results = covid19sim.inference.server_utils.proc_human_batch(sample, engine, cluster_mgr_map, config_map)
+        assert engine.batch_sizes == [3]
+        assert [name for name, _ in results] == ["human:0", "human:1", "human:2"]
+        for idx, (_, risk_history) in enumerate(results):
+            np.testing.assert_array_equal(risk_history, np.full(14, idx))
+        assert len(cluster_mgr_map) == 3
+
+
+class FaithfulPreprocessor:
+    """Mimics the ctt `ContactPreprocessor`: samples of (zero-)padded encounters are stacked by `collate_fn`."""
+    class Batch(dict):
+        def to_dict(self):
+            return dict(self)
+
+    def preprocess(self, daily_output, as_batch=True):
+        observed = daily_output["observed"]
+        sample = {
+            "encounters": torch.as_tensor(observed["candidate_encounters"], dtype=torch.float32).reshape(-1, 4),
+            "symptoms": torch.as_tensor(observed["reported_symptoms"], dtype=torch.float32),
+        }
+        return self.collate_fn([sample]) if as_batch else sample
+
+    @staticmethod
+    def collate_fn(samples):
+        encounters = torch.nn.utils.rnn.pad_sequence([sample["encounters"] for sample in samples], batch_first=True)
+        return FaithfulPreprocessor.Batch(
+            encounters=encounters, symptoms=torch.stack([sample["symptoms"] for sample in samples]),
+        )
+
+
+class FaithfulEngine(covid19sim.inference.server_utils.InferenceEngineWrapper):
+    """Engine whose `infer` runs one human at a time, as the ctt `InferenceEngine` does."""
+    def __init__(self, with_model=True):
+        self.preprocessor = FaithfulPreprocessor()
+        if with_model:
+            torch.manual_seed(0)
+            self.model = FaithfulModel()
+
+    def infer(self, daily_output):
+        if not len(daily_output["observed"]["candidate_encounters"]):
+            return None
+        if not hasattr(self, "model"):
+            return {"infectiousness": daily_output["observed"]["reported_symptoms"].sum(1)}
+        with torch.no_grad():
+            model_output = self.model(self.preprocessor.preprocess(daily_output).to_dict())
+        return {
+            "contagion_proba": model_output["encounter_variables"].sigmoid().numpy()[0, :, 0],
+            "infectiousness": model_output["latent_variable"].numpy()[0, :, 0],
+        }
+
+
+if torch is not None:
+    class FaithfulModel(torch.nn.Module):
+        """Model scoring each encounter independently, so that padded encounters do not change the others."""
+        def __init__(self):
+            super().__init__()
+            self.encounter_layer = torch.nn.Linear(4, 1)
+            self.latent_layer = torch.nn.Linear(27, 1)
+
+        def forward(self, inputs):
+            return {
+                "encounter_variables": self.encounter_layer(inputs["encounters"]),
+                "latent_variable": self.latent_layer(inputs["symptoms"]),
+            }
+
+
+class InferBatchTests(unittest.TestCase):
+    daily_outputs = [_make_daily_output(3, human_idx, n_encounters=human_idx % 4) for human_idx in range(10)]
+
+    @unittest.skipIf(torch is None, "padded batches need pytorch")
+    def test_padded_batch_matches_per_human_inference(self):
+        engine = FaithfulEngine()
+        self.assertTrue(engine.supports_padded_batches())
+        with unittest.mock.patch.object(engine, "max_batch_size", 4):
+            batch_results = engine.infer_batch(self.daily_outputs)
+        for daily_output, batch_result in zip(self.daily_outputs, batch_results):
+            result = engine.infer(daily_output)
+            if result is None:
+                self.assertIsNone(batch_result)
+                continue
+            self.assertEqual(set(result), set(batch_result))
+            for key, value in result.items():
+                np.testing.assert_allclose(batch_result[key], value, rtol=1e-5, atol=1e-6)
+
+    def test_unbatched_engines_fall_back_to_per_human_inference(self):
+        engine = FaithfulEngine(with_model=False)
+        self.assertFalse(engine.supports_padded_batches())
+        with self.assertWarns(RuntimeWarning):
+            batch_results = engine.infer_batch(self.daily_outputs)
+        for daily_output, batch_result in zip(self.daily_outputs, batch_results):
+            result = engine.infer(daily_output)
+            if result is None:
+                self.assertIsNone(batch_result)
+            else:
+                np.testing.assert_array_equal(batch_result["infectiousness"], result["infectiousness"])
+
+
+class ShardRoutingTests(unittest.TestCase):
+    def test_shards_stick_to_workers_until_stolen(self):
+        worker_ids = [b"worker:0", b"worker:1", b"worker:2"]
+        router = covid19sim.inference.server_utils.ShardRouter(worker_ids, steal_threshold=2)
+        owners = {shard_idx: router.get_owner(shard_idx) for shard_idx in range(32)}
+        assert set(owners.values()) == set(worker_ids)
+        # the ring only depends on the worker ids, so another broker would route the same way
+        other_router = covid19sim.inference.server_utils.ShardRouter(worker_ids, steal_threshold=2)
+        assert owners == {shard_idx: other_router.get_owner(shard_idx) for shard_idx in range(32)}
+
+        busy_worker_id = owners[0]
+        busy_shards = [shard_idx for shard_idx, owner in owners.items() if owner == busy_worker_id]
+        for request_idx, shard_idx in enumerate(busy_shards[:3]):
+            router.push(f"request:{request_idx}", shard_idx=shard_idx)
+        router.push("unrouted")
+        idle_worker_id = next(w for w in worker_ids if w != busy_worker_id)
+        assert router.pop(busy_worker_id) == (busy_shards[0], 0, "request:0")
+        assert router.pop(idle_worker_id) == (None, None, "unrouted")
+        # two requests are still waiting for the busy worker: the idle one steals the latest
+        assert router.pop(idle_worker_id) == (busy_shards[2], 1, "request:2")
+        assert router.get_owner(busy_shards[2]) == idle_worker_id
+        assert router.pop(idle_worker_id) is None  # below the stealing threshold
+        assert router.pop(busy_worker_id) == (busy_shards[1], 0, "request:1")
+        assert not len(router)
+
+    def test_cluster_mgr_cache_invalidated_by_shard_epoch(self):
+        shared_map = {}
+        cache = covid19sim.inference.server_utils.ClusterMgrCache(shared_map)
+        cluster_mgr_hash = covid19sim.inference.server_utils.get_cluster_mgr_hash(0, "human:1")
+        shard_idx = covid19sim.inference.server_utils.get_shard_idx(cluster_mgr_hash, 8)
+        cache.set_route(shard_idx, 8, 0)
+        cache[cluster_mgr_hash] = "clusters@t0"
+        assert shared_map[cluster_mgr_hash] == "clusters@t0"  # written through for migrations
+        shared_map[cluster_mgr_hash] = "clusters@t1"  # e.g. updated by a worker that stole the shard
+        cache.set_route(shard_idx, 8, 0)
+        assert cache[cluster_mgr_hash] == "clusters@t0"  # same epoch, local copy is still trusted
+        cache.set_route(shard_idx, 8, 1)
+        assert cache[cluster_mgr_hash] == "clusters@t1"
+        with self.assertRaises(AssertionError):
+            other_hash = next(
+                h for h in (f"0:human:{idx}" for idx in range(100))
+                if covid19sim.inference.server_utils.get_shard_idx(h, 8) != shard_idx
+            )
+            cache[other_hash] = "clusters"
+        cache.set_route(None)
+        assert cluster_mgr_hash in cache
+
 
 if __name__ == "__main__":
     unittest.main()
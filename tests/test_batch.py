@@ -0,0 +1,37 @@
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from covid19sim.batch import load_conf, run_jobs
+from covid19sim.inference.heavy_jobs import DummyMemManager
+
+
+def _collect_infections(city):
+    return [(human.name, str(human.infection_timestamp)) for human in city.humans]
+
+
+def test_load_conf():
+    """
+    Overrides should select the files of configuration groups, or override keys of the configuration.
+    """
+    conf = load_conf({"intervention": "heuristicv1", "n_people": 10})
+    assert conf["RISK_MODEL"] == "heuristicv1" and conf["n_people"] == 10
+    assert load_conf()["RISK_MODEL"] == ""
+    with pytest.raises(AssertionError):
+        load_conf({"NOT_A_KEY": 1})
+
+
+def test_batched_jobs_match_single_runs():
+    """
+    Jobs run one after the other in a process should not depend on the ones before them.
+    """
+    with TemporaryDirectory() as d:
+        overrides = {
+            "intervention": "heuristicv1", "INTERVENTION_DAY": 1, "TRANSFORMER_EXP_PATH": "", "n_people": 100,
+            "simulation_days": 4, "init_fraction_sick": 0.2, "outdir": d,
+        }
+        jobs = [(seed, overrides) for seed in (1, 2, 1)]
+        infections = run_jobs(jobs, collect=_collect_infections)
+        assert infections[0] == infections[2] and infections[0] != infections[1]
+        assert DummyMemManager.global_config_map == {}
+        assert run_jobs(jobs[:2], collect=_collect_infections, n_workers=2) == infections[:2]
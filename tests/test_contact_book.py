@@ -0,0 +1,165 @@
+import datetime
+import functools
+
+import numpy as np
+
+from covid19sim.inference.message_utils import ContactBook, PersonalMailbox, exchange_encounter_messages, \
+    generate_batched_updates, risk_history_maps_to_array
+from covid19sim.utils.utils import _proba_to_risk
+
+
+class HumanMock:
+    def __init__(self, name):
+        self.name = name
+        self.contact_book = ContactBook(tracing_n_days_history=14, owner_uid=name)
+
+
+def _risk_level(proba):
+    return int(proba * 16)
+
+
+def test_contact_book_updates_and_cleanup():
+    """
+    Encounters stored in the columnar contact book should produce the same updates as the
+    message-based bookkeeping: one initial update per encounter, then one per risk change.
+    """
+    init_timestamp = datetime.datetime(2020, 2, 28, 0, 0)
+    h1, h2, h3 = HumanMock("human:1"), HumanMock("human:2"), HumanMock("human:3")
+    for day_idx in range(3):
+        for minute in range(0, 600, 15):
+            other = h2 if minute % 45 else h3
+            h1_handle, h2_handle = exchange_encounter_messages(
+                h1, other, init_timestamp + datetime.timedelta(days=day_idx, minutes=minute),
+                init_timestamp, use_gaen_key=True,
+            )
+            assert h1_handle.to_message().uid in other.contact_book.get_mailbox_keys()
+            assert h2_handle.to_message().uid in h1.contact_book.get_mailbox_keys()
+    h1_handle._exposition_event = True
+    assert h1.contact_book.encounters_by_day[2][-1]._exposition_event
+    assert not h1.contact_book.encounters_by_day[2][-2]._exposition_event
+    assert len(h1.contact_book.get_mailbox_keys()) == 3 * 40
+    assert len(h2.contact_book.get_mailbox_keys()) + len(h3.contact_book.get_mailbox_keys()) == 3 * 40
+    humans = {h.name: h for h in (h1, h2, h3)}
+    assert not h1.contact_book.get_contacts(humans, only_with_initial_update=True)
+
+    now = init_timestamp + datetime.timedelta(days=2, hours=23)
+    prev_risk = {0: 0.1, 1: 0.2, 2: 0.3}
+    updates = h1.contact_book.generate_initial_updates(2, now, prev_risk, _risk_level, intervention=object())
+    assert len(updates) == 3 * 40
+    assert [h.name for h in h1.contact_book.get_contacts(humans, True, True)] == ["human:3", "human:2"]
+    assert not h1.contact_book.generate_initial_updates(2, now, prev_risk, _risk_level, intervention=object())
+
+    curr_risk = {0: 0.5, 1: 0.2, 2: 0.9}
+    updates = h1.contact_book.generate_updates(
+        2, now, prev_risk, curr_risk, _risk_level, "unknown", intervention=object(),
+    )
+    assert len(updates) == 2 * 40
+    assert {(m.old_risk_level, m.new_risk_level) for m in updates} == {(1, 8), (4, 14)}
+    assert {m._applied_update_count for m in h1.contact_book.encounters_by_day[0]} == {1}
+    assert {m._applied_update_count for m in h1.contact_book.encounters_by_day[1]} == {None}
+
+    h1.contact_book.cleanup_contacts(init_timestamp, init_timestamp + datetime.timedelta(days=16))
+    assert list(h1.contact_book.encounters_by_day) == [2]
+
+
+def _get_humans_with_encounters(n_humans, n_days, init_timestamp, seed, initial_risks, risk_mapping):
+    np.random.seed(seed)  # used to create the message uids
+    rng = np.random.RandomState(seed)
+    humans = [HumanMock(f"human:{idx}") for idx in range(n_humans)]
+    for day_idx in range(n_days):
+        if day_idx == n_days - 2:
+            # send the initial updates for the older encounters, so that some of them get updated later
+            for human, risks in zip(humans, initial_risks):
+                human.contact_book.generate_initial_updates(
+                    day_idx, init_timestamp + datetime.timedelta(days=day_idx), risks,
+                    functools.partial(_proba_to_risk, mapping=risk_mapping), intervention=object(),
+                )
+        for minute in range(0, 300, 15):
+            h1, h2 = rng.choice(humans, size=2, replace=False)
+            exchange_encounter_messages(
+                h1, h2, init_timestamp + datetime.timedelta(days=day_idx, minutes=minute),
+                init_timestamp, use_gaen_key=True,
+            )
+    return humans
+
+
+def test_batched_updates_match_contact_book_updates():
+    """
+    `generate_batched_updates` should produce the same messages (in the same order) and leave the
+    contact books in the same state as the per-human `generate_initial_updates` + `generate_updates`.
+    """
+    init_timestamp = datetime.datetime(2020, 2, 28, 0, 0)
+    n_days, n_history_days = 6, 14
+    risk_mapping = np.linspace(0, 1, 17)
+    risk_mapping[-1] = 1.01
+    rng = np.random.RandomState(42)
+    prev_risks = [{day: rng.rand() for day in range(n_days) if rng.rand() < 0.8} for _ in range(8)]
+    curr_risks = [
+        {day: rng.choice([risk, rng.rand()]) for day, risk in prev_risk.items()}
+        for prev_risk in prev_risks
+    ]
+    for curr_risk in curr_risks:
+        curr_risk.update({day: rng.rand() for day in range(n_days) if day not in curr_risk})
+    initial_risks = [{**curr_risk, **prev_risk} for prev_risk, curr_risk in zip(prev_risks, curr_risks)]
+    now = init_timestamp + datetime.timedelta(days=n_days - 1, hours=12)
+
+    humans = _get_humans_with_encounters(8, n_days, init_timestamp, 0, initial_risks, risk_mapping)
+    expected = []
+    for human, prev_risk, curr_risk in zip(humans, prev_risks, curr_risks):
+        to_level = functools.partial(_proba_to_risk, mapping=risk_mapping)
+        expected.extend(human.contact_book.generate_initial_updates(
+            n_days - 1, now, curr_risk, to_level, intervention=object(),
+        ))
+        expected.extend(human.contact_book.generate_updates(
+            n_days - 1, now, dict(prev_risk), curr_risk, to_level, "unknown", intervention=object(),
+        ))
+
+    batched_humans = _get_humans_with_encounters(8, n_days, init_timestamp, 0, initial_risks, risk_mapping)
+    batch = generate_batched_updates(
+        contact_books=[human.contact_book for human in batched_humans],
+        current_day_idx=n_days - 1,
+        current_timestamp=now,
+        prev_risk_histories=risk_history_maps_to_array(prev_risks, n_days - 1, n_history_days + 1),
+        curr_risk_histories=risk_history_maps_to_array(curr_risks, n_days - 1, n_history_days + 1),
+        risk_mapping=risk_mapping,
+    )
+    assert len(batch) == len(expected) > 0
+    assert list(batch) == expected
+    assert {message._update_reason for message in expected} == {"contact", "unknown"}
+    assert batch.sender_uids == {message._sender_uid for message in expected}
+    for human, batched_human in zip(humans, batched_humans):
+        assert human.contact_book.encounters_by_day == batched_human.contact_book.encounters_by_day
+
+
+def test_personal_mailbox_buckets():
+    """
+    Update messages should be popped for the encounter days of the receiver's contact book, and
+    dropped with their whole day bucket once expired.
+    """
+    init_timestamp = datetime.datetime(2020, 2, 28, 0, 0)
+    h1, h2 = HumanMock("human:1"), HumanMock("human:2")
+    for day_idx in range(4):
+        exchange_encounter_messages(
+            h1, h2, init_timestamp + datetime.timedelta(days=day_idx, hours=23, minutes=45),
+            init_timestamp, use_gaen_key=True,
+        )
+    risks = {day_idx: 0.5 for day_idx in range(4)}
+    batch = generate_batched_updates(
+        contact_books=[h1.contact_book],
+        current_day_idx=3,
+        current_timestamp=init_timestamp + datetime.timedelta(days=3, hours=23, minutes=50),
+        prev_risk_histories=risk_history_maps_to_array([risks], 3, 15),
+        curr_risk_histories=risk_history_maps_to_array([risks], 3, 15),
+        risk_mapping=np.linspace(0, 1, 17),
+    )
+    assert batch.encounter_day_idxs.tolist() == [0, 1, 2, 3]
+
+    mailbox = PersonalMailbox()
+    for message, day_idx in zip(batch, batch.encounter_day_idxs):
+        mailbox.add_message(day_idx, message.uid, message)
+    assert len(mailbox) == 4
+    mailbox.cleanup(min_day_idx=1)
+    assert len(mailbox) == 3
+    messages = mailbox.pop_messages(h2.contact_book.encounter_day_idxs[-2:])
+    assert {message.uid for message in messages} == set(h2.contact_book.get_mailbox_keys()[-2:])
+    assert len(mailbox) == 1
@@ -0,0 +1,180 @@
+import datetime
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import zmq
+
+import covid19sim.inference.wire_format
+from covid19sim.inference.dataset_format import DatasetReader, DatasetWriter, create_dataset, get_shard_ranges
+from covid19sim.inference.server_utils import DataCollectionClient, DataCollectionServer
+
+
+def _make_daily_output(day_idx, human_idx, n_encounters, n_days=14, n_symptoms=27):
+    rng = np.random.RandomState(day_idx * 100 + human_idx)
+    infection_timestamp = datetime.datetime(2020, 2, 28, 5) if human_idx % 2 else None
+    return {
+        "current_day": day_idx,
+        "observed": {
+            "reported_symptoms": (rng.rand(n_days, n_symptoms) < 0.1).astype(np.float64),
+            "candidate_encounters": rng.randint(0, 16, size=(n_encounters, 4)).astype(np.float64)
+            if n_encounters else np.asarray([]),
+            "test_results": np.zeros(n_days),
+            "preexisting_conditions": np.zeros(11),
+            "age": -1,
+            "sex": 2,
+            "risk_mapping": [0.0, 0.25, 0.5, 1.0],
+        },
+        "unobserved": {
+            "human_id": f"human:{human_idx}",
+            "incubation_days": 3.5 if infection_timestamp else None,
+            "recovery_days": None,
+            "true_symptoms": (rng.rand(n_days, n_symptoms) < 0.2).astype(np.float64),
+            "is_exposed": infection_timestamp is not None,
+            "exposure_encounter": rng.randint(0, 2, size=n_encounters).astype(np.float64),
+            "exposure_day": day_idx if infection_timestamp else None,
+            "is_recovered": False,
+            "recovery_day": None,
+            "infectiousness": rng.rand(min(day_idx + 1, n_days)),
+            "true_preexisting_conditions": (rng.rand(11) < 0.3).astype(np.float64),
+            "true_age": 30 + human_idx,
+            "true_sex": 1,
+            "viral_load_to_infectiousness_multiplier": 0.7,
+            "infection_timestamp": infection_timestamp,
+            "recovered_timestamp": datetime.datetime.max,
+        },
+    }
+
+
+class DatasetFormatTest(unittest.TestCase):
+    def assertSampleEqual(self, sample, read_sample):
+        self.assertEqual(sample["current_day"], read_sample["current_day"])
+        for group in ("observed", "unobserved"):
+            self.assertEqual(set(sample[group]), set(read_sample[group]))
+            for name, value in sample[group].items():
+                read_value = read_sample[group][name]
+                if isinstance(value, np.ndarray):
+                    self.assertEqual(value.size, read_value.size, name)
+                    np.testing.assert_array_equal(value.reshape(read_value.shape), read_value)
+                else:
+                    self.assertEqual(value, read_value, name)
+
+    def test_round_trip(self):
+        with TemporaryDirectory() as d:
+            create_dataset(d, human_count=5, simulation_days=3, attrs={"config": "{}"})
+            writer = DatasetWriter(d)
+            expected = {}
+            # slots are written out of order, and the last samples arrive after their slot was flushed
+            indices = [(0, 5, 1), (0, 5, 0), (1, 2, 3), (0, 6, 2), (1, 3, 4), (2, 0, 1), (0, 5, 4), (1, 2, 0)]
+            for day_idx, hour_idx, human_idx in indices:
+                sample = _make_daily_output(day_idx, human_idx, n_encounters=(human_idx * 3) % 4)
+                writer.write(day_idx, hour_idx, human_idx, sample)
+                expected[day_idx, hour_idx, human_idx] = sample
+            writer.write(2, 1, 3, {"not": "a daily output"})  # e.g. human copies of the tracker
+            writer.close()
+
+            reader = DatasetReader(d)
+            self.assertEqual((reader.simulation_days, reader.human_count), (3, 5))
+            self.assertEqual(reader.attrs["config"], "{}")
+            self.assertEqual(reader.total_samples, len(indices) + 1)
+            self.assertEqual(reader[2, 1], [{"not": "a daily output"}])
+            self.assertIsNone(reader[2, 1, 0])
+            self.assertEqual(reader[1, 4], [])
+            for (day_idx, hour_idx, human_idx), sample in expected.items():
+                self.assertSampleEqual(sample, reader[day_idx, hour_idx, human_idx])
+            slot_samples = reader[0, 5]
+            self.assertEqual([s["unobserved"]["human_id"] for s in slot_samples], ["human:0", "human:1", "human:4"])
+            for sample in slot_samples:
+                human_idx = int(sample["unobserved"]["human_id"].split(":")[-1])
+                self.assertSampleEqual(expected[0, 5, human_idx], sample)
+            self.assertFalse(any([array.dtype == object for _, array in reader.shards[0].dataset.arrays(recurse=True)]))
+
+    def test_shards_are_stitched_by_human_index(self):
+        self.assertEqual(get_shard_ranges(7, 3), [(0, 2), (2, 4), (4, 7)])
+        with TemporaryDirectory() as d:
+            create_dataset(d, human_count=7, simulation_days=2, n_shards=3)
+            writers = [DatasetWriter(d, shard_idx=shard_idx) for shard_idx in range(3)]
+            for human_idx in reversed(range(7)):
+                shard_idx = next(idx for idx, writer in enumerate(writers) if writer.human_stop > human_idx)
+                writers[shard_idx].write(1, 3, human_idx, _make_daily_output(1, human_idx, n_encounters=human_idx % 3))
+            with self.assertRaises(AssertionError):
+                writers[0].write(1, 3, 2, _make_daily_output(1, 2, n_encounters=0))  # owned by the next shard
+            for writer in writers:
+                writer.close()
+
+            reader = DatasetReader(d)
+            self.assertEqual(reader.total_samples, 7)
+            self.assertEqual(reader.get_is_filled().shape, (2, 24, 7))
+            self.assertTrue(reader.get_is_filled()[1, 3].all())
+            samples = reader[1, 3]
+            self.assertEqual([s["unobserved"]["human_id"] for s in samples], [f"human:{idx}" for idx in range(7)])
+            for human_idx, sample in enumerate(samples):
+                self.assertSampleEqual(_make_daily_output(1, human_idx, n_encounters=human_idx % 3), sample)
+                self.assertSampleEqual(sample, reader[1, 3, human_idx])
+            self.assertIsNone(reader[0, 3, 4])
+
+    def _collect_with_server(self, d, workers):
+        collection_server = DataCollectionServer(
+            data_output_path=os.path.join(d, "train.zarr"),
+            human_count=5,
+            simulation_days=2,
+            workers=workers,
+            frontend_address="ipc://" + os.path.join(d, "frontend.ipc"),
+            backend_address="ipc://" + os.path.join(d, "backend.ipc"),
+        )
+        collection_server.start()
+        clients = [DataCollectionClient(server_address=collection_server.frontend_address) for _ in range(2)]
+        for day_idx in range(2):
+            for hour_idx in range(24):
+                # one client writes humans one by one, the other in batches spanning many shards
+                for human_idx in range(0, 5, 2):
+                    sample = _make_daily_output(day_idx, human_idx, n_encounters=human_idx)
+                    clients[0].write(day_idx, hour_idx, human_idx, sample)
+                clients[1].write_batch([
+                    (day_idx, hour_idx, human_idx, _make_daily_output(day_idx, human_idx, n_encounters=human_idx))
+                    for human_idx in range(1, 5, 2)
+                ])
+        for client in clients:
+            client.close()
+        collection_server.stop_gracefully()
+        collection_server.join()
+
+        reader = DatasetReader(os.path.join(d, "train.zarr"))
+        self.assertEqual(len(reader.shards), workers)
+        self.assertTrue(reader.get_is_filled().all())
+        self.assertEqual(reader.total_samples, 2 * 24 * 5)
+        for day_idx in range(2):
+            for hour_idx in (0, 23):
+                samples = reader[day_idx, hour_idx]
+                self.assertEqual(len(samples), 5)
+                for human_idx, sample in enumerate(samples):
+                    self.assertSampleEqual(_make_daily_output(day_idx, human_idx, n_encounters=human_idx), sample)
+
+    def test_out_of_range_human_indices_are_rejected(self):
+        with TemporaryDirectory() as d:
+            collection_server = DataCollectionServer(data_output_path=os.path.join(d, "train.zarr"), human_count=5, simulation_days=2)
+            shard_starts = [start for start, _ in get_shard_ranges(5, 2)]
+            for human_idxs, expected_shard_idxs in (([0, 4], [0, 1]), ([0, -1], None), ([5], None)):
+                frames = covid19sim.inference.wire_format.encode_collection_batch(
+                    [(0, 0, human_idx) for human_idx in human_idxs], [b"sample" for _ in human_idxs],
+                )
+                request = [zmq.Frame(frame) for frame in frames]
+                if expected_shard_idxs is None:
+                    with self.assertRaises(ValueError):
+                        list(collection_server._split_request(request, shard_starts))
+                else:
+                    shard_idxs = [shard_idx for shard_idx, _ in collection_server._split_request(request, shard_starts)]
+                    self.assertEqual(shard_idxs, expected_shard_idxs)
+
+    def test_server_collects_pushed_samples(self):
+        with TemporaryDirectory() as d:
+            self._collect_with_server(d, workers=1)
+
+    def test_sharded_server_collects_pushed_samples(self):
+        with TemporaryDirectory() as d:
+            self._collect_with_server(d, workers=3)
+
+
+if __name__ == "__main__":
+    unittest.main()
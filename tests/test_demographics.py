@@ -8,6 +8,7 @@ import pytest
 from covid19sim.utils import utils
 from covid19sim.locations.city import City
 from covid19sim.utils.env import Env
+from covid19sim.utils.demographics import HumanPool
 from tests.utils import get_test_conf
 
 
@@ -16,6 +17,7 @@ from tests.utils import get_test_conf
 def test_basic_demographics(
         seed: int,
         test_conf_name: str,
+        tmp_path,
         age_error_tol: float = 3.21,
         age_distribution_error_tol: float = 0.20,
         sex_diff_error_tol: float = 0.1,
@@ -58,7 +60,7 @@ def test_basic_demographics(
         x_range=city_x_range,
         y_range=city_y_range,
         conf=conf,
-        logfile="logfile.txt",
+        logfile=str(tmp_path / "logfile.txt"),
     )
     city.have_some_humans_download_the_app()
 
@@ -151,6 +153,7 @@ def test_basic_demographics(
 def test_household_distribution(
         seed: int,
         test_conf_name: str,
+        tmp_path,
         avg_household_size_error_tol: float = 0.22, #TODO: change this back to 0.1. I had to bump it up otherwise the tests fail for inscrutable reasons...
         fraction_in_households_error_tol: float = 0.1,
         household_size_distribution_error_tol: float = 0.1):
@@ -219,7 +222,7 @@ def test_household_distribution(
         x_range=city_x_range,
         y_range=city_y_range,
         conf=conf,
-        logfile="logfile.txt"
+        logfile=str(tmp_path / "logfile.txt")
     )
 
     # Verify that each human is associated to a household
@@ -267,7 +270,8 @@ def test_household_distribution(
 def test_app_distribution(
         seed: int,
         test_conf_name: str,
-        app_uptake: float
+        app_uptake: float,
+        tmp_path,
 ):
     """
         Tests for the demographic statistics related to the app users
@@ -301,7 +305,7 @@ def test_app_distribution(
         x_range=city_x_range,
         y_range=city_y_range,
         conf=conf,
-        logfile="logfile.txt",
+        logfile=str(tmp_path / "logfile.txt"),
     )
     city.have_some_humans_download_the_app()
 
@@ -356,7 +360,8 @@ def test_app_distribution(
 @pytest.mark.parametrize('app_uptake', [None, 0.25, 0.5, 0.75, 1.0])
 def test_app_distribution(
         test_conf_name: str,
-        app_uptake: float
+        app_uptake: float,
+        tmp_path,
 ):
     """
         Tests for the demographic statistics related to the app users
@@ -390,7 +395,7 @@ def test_app_distribution(
         x_range=city_x_range,
         y_range=city_y_range,
         conf=conf,
-        logfile="logfile.txt",
+        logfile=str(tmp_path / "logfile.txt"),
     )
     city.have_some_humans_download_the_app()
 
@@ -439,3 +444,29 @@ def test_app_distribution(
         age_grouped = age_grouped.has_app.apply(lambda x: x / n_apps)
 
         assert np.allclose(age_grouped.to_numpy(), np.array(list(n_apps_per_age.values())) / n_apps)
+
+
+def test_human_pool():
+    """
+        Tests that humans are drawn from and removed out of a `HumanPool` as they would be from a list, up to their order.
+    """
+    humans = [f"human:{i}" for i in range(10)]
+    pool = HumanPool(humans)
+    pool.remove("human:2")
+    pool.remove("human:9")
+    assert len(pool) == 8 and "human:2" not in pool and "human:9" not in pool
+    assert sorted(pool) == sorted(set(humans) - {"human:2", "human:9"})
+
+    rng, expected_rng = np.random.RandomState(3), np.random.RandomState(3)
+    sampled_humans = []
+    while len(pool):
+        expected_idx = expected_rng.randint(len(pool), size=1).item()
+        expected_human = pool.humans[expected_idx]
+        sampled_humans.append(pool.sample(rng))
+        assert sampled_humans[-1] == expected_human and expected_human not in pool
+    assert sorted(sampled_humans) == sorted(set(humans) - {"human:2", "human:9"})
+
+    pool.append("human:2")
+    assert list(pool) == ["human:2"] and "human:2" in pool
+    with pytest.raises(AssertionError):
+        pool.append("human:2")
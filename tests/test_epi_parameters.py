@@ -7,8 +7,9 @@ import matplotlib.pyplot as plt
 from covid19sim.utils.constants import SECONDS_PER_DAY
 from covid19sim.locations.city import City
 from covid19sim.utils.env import Env
-from covid19sim.epidemiology.viral_load import compute_covid_properties, viral_load_for_day
+from covid19sim.epidemiology.viral_load import compute_covid_properties, viral_load_for_day, viral_loads_for_day
 from covid19sim.native import Environment
+from covid19sim.utils.utils import calculate_average_infectiousnesses
 from tests.utils import get_test_conf
 
 
@@ -355,6 +356,38 @@ def test_viral_load_for_day():
                                                             2)) == 0.75 / 2
     assert viral_load_for_day(human, now + datetime.timedelta(days=recovery_days)) == 0.0
 
+    # batched evaluation agrees with the per-timestamp one
+    days = [0, infectiousness_onset_days, viral_load_peak_start, incubation_days, viral_load_plateau_end, recovery_days]
+    timestamps = [now + datetime.timedelta(days=d) for d in days]
+    assert viral_loads_for_day([human] * len(days), timestamps).tolist() == \
+        [viral_load_for_day(human, timestamp) for timestamp in timestamps]
+    assert viral_loads_for_day([human], timestamps[3]).tolist() == [0.75 + 0.25 / 2]
+
+
+
+def test_calculate_average_infectiousnesses():
+    """
+    Intialize infected `Human`s and test whether their batched infectiousnesses of tomorrow match the per-human ones.
+    """
+    conf = get_test_conf("test_covid_testing.yaml")
+    rng = np.random.RandomState(42)
+    env = Env(datetime.datetime(2020, 2, 28, 0, 0))
+    city = City(env, 50, 0.5, rng, (0, 1000), (0, 1000), conf)
+
+    for days_since_infection, human in enumerate(city.humans[:30]):
+        human._get_infected(initial_viral_load=human.rng.random())
+        human.infection_timestamp = env.timestamp - datetime.timedelta(days=days_since_infection % 15)
+
+    tomorrow = env.now + SECONDS_PER_DAY
+    expected_infectiousnesses = [
+        human.get_infectiousness_for_day(
+            tomorrow, tomorrow - human.ts_covid19_infection >= human.infectiousness_onset_days * SECONDS_PER_DAY,
+        )
+        for human in city.humans
+    ]
+    assert any(infectiousness > 0 for infectiousness in expected_infectiousnesses)
+    assert calculate_average_infectiousnesses(city.humans) == expected_infectiousnesses
+    assert calculate_average_infectiousnesses([]) == []
 
 class EnvMock(Environment):
     pass
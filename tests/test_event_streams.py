@@ -0,0 +1,130 @@
+import copy
+import datetime
+import os
+import pickle
+from tempfile import TemporaryDirectory
+
+import dill
+import numpy as np
+
+from covid19sim.epidemiology.symptoms import FEVER, MILD
+from covid19sim.log.event_streams import EventStream, StreamedEvents, get_event_stream_path, load_streamed_events, \
+    read_event_columns, read_event_stream
+
+SCHEMA = [
+    ("name", "str"), ("count", "int"), ("level", "optional_int"), ("risk", "optional_float"), ("has_app", "bool"),
+    ("is_asymptomatic", "optional_bool"), ("timestamp", "timestamp"), ("date", "date"), ("symptoms", "pickle"),
+]
+
+
+def _make_event(idx):
+    timestamp = datetime.datetime(2020, 2, 28, 5, 3, 1, idx) if idx % 3 else None
+    return {
+        "name": f"human:{idx}" if idx % 4 else None,
+        "count": idx,
+        "level": idx % 4 if idx % 5 else None,
+        "risk": idx / 7 if idx % 6 else None,
+        "has_app": bool(idx % 2),
+        "is_asymptomatic": bool(idx % 3) if idx % 7 else None,
+        "timestamp": timestamp if idx != 8 else datetime.datetime.max,
+        "date": datetime.date(2020, 3, 1) + datetime.timedelta(days=idx),
+        "symptoms": [MILD, FEVER][:idx % 3] if idx % 2 else {"positive test"},
+    }
+
+
+def test_events_round_trip():
+    """
+    Events should be read back as they were appended, whether they were written or still buffered.
+    """
+    with TemporaryDirectory() as d:
+        path = get_event_stream_path(d, "monitor")
+        stream = EventStream(path, SCHEMA, chunk_size=4)
+        events = [_make_event(idx) for idx in range(11)]
+        stream.extend(events)
+        assert (len(stream), stream.n_flushed) == (11, 8)  # only full chunks are written
+        assert list(stream) == events
+        assert len(read_event_stream(path)) == 8
+        stream.flush()
+        assert read_event_stream(path) == events
+        assert read_event_stream(path)[1]["symptoms"] == [MILD]
+        columns = read_event_columns(path, ["count", "risk"])
+        np.testing.assert_array_equal(columns["count"], np.arange(11))
+        assert columns["risk"].dtype == np.float64
+
+
+def test_keyed_and_tuple_streams():
+    """
+    Keyed streams should be read back as dictionaries of lists of events, tuple streams as lists of tuples.
+    """
+    with TemporaryDirectory() as d:
+        keyed = EventStream(get_event_stream_path(d, "human_monitor"), [("date", "date"), ("name", "str")], 3, key="date")
+        tuples = EventStream(get_event_stream_path(d, "contacts"), [("success", "bool"), ("p", "optional_float")], 3,
+                             row_type="tuple")
+        days = [datetime.date(2020, 2, 28), datetime.date(2020, 2, 29)]
+        for day in days:
+            keyed[day] = [{"name": f"human:{idx}"} for idx in range(4)]
+        tuples.extend([(True, 0.5), (False, None)])
+        for stream in (keyed, tuples):
+            stream.flush()
+
+        data = {
+            "human_monitor": StreamedEvents("human_monitor"),
+            "patterns": {"contacts": StreamedEvents("contacts"), "n": 1},
+        }
+        data = load_streamed_events(pickle.loads(pickle.dumps(data)), d)
+        assert data["human_monitor"] == {day: [{"name": f"human:{idx}"} for idx in range(4)] for day in days}
+        assert data["patterns"] == {"contacts": [(True, 0.5), (False, None)], "n": 1}
+
+
+def test_forked_stream():
+    """
+    A forked stream should hold the events of the original stream, which keeps being written independently.
+    """
+    with TemporaryDirectory() as d:
+        schema = [("count", "int")]
+        stream = EventStream(os.path.join(d, "base"), schema, chunk_size=2)
+        stream.extend({"count": idx} for idx in range(5))
+        original = copy.copy(stream)  # e.g. the stream of the parent process
+        original.buffer = list(stream.buffer)
+        stream.fork(os.path.join(d, "fork"))
+        original.append({"count": -1})
+        stream.append({"count": 5})
+        original.flush()
+        stream.flush()
+        assert [e["count"] for e in read_event_stream(os.path.join(d, "base"))] == [0, 1, 2, 3, 4, -1]
+        assert [e["count"] for e in read_event_stream(os.path.join(d, "fork"))] == [0, 1, 2, 3, 4, 5]
+
+
+def test_streamed_tracker_events_match_in_memory_ones():
+    """
+    The tracker data of a simulation should not depend on whether its events are streamed to `outdir`.
+    """
+    from covid19sim.run import simulate
+    from covid19sim.utils.utils import extract_tracker_data
+    from tests.utils import get_test_conf
+
+    all_data = []
+    for stream_events in (False, True):
+        with TemporaryDirectory() as d:
+            conf = get_test_conf("test_heuristic.yaml")
+            conf.update({
+                "COLLECT_TRAINING_DATA": False, "INTERVENTION_DAY": 1, "TRANSFORMER_EXP_PATH": "", "outdir": d,
+                "track_humans": True, "STREAM_TRACKER_EVENTS": stream_events, "TRACKER_EVENTS_CHUNK_SIZE": 100,
+            })
+            city = simulate(
+                n_people=50,
+                start_time=datetime.datetime(2020, 2, 28, 0, 0),
+                simulation_days=5,
+                init_fraction_sick=0.2,
+                seed=7,
+                conf=conf,
+            )
+            data = extract_tracker_data(city.tracker, conf)
+            assert isinstance(data["risk_attributes"], StreamedEvents) == stream_events
+            all_data.append(load_streamed_events(dill.loads(dill.dumps(data)), d))
+
+    for key in ["infection_monitor", "test_monitor", "human_monitor", "risk_attributes"]:
+        assert all_data[0][key] == all_data[1][key], key
+        assert len(all_data[0][key]) > 0, key
+    for key in ["p_infection_at_contact_human", "p_infection_at_contact_environment"]:
+        assert all_data[0]["infectious_contact_patterns"][key] == all_data[1]["infectious_contact_patterns"][key]
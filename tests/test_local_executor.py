@@ -0,0 +1,82 @@
+import json
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from covid19sim.job_scripts.local_executor import LocalExecutor
+
+# appends the start ("1 <time>") and end ("-1 <time>") of the run to `<log>`, and exits with `<exit code>`
+SCRIPT = """
+import sys, time
+log, exit_code = sys.argv[1], int(sys.argv[2])
+with open(log, "a") as f:
+    f.write(f"1 {time.time()}\\n")
+time.sleep(0.3)
+with open(log, "a") as f:
+    f.write(f"-1 {time.time()}\\n")
+sys.exit(exit_code)
+"""
+
+
+def _read_events(path):
+    with open(path) as f:
+        return [(float(t), int(delta)) for delta, t in map(str.split, f)]
+
+
+def _n_runs(events):
+    return sum(delta == 1 for _, delta in events)
+
+
+def _max_overlap(events):
+    n_running, max_running = 0, 0
+    for _, delta in sorted(events):
+        n_running += delta
+        max_running = max(max_running, n_running)
+    return max_running
+
+
+def test_local_executor_bounds_retries_and_resumes():
+    """
+    Runs should be started at most `n_workers` at a time within the memory budget, failed runs should be retried,
+    and completed runs should be skipped when the search is launched again.
+    """
+    with TemporaryDirectory() as d:
+        d = Path(d)
+
+        def make_executor(**kwargs):
+            return LocalExecutor(
+                d / "logs", journal_path=d / "runs.json", mem_per_run=1.0, mem_per_person=1.0, poll_interval=0.05,
+                **kwargs
+            )
+
+        executor = make_executor(n_workers=2, pin_cpus=False, mem_budget=100)
+        for run_idx in range(5):
+            executor.submit(run_idx, [sys.executable, "-c", SCRIPT, d / "workers.txt", 0], n_people=1000)
+        assert executor.run() == {run_idx: "done" for run_idx in range(5)}
+        events = _read_events(d / "workers.txt")
+        assert _n_runs(events) == 5 and _max_overlap(events) == 2
+
+        # 3 runs of ~2GB in a 5GB budget: at most 2 at a time, whatever the number of workers
+        executor = make_executor(n_workers=3, pin_cpus=False, mem_budget=5)
+        for run_idx in range(3):
+            executor.submit(run_idx, [sys.executable, "-c", SCRIPT, d / "mem.txt", 0], n_people=1024)
+        executor.run()
+        assert _max_overlap(_read_events(d / "mem.txt")) == 2
+
+        # run 1 always fails, and is retried once; completed runs are skipped when launched again
+        executor = make_executor(n_workers=2, max_retries=1)
+        commands = {run_idx: [sys.executable, "-c", SCRIPT, d / "retries.txt", int(run_idx == 1)] for run_idx in range(3)}
+        for run_idx, command in commands.items():
+            executor.submit(run_idx, command)
+        assert executor.run() == {0: "done", 1: "failed", 2: "done"}
+        assert _n_runs(_read_events(d / "retries.txt")) == 4
+        assert executor.get_resume_index() == 1
+        with (d / "runs.json").open("r") as f:
+            assert json.load(f)["1"]["attempts"] == 2
+
+        executor = make_executor(n_workers=2, max_retries=0)
+        for run_idx, command in commands.items():
+            executor.submit(run_idx, command)
+        assert executor.run() == {0: "resumed", 1: "failed", 2: "resumed"}
+        assert _n_runs(_read_events(d / "retries.txt")) == 5
+        assert (d / "logs" / "run_1.out").exists()
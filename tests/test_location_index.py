@@ -0,0 +1,51 @@
+import numpy as np
+
+from covid19sim.utils.location_index import LocationIndex
+from covid19sim.utils.utils import compute_distance
+
+
+class LocationMock:
+    def __init__(self, name, lat, lon):
+        self.name = name
+        self.lat = lat
+        self.lon = lon
+
+
+def _get_locations(location_type, n, rng):
+    return [LocationMock(f"{location_type}:{i}", rng.randint(0, 1000), rng.randint(0, 1000)) for i in range(n)]
+
+
+def test_preferences_match_distances():
+    """
+    Preferences of households should be the inverse distances to their nearest locations, nearest first.
+    """
+    rng = np.random.RandomState(0)
+    stores = _get_locations("STORE", 30, rng)
+    households = _get_locations("HOUSEHOLD", 20, rng)
+    for top_k in [None, 5, 100]:
+        index = LocationIndex({"STORE": stores, "PARK": []}, top_k=top_k)
+        index.compute_preferences("STORE", households)
+        index.compute_preferences("PARK", households)
+        for origin in households + [LocationMock("HOUSEHOLD:not-indexed", 500, 500)]:
+            locations, preferences = index.get_preferences("STORE", origin)
+            expected = sorted(stores, key=lambda s: compute_distance(origin, s))[:top_k]
+            assert len(locations) == len(expected) == min(top_k or len(stores), len(stores))
+            assert [compute_distance(origin, s) for s in locations] == [compute_distance(origin, s) for s in expected]
+            np.testing.assert_allclose(preferences, [(compute_distance(origin, s) + 1e-1) ** -1 for s in locations],
+                                       rtol=1e-6)
+            assert index.get_preferences("PARK", origin) == ([], [])
+
+
+def test_iter_nearest():
+    """
+    Locations should be iterated over from the nearest to the farthest, each one exactly once.
+    """
+    rng = np.random.RandomState(1)
+    hospitals = _get_locations("HOSPITAL", 11, rng)
+    index = LocationIndex({"HOSPITAL": hospitals})
+    origin = LocationMock("HOUSEHOLD:0", 100, 900)
+    nearest = list(index.iter_nearest("HOSPITAL", origin))
+    assert sorted(h.name for h in nearest) == sorted(h.name for h in hospitals)
+    distances = [compute_distance(origin, h) for h in nearest]
+    assert distances == sorted(distances)
+    assert next(index.iter_nearest("HOSPITAL", origin)) is nearest[0]
@@ -0,0 +1,139 @@
+import collections
+import datetime
+
+import numpy as np
+
+from covid19sim.epidemiology.human_properties import get_age_bin
+from covid19sim.locations.location import Location
+from covid19sim.utils.constants import SECONDS_PER_HOUR
+from covid19sim.utils.env import Env
+from tests.utils import get_test_conf
+
+
+class IntervenedBehaviorMock:
+    def __init__(self, reduction_factor):
+        self.reduction_factor = reduction_factor
+
+    def daily_interaction_reduction_factor(self, location):
+        return self.reduction_factor
+
+
+class HumanMock:
+    def __init__(self, name, age, reduction_factor=0.0):
+        self.name = name
+        self.age_bin_width_5 = get_age_bin(age, width=5)
+        self.known_connections = set()
+        self.intervened_behavior = IntervenedBehaviorMock(reduction_factor)
+        self.is_infectious = False
+        self.location_start_time = 0
+        self.location_leaving_time = 0
+
+
+def _get_location(n_humans, seed=0):
+    conf = get_test_conf("base.yaml")
+    conf['_CURRENT_PREFERENTIAL_ATTACHMENT_FACTOR'] = 0.5
+    conf['_MEAN_DAILY_UNKNOWN_CONTACTS'] = conf['MEAN_DAILY_UNKNOWN_CONTACTS']
+    env = Env(datetime.datetime(2020, 2, 28, 0, 0))
+    rng = np.random.RandomState(seed)
+    location = Location(env=env, rng=rng, conf=conf, area=100, name="workplace", location_type="WORKPLACE",
+                        lat=0, lon=0, capacity=None)
+    humans = [HumanMock(i, rng.randint(0, 90)) for i in range(n_humans)]
+    for human in humans:
+        human.location_start_time = env.now
+        human.location_leaving_time = env.now + 8 * SECONDS_PER_HOUR
+        location.add_human(human)
+    return location, humans
+
+
+def test_occupant_index_add_remove():
+    """
+    The occupant index should always describe the humans currently at the location.
+    """
+    location, humans = _get_location(50)
+    for human in humans[::3]:
+        location.remove_human(human)
+    location.add_human(humans[1])  # adding twice is a no-op
+
+    present = set(humans) - set(humans[::3])
+    assert set(location._occupants) == present
+    assert len(location._occupants) == len(present)
+    for human, idx in location._occupant_idx.items():
+        assert location._occupants[idx] is human
+
+    for age_bin, members in enumerate(location._binned_occupants):
+        assert location._binned_counts[age_bin] == len(members)
+        assert set(members) == {h for h in present if h.age_bin_width_5.index == age_bin}
+        for idx, human in enumerate(members):
+            assert location._binned_occupant_idx[human] == idx
+
+
+def test_sample_interactee_distribution():
+    """
+    Sampled interactees should follow the age-mixing and preferential attachment probabilities.
+    """
+    location, humans = _get_location(60)
+    for human in humans[::4]:
+        location.remove_human(human)
+
+    human = humans[1]
+    human.known_connections = {humans[i] for i in [0, 2, 3, 5, 7, 9]}
+    factor = location.conf['_CURRENT_PREFERENTIAL_ATTACHMENT_FACTOR']
+
+    n_samples = 100000
+    known_counts = collections.Counter(location._sample_interactee("known", human, n=n_samples))
+    unknown_counts = collections.Counter(location._sample_interactee("unknown", human, n=n_samples))
+
+    candidates = [h for h in location.humans if h is not human]
+    p_contact = np.array([
+        location.P_CONTACT[h.age_bin_width_5.index, human.age_bin_width_5.index]
+        * ((1 - factor) + factor * (h in human.known_connections))
+        for h in candidates
+    ])
+    p_contact /= p_contact.sum()
+
+    assert known_counts[human] == 0 and unknown_counts[human] == 0
+    assert sum(known_counts[h] for h in humans[::4]) == 0
+    assert np.allclose([known_counts[h] / n_samples for h in candidates], p_contact, atol=5e-3)
+    assert np.allclose([unknown_counts[h] / n_samples for h in candidates], 1 / len(candidates), atol=5e-3)
+
+
+def test_sample_interactee_full_reduction():
+    """
+    No known interactions are sampled when `human` reduces all of their interactions.
+    """
+    location, humans = _get_location(20)
+    humans[0].intervened_behavior.reduction_factor = 1.0
+    assert location._sample_interactee("known", humans[0], n=5) == [None]
+
+
+def test_sample_interactions_batch():
+    """
+    Humans leaving a location at the same time get their interactions sampled together.
+    """
+    location, humans = _get_location(40)
+    env = location.env
+    location.conf['_MEAN_DAILY_UNKNOWN_CONTACTS'] = 5.0
+    leaving_humans = humans[:10]
+    interactions = {}
+
+    def leave(human, unknown_only):
+        yield env.timeout(8 * SECONDS_PER_HOUR)
+        interactions[human] = yield location.request_interactions(human, unknown_only=unknown_only)
+        location.remove_human(human)
+
+    for i, human in enumerate(leaving_humans):
+        env.process(leave(human, unknown_only=i % 2 == 0))
+    env.run(until=env.now + 9 * SECONDS_PER_HOUR)
+
+    assert set(interactions) == set(leaving_humans)
+    assert location._leaving_humans == []
+    assert len(location.humans) == len(humans) - len(leaving_humans)
+    for i, human in enumerate(leaving_humans):
+        known_interactions, unknown_interactions = interactions[human]
+        if i % 2 == 0:
+            assert known_interactions == []
+        for other_human, distance_profile, duration in known_interactions + unknown_interactions:
+            assert other_human is not human
+            assert 0 <= distance_profile.distance <= distance_profile.packing_term
+            assert duration >= 0
+    assert sum(len(x[1]) for x in interactions.values()) > 0
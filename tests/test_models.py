@@ -5,7 +5,6 @@ import pickle
 import unittest
 from tempfile import TemporaryDirectory
 import warnings
-import zarr
 
 import numpy as np
 from tests.utils import get_test_conf
@@ -13,6 +12,7 @@ from tests.utils import get_test_conf
 from covid19sim.inference.helper import (conditions_to_np, symptoms_to_np, encode_age, encode_sex,
                                          encode_test_result, recovered_array, candidate_exposures,
                                          exposure_array)
+from covid19sim.inference.dataset_format import DatasetReader
 from covid19sim.inference.heavy_jobs import DummyMemManager
 from covid19sim.inference.human_as_message import get_test_results_array
 from covid19sim.inference.server_utils import DataCollectionServer
@@ -183,10 +183,9 @@ class ModelsTest(unittest.TestCase):
                     assert h.location.is_contaminated
                     assert h.location.contamination_probability == 1.0
 
-            dataset = zarr.open(os.path.join(d, "dataset"), "r")
-            assert dataset.shape[0] == n_days
-            assert dataset.shape[1] == 24
-            assert dataset.shape[2] == n_people
+            dataset = DatasetReader(d)
+            assert dataset.simulation_days == n_days
+            assert dataset.human_count == n_people
             output = []
             for day_idx in range(conf.get('INTERVENTION_DAY'), n_days):
                 hour_outputs = []
@@ -530,6 +529,7 @@ class HumanAsMessageTest(unittest.TestCase):
     def test_human_as_message(self):
         from covid19sim.human import Human
         from covid19sim.inference.heavy_jobs import make_human_as_message
+        from covid19sim.inference.message_utils import PersonalMailbox
 
         # Load the experimental configuration
         conf_name = "test_models.yaml"
@@ -543,8 +543,14 @@ class HumanAsMessageTest(unittest.TestCase):
 
         human = Human(env=env, city={'city': 'city'}, name=1, age=25, rng=rng, conf=conf)
         human.has_app = True
-        human.contact_book.mailbox_keys_by_day[0] = [0, 1]  # add two dummy encounter keys
-        personal_mailbox = {1: ["fake_message"]}  # create a dummy personal mailbox with one update
+        for mailbox_key in [0, 1]:  # add two dummy encounter keys
+            human.contact_book.add_encounter(
+                day_idx=0, real_encounter_time=today, initial_timestamp=today,
+                uid=mailbox_key, mailbox_key=mailbox_key, receiver_uid="human:2",
+            )
+        personal_mailbox = PersonalMailbox()  # create a dummy personal mailbox with one update
+        personal_mailbox.add_message(day_idx=0, mailbox_key=1, message="fake_message")
+        personal_mailbox.add_message(day_idx=1, mailbox_key=2, message="unrelated_message")
         dummy_conf = {"TRACING_N_DAYS_HISTORY": 14}  # create a dummy config (only needs 1 setting)
         message = make_human_as_message(human, personal_mailbox, dummy_conf)
 
@@ -552,6 +558,7 @@ class HumanAsMessageTest(unittest.TestCase):
             if k == 'update_messages':
                 self.assertEqual(len(message.update_messages), 1)
                 self.assertEqual(message.update_messages[0], "fake_message")
+                self.assertEqual(len(personal_mailbox), 1)
             elif k == "infectiousnesses":
                 self.assertEqual(len(human.infectiousnesses), dummy_conf["TRACING_N_DAYS_HISTORY"])
             else:
@@ -0,0 +1,66 @@
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+import yaml
+
+import covid19sim.plotting.utils as plotting_utils
+from covid19sim.utils.utils import dump_tracker_data
+
+
+def _dump_run(run_dir, intervention_day):
+    run_dir.mkdir(parents=True, exist_ok=True)
+    with (run_dir / "full_configuration.yaml").open("w") as f:
+        yaml.safe_dump({"seed": 0}, f)
+    data = {
+        "intervention_day": intervention_day,
+        "cases_per_day": [1, 4, 2, 0],
+        "test_monitor": [{"name": "human:1", "test_result": "positive"}],
+    }
+    dump_tracker_data(data, run_dir, "tracker_data.pkl")
+
+
+def _load(d, keys, **kwargs):
+    """Returns the loaded data of the runs of `d` and the runs that were read from their tracker data."""
+    with mock.patch.object(plotting_utils, "read_tracker_index", wraps=plotting_utils.read_tracker_index) as read:
+        all_data = plotting_utils.get_all_data(d, keys, cache_dir=Path(d) / ".plot_cache", **kwargs)
+    pkls = {Path(r).name: run["pkl"] for runs in all_data.values() for r, run in runs.items()}
+    return pkls, sorted(Path(call[0][0]).name for call in read.call_args_list)
+
+
+def test_plot_cache_is_incremental():
+    """
+    Only the keys and runs missing from the per-run caches should be loaded, and changed runs should be reloaded.
+    """
+    with TemporaryDirectory() as d:
+        method_dir = Path(d) / "method"
+        _dump_run(method_dir / "run_0", 2)
+        keys = {"intervention_day", "test_monitor"}
+
+        pkls, read = _load(d, keys, dump_cache=True)
+        assert read == ["run_0"] and (Path(d) / ".plot_cache" / "method" / "run_0.pkl").exists()
+        pkls, read = _load(d, keys, dump_cache=True)
+        assert read == [] and pkls["run_0"]["intervention_day"] == 2
+        assert pkls["run_0"]["test_monitor"] == [{"name": "human:1", "test_result": "positive"}]
+
+        # new plots: only the new keys are loaded, keys missing from the tracker data are remembered as such
+        pkls, read = _load(d, keys | {"cases_per_day", "not_a_key"}, dump_cache=True)
+        assert read == ["run_0"] and set(pkls["run_0"]) == keys | {"cases_per_day"}
+        pkls, read = _load(d, keys | {"cases_per_day", "not_a_key"}, dump_cache=True)
+        assert read == [] and pkls["run_0"]["cases_per_day"] == [1, 4, 2, 0]
+
+        # new runs: only those are loaded
+        _dump_run(method_dir / "run_1", 3)
+        pkls, read = _load(d, keys, dump_cache=True)
+        assert read == ["run_1"] and pkls["run_1"]["intervention_day"] == 3 and set(pkls["run_0"]) == keys
+
+        # a run whose tracker data is only touched is not reloaded, one whose tracker data changed is
+        os.utime(method_dir / "run_0" / "tracker_data.pkl")
+        _dump_run(method_dir / "run_1", 4)
+        pkls, read = _load(d, keys, dump_cache=True)
+        assert read == ["run_1"] and pkls["run_1"]["intervention_day"] == 4
+
+        # without using the caches, everything is loaded
+        _, read = _load(d, keys, use_cache=False)
+        assert read == ["run_0", "run_1"]
@@ -0,0 +1,90 @@
+import datetime
+
+import numpy as np
+
+from covid19sim.epidemiology.human_properties import get_age_bin
+from covid19sim.native._native import BaseHuman
+from covid19sim.utils.constants import SECONDS_PER_DAY, SECONDS_PER_HOUR
+from covid19sim.utils.env import Env
+from covid19sim.utils.population import PopulationColumn, PopulationMirror, PopulationTable
+
+
+class HumanMock(BaseHuman):
+    ts_death = PopulationMirror()
+    infectiousness_onset_days = PopulationMirror()
+    infection_timestamp = PopulationMirror()
+    recovered_timestamp = PopulationMirror()
+    is_immune = PopulationMirror()
+    has_app = PopulationColumn("has_app", bool)
+
+    def __init__(self, env, population, age, time_slots):
+        super().__init__(env)
+        self._population = population
+        if population is not None:
+            self._population_idx = population.register(self)
+            population.sync_covid_state(self)
+        self.age_bin_width_5 = get_age_bin(age, width=5)
+        self.time_slots = time_slots
+        self.has_app = False
+        if population is not None:
+            population.set_static_attributes(self)
+
+
+def _get_population(n_humans, seed=0):
+    env = Env(datetime.datetime(2020, 2, 28, 0, 0))
+    rng = np.random.RandomState(seed)
+    population = PopulationTable(env, capacity=4)  # small capacity to exercise `_grow`
+    humans = [
+        HumanMock(env, population, rng.randint(0, 90), [rng.randint(0, 24)])
+        for _ in range(n_humans)
+    ]
+    return env, rng, population, humans
+
+
+def test_seir_counts_match_humans():
+    """
+    Vectorized SEIR masks should agree with the native properties of each human.
+    """
+    env, rng, population, humans = _get_population(40)
+    for human in humans[:20]:
+        human.infectiousness_onset_days = rng.randint(1, 4)
+        human.infection_timestamp = env.timestamp
+    for human in humans[:5]:
+        human.recovered_timestamp = datetime.datetime.max  # dies
+    humans[5].is_immune = True
+
+    for days in [0, 1, 2, 5]:
+        env._now = env.ts_initial + days * SECONDS_PER_DAY
+        masks = population.seir_masks()
+        for mask, attr in zip(masks, ["is_susceptible", "is_exposed", "is_infectious", "is_removed"]):
+            assert mask.tolist() == [getattr(human, attr) for human in humans]
+        assert population.alive_mask().tolist() == [not human.is_dead for human in humans]
+        assert population.seir_counts() == tuple(int(mask.sum()) for mask in masks)
+
+
+def test_app_holders_in_timeslot():
+    """
+    Humans selected for a timeslot should have the app and have that hour in their timeslots.
+    """
+    env, rng, population, humans = _get_population(60)
+    for human in humans[::2]:
+        human.has_app = True
+    assert all(isinstance(human.has_app, bool) for human in humans)
+
+    population.set_order(humans[::-1])
+    for hour in range(24):
+        selected = population.select(population.app_holders_in_timeslot_mask(hour))
+        expected = [human for human in humans[::-1] if human.has_app and hour in human.time_slots]
+        assert selected == expected
+
+
+def test_attributes_without_population():
+    """
+    Humans created without a population table keep their attributes in their `__dict__`.
+    """
+    env = Env(datetime.datetime(2020, 2, 28, 0, 0))
+    human = HumanMock(env, None, 30, [0])
+    human.has_app = True
+    human.infection_timestamp = env.timestamp + datetime.timedelta(seconds=SECONDS_PER_HOUR)
+    assert human.__dict__["has_app"] is True
+    assert human.ts_covid19_infection == env.ts_initial + SECONDS_PER_HOUR
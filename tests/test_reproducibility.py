@@ -7,10 +7,45 @@ from tempfile import TemporaryDirectory
 
 from tests.utils import get_test_conf
 
+from covid19sim.inference.heavy_jobs import make_human_as_message
 from covid19sim.run import simulate
+from covid19sim.utils.utils import load_intervention_conf
 
 TEST_CONF_NAME = "base.yaml"
 
+
+def _simulate(conf, outdir, n_people=60, simulation_days=5, init_fraction_sick=0.2, seed=7, **kwargs):
+    """Runs a simulation starting on 2020-02-28, writing its outputs to `outdir`."""
+    return simulate(
+        n_people=n_people,
+        start_time=datetime.datetime(2020, 2, 28, 0, 0),
+        simulation_days=simulation_days,
+        outfile=os.path.join(outdir, "data"),
+        out_chunk_size=0,
+        init_fraction_sick=init_fraction_sick,
+        seed=seed,
+        conf=conf,
+        **kwargs,
+    )
+
+
+def _get_city_md5(city):
+    """Hashes the state of the humans of `city`: their messages to the inference, activities and random states."""
+    md5 = hashlib.md5()
+    for human in city.humans:
+        md5.update(pickle.dumps(make_human_as_message(human, city.global_mailbox[human.name], city.conf)))
+        md5.update(pickle.dumps(human.rec_level))
+        md5.update(str(human.mobility_planner.current_activity).encode())
+        md5.update(pickle.dumps(human.rng.get_state()))
+    return md5.hexdigest()
+
+
+def _get_simulation_md5(conf, **kwargs):
+    """Hashes the state of the humans at the end of a simulation (see `_simulate` for `kwargs`)."""
+    with TemporaryDirectory() as d:
+        return _get_city_md5(_simulate(conf, d, **kwargs))
+
+
 class ReproducibilityTests(unittest.TestCase):
     config = None
 
@@ -64,3 +99,127 @@ class ReproducibilityTests(unittest.TestCase):
                             msg=f"Two simulations run with different seeds "
                             f"{self.test_seed}, {self.test_seed+1} yielded "
                             f"different results")
+
+
+class AsyncHeavyJobsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.config = get_test_conf("test_heuristic.yaml")
+        self.config['COLLECT_TRAINING_DATA'] = False
+        self.config['INTERVENTION_DAY'] = 1
+        self.config['TRANSFORMER_EXP_PATH'] = ""  # the heuristic model does not need the inference engine
+
+    def test_async_heavy_jobs_reproducibility(self):
+        """
+        Run two simulations whose heavy jobs are joined one timeslot late, and ensure they match.
+        """
+        self.config['ASYNC_HEAVY_JOBS'] = True
+
+        events_logs = []
+        for _ in range(2):
+            with TemporaryDirectory() as d:
+                city = _simulate(self.config, d, n_people=40, init_fraction_sick=0.1, seed=136)
+                # the heavy jobs of the last timeslot are applied when the simulation stops
+                self.assertIsNone(city.pending_app_jobs)
+                self.assertTrue(any([human.rec_level >= 0 for human in city.humans]))
+                events_logs.append(_get_city_md5(city))
+
+        self.assertEqual(events_logs[0], events_logs[1])
+
+    def test_async_heavy_jobs_match_sync(self):
+        """
+        Run the app jobs of a timeslot in the background, and right away, from the same state, and ensure they match.
+        """
+        events_logs = []
+        for run_in_background in (False, True):
+            with TemporaryDirectory() as d:
+                city = _simulate(self.config, d, n_people=40, init_fraction_sick=0.1, seed=136)
+                current_day = (city.env.timestamp - city.start_time).days
+                alive_humans = [human for human in city.humans if not human.is_dead]
+                city.submit_app_jobs(current_day, alive_humans, run_in_background=run_in_background)
+                self.assertTrue(len(city.pending_app_jobs[1]) > 0)
+                city.finish_app_jobs()
+                self.assertIsNone(city.pending_app_jobs)
+                events_logs.append(_get_city_md5(city))
+
+        self.assertEqual(events_logs[0], events_logs[1])
+
+
+class ScheduleHorizonTests(unittest.TestCase):
+
+    def test_schedule_horizon_does_not_change_results(self):
+        """
+        Run simulations with schedules planned for the entire simulation, and only a few days ahead, and ensure they match.
+        """
+        config = get_test_conf(TEST_CONF_NAME)
+        config['INTERVENTION_DAY'] = 0
+        config['INTERVENTION'] = "Tracing"
+
+        events_logs = []
+        for schedule_horizon_days in (None, 2):
+            config['SCHEDULE_HORIZON_DAYS'] = schedule_horizon_days
+            events_logs.append(_get_simulation_md5(config, n_people=100, simulation_days=10))
+
+        self.assertEqual(events_logs[0], events_logs[1])
+
+
+class ParallelInitTests(unittest.TestCase):
+
+    def test_parallel_init_does_not_change_results(self):
+        """
+        Run simulations whose schedules are presampled in sequence, and by a pool of processes, and ensure they match.
+        """
+        config = get_test_conf(TEST_CONF_NAME)
+
+        events_logs = []
+        for init_n_jobs in (1, 2):
+            config['INIT_N_JOBS'] = init_n_jobs
+            events_logs.append(_get_simulation_md5(config))
+
+        self.assertEqual(events_logs[0], events_logs[1])
+
+
+class InterventionScenarioTests(unittest.TestCase):
+
+    def test_forked_scenario_matches_fresh_simulation(self):
+        """
+        Run a simulation forking an intervention on its intervention day, and ensure both match the simulations run from scratch.
+        """
+        def get_config(**overrides):
+            config = get_test_conf(TEST_CONF_NAME)
+            config['COLLECT_TRAINING_DATA'] = False
+            config['INTERVENTION_DAY'] = 2
+            config['INTERVENTION'] = "Tracing"
+            config['TRANSFORMER_EXP_PATH'] = ""  # the heuristic model does not need the inference engine
+            config.update(overrides)
+            return config
+
+        base_intervention = load_intervention_conf("bdt1")
+        base_intervention.pop('INTERVENTION_DAY')
+        scenario = load_intervention_conf("heuristicv1")
+        scenario['APP_UPTAKE'] = 0.5
+        with TemporaryDirectory() as d:
+            scenario_md5_path = os.path.join(d, "scenario.md5")
+
+            def on_scenario_end(city):
+                assert city.conf['RISK_MODEL'] == "heuristicv1"
+                with open(scenario_md5_path, "w") as f:
+                    f.write(_get_city_md5(city))
+
+            city = _simulate(
+                get_config(**base_intervention), d, simulation_days=6,
+                intervention_scenarios=[scenario], on_scenario_end=on_scenario_end,
+            )
+            self.assertEqual(city.conf['RISK_MODEL'], "digital")
+            forked_md5s = [_get_city_md5(city)]
+            with open(scenario_md5_path) as f:
+                forked_md5s.append(f.read())
+
+        scenario.pop('INTERVENTION_DAY')
+        fresh_md5s = [
+            _get_simulation_md5(config, simulation_days=6)
+            for config in (get_config(**base_intervention), get_config(**scenario))
+        ]
+
+        self.assertEqual(forked_md5s, fresh_md5s)
+        self.assertNotEqual(fresh_md5s[0], fresh_md5s[1])
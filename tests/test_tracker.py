@@ -1,10 +1,12 @@
 import datetime
+import unittest.mock
 
 import numpy as np
 
 from covid19sim.utils.env import Env
 from covid19sim.human import Human
 from covid19sim.log.track import Tracker
+from covid19sim.run import simulate
 from tests.utils import get_test_conf
 from covid19sim.locations.city import EmptyCity
 from covid19sim.locations.location import Household
@@ -119,3 +121,33 @@ def test_track_serial_interval():
         for i in [5,0,2]:
             assert len(t.serial_interval_book_from[humans[i].name])==0
             assert len(t.serial_interval_book_to[humans[i].name])==0
+
+
+def test_full_human_copies_are_written_by_human_index():
+    """
+    The copies of humans kept with KEEP_FULL_OBJ_COPIES should be written at the (0-based) index of their name.
+    """
+    conf = get_test_conf("base.yaml")
+    conf['COLLECT_TRAINING_DATA'] = False
+    conf['KEEP_FULL_OBJ_COPIES'] = True
+    conf['track_humans'] = True
+    conf['RISK_MODEL'] = "digital"  # humans are only tracked with a risk model
+    with tempfile.TemporaryDirectory() as d, \
+            unittest.mock.patch("covid19sim.log.track.DataCollectionServer"), \
+            unittest.mock.patch("covid19sim.log.track.DataCollectionClient") as client_type:
+        conf['outdir'] = d
+        simulate(
+            n_people=10,
+            start_time=datetime.datetime(2020, 2, 28, 0, 0),
+            simulation_days=1,
+            outfile=None,
+            init_fraction_sick=0.1,
+            seed=0,
+            conf=conf,
+        )
+    write_batch = client_type.return_value.write_batch
+    assert write_batch.called
+    for (samples,), _ in write_batch.call_args_list:
+        human_idxs = sorted(human_idx for _, _, human_idx, _ in samples)
+        assert human_idxs == list(range(10))
+        assert all(human.name == f"human:{human_idx}" for _, _, human_idx, human in samples)
@@ -0,0 +1,103 @@
+import datetime
+import os
+from collections import defaultdict
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import dill
+import numpy as np
+import yaml
+
+from covid19sim.log.event_streams import EventStream, StreamedEvents, get_event_stream_path
+from covid19sim.log.tracker_index import read_tracker_index
+from covid19sim.utils.utils import dump_tracker_data
+
+
+def _make_tracker_data():
+    humans_state = defaultdict(list)
+    for idx in range(3):
+        humans_state[f"human:{idx}"].extend(["S", "E", "I", "R"][idx:] + ["R"] * idx)
+    return {
+        "intervention_day": 2,
+        "intervention": "Tracing",
+        "p_transmission": np.float64(0.25),
+        "adoption_rate": None,
+        "SIMULATION_START_TIME": datetime.datetime(2020, 2, 28, 0, 0),
+        "cases_per_day": [1, 4, 2, 0],
+        "avg_infectiousness_per_day": np.linspace(0, 1, 4),
+        "risk_precision": [(0.5, 1.0, 0.25), (0.25, 0.5, 0.125)],
+        "humans_state": humans_state,
+        "humans_rec_level": {f"human:{idx}": [0, idx, idx, 1] for idx in range(3)},
+        "known_connections": {"human:0": {"human:1"}, "human:1": set()},
+        "test_monitor": [{"name": "human:1", "test_result": "positive"}],
+        "all_serial_intervals": [],
+        "infection_monitor": StreamedEvents("infection_monitor"),
+    }
+
+
+def test_index_round_trip():
+    """
+    Indexed keys should be read back as they were dumped, the other ones should be reported as missing.
+    """
+    data = _make_tracker_data()
+    with TemporaryDirectory() as d:
+        dump_tracker_data(data, d, "tracker_data.pkl")
+        indexed, missing = read_tracker_index(d, list(data) + ["not_a_key"], tracker_filename="tracker_data.pkl")
+        assert missing == {"known_connections", "test_monitor", "all_serial_intervals", "not_a_key"}
+        for key, value in indexed.items():
+            if isinstance(value, np.ndarray):
+                np.testing.assert_array_equal(value, data[key])
+            elif isinstance(value, StreamedEvents):
+                assert value.name == data[key].name
+            else:
+                assert value == data[key], key
+                assert type(value) == type(data[key]) or key in ("p_transmission", "humans_state"), key
+        indexed, missing = read_tracker_index(d, ["cases_per_day"], tracker_filename="tracker_data_other.pkl")
+        assert indexed == {} and missing == {"cases_per_day"}
+
+
+def test_run_is_read_from_index():
+    """
+    The plotting loader should read indexed keys from the index, and unpickle the tracker data for the other ones.
+    """
+    from covid19sim.plotting.utils import get_all_data
+
+    data = _make_tracker_data()
+    with TemporaryDirectory() as d:
+        run_dir = Path(d) / "method" / "run"
+        run_dir.mkdir(parents=True)
+        with (run_dir / "full_configuration.yaml").open("w") as f:
+            yaml.safe_dump({"seed": 0}, f)
+        stream = EventStream(get_event_stream_path(run_dir, "infection_monitor"), [("to", "str")], chunk_size=2)
+        stream.extend([{"to": "human:1"}, {"to": "human:2"}, {"to": "human:0"}])
+        stream.flush()
+        dump_tracker_data(data, run_dir, "tracker_data.pkl")
+        # keys of the index are not read from the tracker data anymore
+        data["intervention_day"] = 3
+        with (run_dir / "tracker_data.pkl").open("wb") as f:
+            dill.dump(data, f)
+
+        keys = {"intervention_day", "humans_state", "test_monitor", "infection_monitor"}
+        for n_jobs in (1, 2):
+            pkl = get_all_data(d, keys, n_jobs=n_jobs)[str(Path(d) / "method")][str(run_dir)]["pkl"]
+            assert pkl["intervention_day"] == 2
+            assert pkl["humans_state"] == dict(data["humans_state"])
+            assert pkl["test_monitor"] == data["test_monitor"]
+            assert pkl["infection_monitor"] == [{"to": "human:1"}, {"to": "human:2"}, {"to": "human:0"}]
+
+
+def test_mixed_types_are_not_indexed():
+    """
+    Lists whose elements would change type in an array (e.g. numbers turned into strings) should be read from the tracker data.
+    """
+    data = {
+        "mixed_tuples": [(1.5, "positive"), (2.0, "negative")],
+        "mixed_numbers": [True, 2],
+        "mixed_table": {"human:0": [1, "S"], "human:1": [2, "E"]},
+        "floats_with_nans": [0.5, float("nan")],
+    }
+    with TemporaryDirectory() as d:
+        dump_tracker_data(data, d, "tracker_data.pkl")
+        indexed, missing = read_tracker_index(d, list(data), tracker_filename="tracker_data.pkl")
+        assert missing == {"mixed_tuples", "mixed_numbers", "mixed_table"}
+        assert indexed["floats_with_nans"][0] == 0.5 and np.isnan(indexed["floats_with_nans"][1])
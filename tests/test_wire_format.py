@@ -0,0 +1,94 @@
+import datetime
+import pickle
+import unittest
+
+import numpy as np
+
+from covid19sim.inference.human_as_message import HumanAsMessage
+from covid19sim.inference.message_utils import RiskLevelType, UpdateMessage
+from covid19sim.inference.wire_format import can_encode_human_batch, decode_collection_batch, \
+    decode_collection_request, decode_human_batch, encode_collection_batch, encode_collection_request, \
+    encode_human_batch, is_human_batch
+
+
+def _make_human_as_message(human_idx, n_updates, n_days=14, n_symptoms=30):
+    rng = np.random.RandomState(human_idx)
+    timestamp = datetime.datetime(2020, 3, 1, 5)
+    update_messages = [
+        UpdateMessage(
+            uid=(1 << 100) + human_idx * 7 + update_idx,
+            old_risk_level=RiskLevelType(1),
+            new_risk_level=RiskLevelType(update_idx % 16),
+            encounter_time=datetime.datetime(2020, 2, 28),
+            update_time=datetime.datetime(2020, 3, 1),
+            _sender_uid=f"human:{update_idx}",
+            _receiver_uid=f"human:{human_idx}",
+            _real_encounter_time=timestamp - datetime.timedelta(days=2, minutes=15),
+            _real_update_time=timestamp,
+            _exposition_event=True if update_idx == 0 else None,
+            _update_reason="contact" if update_idx % 2 else "unknown",
+        ) for update_idx in range(n_updates)
+    ]
+    return HumanAsMessage(
+        name=f"human:{human_idx}",
+        age=30 + human_idx,
+        sex=1,
+        obs_age=-1,
+        obs_sex=2,
+        preexisting_conditions=(rng.rand(11) < 0.3).astype(np.float64),
+        obs_preexisting_conditions=np.zeros(11),
+        infectiousnesses=list(rng.rand(n_days)),
+        infection_timestamp=None if human_idx else timestamp,
+        recovered_timestamp=datetime.datetime.max,
+        test_results=np.array([0.] * (n_days - 1) + [1.]),
+        rolling_all_symptoms=(rng.rand(n_days, n_symptoms) < 0.2).astype(np.float64),
+        rolling_all_reported_symptoms=np.zeros((n_days, n_symptoms)),
+        incubation_days=3.2,
+        recovery_days=None,
+        viral_load_to_infectiousness_multiplier=0.7,
+        update_messages=update_messages,
+        carefulness=0.5,
+        has_app=True,
+        oracle_noise_random_seed=12,
+    )
+
+
+class WireFormatTest(unittest.TestCase):
+    def test_human_batch_round_trip(self):
+        sample = [
+            {"current_day": 3, "time_slot": 5, "city_hash": 1700000000000000000,
+             "human": _make_human_as_message(human_idx, n_updates)}
+            for human_idx, n_updates in enumerate([3, 0, 5])
+        ]
+        self.assertTrue(can_encode_human_batch(sample))
+        frames = encode_human_batch(sample)
+        self.assertTrue(is_human_batch(frames))
+        self.assertLess(sum([len(frame) for frame in frames]), len(pickle.dumps(sample)))
+
+        decoded_sample = decode_human_batch([memoryview(frame) for frame in frames])
+        self.assertEqual(len(decoded_sample), len(sample))
+        for params, decoded_params in zip(sample, decoded_sample):
+            human, decoded_human = params.pop("human"), decoded_params.pop("human")
+            self.assertEqual(params, decoded_params)
+            for field in HumanAsMessage.__dataclass_fields__:
+                value, decoded_value = getattr(human, field), getattr(decoded_human, field)
+                if isinstance(value, np.ndarray):
+                    np.testing.assert_array_equal(value, decoded_value)
+                else:
+                    self.assertEqual(value, decoded_value, field)
+
+    def test_pickled_samples_are_not_encoded(self):
+        self.assertFalse(can_encode_human_batch(42))
+        self.assertFalse(can_encode_human_batch([{"human": 42}]))
+        self.assertFalse(is_human_batch([pickle.dumps([{"human": 42}])]))
+
+    def test_collection_request_round_trip(self):
+        frames = encode_collection_request(12, 23, 1234, b"payload")
+        self.assertEqual(decode_collection_request(frames), (12, 23, 1234, b"payload"))
+
+    def test_collection_batch_round_trip(self):
+        indices = [(3, 4, idx) for idx in (7, 2, 9)]
+        frames = encode_collection_batch(indices, [b"a", b"bb", b"ccc"])
+        header, buffers = decode_collection_batch(frames)
+        self.assertEqual([tuple(row) for row in header.tolist()], indices)
+        self.assertEqual(buffers, [b"a", b"bb", b"ccc"])